@@ -1,94 +1,234 @@
 import logging
-import boto3
-import tempfile
 import os
-from mypy_boto3_dynamodb.service_resource import DynamoDBServiceResource, Table
-from mypy_boto3_s3 import S3Client
-from typing import List, Dict, Any, Tuple
-from utils import read_products_from_csv, safe_get_env, write_products_to_dynamo
-from model import Product
+import clients
+import metrics
+import profiling
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, List, Dict, Any, Optional
+from storage import open_s3_text
+from utils import (
+    CSV_ENCODING,
+    read_products,
+    safe_get_env,
+    write_products_to_dynamo,
+    normalize_sequencer,
+    check_sync_state,
+    record_sync_state,
+    reconcile_products,
+    DEFAULT_SCAN_SEGMENTS,
+)
+from dataclasses import asdict
+from model import Product, ObjectVersion
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import DynamoDBServiceResource, Table
+    from mypy_boto3_s3 import S3Client
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 TABLE_NAME = "TABLE_NAME"
+SYNC_STATE_TABLE_NAME = "SYNC_STATE_TABLE_NAME"
+RECONCILE = "RECONCILE"
+SCAN_SEGMENTS = "SCAN_SEGMENTS"
+MAX_CONCURRENT_FILES = "MAX_CONCURRENT_FILES"
+DEFAULT_MAX_CONCURRENT_FILES = 4
 
 
-def parse_s3_event(event: Dict[str, Any]) -> Tuple[str, str]:
+def parse_s3_event(event: Dict[str, Any]) -> List[ObjectVersion]:
     """
-    Parses the S3 event to extract the bucket name and object key.
+    Parses every record of the S3 event into the uploaded object's bucket, key,
+    ETag, size and sequencer.
     """
     try:
-        record = event["Records"][0]
-        bucket_name = record["s3"]["bucket"]["name"]
-        object_key = record["s3"]["object"]["key"]
-        logger.info(f"Parsed S3 event: bucket={bucket_name}, key={object_key}")
-        return bucket_name, object_key
-    except (KeyError, IndexError) as e:
+        records = event["Records"]
+        if not records:
+            raise IndexError("event has no records")
+        objects = []
+        for record in records:
+            s3_object = record["s3"]["object"]
+            objects.append(
+                ObjectVersion(
+                    bucket=record["s3"]["bucket"]["name"],
+                    key=s3_object["key"],
+                    etag=str(s3_object.get("eTag", "")).strip('"'),
+                    size=int(s3_object.get("size", 0)),
+                    sequencer=normalize_sequencer(s3_object.get("sequencer", "")),
+                )
+            )
+        logger.info(
+            f"Parsed S3 event with {len(objects)} objects: "
+            + ", ".join(f"s3://{o.bucket}/{o.key}" for o in objects)
+        )
+        return objects
+    except (KeyError, IndexError, TypeError) as e:
         logger.error(f"Error parsing S3 event: {e}", exc_info=True)
         raise ValueError(f"Error parsing event: {e}")
 
 
-def download_file_from_s3(
-    s3_client: S3Client, bucket_name: str, object_key: str
-) -> str:
+def get_sync_state_table(
+    dynamo_db: "DynamoDBServiceResource",
+) -> Optional["Table"]:
     """
-    Downloads a file from S3 to a temporary file and returns the path.
+    Returns the sync state table, or None when upload deduplication is disabled.
     """
-    with tempfile.NamedTemporaryFile(
-        mode="wb", delete=False, suffix=".csv"
-    ) as temp_file:
-        temp_file_path = temp_file.name
-        logger.info(f"Downloading s3://{bucket_name}/{object_key} to {temp_file_path}")
-        s3_client.download_fileobj(bucket_name, object_key, temp_file)
-        logger.info("Download complete")
-        return temp_file_path
+    state_table_name = os.getenv(SYNC_STATE_TABLE_NAME)
+    if not state_table_name:
+        return None
+    return dynamo_db.Table(state_table_name)
 
 
-def handler(event, context):
-    logger.info("Lambda handler started")
-    logger.debug(f"Event received: {event}")
+def is_reconcile_enabled() -> bool:
+    """
+    Returns whether products missing from the uploaded file should be deleted.
+    """
+    return os.getenv(RECONCILE, "false").lower() == "true"
 
-    s3_client: S3Client = boto3.client("s3")
-    dynamo_db: DynamoDBServiceResource = boto3.resource("dynamodb")
-    table_name = safe_get_env(TABLE_NAME)
-    table: Table = dynamo_db.Table(table_name)
+
+def get_scan_segments() -> int:
+    """
+    Returns the number of parallel scan segments used by reconciliation.
+    """
+    value = os.getenv(SCAN_SEGMENTS, str(DEFAULT_SCAN_SEGMENTS))
     try:
-        bucket_name, object_key = parse_s3_event(event)
-    except ValueError as e:
-        logger.error(f"Invalid event structure: {str(e)}")
-        return {"statusCode": 400, "body": {"error": "Invalid event structure"}}
+        total_segments = int(value)
+    except ValueError:
+        total_segments = 0
+    if total_segments < 1:
+        message = (
+            f"Environment variable '{SCAN_SEGMENTS}' must be a positive integer, "
+            f"got '{value}'."
+        )
+        logger.error(message)
+        raise EnvironmentError(message)
+    return total_segments
+
+
+def process_file(
+    s3_client: "S3Client",
+    dynamo_db: "DynamoDBServiceResource",
+    table_name: str,
+    s3_object: ObjectVersion,
+    reconcile: bool,
+    total_segments: int = DEFAULT_SCAN_SEGMENTS,
+) -> Dict[str, Any]:
+    """
+    Syncs a single uploaded products file and returns its status.
+    """
+    bucket_name, object_key = s3_object.bucket, s3_object.key
+    state_table = get_sync_state_table(dynamo_db)
+    if state_table is not None:
+        try:
+            with metrics.stage("sync_state"):
+                skip_reason = check_sync_state(
+                    s3_client, state_table, table_name, s3_object
+                )
+        except Exception as e:
+            logger.warning(f"Could not check sync state, syncing anyway: {e}")
+            skip_reason = None
+        if skip_reason:
+            logger.info(f"Skipping s3://{bucket_name}/{object_key}: {skip_reason}")
+            return {"statusCode": 200, "body": {"skipped": True, "reason": skip_reason}}
 
-    temp_file_path = None
     try:
-        temp_file_path = download_file_from_s3(s3_client, bucket_name, object_key)
-        products: List[Product] = read_products_from_csv(temp_file_path)
+        with metrics.stage("read") as stage, open_s3_text(
+            s3_client, bucket_name, object_key, CSV_ENCODING
+        ) as csvfile:
+            products: List[Product] = read_products(csvfile)
+            stage.records = len(products)
+            stage.bytes = s3_object.size
         logger.info(f"Read {len(products)} products from CSV")
     except Exception as e:
         logger.error(f"Error downloading or reading CSV file: {e}", exc_info=True)
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
         return {"statusCode": 500, "body": {"error": str(e)}}
 
     try:
-        table: Table = dynamo_db.Table(table_name)
-        write_result = write_products_to_dynamo(products, table)
+        table: "Table" = dynamo_db.Table(table_name)
+        with metrics.stage("write") as stage:
+            write_result = write_products_to_dynamo(products, table)
+            stage.records = write_result.successful_inserts
     except Exception as e:
         logger.error(f"Error processing products: {str(e)}", exc_info=True)
         return {"statusCode": 500, "body": {"error": str(e)}}
-    finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
-            logger.info(f"Deleted temporary file {temp_file_path}")
 
     logger.info(
         f"Processing complete. Summary: {write_result.successful_inserts} successful, {write_result.failed_inserts} errors"
     )
-    return {
-        "statusCode": 200,
-        "body": {
-            "total": len(products),
-            "successful_inserts": write_result.successful_inserts,
-            "failed_inserts": write_result.failed_inserts,
-        },
+    reconcile_result = None
+    if reconcile:
+        try:
+            with metrics.stage("reconcile") as stage:
+                reconcile_result = reconcile_products(
+                    clients.get_client("dynamodb"),
+                    table_name,
+                    products,
+                    total_segments,
+                )
+                stage.records = reconcile_result.scanned
+        except Exception as e:
+            logger.error(f"Error reconciling products: {e}", exc_info=True)
+            return {"statusCode": 500, "body": {"error": str(e)}}
+
+    if state_table is not None and write_result.failed_inserts == 0:
+        try:
+            record_sync_state(state_table, table_name, s3_object)
+        except Exception as e:
+            logger.warning(f"Could not record sync state: {e}")
+    body: Dict[str, Any] = {
+        "total": len(products),
+        "successful_inserts": write_result.successful_inserts,
+        "failed_inserts": write_result.failed_inserts,
     }
+    if reconcile_result:
+        body["reconciliation"] = asdict(reconcile_result)
+    return {"statusCode": 200, "body": body}
+
+
+def summarize_status(results: List[Dict[str, Any]]) -> int:
+    """
+    Returns 200 when every file succeeded, 500 when none did and 207 otherwise.
+    """
+    failed = sum(1 for result in results if result["statusCode"] >= 400)
+    if failed == 0:
+        return 200
+    return 500 if failed == len(results) else 207
+
+
+@profiling.profiled("crm-sync-products")
+@metrics.instrument("crm-sync-products")
+def handler(event, context):
+    logger.info("Lambda handler started")
+    logger.debug(f"Event received: {event}")
+
+    s3_client: "S3Client" = clients.get_client("s3")
+    dynamo_db: "DynamoDBServiceResource" = clients.get_resource("dynamodb")
+    table_name = safe_get_env(TABLE_NAME)
+    try:
+        s3_objects = parse_s3_event(event)
+    except ValueError as e:
+        logger.error(f"Invalid event structure: {str(e)}")
+        return {"statusCode": 400, "body": {"error": "Invalid event structure"}}
+
+    # Each file is a full export, so reconciling against one of several files
+    # uploaded together would delete the products listed only in the others
+    reconcile = is_reconcile_enabled()
+    if reconcile and len(s3_objects) > 1:
+        logger.warning("Event has several files; skipping reconciliation")
+        reconcile = False
+    # Checked before anything is written, not when the scan starts
+    total_segments = get_scan_segments() if reconcile else DEFAULT_SCAN_SEGMENTS
+
+    def process(s3_object: ObjectVersion) -> Dict[str, Any]:
+        result = process_file(
+            s3_client, dynamo_db, table_name, s3_object, reconcile, total_segments
+        )
+        return {"bucket": s3_object.bucket, "key": s3_object.key, **result}
+
+    max_workers = min(
+        int(os.getenv(MAX_CONCURRENT_FILES, DEFAULT_MAX_CONCURRENT_FILES)),
+        len(s3_objects),
+    )
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(process, s3_objects))
+
+    return {"statusCode": summarize_status(results), "body": {"files": results}}
@@ -0,0 +1,218 @@
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, ContextManager, Dict, Iterator, Optional, TypeVar
+
+logger = logging.getLogger(__name__)
+
+METRICS_ENABLED = "METRICS_ENABLED"
+METRICS_NAMESPACE = "METRICS_NAMESPACE"
+FUNCTION_NAME = "AWS_LAMBDA_FUNCTION_NAME"
+DEFAULT_NAMESPACE = "CRM"
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+class Stage:
+    """
+    Measurements of one run of a stage. The caller fills in records and bytes.
+    """
+
+    __slots__ = ("name", "records", "bytes", "seconds")
+
+    def __init__(self, name: str, records: int = 0, bytes: int = 0) -> None:
+        self.name = name
+        self.records = records
+        self.bytes = bytes
+        self.seconds = 0.0
+
+    @property
+    def throughput(self) -> float:
+        return self.records / self.seconds if self.seconds > 0 else 0.0
+
+
+class Metrics:
+    """
+    Collects stage timings for one invocation and writes them to stdout as
+    CloudWatch Embedded Metric Format documents. When disabled, stages are
+    still timed and summarized but nothing is written.
+    """
+
+    def __init__(
+        self,
+        service: str,
+        namespace: str = DEFAULT_NAMESPACE,
+        enabled: bool = True,
+    ) -> None:
+        self.service = service
+        self.namespace = namespace
+        self.enabled = enabled
+        self._totals: Dict[str, Stage] = {}
+        self._lock = threading.Lock()
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[Stage]:
+        """Times the enclosed block as one run of the named stage."""
+        stage = Stage(name)
+        started = time.perf_counter()
+        try:
+            yield stage
+        finally:
+            stage.seconds = time.perf_counter() - started
+            self.record(stage)
+
+    def record(self, stage: Stage) -> None:
+        """Adds a stage measured by the caller, e.g. time summed over a loop."""
+        with self._lock:
+            total = self._totals.get(stage.name)
+            if total is None:
+                total = self._totals[stage.name] = Stage(stage.name)
+            total.records += stage.records
+            total.bytes += stage.bytes
+            total.seconds += stage.seconds
+        if self.enabled:
+            self._emit(
+                {"Stage": stage.name},
+                {
+                    "Duration": (stage.seconds * 1000, "Milliseconds"),
+                    "Records": (stage.records, "Count"),
+                    "Bytes": (stage.bytes, "Bytes"),
+                    "Throughput": (stage.throughput, "Count/Second"),
+                },
+            )
+
+    def summary(self, **properties: Any) -> Dict[str, Any]:
+        """Returns, and writes when enabled, the totals of the invocation."""
+        with self._lock:
+            stages = list(self._totals.values())
+        values: Dict[str, Any] = {
+            "InvocationDuration": (
+                (time.perf_counter() - self._started) * 1000,
+                "Milliseconds",
+            )
+        }
+        for stage in stages:
+            values[f"{stage.name}.Duration"] = (stage.seconds * 1000, "Milliseconds")
+            values[f"{stage.name}.Records"] = (stage.records, "Count")
+        if self.enabled:
+            self._emit({}, values, properties)
+        return {name: value for name, (value, _) in values.items()}
+
+    def _emit(
+        self,
+        dimensions: Dict[str, str],
+        values: Dict[str, Any],
+        properties: Optional[Dict[str, Any]] = None,
+    ) -> None:
+        document: Dict[str, Any] = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [
+                    {
+                        "Namespace": self.namespace,
+                        "Dimensions": [["Service", *dimensions]],
+                        "Metrics": [
+                            {"Name": name, "Unit": unit}
+                            for name, (_, unit) in values.items()
+                        ],
+                    }
+                ],
+            },
+            "Service": self.service,
+            **dimensions,
+            **(properties or {}),
+        }
+        for name, (value, _) in values.items():
+            document[name] = round(value, 3) if isinstance(value, float) else value
+        sys.stdout.write(json.dumps(document, default=str) + "\n")
+        sys.stdout.flush()
+
+
+def is_enabled() -> bool:
+    """Metrics are written by default only when running inside Lambda."""
+    default = "true" if os.getenv(FUNCTION_NAME) else "false"
+    return os.getenv(METRICS_ENABLED, default).lower() == "true"
+
+
+_current = Metrics("unknown", enabled=False)
+
+
+def current() -> Metrics:
+    return _current
+
+
+@contextmanager
+def invocation(service: str) -> Iterator[Metrics]:
+    """Makes a fresh collector current for the enclosed invocation."""
+    global _current
+    previous = _current
+    _current = Metrics(
+        service,
+        namespace=os.getenv(METRICS_NAMESPACE, DEFAULT_NAMESPACE),
+        enabled=is_enabled(),
+    )
+    try:
+        yield _current
+    finally:
+        _current = previous
+
+
+def stage(name: str) -> ContextManager[Stage]:
+    """Times the enclosed block with the collector of the current invocation."""
+    return _current.stage(name)
+
+
+def record(name: str, seconds: float, records: int = 0, bytes: int = 0) -> None:
+    stage = Stage(name, records, bytes)
+    stage.seconds = seconds
+    _current.record(stage)
+
+
+def timed(name: str) -> Callable[[F], F]:
+    """Decorator form of stage(); the returned value is counted when it is sized."""
+
+    def decorator(func: F) -> F:
+        @wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with stage(name) as measured:
+                result = func(*args, **kwargs)
+                if hasattr(result, "__len__"):
+                    measured.records = len(result)
+                return result
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+def instrument(service: str) -> Callable[[F], F]:
+    """
+    Decorator for a Lambda handler that collects the stages of each invocation
+    and writes a single summary when it returns.
+    """
+
+    def decorator(handler: F) -> F:
+        @wraps(handler)
+        def wrapper(event: Any, context: Any) -> Any:
+            with invocation(service) as collector:
+                status: Optional[int] = None
+                try:
+                    response = handler(event, context)
+                    if isinstance(response, dict):
+                        status = response.get("statusCode")
+                    return response
+                finally:
+                    try:
+                        collector.summary(StatusCode=status)
+                    except Exception as e:
+                        logger.warning(f"Could not write metrics summary: {e}")
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
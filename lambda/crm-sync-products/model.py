@@ -9,9 +9,9 @@ class Product:
 
     def to_dynamo_item(self) -> dict:
         return {
-            "id": {"S": self.id},
-            "description": {"S": self.description},
-            "product_type": {"S": self.product_type},
+            "id": self.id,
+            "description": self.description,
+            "product_type": self.product_type,
         }
 
 
@@ -19,3 +19,22 @@ class Product:
 class DBWriteResult:
     successful_inserts: int = 0
     failed_inserts: int = 0
+
+
+@dataclass
+class ObjectVersion:
+    bucket: str
+    key: str
+    etag: str = ""
+    size: int = 0
+    sequencer: str = ""
+
+
+@dataclass
+class ReconcileResult:
+    scanned: int = 0
+    orphaned: int = 0
+    deleted: int = 0
+    failed_deletes: int = 0
+    scan_seconds: float = 0.0
+    delete_seconds: float = 0.0
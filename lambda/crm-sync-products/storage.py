@@ -0,0 +1,240 @@
+import io
+import logging
+import mmap
+import os
+import shutil
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Dict,
+    Iterator,
+    Optional,
+    TextIO,
+    Tuple,
+    cast,
+)
+import metrics
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+
+logger = logging.getLogger(__name__)
+
+SPOOL_MAX_BYTES = "SPOOL_MAX_BYTES"
+IN_MEMORY_MAX_BYTES = "IN_MEMORY_MAX_BYTES"
+
+# Objects up to this size are read with a single GET into a spooled buffer
+DEFAULT_SPOOL_MAX_BYTES = 16 * 1024 * 1024
+# Larger objects up to this size go into an anonymous memory map, beyond it
+# into a memory-mapped file under /tmp
+DEFAULT_IN_MEMORY_MAX_BYTES = 256 * 1024 * 1024
+RANGE_PART_BYTES = 8 * 1024 * 1024
+MAX_RANGE_WORKERS = 8
+READ_CHUNK_BYTES = 1024 * 1024
+PRECONDITION_FAILED_CODES = {"PreconditionFailed", "412"}
+
+
+class ObjectChangedError(IOError):
+    """The object was overwritten while it was being read."""
+
+
+class _MappedReader(io.RawIOBase):
+    """Read-only, seekable file view over a memory map without copying it."""
+
+    def __init__(self, buffer: mmap.mmap) -> None:
+        self._buffer = buffer
+        self._position = 0
+
+    def readable(self) -> bool:
+        return True
+
+    def seekable(self) -> bool:
+        return True
+
+    def readinto(self, target) -> int:
+        data = self._buffer[self._position : self._position + len(target)]
+        target[: len(data)] = data
+        self._position += len(data)
+        return len(data)
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += len(self._buffer)
+        self._position = max(0, offset)
+        return self._position
+
+    def tell(self) -> int:
+        return self._position
+
+
+def _object_head(
+    s3_client: "S3Client", bucket_name: str, object_key: str
+) -> Tuple[int, str]:
+    head = s3_client.head_object(Bucket=bucket_name, Key=object_key)
+    return int(head["ContentLength"]), head["ETag"]
+
+
+def _quoted(etag: str) -> str:
+    """ETags come unquoted in S3 events but quoted from HEAD and GET."""
+    return etag if etag.startswith('"') else f'"{etag}"'
+
+
+def _get_object(
+    s3_client: "S3Client", bucket_name: str, object_key: str, etag: str, **kwargs: Any
+) -> Dict[str, Any]:
+    """GET that fails with ObjectChangedError unless the object still has the ETag."""
+    from botocore.exceptions import ClientError
+
+    try:
+        return s3_client.get_object(
+            Bucket=bucket_name, Key=object_key, IfMatch=etag, **kwargs
+        )
+    except ClientError as e:
+        if e.response["Error"]["Code"] in PRECONDITION_FAILED_CODES:  # type: ignore
+            raise ObjectChangedError(
+                f"s3://{bucket_name}/{object_key} no longer has ETag {etag}"
+            ) from e
+        raise
+
+
+def _download_range(
+    s3_client: "S3Client",
+    bucket_name: str,
+    object_key: str,
+    etag: str,
+    buffer: mmap.mmap,
+    start: int,
+    end: int,
+) -> None:
+    """Copy bytes [start, end] of the object into the same offsets of the buffer."""
+    response = _get_object(
+        s3_client, bucket_name, object_key, etag, Range=f"bytes={start}-{end}"
+    )
+    body = response["Body"]
+    offset = start
+    while offset <= end:
+        chunk = body.read(min(READ_CHUNK_BYTES, end - offset + 1))
+        if not chunk:
+            raise IOError(f"Range {start}-{end} ended early at byte {offset}")
+        buffer[offset : offset + len(chunk)] = chunk
+        offset += len(chunk)
+
+
+def _download_ranges(
+    s3_client: "S3Client",
+    bucket_name: str,
+    object_key: str,
+    etag: str,
+    buffer: mmap.mmap,
+    size: int,
+) -> None:
+    # Every part is read from the same version, or the download fails
+    ranges = [
+        (start, min(start + RANGE_PART_BYTES, size) - 1)
+        for start in range(0, size, RANGE_PART_BYTES)
+    ]
+    with ThreadPoolExecutor(max_workers=min(MAX_RANGE_WORKERS, len(ranges))) as pool:
+        futures = [
+            pool.submit(
+                _download_range,
+                s3_client,
+                bucket_name,
+                object_key,
+                etag,
+                buffer,
+                *byte_range,
+            )
+            for byte_range in ranges
+        ]
+        for future in futures:
+            future.result()
+
+
+@contextmanager
+def open_s3_object(
+    s3_client: "S3Client",
+    bucket_name: str,
+    object_key: str,
+    size: Optional[int] = None,
+    etag: Optional[str] = None,
+) -> Iterator[BinaryIO]:
+    """
+    Yields a seekable, read-only file object with the content of an S3 object.
+    Small objects are streamed into a spooled in-memory buffer with a single
+    GET; large ones are fetched with parallel ranged GETs into a preallocated
+    memory map. Pass the size and ETag from the S3 event to skip the HEAD
+    request. Every GET is conditional on the ETag, so an object overwritten
+    meanwhile raises ObjectChangedError instead of mixing two versions; the
+    newer version has an event of its own. Everything is released when the
+    context exits.
+    """
+    if not size or not etag:
+        head_size, head_etag = _object_head(s3_client, bucket_name, object_key)
+        size, etag = size or head_size, etag or head_etag
+    etag = _quoted(etag)
+    spool_max = int(os.getenv(SPOOL_MAX_BYTES, DEFAULT_SPOOL_MAX_BYTES))
+    in_memory_max = int(os.getenv(IN_MEMORY_MAX_BYTES, DEFAULT_IN_MEMORY_MAX_BYTES))
+
+    if size <= spool_max:
+        logger.info(f"Streaming s3://{bucket_name}/{object_key} ({size} bytes)")
+        with tempfile.SpooledTemporaryFile(max_size=spool_max) as buffer:
+            with metrics.stage("download") as stage:
+                body = _get_object(s3_client, bucket_name, object_key, etag)["Body"]
+                try:
+                    shutil.copyfileobj(body, buffer, READ_CHUNK_BYTES)
+                finally:
+                    body.close()
+                stage.bytes = size
+            buffer.seek(0)
+            yield cast(BinaryIO, buffer)
+        return
+
+    if size <= in_memory_max:
+        logger.info(
+            f"Downloading s3://{bucket_name}/{object_key} ({size} bytes) "
+            "with ranged GETs into memory"
+        )
+        with mmap.mmap(-1, size) as buffer:
+            with metrics.stage("download") as stage:
+                _download_ranges(s3_client, bucket_name, object_key, etag, buffer, size)
+                stage.bytes = size
+            with _MappedReader(buffer) as reader:
+                yield cast(BinaryIO, reader)
+        return
+
+    logger.info(
+        f"Downloading s3://{bucket_name}/{object_key} ({size} bytes) "
+        "with ranged GETs into a memory-mapped file"
+    )
+    with tempfile.TemporaryFile() as backing_file:
+        backing_file.truncate(size)
+        with mmap.mmap(backing_file.fileno(), size) as buffer:
+            with metrics.stage("download") as stage:
+                _download_ranges(s3_client, bucket_name, object_key, etag, buffer, size)
+                stage.bytes = size
+            with _MappedReader(buffer) as reader:
+                yield cast(BinaryIO, reader)
+
+
+@contextmanager
+def open_s3_text(
+    s3_client: "S3Client", bucket_name: str, object_key: str, encoding: str
+) -> Iterator[TextIO]:
+    """
+    Yields a text stream that decodes the object straight off the GET response
+    body, without a local copy. Lines end only at \n, \r\n or \r, as with
+    open(..., newline=""), so the csv module sees control characters such as
+    latin-1 0x85 inside fields unchanged.
+    """
+    logger.info(f"Streaming s3://{bucket_name}/{object_key}")
+    body = s3_client.get_object(Bucket=bucket_name, Key=object_key)["Body"]
+    try:
+        yield cast(TextIO, io.TextIOWrapper(body, encoding=encoding, newline=""))
+    finally:
+        body.close()
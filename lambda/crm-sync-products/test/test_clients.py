@@ -0,0 +1,62 @@
+import os
+import unittest
+from unittest.mock import Mock, patch
+import clients
+
+
+class TestClients(unittest.TestCase):
+    def setUp(self):
+        clients.reset()
+
+    def tearDown(self):
+        clients.reset()
+
+    @patch("clients.boto3")
+    def test_client_created_once_per_container(self, mock_boto3):
+        first = clients.get_client("s3")
+        second = clients.get_client("s3")
+
+        self.assertIs(first, second)
+        mock_boto3.client.assert_called_once()
+
+    @patch("clients.boto3")
+    def test_resource_created_once_per_container(self, mock_boto3):
+        clients.get_resource("dynamodb")
+        clients.get_resource("dynamodb")
+
+        mock_boto3.resource.assert_called_once()
+
+    @patch.dict(
+        os.environ,
+        {
+            "CLIENT_MAX_POOL_CONNECTIONS": "32",
+            "CLIENT_RETRY_MODE": "adaptive",
+            "CLIENT_MAX_ATTEMPTS": "3",
+        },
+    )
+    def test_client_config_from_environment(self):
+        config = clients.client_config()
+
+        self.assertEqual(config.max_pool_connections, 32)
+        self.assertTrue(config.tcp_keepalive)
+        self.assertEqual(config.retries, {"mode": "adaptive", "max_attempts": 3})
+
+    def test_client_config_defaults(self):
+        config = clients.client_config()
+
+        self.assertEqual(
+            config.max_pool_connections, clients.DEFAULT_MAX_POOL_CONNECTIONS
+        )
+        self.assertEqual(config.retries["mode"], clients.DEFAULT_RETRY_MODE)
+
+    @patch("clients.boto3")
+    def test_injected_client_is_returned(self, mock_boto3):
+        fake_s3 = Mock()
+        clients.set_client("s3", fake_s3)
+
+        self.assertIs(clients.get_client("s3"), fake_s3)
+        mock_boto3.client.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,54 @@
+import os
+import subprocess
+import sys
+import unittest
+from typing import Dict
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time allowed for the handler module, boto3 included
+IMPORT_BUDGET_MS = int(os.getenv("IMPORT_BUDGET_MS", "350"))
+RUNS = 3
+LAZY_MODULES = ["mypy_boto3_s3", "mypy_boto3_dynamodb"]
+
+
+def measure_import(module: str) -> Dict[str, int]:
+    """
+    Imports a module in a fresh interpreter with -X importtime and returns the
+    cumulative import time, in microseconds, of every module it pulled in.
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=BASE_DIR,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    timings: Dict[str, int] = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:") :].split("|")
+        timings[name.strip()] = int(cumulative)
+    return timings
+
+
+class TestImportTime(unittest.TestCase):
+    def test_handler_import_within_budget(self):
+        best_us = min(measure_import("main")["main"] for _ in range(RUNS))
+
+        self.assertLessEqual(
+            best_us / 1000,
+            IMPORT_BUDGET_MS,
+            f"Importing main took {best_us / 1000:.0f}ms, budget is {IMPORT_BUDGET_MS}ms",
+        )
+
+    def test_heavy_modules_are_imported_lazily(self):
+        imported = measure_import("main")
+
+        for module in LAZY_MODULES:
+            self.assertNotIn(module, imported, f"{module} is imported at cold start")
+
+
+if __name__ == "__main__":
+    unittest.main()
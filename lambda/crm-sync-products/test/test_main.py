@@ -1,10 +1,20 @@
+import io
 import unittest
 import os
 import tempfile
 from unittest.mock import Mock, patch, MagicMock
-from main import parse_s3_event, download_file_from_s3, handler
-from model import Product, DBWriteResult
-from utils import safe_get_env, read_products_from_csv, write_products_to_dynamo
+from botocore.exceptions import ClientError
+from main import parse_s3_event, handler
+from model import Product, DBWriteResult, ObjectVersion
+from utils import (
+    safe_get_env,
+    read_products_from_csv,
+    write_products_to_dynamo,
+    normalize_sequencer,
+    check_sync_state,
+    record_sync_state,
+    reconcile_products,
+)
 
 
 class TestParseS3Event(unittest.TestCase):
@@ -23,10 +33,30 @@ class TestParseS3Event(unittest.TestCase):
             ]
         }
 
-        bucket_name, object_key = parse_s3_event(event)
+        [s3_object] = parse_s3_event(event)
 
-        self.assertEqual(bucket_name, "test-bucket")
-        self.assertEqual(object_key, "test-folder/file.csv")
+        self.assertEqual(s3_object.bucket, "test-bucket")
+        self.assertEqual(s3_object.key, "test-folder/file.csv")
+
+    def test_parse_event_with_several_records(self):
+        """Test that every record of a batched notification is parsed"""
+        event = {
+            "Records": [
+                {
+                    "s3": {
+                        "bucket": {"name": "test-bucket"},
+                        "object": {"key": f"branch-{i}.csv"},
+                    }
+                }
+                for i in range(3)
+            ]
+        }
+
+        s3_objects = parse_s3_event(event)
+
+        self.assertEqual(
+            [o.key for o in s3_objects], ["branch-0.csv", "branch-1.csv", "branch-2.csv"]
+        )
 
     def test_parse_event_missing_records(self):
         """Test parsing event with missing Records key"""
@@ -61,40 +91,6 @@ class TestParseS3Event(unittest.TestCase):
         self.assertIn("Error parsing event", str(context.exception))
 
 
-class TestDownloadFileFromS3(unittest.TestCase):
-    """Tests for download_file_from_s3 function"""
-
-    def test_download_file_successfully(self):
-        """Test successful file download from S3"""
-        mock_s3_client = Mock()
-        bucket_name = "test-bucket"
-        object_key = "test.csv"
-
-        temp_file_path = download_file_from_s3(mock_s3_client, bucket_name, object_key)
-
-        # Verify download_fileobj was called with correct parameters
-        mock_s3_client.download_fileobj.assert_called_once()
-        call_args = mock_s3_client.download_fileobj.call_args
-        self.assertEqual(call_args[0][0], bucket_name)
-        self.assertEqual(call_args[0][1], object_key)
-
-        # Verify file was created
-        self.assertTrue(temp_file_path.endswith(".csv"))
-        self.assertTrue(os.path.exists(temp_file_path))
-
-        # Cleanup
-        os.unlink(temp_file_path)
-
-    def test_download_file_s3_error(self):
-        """Test handling of S3 download error"""
-        mock_s3_client = Mock()
-        mock_s3_client.download_fileobj.side_effect = Exception("S3 Error")
-
-        with self.assertRaises(Exception) as context:
-            download_file_from_s3(mock_s3_client, "bucket", "key")
-        self.assertIn("S3 Error", str(context.exception))
-
-
 class TestSafeGetEnv(unittest.TestCase):
     """Tests for safe_get_env function"""
 
@@ -268,41 +264,51 @@ class TestHandler(unittest.TestCase):
             Product(id="PROD002", description="Product 2", product_type="Type B"),
         ]
 
-    @patch("main.boto3")
-    @patch("main.download_file_from_s3")
-    @patch("main.read_products_from_csv")
+    @patch("main.clients")
+    @patch("main.open_s3_text")
+    @patch("main.read_products")
     @patch("main.write_products_to_dynamo")
     @patch.dict(os.environ, {"TABLE_NAME": "test-table"})
     def test_handler_success(
-        self, mock_write_products, mock_read_products, mock_download, mock_boto3
+        self, mock_write_products, mock_read_products, mock_open, mock_clients
     ):
         """Test successful handler execution"""
-        temp_file = "/tmp/test.csv"
-        mock_download.return_value = temp_file
+        csvfile = io.StringIO("")
+        mock_open.return_value.__enter__.return_value = csvfile
         mock_read_products.return_value = self.sample_products
 
         mock_write_result = DBWriteResult(successful_inserts=2, failed_inserts=0)
         mock_write_products.return_value = mock_write_result
 
-        with patch("main.os.path.exists", return_value=True), patch(
-            "main.os.unlink"
-        ) as mock_unlink:
-
-            result = handler(self.valid_s3_event, None)
+        result = handler(self.valid_s3_event, None)
 
         self.assertEqual(result["statusCode"], 200)
-        self.assertEqual(result["body"]["total"], 2)
-        self.assertEqual(result["body"]["successful_inserts"], 2)
-        self.assertEqual(result["body"]["failed_inserts"], 0)
+        self.assertEqual(result["body"]["files"][0]["body"]["total"], 2)
+        self.assertEqual(result["body"]["files"][0]["body"]["successful_inserts"], 2)
+        self.assertEqual(result["body"]["files"][0]["body"]["failed_inserts"], 0)
 
-        mock_download.assert_called_once()
-        mock_read_products.assert_called_once_with(temp_file)
+        mock_open.assert_called_once()
+        self.assertEqual(mock_open.call_args[0][1:3], ("test-bucket", "products.csv"))
+        mock_read_products.assert_called_once_with(csvfile)
         mock_write_products.assert_called_once()
-        mock_unlink.assert_called_once_with(temp_file)
 
-    @patch("main.boto3")
+    @patch("main.clients")
+    @patch("main.write_products_to_dynamo")
+    @patch.dict(os.environ, {"TABLE_NAME": "test-table", "RECONCILE": "true"})
+    def test_handler_rejects_invalid_scan_segments(
+        self, mock_write_products, mock_clients
+    ):
+        """Test that a bad SCAN_SEGMENTS fails before any product is written"""
+        for value in ["0", "-2", "eight"]:
+            with patch.dict(os.environ, {"SCAN_SEGMENTS": value}):
+                with self.assertRaisesRegex(EnvironmentError, "SCAN_SEGMENTS"):
+                    handler(self.valid_s3_event, None)
+
+        mock_write_products.assert_not_called()
+
+    @patch("main.clients")
     @patch.dict(os.environ, {"TABLE_NAME": "test-table"})
-    def test_handler_invalid_event(self, mock_boto3):
+    def test_handler_invalid_event(self, mock_clients):
         """Test handler with invalid event structure"""
         invalid_event = {"Records": []}
 
@@ -312,113 +318,358 @@ class TestHandler(unittest.TestCase):
         self.assertIn("error", result["body"])
         self.assertEqual(result["body"]["error"], "Invalid event structure")
 
-    @patch("main.boto3")
-    @patch("main.download_file_from_s3")
+    @patch("main.clients")
+    @patch("main.open_s3_text")
     @patch.dict(os.environ, {"TABLE_NAME": "test-table"})
-    def test_handler_download_error(self, mock_download, mock_boto3):
+    def test_handler_download_error(self, mock_open, mock_clients):
         """Test handler when S3 download fails"""
-        mock_download.side_effect = Exception("Download failed")
+        mock_open.side_effect = Exception("Download failed")
 
         result = handler(self.valid_s3_event, None)
 
         self.assertEqual(result["statusCode"], 500)
-        self.assertIn("error", result["body"])
-        self.assertIn("Download failed", result["body"]["error"])
+        self.assertIn("error", result["body"]["files"][0]["body"])
+        self.assertIn("Download failed", result["body"]["files"][0]["body"]["error"])
 
-    @patch("main.boto3")
-    @patch("main.download_file_from_s3")
-    @patch("main.read_products_from_csv")
+    @patch("main.clients")
+    @patch("main.open_s3_text")
+    @patch("main.read_products")
     @patch.dict(os.environ, {"TABLE_NAME": "test-table"})
-    def test_handler_csv_read_error(
-        self, mock_read_products, mock_download, mock_boto3
-    ):
+    def test_handler_csv_read_error(self, mock_read_products, mock_open, mock_clients):
         """Test handler when CSV reading fails"""
-        temp_file = "/tmp/test.csv"
-        mock_download.return_value = temp_file
         mock_read_products.side_effect = Exception("CSV parsing error")
 
-        with patch("main.os.path.exists", return_value=True), patch(
-            "main.os.unlink"
-        ) as mock_unlink:
-
-            result = handler(self.valid_s3_event, None)
+        result = handler(self.valid_s3_event, None)
 
         self.assertEqual(result["statusCode"], 500)
-        self.assertIn("error", result["body"])
-        self.assertIn("CSV parsing error", result["body"]["error"])
-        mock_unlink.assert_called_once_with(temp_file)
+        self.assertIn("error", result["body"]["files"][0]["body"])
+        self.assertIn("CSV parsing error", result["body"]["files"][0]["body"]["error"])
+        mock_open.return_value.__exit__.assert_called_once()
 
-    @patch("main.boto3")
-    @patch("main.download_file_from_s3")
-    @patch("main.read_products_from_csv")
+    @patch("main.clients")
+    @patch("main.open_s3_text")
+    @patch("main.read_products")
     @patch("main.write_products_to_dynamo")
     @patch.dict(os.environ, {"TABLE_NAME": "test-table"})
     def test_handler_dynamo_write_error(
-        self, mock_write_products, mock_read_products, mock_download, mock_boto3
+        self, mock_write_products, mock_read_products, mock_open, mock_clients
     ):
         """Test handler when DynamoDB write fails"""
-        temp_file = "/tmp/test.csv"
-        mock_download.return_value = temp_file
         mock_read_products.return_value = self.sample_products
         mock_write_products.side_effect = Exception("DynamoDB error")
 
-        with patch("main.os.path.exists", return_value=True), patch(
-            "main.os.unlink"
-        ) as mock_unlink:
-
-            result = handler(self.valid_s3_event, None)
+        result = handler(self.valid_s3_event, None)
 
         self.assertEqual(result["statusCode"], 500)
-        self.assertIn("error", result["body"])
-        self.assertIn("DynamoDB error", result["body"]["error"])
-        mock_unlink.assert_called_once_with(temp_file)
+        self.assertIn("error", result["body"]["files"][0]["body"])
+        self.assertIn("DynamoDB error", result["body"]["files"][0]["body"]["error"])
 
-    @patch("main.boto3")
-    @patch("main.download_file_from_s3")
-    @patch("main.read_products_from_csv")
+    @patch("main.clients")
+    @patch("main.open_s3_text")
+    @patch("main.read_products")
     @patch("main.write_products_to_dynamo")
     @patch.dict(os.environ, {"TABLE_NAME": "test-table"})
     def test_handler_partial_success(
-        self, mock_write_products, mock_read_products, mock_download, mock_boto3
+        self, mock_write_products, mock_read_products, mock_open, mock_clients
     ):
         """Test handler with partial write success"""
-        temp_file = "/tmp/test.csv"
-        mock_download.return_value = temp_file
         mock_read_products.return_value = self.sample_products
 
         mock_write_result = DBWriteResult(successful_inserts=1, failed_inserts=1)
         mock_write_products.return_value = mock_write_result
 
-        with patch("main.os.path.exists", return_value=True), patch("main.os.unlink"):
+        result = handler(self.valid_s3_event, None)
 
-            result = handler(self.valid_s3_event, None)
+        self.assertEqual(result["statusCode"], 200)
+        self.assertEqual(result["body"]["files"][0]["body"]["total"], 2)
+        self.assertEqual(result["body"]["files"][0]["body"]["successful_inserts"], 1)
+        self.assertEqual(result["body"]["files"][0]["body"]["failed_inserts"], 1)
+
+    @patch("main.clients")
+    @patch("main.read_products")
+    @patch("main.write_products_to_dynamo")
+    @patch.dict(os.environ, {"TABLE_NAME": "test-table"})
+    def test_handler_streams_object_body(
+        self, mock_write_products, mock_read_products, mock_clients
+    ):
+        """Test that the object body is streamed and closed without a temp file"""
+        body = io.BytesIO(b"PROD001,Product 1,Type A\n")
+        mock_s3_client = mock_clients.get_client.return_value
+        mock_s3_client.get_object.return_value = {"Body": body}
+        mock_read_products.side_effect = lambda csvfile: [
+            Product(id="PROD001") for _ in csvfile
+        ]
+        mock_write_products.return_value = DBWriteResult(1, 0)
+
+        result = handler(self.valid_s3_event, None)
 
         self.assertEqual(result["statusCode"], 200)
-        self.assertEqual(result["body"]["total"], 2)
-        self.assertEqual(result["body"]["successful_inserts"], 1)
-        self.assertEqual(result["body"]["failed_inserts"], 1)
+        self.assertEqual(result["body"]["files"][0]["body"]["total"], 1)
+        mock_s3_client.download_fileobj.assert_not_called()
+        self.assertTrue(body.closed)
 
-    @patch("main.boto3")
-    @patch("main.download_file_from_s3")
-    @patch("main.read_products_from_csv")
+    @patch("main.clients")
+    @patch("main.open_s3_text")
+    @patch("main.read_products")
     @patch("main.write_products_to_dynamo")
     @patch.dict(os.environ, {"TABLE_NAME": "test-table"})
-    def test_handler_temp_file_cleanup(
-        self, mock_write_products, mock_read_products, mock_download, mock_boto3
+    def test_handler_processes_every_record(
+        self, mock_write_products, mock_read_products, mock_open, mock_clients
     ):
-        """Test that temporary file is cleaned up even on error"""
-        temp_file = "/tmp/test.csv"
-        mock_download.return_value = temp_file
+        """Test that one bad file does not abort the others in the event"""
+        event = {
+            "Records": [
+                {
+                    "s3": {
+                        "bucket": {"name": "test-bucket"},
+                        "object": {"key": key},
+                    }
+                }
+                for key in ["good.csv", "bad.csv"]
+            ]
+        }
+
+        def open_s3_text(s3_client, bucket_name, object_key, encoding):
+            if object_key == "bad.csv":
+                raise Exception("Download failed")
+            return MagicMock()
+
+        mock_open.side_effect = open_s3_text
         mock_read_products.return_value = self.sample_products
-        mock_write_products.side_effect = Exception("Write error")
+        mock_write_products.return_value = DBWriteResult(2, 0)
+
+        result = handler(event, None)
+
+        self.assertEqual(result["statusCode"], 207)
+        files = {f["key"]: f for f in result["body"]["files"]}
+        self.assertEqual(files["good.csv"]["statusCode"], 200)
+        self.assertEqual(files["good.csv"]["body"]["total"], 2)
+        self.assertEqual(files["bad.csv"]["statusCode"], 500)
+        self.assertIn("Download failed", files["bad.csv"]["body"]["error"])
+
+
+class TestSyncState(unittest.TestCase):
+    """Tests for upload deduplication via the sync state table"""
+
+    def setUp(self):
+        self.s3_client = Mock()
+        self.s3_client.head_object.return_value = {
+            "ETag": '"abc123"',
+            "ContentLength": 100,
+        }
+        self.state_table = Mock()
+        self.version = ObjectVersion(
+            bucket="bucket",
+            key="products.csv",
+            etag="abc123",
+            size=100,
+            sequencer=normalize_sequencer("0055AED6DCD90281E5"),
+        )
+
+    def test_parse_event_object_version(self):
+        """Test the ETag, size and sequencer are read from the event"""
+        event = {
+            "Records": [
+                {
+                    "s3": {
+                        "bucket": {"name": "bucket"},
+                        "object": {
+                            "key": "products.csv",
+                            "eTag": "abc123",
+                            "size": 100,
+                            "sequencer": "0055AED6DCD90281E5",
+                        },
+                    }
+                }
+            ]
+        }
+
+        [version] = parse_s3_event(event)
+
+        self.assertEqual(version, self.version)
+        self.assertEqual(len(version.sequencer), 32)
+
+    def test_normalize_sequencer_right_pads_shorter_values(self):
+        """Test that sequencers of different lengths compare as S3 specifies"""
+        self.assertEqual(normalize_sequencer("ff"), "FF".ljust(32, "0"))
+        self.assertLess(normalize_sequencer("100"), normalize_sequencer("FF"))
+        self.assertLess(
+            normalize_sequencer("0055AED6DCD90281E5"),
+            normalize_sequencer("0055AED6DCD90281E5A"),
+        )
+        self.assertEqual(normalize_sequencer("10"), normalize_sequencer("100"))
+        self.assertEqual(normalize_sequencer(""), "")
+
+    def test_process_when_no_state(self):
+        """Test that the first upload is always processed"""
+        self.state_table.get_item.return_value = {}
+
+        self.assertIsNone(
+            check_sync_state(self.s3_client, self.state_table, "t", self.version)
+        )
+
+    def test_skip_unchanged_object(self):
+        """Test that a byte-identical upload is skipped"""
+        self.state_table.get_item.return_value = {
+            "Item": {"object_key": "other.csv", "etag": "abc123", "size": 100}
+        }
+
+        reason = check_sync_state(self.s3_client, self.state_table, "t", self.version)
+
+        self.assertEqual(reason, "unchanged")
+
+    def test_skip_superseded_object(self):
+        """Test that an upload overwritten by a newer one is dropped"""
+        self.s3_client.head_object.return_value = {
+            "ETag": '"newer"',
+            "ContentLength": 120,
+        }
+
+        reason = check_sync_state(self.s3_client, self.state_table, "t", self.version)
+
+        self.assertEqual(reason, "superseded")
+        self.state_table.get_item.assert_not_called()
+
+    def test_skip_stale_event(self):
+        """Test that an event older than the recorded one is dropped"""
+        self.state_table.get_item.return_value = {
+            "Item": {
+                "object_key": "products.csv",
+                "etag": "zzz",
+                "size": 1,
+                "sequencer": normalize_sequencer("0055AED6DCD90281F0"),
+            }
+        }
+
+        reason = check_sync_state(self.s3_client, self.state_table, "t", self.version)
+
+        self.assertEqual(reason, "stale")
+
+    def test_process_changed_object(self):
+        """Test that a new version is processed"""
+        self.state_table.get_item.return_value = {
+            "Item": {
+                "object_key": "products.csv",
+                "etag": "old",
+                "size": 90,
+                "sequencer": normalize_sequencer("0055AED6DCD90281A0"),
+            }
+        }
+
+        self.assertIsNone(
+            check_sync_state(self.s3_client, self.state_table, "t", self.version)
+        )
+
+    def test_record_sync_state_is_conditional(self):
+        """Test that the state is written with a sequencer guard"""
+        self.assertTrue(record_sync_state(self.state_table, "t", self.version))
+
+        kwargs = self.state_table.put_item.call_args.kwargs
+        self.assertEqual(kwargs["Item"]["id"], "t")
+        self.assertEqual(kwargs["Item"]["etag"], "abc123")
+        self.assertIn("ConditionExpression", kwargs)
+
+    def test_record_sync_state_newer_already_recorded(self):
+        """Test that losing the conditional write is not an error"""
+        self.state_table.put_item.side_effect = ClientError(
+            {"Error": {"Code": "ConditionalCheckFailedException", "Message": ""}},
+            "PutItem",
+        )
+
+        self.assertFalse(record_sync_state(self.state_table, "t", self.version))
+
+    @patch("main.clients")
+    @patch("main.check_sync_state", return_value="unchanged")
+    @patch("main.open_s3_text")
+    @patch.dict(
+        os.environ, {"TABLE_NAME": "test-table", "SYNC_STATE_TABLE_NAME": "state"}
+    )
+    def test_handler_skips_unchanged_upload(
+        self, mock_open, mock_check, mock_clients
+    ):
+        """Test the handler does no work for a duplicate upload"""
+        event = {
+            "Records": [
+                {
+                    "s3": {
+                        "bucket": {"name": "test-bucket"},
+                        "object": {"key": "products.csv"},
+                    }
+                }
+            ]
+        }
+
+        result = handler(event, None)
+
+        self.assertEqual(result["statusCode"], 200)
+        self.assertEqual(result["body"]["files"][0]["body"], {"skipped": True, "reason": "unchanged"})
+        mock_open.assert_not_called()
+
+
+class TestReconcileProducts(unittest.TestCase):
+    """Tests for deleting products missing from the uploaded file"""
+
+    def setUp(self):
+        self.dynamo_client = Mock()
+        pages_by_segment = {
+            0: [{"Items": [{"id": {"S": "PROD001"}}, {"id": {"S": "OLD001"}}]}],
+            1: [
+                {"Items": [{"id": {"S": "PROD002"}}]},
+                {"Items": [{"id": {"S": "OLD002"}}]},
+            ],
+        }
+        paginator = Mock()
+        paginator.paginate.side_effect = lambda **kwargs: pages_by_segment[
+            kwargs["Segment"]
+        ]
+        self.dynamo_client.get_paginator.return_value = paginator
+        self.dynamo_client.batch_write_item.return_value = {"UnprocessedItems": {}}
+        self.products = [
+            Product(id="PROD001", description="Product 1", product_type="Type A"),
+            Product(id="PROD002", description="Product 2", product_type="Type B"),
+        ]
+
+    def test_deletes_orphaned_products(self):
+        """Test that only keys missing from the file are deleted"""
+        result = reconcile_products(
+            self.dynamo_client, "products", self.products, total_segments=2
+        )
+
+        self.assertEqual(result.scanned, 4)
+        self.assertEqual(result.orphaned, 2)
+        self.assertEqual(result.deleted, 2)
+        self.assertEqual(result.failed_deletes, 0)
+        request_items = self.dynamo_client.batch_write_item.call_args.kwargs[
+            "RequestItems"
+        ]["products"]
+        deleted_ids = {r["DeleteRequest"]["Key"]["id"]["S"] for r in request_items}
+        self.assertEqual(deleted_ids, {"OLD001", "OLD002"})
+
+    def test_scan_projects_only_the_key(self):
+        """Test that each segment scan projects the id attribute only"""
+        reconcile_products(self.dynamo_client, "products", self.products, 2)
+
+        paginate = self.dynamo_client.get_paginator.return_value.paginate
+        self.assertEqual(paginate.call_count, 2)
+        for call in paginate.call_args_list:
+            self.assertEqual(call.kwargs["ProjectionExpression"], "#id")
+            self.assertEqual(call.kwargs["TotalSegments"], 2)
+
+    def test_counts_unprocessed_deletes(self):
+        """Test that deletes left unprocessed after retries are reported"""
+        self.dynamo_client.batch_write_item.side_effect = Exception("Throttled")
+
+        result = reconcile_products(self.dynamo_client, "products", self.products, 2)
 
-        with patch("main.os.path.exists", return_value=True), patch(
-            "main.os.unlink"
-        ) as mock_unlink:
+        self.assertEqual(result.deleted, 0)
+        self.assertEqual(result.failed_deletes, 2)
 
-            handler(self.valid_s3_event, None)
+    def test_empty_file_deletes_nothing(self):
+        """Test that an empty upload never wipes the catalog"""
+        result = reconcile_products(self.dynamo_client, "products", [], 2)
 
-            mock_unlink.assert_called_once_with(temp_file)
+        self.assertEqual(result.orphaned, 0)
+        self.dynamo_client.get_paginator.assert_not_called()
 
 
 class TestProductModel(unittest.TestCase):
@@ -432,9 +683,9 @@ class TestProductModel(unittest.TestCase):
 
         dynamo_item = product.to_dynamo_item()
 
-        self.assertEqual(dynamo_item["id"]["S"], "PROD001")
-        self.assertEqual(dynamo_item["description"]["S"], "Test Product")
-        self.assertEqual(dynamo_item["product_type"]["S"], "Type A")
+        self.assertEqual(dynamo_item["id"], "PROD001")
+        self.assertEqual(dynamo_item["description"], "Test Product")
+        self.assertEqual(dynamo_item["product_type"], "Type A")
 
     def test_product_default_values(self):
         """Test Product with default values"""
@@ -0,0 +1,163 @@
+import io
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+
+import storage
+from storage import ObjectChangedError, open_s3_object, open_s3_text
+from utils import read_products
+
+
+class FakeS3Client:
+    """Serves a single object from memory, honouring Range and IfMatch requests"""
+
+    def __init__(self, data: bytes, etag: str = '"v1"'):
+        self.data = data
+        self.etag = etag
+        self.heads = 0
+        self.ranges = []
+        self.conditions = []
+
+    def head_object(self, Bucket, Key):
+        self.heads += 1
+        return {"ContentLength": len(self.data), "ETag": self.etag}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        self.conditions.append(IfMatch)
+        if IfMatch is not None and IfMatch != self.etag:
+            raise ClientError(
+                {"Error": {"Code": "PreconditionFailed", "Message": "ETag mismatch"}},
+                "GetObject",
+            )
+        data = self.data
+        if Range:
+            start, end = (int(part) for part in Range[len("bytes=") :].split("-"))
+            self.ranges.append((start, end))
+            data = data[start : end + 1]
+        return {"Body": io.BytesIO(data)}
+
+
+class TestOpenS3Object(unittest.TestCase):
+    """Tests for open_s3_object function"""
+
+    def setUp(self):
+        self.data = bytes(range(256)) * 40
+
+    @patch.dict(os.environ, {"SPOOL_MAX_BYTES": "1048576"})
+    def test_small_object_is_spooled(self):
+        s3_client = FakeS3Client(self.data)
+
+        with open_s3_object(s3_client, "bucket", "key") as fileobj:
+            self.assertEqual(fileobj.read(), self.data)
+
+        self.assertEqual(s3_client.ranges, [])
+        self.assertEqual(s3_client.conditions, ['"v1"'])
+
+    @patch.dict(
+        os.environ, {"SPOOL_MAX_BYTES": "100", "IN_MEMORY_MAX_BYTES": "1048576"}
+    )
+    @patch.object(storage, "RANGE_PART_BYTES", 1000)
+    def test_large_object_uses_ranged_gets(self):
+        s3_client = FakeS3Client(self.data)
+
+        with open_s3_object(s3_client, "bucket", "key") as fileobj:
+            self.assertEqual(fileobj.read(), self.data)
+            fileobj.seek(5000)
+            self.assertEqual(fileobj.read(10), self.data[5000:5010])
+
+        self.assertEqual(len(s3_client.ranges), 11)
+        self.assertEqual(s3_client.ranges[-1], (10000, 10239))
+
+    @patch.dict(
+        os.environ, {"SPOOL_MAX_BYTES": "100", "IN_MEMORY_MAX_BYTES": "1048576"}
+    )
+    @patch.object(storage, "RANGE_PART_BYTES", 1000)
+    def test_every_ranged_get_is_conditional_on_the_etag(self):
+        s3_client = FakeS3Client(self.data)
+
+        with open_s3_object(
+            s3_client, "bucket", "key", size=len(self.data), etag="v1"
+        ) as fileobj:
+            self.assertEqual(fileobj.read(), self.data)
+
+        self.assertEqual(s3_client.heads, 0)
+        self.assertEqual(s3_client.conditions, ['"v1"'] * 11)
+
+    @patch.dict(
+        os.environ, {"SPOOL_MAX_BYTES": "100", "IN_MEMORY_MAX_BYTES": "1048576"}
+    )
+    @patch.object(storage, "RANGE_PART_BYTES", 1000)
+    def test_object_overwritten_during_download_raises(self):
+        s3_client = FakeS3Client(self.data)
+        get_object = s3_client.get_object
+
+        def overwrite_after_first_range(**kwargs):
+            response = get_object(**kwargs)
+            s3_client.etag = '"v2"'
+            return response
+
+        s3_client.get_object = overwrite_after_first_range
+
+        with self.assertRaises(ObjectChangedError):
+            with open_s3_object(s3_client, "bucket", "key"):
+                pass
+
+    @patch.dict(os.environ, {"SPOOL_MAX_BYTES": "100", "IN_MEMORY_MAX_BYTES": "1000"})
+    @patch.object(storage, "RANGE_PART_BYTES", 4096)
+    def test_very_large_object_is_file_backed(self):
+        s3_client = FakeS3Client(self.data)
+
+        with patch(
+            "storage.tempfile.TemporaryFile", wraps=storage.tempfile.TemporaryFile
+        ) as mock_tmp:
+            with open_s3_object(s3_client, "bucket", "key") as fileobj:
+                self.assertEqual(fileobj.read(), self.data)
+
+        mock_tmp.assert_called_once()
+
+    @patch.dict(
+        os.environ, {"SPOOL_MAX_BYTES": "100", "IN_MEMORY_MAX_BYTES": "1048576"}
+    )
+    def test_truncated_range_raises(self):
+        s3_client = FakeS3Client(self.data)
+        s3_client.get_object = MagicMock(return_value={"Body": io.BytesIO(b"short")})
+
+        with self.assertRaises(IOError):
+            with open_s3_object(s3_client, "bucket", "key", size=len(self.data)):
+                pass
+
+
+class TestOpenS3Text(unittest.TestCase):
+    """Tests for open_s3_text function"""
+
+    def open_text(self, data: bytes):
+        self.body = io.BytesIO(data)
+        s3_client = MagicMock()
+        s3_client.get_object.return_value = {"Body": self.body}
+        return open_s3_text(s3_client, "bucket", "key", "latin-1")
+
+    def test_decodes_body_and_closes_it(self):
+        with self.open_text("ID1,Caf\xe9\nID2,Té\n".encode("latin-1")) as textfile:
+            lines = list(textfile)
+
+        self.assertEqual(lines, ["ID1,Caf\xe9\n", "ID2,Té\n"])
+        self.assertTrue(self.body.closed)
+
+    def test_control_characters_do_not_end_a_line(self):
+        # 0x85 is "…" in cp1252; str.splitlines() would break on it
+        header = ",,,Clave,Descripcion" + "," * 9 + ",Tipo\r\n"
+        quoted = ',,,GP7145,"Codo 90\x85 cobre"' + "," * 9 + ",Conexiones\r\n"
+        unquoted = ",,,GP7146,Tee\x85 cobre" + "," * 9 + ",Conexiones\r\n"
+
+        with self.open_text((header + quoted + unquoted).encode("latin-1")) as f:
+            products = read_products(f)
+
+        self.assertEqual(
+            [(product.id, product.description) for product in products],
+            [("GP7145", "Codo 90\x85 cobre"), ("GP7146", "Tee\x85 cobre")],
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
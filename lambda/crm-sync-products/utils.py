@@ -1,12 +1,27 @@
 import os
 import csv
 import logging
-from typing import List
-from model import Product, DBWriteResult
-from mypy_boto3_dynamodb.service_resource import Table
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Iterable, List, Optional, FrozenSet, Tuple
+from boto3.dynamodb.conditions import Attr
+from botocore.exceptions import ClientError
+from model import Product, DBWriteResult, ObjectVersion, ReconcileResult
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb import DynamoDBClient
+    from mypy_boto3_dynamodb.service_resource import Table
+    from mypy_boto3_s3 import S3Client
 
 logger = logging.getLogger(__name__)
 
+SEQUENCER_WIDTH = 32
+CSV_ENCODING = "latin-1"
+BATCH_SIZE = 25
+MAX_BATCH_RETRIES = 5
+DEFAULT_SCAN_SEGMENTS = 8
+
 
 def safe_get_env(var_name: str) -> str:
     value = os.getenv(var_name)
@@ -15,44 +30,52 @@ def safe_get_env(var_name: str) -> str:
     return value
 
 
-def read_products_from_csv(file_path: str) -> List[Product]:
+def read_products(csvfile: Iterable[str]) -> List[Product]:
     """
-    Reads products from a CSV file.
+    Reads products from the lines of a CSV export, e.g. an open file or a
+    decoded S3 stream.
     """
     products = []
-    with open(file_path, mode="r", encoding="latin-1") as csvfile:
-        reader = csv.reader(csvfile)
-        header_found = False
-        for row in reader:
-            if not row:
-                continue
-            if len(row) > 3 and row[3] == "Clave":
-                header_found = True
-                break
-
-        if not header_found:
-            return []
-        for row in reader:
-            if not row:
-                continue
-            if len(row) <= 14:
-                continue
-
-            id_ = row[3].strip()
-            if not id_:
-                continue
-
-            description = row[4].strip()
-            product_type = row[14].strip()
-
-            products.append(
-                Product(id=id_, description=description, product_type=product_type)
-            )
+    reader = csv.reader(csvfile)
+    header_found = False
+    for row in reader:
+        if not row:
+            continue
+        if len(row) > 3 and row[3] == "Clave":
+            header_found = True
+            break
+
+    if not header_found:
+        return []
+    for row in reader:
+        if not row:
+            continue
+        if len(row) <= 14:
+            continue
+
+        id_ = row[3].strip()
+        if not id_:
+            continue
+
+        description = row[4].strip()
+        product_type = row[14].strip()
+
+        products.append(
+            Product(id=id_, description=description, product_type=product_type)
+        )
 
     return products
 
 
-def write_products_to_dynamo(products: List[Product], table: Table) -> DBWriteResult:
+def read_products_from_csv(file_path: str) -> List[Product]:
+    """
+    Reads products from a CSV file.
+    """
+    with open(file_path, mode="r", encoding=CSV_ENCODING) as csvfile:
+        return read_products(csvfile)
+
+
+def write_products_to_dynamo(products: List[Product], table: "Table") -> DBWriteResult:
     """
     Writes a list of products to a DynamoDB table.
     """
@@ -67,3 +90,197 @@ def write_products_to_dynamo(products: List[Product], table: Table) -> DBWriteRe
                 logger.error(f"Error writing product {product.id} to DynamoDB: {e}")
                 error_count += 1
     return DBWriteResult(successful_inserts=success_count, failed_inserts=error_count)
+
+
+def normalize_sequencer(sequencer: str) -> str:
+    """
+    Right-pads an S3 event sequencer with zeros, as S3 specifies for comparing
+    sequencers of different lengths, so that plain string comparison orders the
+    events of a key.
+    """
+    if not sequencer:
+        return ""
+    return sequencer.upper().ljust(SEQUENCER_WIDTH, "0")
+
+
+def check_sync_state(
+    s3_client: "S3Client", state_table: "Table", table_name: str, version: ObjectVersion
+) -> Optional[str]:
+    """
+    Compares an uploaded object against the last processed version recorded for
+    the target table. Returns the reason the sync should be skipped, or None when
+    the object must be processed.
+    """
+    head = s3_client.head_object(Bucket=version.bucket, Key=version.key)
+    current_etag = head["ETag"].strip('"')
+    if version.etag and version.etag != current_etag:
+        logger.info(
+            f"s3://{version.bucket}/{version.key} was overwritten since this event "
+            f"(event ETag {version.etag}, current {current_etag})"
+        )
+        return "superseded"
+    version.etag = current_etag
+    version.size = int(head.get("ContentLength", version.size))
+
+    state = state_table.get_item(Key={"id": table_name}, ConsistentRead=True).get(
+        "Item"
+    )
+    if not state:
+        return None
+    if (
+        version.sequencer
+        and state.get("object_key") == version.key
+        and str(state.get("sequencer", "")) >= version.sequencer
+    ):
+        return "stale"
+    if state.get("etag") == version.etag and int(state.get("size", -1)) == version.size:
+        return "unchanged"
+    return None
+
+
+def record_sync_state(
+    state_table: "Table", table_name: str, version: ObjectVersion
+) -> bool:
+    """
+    Records the object version that was just synced into the target table.
+    A newer version of the same key that was recorded concurrently is never
+    overwritten.
+    """
+    item = {
+        "id": table_name,
+        "bucket": version.bucket,
+        "object_key": version.key,
+        "etag": version.etag,
+        "size": version.size,
+        "sequencer": version.sequencer,
+        "processed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        if version.sequencer:
+            state_table.put_item(
+                Item=item,
+                ConditionExpression=Attr("id").not_exists()
+                | Attr("object_key").ne(version.key)
+                | Attr("sequencer").lt(version.sequencer),
+            )
+        else:
+            state_table.put_item(Item=item)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":  # type: ignore
+            raise
+        logger.info(f"A newer version of {version.key} was already recorded")
+        return False
+
+
+def _scan_orphans_in_segment(
+    dynamo_client: "DynamoDBClient",
+    table_name: str,
+    keep_ids: FrozenSet[str],
+    segment: int,
+    total_segments: int,
+) -> Tuple[int, List[str]]:
+    """
+    Scans one segment of the table projecting only the key, and returns the
+    number of keys seen along with the ones missing from keep_ids.
+    """
+    scanned = 0
+    orphans: List[str] = []
+    paginator = dynamo_client.get_paginator("scan")
+    for page in paginator.paginate(
+        TableName=table_name,
+        ProjectionExpression="#id",
+        ExpressionAttributeNames={"#id": "id"},
+        Segment=segment,
+        TotalSegments=total_segments,
+    ):
+        for item in page.get("Items", []):
+            scanned += 1
+            product_id = item["id"]["S"]
+            if product_id not in keep_ids:
+                orphans.append(product_id)
+    return scanned, orphans
+
+
+def _delete_batch(
+    dynamo_client: "DynamoDBClient", table_name: str, product_ids: List[str]
+) -> int:
+    """
+    Deletes up to 25 products in one BatchWriteItem call, retrying unprocessed
+    keys with exponential backoff. Returns the number of keys left undeleted.
+    """
+    requests = [
+        {"DeleteRequest": {"Key": {"id": {"S": product_id}}}}
+        for product_id in product_ids
+    ]
+    try:
+        for attempt in range(MAX_BATCH_RETRIES):
+            response = dynamo_client.batch_write_item(
+                RequestItems={table_name: requests}
+            )
+            requests = response.get("UnprocessedItems", {}).get(table_name, [])
+            if not requests:
+                return 0
+            time.sleep(min(0.05 * 2**attempt, 1.0))
+        logger.error(f"{len(requests)} deletes still unprocessed after retries")
+    except Exception as e:
+        logger.error(f"Error deleting products from DynamoDB: {e}")
+    return len(requests)
+
+
+def reconcile_products(
+    dynamo_client: "DynamoDBClient",
+    table_name: str,
+    products: List[Product],
+    total_segments: int = DEFAULT_SCAN_SEGMENTS,
+) -> ReconcileResult:
+    """
+    Deletes products that exist in the table but not in the uploaded file.
+    Keys are read with a parallel segmented scan and diffed against the file
+    as they stream in, so only the orphaned keys are held in memory.
+    """
+    result = ReconcileResult()
+    keep_ids = frozenset(product.id for product in products)
+    if not keep_ids:
+        logger.warning("Uploaded file has no products; skipping reconciliation")
+        return result
+
+    scan_start = time.perf_counter()
+    orphans: List[str] = []
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        futures = [
+            executor.submit(
+                _scan_orphans_in_segment,
+                dynamo_client,
+                table_name,
+                keep_ids,
+                segment,
+                total_segments,
+            )
+            for segment in range(total_segments)
+        ]
+        for future in futures:
+            scanned, segment_orphans = future.result()
+            result.scanned += scanned
+            orphans.extend(segment_orphans)
+    result.scan_seconds = time.perf_counter() - scan_start
+    result.orphaned = len(orphans)
+    logger.info(
+        f"Scanned {result.scanned} keys in {result.scan_seconds:.2f}s, "
+        f"found {result.orphaned} orphaned products"
+    )
+
+    delete_start = time.perf_counter()
+    batches = [orphans[i : i + BATCH_SIZE] for i in range(0, len(orphans), BATCH_SIZE)]
+    with ThreadPoolExecutor(max_workers=total_segments) as executor:
+        for failed in executor.map(
+            lambda batch: _delete_batch(dynamo_client, table_name, batch), batches
+        ):
+            result.failed_deletes += failed
+    result.deleted = result.orphaned - result.failed_deletes
+    result.delete_seconds = time.perf_counter() - delete_start
+    logger.info(
+        f"Deleted {result.deleted} orphaned products in {result.delete_seconds:.2f}s, "
+        f"{result.failed_deletes} failed"
+    )
+    return result
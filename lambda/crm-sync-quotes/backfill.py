@@ -0,0 +1,361 @@
+"""
+Reprocesses ERP exports from the command line, e.g. after a mailer outage.
+
+Each ZIP is parsed and filtered in a process pool as of its own date, taken
+from a manifest, from a date in the file name or from --as-of, in that order.
+The parent walks the files in date order and keeps a single set of the quote
+IDs and cadence steps already emailed, so each step of a quote is sent at most
+once across all files (and across runs with --dedup-file, which a dry run
+leaves untouched). With --through, each file also catches up on
+the quotes due on every day after its as-of date up to that date, from the
+same parse. Nothing is sent unless --send is given.
+
+    python backfill.py exports/ --as-of 2024-06-01
+    python backfill.py exports/*.zip --manifest dates.csv --send --dedup-file sent.txt
+    python backfill.py export.zip --as-of 2024-06-01 --through 2024-06-30
+"""
+
+import argparse
+import csv
+import logging
+import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, Iterator, List, Optional, Sequence, Set, Tuple
+from filter import QuoteFilter
+from model import Quote, SalesRep
+from parser import QuoteParser
+from sales_reps import load_sales_reps_from_csv
+from main import (
+    ALLOW_LIST_PATH,
+    DOMANAIN,
+    EMAIL_CADENCE_DAYS,
+    PRODUCTS_TABLE_NAME,
+    SALES_REPS_PATH,
+    SENDER,
+    TABLE_NAME,
+    TEMPLATE_PATH,
+)
+
+logger = logging.getLogger(__name__)
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+FILENAME_DATE = re.compile(r"(\d{4})-?(\d{2})-?(\d{2})")
+
+_sales_reps: Dict[str, SalesRep] = {}
+
+
+@dataclass
+class FileJob:
+    path: str
+    as_of: datetime
+    through: Optional[datetime] = None
+
+
+@dataclass
+class FileResult:
+    path: str
+    as_of: datetime
+    quotes: int = 0
+    # Due quotes with the cadence step (days after creation) they are due for
+    due: List[Tuple[Quote, int]] = field(default_factory=list)
+    error: Optional[str] = None
+
+
+def parse_date(value: str) -> datetime:
+    return datetime.fromisoformat(value.strip())
+
+
+def date_from_filename(path: str) -> Optional[datetime]:
+    match = FILENAME_DATE.search(os.path.basename(path))
+    if not match:
+        return None
+    try:
+        return datetime(*map(int, match.groups()))
+    except ValueError:
+        return None
+
+
+def find_zips(paths: Sequence[str]) -> Iterator[str]:
+    for path in paths:
+        if os.path.isdir(path):
+            for name in sorted(os.listdir(path)):
+                if name.lower().endswith(".zip"):
+                    yield os.path.join(path, name)
+        else:
+            yield path
+
+
+def read_manifest(manifest_path: str) -> Dict[str, datetime]:
+    """Reads a CSV with `path` and `as_of` columns into as-of dates by absolute path."""
+    with open(manifest_path, "r", encoding="utf-8", newline="") as f:
+        return {
+            os.path.abspath(row["path"]): parse_date(row["as_of"])
+            for row in csv.DictReader(f)
+        }
+
+
+def plan_jobs(
+    paths: Sequence[str],
+    manifest: Dict[str, datetime],
+    default_as_of: Optional[datetime],
+    through: Optional[datetime] = None,
+) -> List[FileJob]:
+    """
+    Resolves the as-of date of every ZIP and orders them chronologically, so the
+    earliest due date of a quote found in several exports is the one emailed.
+    """
+    jobs = []
+    for path in find_zips(paths):
+        as_of = (
+            manifest.get(os.path.abspath(path))
+            or date_from_filename(path)
+            or default_as_of
+        )
+        if as_of is None:
+            raise ValueError(
+                f"No as-of date for {path}: add it to the manifest, "
+                "name the file with a date or pass --as-of"
+            )
+        jobs.append(FileJob(path, as_of, through))
+    return sorted(jobs, key=lambda job: (job.as_of, job.path))
+
+
+def init_worker(sales_reps_path: str, log_level: str) -> None:
+    logging.basicConfig(level=log_level)
+    _sales_reps.update(load_sales_reps_from_csv(sales_reps_path))
+
+
+def scan_file(job: FileJob, cadence: Set[int], allowlist_path: str) -> FileResult:
+    """Parses one ZIP and keeps the quotes due for an email on its as-of date."""
+    result = FileResult(job.path, job.as_of)
+    try:
+        quotes = QuoteParser(
+            job.path, SALES_REPS_PATH, _sales_reps
+        ).read_quotes_from_zip()
+        result.quotes = len(quotes)
+        quote_filter = QuoteFilter(quotes, cadence, allowlist_path)
+        if job.through is None:
+            result.due = [
+                (quote, (job.as_of - datetime.fromisoformat(quote.created_at)).days)
+                for quote in quote_filter.filter_quotes(now=job.as_of)
+            ]
+        else:
+            due = quote_filter.filter_quotes_between(
+                job.as_of.date(), job.through.date()
+            )
+            # Earliest send date first, so a step due in several files is sent
+            # from the first one
+            result.due = [
+                (quote, step)
+                for by_step in due.values()
+                for step in sorted(by_step)
+                for quote in by_step[step]
+            ]
+    except Exception as e:
+        logger.error(f"Error processing {job.path}: {e}", exc_info=True)
+        result.error = str(e)
+    return result
+
+
+def dedup_key(quote_id: str, step: int) -> str:
+    return f"{quote_id}:{step}"
+
+
+def load_dedup(dedup_path: Optional[str]) -> Set[str]:
+    """
+    Reads the "<quote id>:<step>" lines of a dedup file. A line holding only a
+    quote ID, as written by earlier versions, stands for all its steps.
+    """
+    if not dedup_path or not os.path.exists(dedup_path):
+        return set()
+    with open(dedup_path, "r", encoding="utf-8") as f:
+        return {line.strip() for line in f if line.strip()}
+
+
+class Backfill:
+    def __init__(
+        self,
+        send: bool = False,
+        seen: Optional[Set[str]] = None,
+        dedup_path: Optional[str] = None,
+        out=sys.stdout,
+    ) -> None:
+        self.send = send
+        self.seen: Set[str] = seen if seen is not None else set()
+        self.dedup_path = dedup_path
+        self.out = out
+        self._sender_options: Optional[Dict] = None
+
+    def _sender_kwargs(self) -> Dict:
+        if self._sender_options is None:
+            import clients
+            from issued_ids import IssuedIdsPublisher
+            from utils import safe_get_env
+
+            dynamodb = clients.get_resource("dynamodb")
+            self._sender_options = {
+                "template_path": os.path.join(BASE_DIR, TEMPLATE_PATH),
+                "sender_email": safe_get_env(SENDER),
+                "transactions_table": dynamodb.Table(safe_get_env(TABLE_NAME)),
+                "domain": safe_get_env(DOMANAIN),
+                "issued_ids": IssuedIdsPublisher.from_env(clients.get_client("s3")),
+            }
+        return self._sender_options
+
+    def _enrich(self, quotes: List[Quote]) -> None:
+        products_table_name = os.getenv(PRODUCTS_TABLE_NAME)
+        if not products_table_name:
+            return
+        import clients
+        from catalog import get_product_catalog
+
+        try:
+            catalog = get_product_catalog(
+                clients.get_client("dynamodb"), products_table_name
+            )
+            catalog.enrich(quotes)
+        except Exception as e:
+            logger.warning(f"Could not enrich quotes with product details: {e}")
+
+    def _deliver(self, quotes: List[Quote]) -> List[str]:
+        """Emails the quotes and returns the IDs of those actually sent."""
+        from sender import QuoteEmailSender
+
+        self._enrich(quotes)
+        email_sender = QuoteEmailSender(quotes=quotes, **self._sender_kwargs())
+        return [transaction.quote_id for transaction in email_sender.send_emails()]
+
+    def _is_sent(self, quote: Quote, step: int) -> bool:
+        return dedup_key(quote.id, step) in self.seen or quote.id in self.seen
+
+    def _remember(self, keys: List[str]) -> None:
+        """
+        Skips the keys for the rest of the run. Only a run that sends appends
+        them to the dedup file, so a dry run does not hide quotes from the next.
+        """
+        self.seen.update(keys)
+        if self.send and self.dedup_path and keys:
+            with open(self.dedup_path, "a", encoding="utf-8") as f:
+                f.writelines(f"{key}\n" for key in keys)
+
+    def handle(self, result: FileResult) -> Dict:
+        """Sends, or reports in a dry run, the due quotes not emailed by an earlier file."""
+        as_of = result.as_of.date().isoformat()
+        summary = {
+            "path": result.path,
+            "as_of": as_of,
+            "quotes": result.quotes,
+            "due": len(result.due),
+            "duplicates": 0,
+            "sent": 0,
+            "error": result.error,
+        }
+        if result.error:
+            print(
+                f"{result.path} (as of {as_of}): FAILED {result.error}", file=self.out
+            )
+            return summary
+
+        # One delivery per step, so the quote IDs it returns map back to a step
+        batches: Dict[int, List[Quote]] = {}
+        pending_keys: Set[str] = set()
+        for quote, step in result.due:
+            key = dedup_key(quote.id, step)
+            if self._is_sent(quote, step) or key in pending_keys:
+                summary["duplicates"] += 1
+                continue
+            batches.setdefault(step, []).append(quote)
+            pending_keys.add(key)
+
+        sent: List[str] = []
+        for step, quotes in batches.items():
+            if self.send:
+                sent.extend(
+                    dedup_key(quote_id, step) for quote_id in self._deliver(quotes)
+                )
+                continue
+            for quote in quotes:
+                sent.append(dedup_key(quote.id, step))
+                print(
+                    f"  would send quote {quote.id} ({step} days) to "
+                    f"{quote.prospect.email} (created {quote.created_at})",
+                    file=self.out,
+                )
+        self._remember(sent)
+        summary["sent"] = len(sent)
+        print(
+            f"{result.path} (as of {as_of}): {result.quotes} quotes, "
+            f"{len(result.due)} due, {summary['duplicates']} already sent, "
+            f"{len(sent)} {'sent' if self.send else 'to send'}",
+            file=self.out,
+        )
+        return summary
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("paths", nargs="+", help="ZIP files or directories of ZIPs")
+    parser.add_argument("--as-of", type=parse_date, help="as-of date of every file")
+    parser.add_argument("--manifest", help="CSV with path and as_of columns")
+    parser.add_argument(
+        "--through", type=parse_date, help="also send what was due up to this date"
+    )
+    parser.add_argument("--send", action="store_true", help="send the emails")
+    parser.add_argument(
+        "--dedup-file", help="quote steps already sent, kept up to date"
+    )
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument(
+        "--cadence",
+        type=lambda value: {int(day) for day in value.split(",")},
+        default=EMAIL_CADENCE_DAYS,
+        help="days after creation on which quotes are emailed",
+    )
+    parser.add_argument("--allowlist", default=os.path.join(BASE_DIR, ALLOW_LIST_PATH))
+    parser.add_argument("--sales-reps", default=os.path.join(BASE_DIR, SALES_REPS_PATH))
+    parser.add_argument("--log-level", default="WARNING")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[Sequence[str]] = None, out=sys.stdout) -> List[Dict]:
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+    manifest = read_manifest(args.manifest) if args.manifest else {}
+    jobs = plan_jobs(args.paths, manifest, args.as_of, args.through)
+    backfill = Backfill(
+        send=args.send,
+        seen=load_dedup(args.dedup_file),
+        dedup_path=args.dedup_file,
+        out=out,
+    )
+    summaries = []
+    with ProcessPoolExecutor(
+        max_workers=max(1, min(args.workers, len(jobs))),
+        initializer=init_worker,
+        initargs=(args.sales_reps, args.log_level),
+    ) as executor:
+        # Results come back in date order while later files are still parsing
+        results = executor.map(
+            scan_file,
+            jobs,
+            [args.cadence] * len(jobs),
+            [args.allowlist] * len(jobs),
+        )
+        for result in results:
+            summaries.append(backfill.handle(result))
+    print(
+        f"{len(summaries)} files, {sum(s['sent'] for s in summaries)} quotes "
+        f"{'sent' if args.send else 'to send'}, "
+        f"{sum(1 for s in summaries if s['error'])} failed",
+        file=out,
+    )
+    return summaries
+
+
+if __name__ == "__main__":
+    summaries = main()
+    sys.exit(1 if any(summary["error"] for summary in summaries) else 0)
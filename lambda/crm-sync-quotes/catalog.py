@@ -0,0 +1,120 @@
+import logging
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, List, Optional, Tuple
+from model import Quote, QuoteItem
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb import DynamoDBClient
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_SCAN_SEGMENTS = 4
+DEFAULT_TTL_SECONDS = 900
+
+# (description, product_type) keyed by product id
+ProductEntry = Tuple[str, str]
+
+_catalog_cache: Dict[str, "ProductCatalog"] = {}
+
+
+def _string_attr(item: Dict, name: str) -> str:
+    return item.get(name, {}).get("S", "")
+
+
+class ProductCatalog:
+    def __init__(self, products: Dict[str, ProductEntry], loaded_at: float) -> None:
+        self.products = products
+        self.loaded_at = loaded_at
+
+    def __len__(self) -> int:
+        return len(self.products)
+
+    def is_fresh(self, ttl_seconds: float) -> bool:
+        return time.monotonic() - self.loaded_at < ttl_seconds
+
+    def lookup(self, product_id: str) -> Optional[QuoteItem]:
+        entry = self.products.get(product_id)
+        if entry is None:
+            return None
+        return QuoteItem(id=product_id, description=entry[0], product_type=entry[1])
+
+    def enrich(self, quotes: List[Quote]) -> int:
+        """Fill in each quote's items from the catalog. Returns the number of unknown item ids."""
+        missing = 0
+        for quote in quotes:
+            items: List[QuoteItem] = []
+            for item_id in quote.item_ids:
+                item = self.lookup(item_id)
+                if item is None:
+                    missing += 1
+                    item = QuoteItem(id=item_id)
+                items.append(item)
+            quote.items = items
+        if missing:
+            logger.info(f"{missing} quote items were not found in the product catalog")
+        return missing
+
+    @staticmethod
+    def _scan_segment(
+        dynamo_client: "DynamoDBClient",
+        table_name: str,
+        segment: int,
+        total_segments: int,
+    ) -> Dict[str, ProductEntry]:
+        products: Dict[str, ProductEntry] = {}
+        paginator = dynamo_client.get_paginator("scan")
+        for page in paginator.paginate(
+            TableName=table_name,
+            ProjectionExpression="#id, description, product_type",
+            ExpressionAttributeNames={"#id": "id"},
+            Segment=segment,
+            TotalSegments=total_segments,
+        ):
+            for item in page.get("Items", []):
+                products[_string_attr(item, "id")] = (
+                    _string_attr(item, "description"),
+                    # Product types repeat across the whole catalog
+                    sys.intern(_string_attr(item, "product_type")),
+                )
+        return products
+
+    @classmethod
+    def load(
+        cls,
+        dynamo_client: "DynamoDBClient",
+        table_name: str,
+        total_segments: int = DEFAULT_SCAN_SEGMENTS,
+    ) -> "ProductCatalog":
+        """Load the whole products table with a parallel segmented scan."""
+        start = time.perf_counter()
+        products: Dict[str, ProductEntry] = {}
+        with ThreadPoolExecutor(max_workers=total_segments) as executor:
+            for segment_products in executor.map(
+                lambda segment: cls._scan_segment(
+                    dynamo_client, table_name, segment, total_segments
+                ),
+                range(total_segments),
+            ):
+                products.update(segment_products)
+        logger.info(
+            f"Loaded {len(products)} products from {table_name} "
+            f"in {time.perf_counter() - start:.2f}s"
+        )
+        return cls(products, time.monotonic())
+
+
+def get_product_catalog(
+    dynamo_client: "DynamoDBClient",
+    table_name: str,
+    ttl_seconds: float = DEFAULT_TTL_SECONDS,
+) -> ProductCatalog:
+    """Return the catalog cached in this container, reloading it once the TTL expires."""
+    catalog = _catalog_cache.get(table_name)
+    if catalog is not None and catalog.is_fresh(ttl_seconds):
+        return catalog
+    catalog = ProductCatalog.load(dynamo_client, table_name)
+    _catalog_cache[table_name] = catalog
+    return catalog
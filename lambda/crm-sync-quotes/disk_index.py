@@ -0,0 +1,86 @@
+import json
+import os
+import sqlite3
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+INDEX_FILENAME = "quote_index.sqlite"
+
+
+class DiskIndex:
+    """
+    Items and customers of the quotes in a SQLite file next to the extracted
+    DBFs, for ZIPs whose lookups do not fit in memory. Lookups go through
+    get() so they can stand in for the dicts the in-memory parse builds.
+    """
+
+    def __init__(self, directory: str) -> None:
+        self.connection = sqlite3.connect(os.path.join(directory, INDEX_FILENAME))
+        # Rebuilt from the ZIP on every run, so durability is not needed
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        self.connection.execute("CREATE TABLE items (quote_key TEXT, item_id TEXT)")
+        self.connection.execute(
+            "CREATE TABLE records (kind TEXT, record_key TEXT, record TEXT)"
+        )
+
+    def add_items(self, items: Iterable[Tuple[str, str]]) -> int:
+        """Store (quote key, item id) pairs in file order; return how many."""
+        cursor = self.connection.executemany("INSERT INTO items VALUES (?, ?)", items)
+        self.connection.execute("CREATE INDEX items_by_quote ON items (quote_key)")
+        self.connection.commit()
+        return cursor.rowcount
+
+    def add_records(self, kind: str, records: Iterable[Tuple[Any, Dict]]) -> int:
+        """Store (key, record) pairs of one kind; the last one of a key wins."""
+        cursor = self.connection.executemany(
+            "INSERT INTO records VALUES (?, ?, ?)",
+            (
+                (kind, str(key), json.dumps(record, default=str))
+                for key, record in records
+            ),
+        )
+        self.connection.commit()
+        return cursor.rowcount
+
+    def finish(self) -> None:
+        self.connection.execute(
+            "CREATE INDEX records_by_key ON records (kind, record_key)"
+        )
+        self.connection.commit()
+
+    def items(self) -> "IndexedItems":
+        return IndexedItems(self.connection)
+
+    def records(self, kind: str) -> "IndexedRecords":
+        return IndexedRecords(self.connection, kind)
+
+    def close(self) -> None:
+        self.connection.close()
+
+
+class IndexedItems:
+    def __init__(self, connection: sqlite3.Connection) -> None:
+        self.connection = connection
+
+    def get(self, quote_key: str, default: Optional[List[str]] = None) -> List[str]:
+        rows = self.connection.execute(
+            "SELECT item_id FROM items WHERE quote_key = ? ORDER BY rowid",
+            (quote_key,),
+        ).fetchall()
+        if not rows:
+            return default if default is not None else []
+        return [row[0] for row in rows]
+
+
+class IndexedRecords:
+    def __init__(self, connection: sqlite3.Connection, kind: str) -> None:
+        self.connection = connection
+        self.kind = kind
+
+    def get(self, key: Any, default: Optional[Dict] = None) -> Optional[Dict]:
+        row = self.connection.execute(
+            "SELECT record FROM records WHERE kind = ? AND record_key = ? "
+            "ORDER BY rowid DESC LIMIT 1",
+            (self.kind, str(key)),
+        ).fetchone()
+        return json.loads(row[0]) if row else default
@@ -1,7 +1,7 @@
-from model import Quote
-from typing import List, Set
-from datetime import datetime
-import yaml
+from model import Quote, QuoteStatus
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
+from datetime import date, datetime, timedelta
 import logging
 
 
@@ -21,6 +21,8 @@ class QuoteFilter:
         """Parse the allowlist file to get a set of allowed quote IDs."""
 
         try:
+            import yaml
+
             with open(allow_list_path, "r", encoding="utf-8") as f:
                 data = yaml.safe_load(f)
                 allowed_ids = set(map(str, data.get("ids", [])))
@@ -30,15 +32,33 @@ class QuoteFilter:
             logger.error(f"Error reading allowlist file: {e}", exc_info=True)
             return set()
 
-    def filter_quotes(self) -> List[Quote]:
-        """Filter quotes based on the email cadence configuration."""
+    def filter_quotes(self, now: Optional[datetime] = None) -> List[Quote]:
+        """Filter open (Emitida) quotes based on the email cadence, as of now unless given."""
         filtered_quotes = []
-        now = datetime.now()
+        now = now or datetime.now()
         for quote in self.quotes:
             days_since_creation = (now - datetime.fromisoformat(quote.created_at)).days
             if (
                 days_since_creation in self.email_cadence_config
                 and quote.id in self.allow_list_set
+                and quote.status == QuoteStatus.SENT
             ):
                 filtered_quotes.append(quote)
         return filtered_quotes
+
+    def filter_quotes_between(
+        self, start: date, end: date
+    ) -> Dict[date, Dict[int, List[Quote]]]:
+        """Group the quotes due from start to end, inclusive, by send date and cadence step."""
+        # One pass over the creation dates, whatever the number of days in the range
+        due: Dict[date, Dict[int, List[Quote]]] = defaultdict(lambda: defaultdict(list))
+        steps = sorted(self.email_cadence_config)
+        for quote in self.quotes:
+            if quote.id not in self.allow_list_set or quote.status != QuoteStatus.SENT:
+                continue
+            created = datetime.fromisoformat(quote.created_at).date()
+            for step in steps:
+                send_date = created + timedelta(days=step)
+                if start <= send_date <= end:
+                    due[send_date][step].append(quote)
+        return {send_date: dict(due[send_date]) for send_date in sorted(due)}
@@ -0,0 +1,125 @@
+import logging
+import os
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Iterable, Optional, Tuple
+from bloom import BloomFilterGenerations
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+ISSUED_IDS_BUCKET = "ISSUED_IDS_BUCKET"
+ISSUED_IDS_KEY = "ISSUED_IDS_KEY"
+ISSUED_IDS_CAPACITY = "ISSUED_IDS_CAPACITY"
+ISSUED_IDS_ERROR_RATE = "ISSUED_IDS_ERROR_RATE"
+ISSUED_IDS_GENERATIONS = "ISSUED_IDS_GENERATIONS"
+DEFAULT_KEY = "issued/transactions.bloom"
+# About 360 KB per generation; two generations keep the last 200k to 400k ids
+DEFAULT_CAPACITY = 200_000
+DEFAULT_ERROR_RATE = 0.001
+DEFAULT_GENERATIONS = 2
+MAX_ATTEMPTS = 5
+CONFLICT_CODES = {"PreconditionFailed", "ConditionalRequestConflict", "412"}
+# Object metadata with the time of the first publish, kept on every later one;
+# crm-web-response counts its grace period for unlisted ids from it
+FIRST_PUBLISHED_AT = "first-published-at"
+
+
+class IssuedIdsPublisher:
+    """Adds the transaction ids about to be emailed to the Bloom filter read by crm-web-response."""
+
+    def __init__(
+        self,
+        s3_client: "S3Client",
+        bucket_name: str,
+        object_key: str = DEFAULT_KEY,
+        capacity: int = DEFAULT_CAPACITY,
+        error_rate: float = DEFAULT_ERROR_RATE,
+        generations: int = DEFAULT_GENERATIONS,
+    ) -> None:
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.generations = generations
+
+    @classmethod
+    def from_env(cls, s3_client: "S3Client") -> Optional["IssuedIdsPublisher"]:
+        bucket_name = os.getenv(ISSUED_IDS_BUCKET)
+        if not bucket_name:
+            return None
+        return cls(
+            s3_client,
+            bucket_name,
+            os.getenv(ISSUED_IDS_KEY, DEFAULT_KEY),
+            int(os.getenv(ISSUED_IDS_CAPACITY, DEFAULT_CAPACITY)),
+            float(os.getenv(ISSUED_IDS_ERROR_RATE, DEFAULT_ERROR_RATE)),
+            int(os.getenv(ISSUED_IDS_GENERATIONS, DEFAULT_GENERATIONS)),
+        )
+
+    def _load(self) -> Tuple[BloomFilterGenerations, Optional[str], str]:
+        """The published filter, its ETag and when the first one was published."""
+        from botocore.exceptions import ClientError
+
+        try:
+            response = self.s3_client.get_object(
+                Bucket=self.bucket_name, Key=self.object_key
+            )
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "NoSuchKey":
+                raise
+            empty = BloomFilterGenerations(
+                self.capacity, self.error_rate, self.generations
+            )
+            return empty, None, datetime.now(timezone.utc).isoformat()
+        body = response["Body"]
+        try:
+            data = body.read()
+        finally:
+            body.close()
+        filters = BloomFilterGenerations.from_bytes(
+            data, self.capacity, self.error_rate, self.generations
+        )
+        first_published_at = (
+            response.get("Metadata", {}).get(FIRST_PUBLISHED_AT)
+            or datetime.now(timezone.utc).isoformat()
+        )
+        return filters, response["ETag"], first_published_at
+
+    def publish(self, transaction_ids: Iterable[str]) -> None:
+        """Merge the ids into the published filter, retrying when another run wrote it first."""
+        from botocore.exceptions import ClientError
+
+        transaction_ids = list(transaction_ids)
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            filters, etag, first_published_at = self._load()
+            for transaction_id in transaction_ids:
+                filters.add(transaction_id)
+            condition = {"IfMatch": etag} if etag else {"IfNoneMatch": "*"}
+            try:
+                self.s3_client.put_object(
+                    Bucket=self.bucket_name,
+                    Key=self.object_key,
+                    Body=filters.to_bytes(),
+                    ContentType="application/octet-stream",
+                    Metadata={FIRST_PUBLISHED_AT: first_published_at},
+                    **condition,
+                )
+            except ClientError as e:
+                if e.response.get("Error", {}).get("Code") not in CONFLICT_CODES:
+                    raise
+                logger.info(
+                    f"Issued ids filter changed while merging, attempt {attempt}"
+                )
+                continue
+            logger.info(
+                f"Published {len(transaction_ids)} issued transaction ids, "
+                f"{len(filters)} in the filter"
+            )
+            return
+        raise RuntimeError(
+            f"Could not publish issued transaction ids after {MAX_ATTEMPTS} attempts"
+        )
@@ -1,68 +1,236 @@
 import os
-import boto3
-from mypy_boto3_s3 import S3Client
-from mypy_boto3_dynamodb.service_resource import Table
+import clients
+import json
 import logging
-from typing import List
+import metrics
+import profiling
+import threading
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import TYPE_CHECKING, Any, Dict, List
+from catalog import get_product_catalog
 from filter import QuoteFilter
-from model import Quote
+from issued_ids import IssuedIdsPublisher
+from model import ObjectVersion, Quote
 from parser import QuoteParser
+from sales_reps import SalesRepProvider
 from sender import QuoteEmailSender
+from snapshot import (
+    CHANGED,
+    INSERTED,
+    REMOVED,
+    QuoteChange,
+    SnapshotStore,
+    build_snapshot,
+    diff_snapshots,
+    write_changes,
+)
+from storage import open_s3_object
 from utils import (
     safe_get_env,
     parse_s3_event,
-    download_file_from_s3,
 )
 
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
+    from mypy_boto3_dynamodb.service_resource import DynamoDBServiceResource, Table
+
 
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
 TABLE_NAME = "TABLE_NAME"
+PRODUCTS_TABLE_NAME = "PRODUCTS_TABLE_NAME"
+SALES_REPS_TABLE_NAME = "SALES_REPS_TABLE_NAME"
+SYNC_STATE_TABLE_NAME = "SYNC_STATE_TABLE_NAME"
+QUOTES_TABLE_NAME = "QUOTES_TABLE_NAME"
+SNAPSHOT_BUCKET = "SNAPSHOT_BUCKET"
+SNAPSHOT_PREFIX = "SNAPSHOT_PREFIX"
+DEFAULT_SNAPSHOT_PREFIX = "snapshots/"
 SENDER = "SENDER_EMAIL"
 DOMANAIN = "DOMAIN"
 TEMPLATE_PATH = "assets/template.html"
 SALES_REPS_PATH = "assets/sales_rep.csv"
 EMAIL_CADENCE_DAYS = set([3, 5, 7])
 ALLOW_LIST_PATH = "assets/allowlist.yaml"
+MAX_CONCURRENT_FILES = "MAX_CONCURRENT_FILES"
+DEFAULT_MAX_CONCURRENT_FILES = 2
 
+# Files of the same event are diffed one at a time against their stored snapshots
+_snapshot_lock = threading.Lock()
 
-def handler(event, context):
-    logger.info("Lambda handler started")
-    logger.debug("Received event: %s", event)
-    s3_client: S3Client = boto3.client("s3")
-    try:
-        bucket_name, object_key = parse_s3_event(event)
-    except ValueError as e:
-        logger.error(f"Invalid event structure: {str(e)}")
-        return {"statusCode": 400, "body": "Invalid event structure."}
-    temp_file_path = None
+
+def get_sales_rep_provider(dynamodb: "DynamoDBServiceResource") -> SalesRepProvider:
+    csv_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), SALES_REPS_PATH)
+    sales_reps_table_name = os.getenv(SALES_REPS_TABLE_NAME)
+    if not sales_reps_table_name:
+        return SalesRepProvider(csv_path)
+    state_table_name = os.getenv(SYNC_STATE_TABLE_NAME)
+    return SalesRepProvider(
+        csv_path,
+        table=dynamodb.Table(sales_reps_table_name),
+        state_table=dynamodb.Table(state_table_name) if state_table_name else None,
+    )
+
+
+def snapshot_key_for(object_key: str) -> str:
+    """Snapshot of the uploads to an object key, e.g. snapshots/MTY.tsv.gz for MTY.zip."""
+    stem, _ = os.path.splitext(object_key)
+    return f"{os.getenv(SNAPSHOT_PREFIX, DEFAULT_SNAPSHOT_PREFIX)}{stem}.tsv.gz"
+
+
+def sync_snapshot(
+    s3_client: "S3Client",
+    dynamodb: "DynamoDBServiceResource",
+    object_key: str,
+    quotes: List[Quote],
+) -> List[QuoteChange]:
+    """
+    Diff the quotes against the last snapshot of the same object key, so each
+    branch upload is compared with its own previous upload, and store the
+    changes and the snapshot.
+    """
+    snapshot_bucket = os.getenv(SNAPSHOT_BUCKET)
+    if not snapshot_bucket:
+        return []
+    store = SnapshotStore(s3_client, snapshot_bucket, snapshot_key_for(object_key))
+    current = build_snapshot(quotes)
+    with _snapshot_lock:
+        with metrics.stage("diff") as stage:
+            with store.open_previous() as previous:
+                changes = list(diff_snapshots(previous, current))
+            stage.records = len(current)
+        for change in changes:
+            if change.status_changed:
+                logger.info(
+                    json.dumps(
+                        {
+                            "event": "quote_status_changed",
+                            "quote_id": change.quote_id,
+                            "previous_status": change.previous_status,
+                            "status": change.status,
+                        },
+                        ensure_ascii=False,
+                    )
+                )
+        quotes_table_name = os.getenv(QUOTES_TABLE_NAME)
+        if quotes_table_name and changes:
+            with metrics.stage("quotes") as stage:
+                stage.records = write_changes(
+                    dynamodb.Table(quotes_table_name),
+                    changes,
+                    datetime.now().isoformat(),
+                )
+        # Saved last, so a failed write is retried against the same snapshot
+        if changes:
+            store.save(entry for entry, _ in current)
+    counts = Counter(change.kind for change in changes)
+    logger.info(
+        f"Quote snapshot diff: {counts[INSERTED]} inserted, "
+        f"{counts[CHANGED]} changed "
+        f"({sum(change.status_changed for change in changes)} status changes), "
+        f"{counts[REMOVED]} removed"
+    )
+    return changes
+
+
+def process_file(
+    s3_client: "S3Client",
+    dynamodb: "DynamoDBServiceResource",
+    bucket_name: str,
+    object_key: str,
+    size: int = 0,
+    etag: str = "",
+) -> Dict[str, Any]:
+    """
+    Parse, filter and email the quotes of a single uploaded ZIP. The size and
+    ETag from the S3 event spare a HEAD request and pin the download to the
+    uploaded version.
+    """
     try:
-        temp_file_path = download_file_from_s3(s3_client, bucket_name, object_key)
-        parser = QuoteParser(temp_file_path, SALES_REPS_PATH)
-        quotes: List[Quote] = parser.read_quotes_from_zip()
+        with metrics.stage("sales_reps") as stage:
+            sales_reps = get_sales_rep_provider(dynamodb).get_sales_reps()
+            stage.records = len(sales_reps)
+        with open_s3_object(
+            s3_client, bucket_name, object_key, size=size, etag=etag
+        ) as zip_file:
+            parser = QuoteParser(zip_file, SALES_REPS_PATH, sales_reps)
+            quotes: List[Quote] = parser.read_quotes_from_zip()
         logger.info(f"Read {len(quotes)} quotes from the file")
     except Exception as e:
         logger.error(f"Error processing file from S3: {str(e)}", exc_info=True)
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
-            logger.info(f"Deleted temporary file {temp_file_path}")
         return {"statusCode": 500, "body": str(e)}
 
-    if temp_file_path and os.path.exists(temp_file_path):
-        os.unlink(temp_file_path)
-        logger.info(f"Deleted temporary file {temp_file_path}")
-    dynamodb = boto3.resource("dynamodb")
-    transactions_table: Table = dynamodb.Table(safe_get_env(TABLE_NAME))
-    quote_filter = QuoteFilter(quotes, EMAIL_CADENCE_DAYS, ALLOW_LIST_PATH)
-    filtered_quotes = quote_filter.filter_quotes()
+    try:
+        sync_snapshot(s3_client, dynamodb, object_key, quotes)
+    except Exception as e:
+        logger.error(f"Error syncing the quote snapshot: {str(e)}", exc_info=True)
+
+    transactions_table: "Table" = dynamodb.Table(safe_get_env(TABLE_NAME))
+    with metrics.stage("filter") as stage:
+        quote_filter = QuoteFilter(quotes, EMAIL_CADENCE_DAYS, ALLOW_LIST_PATH)
+        filtered_quotes = quote_filter.filter_quotes()
+        stage.records = len(quotes)
     logger.info(f"Filtered down to {len(filtered_quotes)} quotes after applying cadence and allowlist")
+    products_table_name = os.getenv(PRODUCTS_TABLE_NAME)
+    if products_table_name and filtered_quotes:
+        try:
+            with metrics.stage("enrich") as stage:
+                catalog = get_product_catalog(
+                    clients.get_client("dynamodb"), products_table_name
+                )
+                catalog.enrich(filtered_quotes)
+                stage.records = len(filtered_quotes)
+        except Exception as e:
+            logger.warning(f"Could not enrich quotes with product details: {e}")
     # email_sender = QuoteEmailSender(
     #     quotes=filtered_quotes,
     #     template_path=TEMPLATE_PATH,
     #     sender_email=safe_get_env(SENDER),
     #     transactions_table=transactions_table,
     #     domain=safe_get_env(DOMANAIN),
+    #     issued_ids=IssuedIdsPublisher.from_env(s3_client),
     # )
     # email_sender.send_emails()
     return {"statusCode": 200, "body": "Processing completed successfully."}
+
+
+@profiling.profiled("crm-sync-quotes")
+@metrics.instrument("crm-sync-quotes")
+def handler(event, context):
+    logger.info("Lambda handler started")
+    logger.debug("Received event: %s", event)
+    s3_client: "S3Client" = clients.get_client("s3")
+    try:
+        s3_objects = parse_s3_event(event)
+    except ValueError as e:
+        logger.error(f"Invalid event structure: {str(e)}")
+        return {"statusCode": 400, "body": "Invalid event structure."}
+    dynamodb: "DynamoDBServiceResource" = clients.get_resource("dynamodb")
+
+    def process(s3_object: ObjectVersion) -> Dict[str, Any]:
+        result = process_file(
+            s3_client,
+            dynamodb,
+            s3_object.bucket,
+            s3_object.key,
+            size=s3_object.size,
+            etag=s3_object.etag,
+        )
+        return {"bucket": s3_object.bucket, "key": s3_object.key, **result}
+
+    # Each ZIP is decoded fully in memory, so only a couple run at once
+    max_workers = min(
+        int(os.getenv(MAX_CONCURRENT_FILES, DEFAULT_MAX_CONCURRENT_FILES)),
+        len(s3_objects),
+    )
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(process, s3_objects))
+
+    failed = sum(1 for result in results if result["statusCode"] >= 400)
+    if failed == 0:
+        status_code = 200
+    else:
+        status_code = 500 if failed == len(results) else 207
+    return {"statusCode": status_code, "body": {"files": results}}
@@ -0,0 +1,126 @@
+import logging
+import os
+import resource
+import time
+from contextlib import contextmanager
+from typing import Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+PARSER_MEMORY_LIMIT_MB = "PARSER_MEMORY_LIMIT_MB"
+PARSER_TRACE_MEMORY = "PARSER_TRACE_MEMORY"
+FUNCTION_MEMORY_SIZE = "AWS_LAMBDA_FUNCTION_MEMORY_SIZE"
+MIB = 1024 * 1024
+
+
+def memory_limit_bytes() -> Optional[int]:
+    """Memory the process may use: PARSER_MEMORY_LIMIT_MB or the Lambda memory size."""
+    limit_mb = os.getenv(PARSER_MEMORY_LIMIT_MB) or os.getenv(FUNCTION_MEMORY_SIZE)
+    return int(float(limit_mb) * MIB) if limit_mb else None
+
+
+def rss_bytes() -> int:
+    """Resident memory of the process right now."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Peak rather than current, in KiB on Linux
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def peak_rss_bytes() -> int:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+
+def _meminfo_available() -> Optional[int]:
+    try:
+        with open("/proc/meminfo") as f:
+            for line in f:
+                if line.startswith("MemAvailable:"):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
+def available_bytes() -> Optional[int]:
+    """
+    Memory left for the parse: the limit minus what the process already holds
+    (the downloaded ZIP included), or what the OS reports as available when
+    there is no limit. None when it cannot be told.
+    """
+    limit = memory_limit_bytes()
+    if limit is not None:
+        return max(0, limit - rss_bytes())
+    return _meminfo_available()
+
+
+def is_tracing_requested() -> bool:
+    return os.getenv(PARSER_TRACE_MEMORY, "false").lower() == "true"
+
+
+class MemoryAccount:
+    """What a parse planned to use and what it did, filled in on exit."""
+
+    def __init__(self, name: str, estimate: int, available: Optional[int]) -> None:
+        self.name = name
+        self.estimate = estimate
+        self.available = available
+        self.traced_peak: Optional[int] = None
+        self.peak_rss = 0
+        self.seconds = 0.0
+
+    def summary(self) -> str:
+        limit = memory_limit_bytes()
+        parts = [
+            f"{self.name}: estimated {self.estimate / MIB:.0f} MiB of "
+            + (
+                f"{self.available / MIB:.0f} MiB available"
+                if self.available is not None
+                else "unknown available memory"
+            )
+        ]
+        if self.traced_peak is not None:
+            parts.append(f"traced peak {self.traced_peak / MIB:.0f} MiB")
+        parts.append(
+            f"peak RSS {self.peak_rss / MIB:.0f} MiB"
+            + (f" ({self.peak_rss / limit:.0%} of the limit)" if limit else "")
+        )
+        parts.append(f"{self.seconds:.2f}s")
+        return ", ".join(parts)
+
+
+@contextmanager
+def account(
+    name: str, estimate: int, available: Optional[int]
+) -> Iterator[MemoryAccount]:
+    """
+    Logs the memory the enclosed block used against its estimate. Allocations
+    are traced with tracemalloc when PARSER_TRACE_MEMORY is true, which makes
+    DBF decoding several times slower, or when something else is already
+    tracing them (a profiler, the load harness); peak RSS is always reported.
+    """
+    import tracemalloc
+
+    started_tracing = is_tracing_requested() and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    tracing = tracemalloc.is_tracing()
+    baseline = tracemalloc.get_traced_memory()[0] if tracing else 0
+    if started_tracing:
+        tracemalloc.reset_peak()
+    memory_account = MemoryAccount(name, estimate, available)
+    started = time.perf_counter()
+    try:
+        yield memory_account
+    finally:
+        memory_account.seconds = time.perf_counter() - started
+        if tracing:
+            memory_account.traced_peak = max(
+                0, tracemalloc.get_traced_memory()[1] - baseline
+            )
+        if started_tracing:
+            tracemalloc.stop()
+        memory_account.peak_rss = peak_rss_bytes()
+        logger.info(memory_account.summary())
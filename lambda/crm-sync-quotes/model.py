@@ -1,4 +1,5 @@
-from dataclasses import dataclass
+from dataclasses import dataclass, field, asdict
+from decimal import Decimal
 from enum import Enum
 from shlex import quote
 
@@ -12,6 +13,14 @@ class QuoteStatus(Enum):
         return self.value
 
 
+@dataclass
+class ObjectVersion:
+    bucket: str
+    key: str
+    etag: str = ""
+    size: int = 0
+
+
 @dataclass
 class Prospect:
     id: str
@@ -27,6 +36,13 @@ class SalesRep:
     phone_number: str
 
 
+@dataclass
+class QuoteItem:
+    id: str
+    description: str = ""
+    product_type: str = ""
+
+
 @dataclass
 class Quote:
     id: str
@@ -36,6 +52,7 @@ class Quote:
     amount: float
     status: QuoteStatus
     created_at: str
+    items: list[QuoteItem] = field(default_factory=list)
 
     def to_dynamodb_item(self) -> dict:
         return {
@@ -43,9 +60,10 @@ class Quote:
             "prospect_id": self.prospect.id,
             "prospect_name": self.prospect.name,
             "prospect_email": self.prospect.email,
-            "sales_rep": self.sales_rep,
+            "sales_rep": asdict(self.sales_rep),
             "item_ids": self.item_ids,
-            "amount": self.amount,
+            "items": [asdict(item) for item in self.items],
+            "amount": Decimal(str(self.amount)),
             "status": self.status.value,
             "created_at": self.created_at,
         }
@@ -66,6 +84,9 @@ class EmailTransaction:
     email_address: str
     sent_at: str
     status: EmailStatus
+    sales_rep_id: str = ""
+    # Days after the quote was created, i.e. the step of the email cadence
+    cadence_step: int = 0
 
     def to_dynamodb_item(self) -> dict:
         return {
@@ -74,4 +95,6 @@ class EmailTransaction:
             "email_address": self.email_address,
             "sent_at": self.sent_at,
             "status": self.status.value,
+            "sales_rep_id": self.sales_rep_id,
+            "cadence_step": self.cadence_step,
         }
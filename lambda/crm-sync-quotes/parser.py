@@ -1,14 +1,30 @@
-from typing import List, Dict, Optional
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    BinaryIO,
+    Iterable,
+    Iterator,
+    List,
+    Dict,
+    Optional,
+    Tuple,
+    Union,
+)
 from model import Quote, Prospect, QuoteStatus, SalesRep
-from utils import extract_email, find_file
+from utils import extract_email
+from sales_reps import load_sales_reps_from_csv
 import logging
+import memory_budget
+import metrics
 import tempfile
+import time
 import zipfile
-import csv
 import os
-from dbfread import DBF
 from datetime import timedelta, datetime
 
+if TYPE_CHECKING:
+    from disk_index import DiskIndex
+
 logger = logging.getLogger(__name__)
 
 COTIZAC_FILENAME = "cotizac.DBF"
@@ -16,6 +32,42 @@ COTIZAD_FILENAME = "cotizad.DBF"
 CLIENTES_FILENAME = "clientes.DBF"
 PROSPECTS_FILENAME = "prospect.DBF"
 SALES_REP_FILENAME = "sales_rep.csv"
+DBF_FILENAMES = [
+    COTIZAC_FILENAME,
+    COTIZAD_FILENAME,
+    CLIENTES_FILENAME,
+    PROSPECTS_FILENAME,
+]
+
+# Fields of the customer records a quote uses, all that the streaming and
+# on-disk strategies keep
+CLIENTE_FIELDS = ["CVE_CTE", "NOM_CTE", "EMAIL_CTE"]
+PROSPECT_FIELDS = ["CVE_PROS", "NOM_PROS", "EMAIL_PROS"]
+
+PARSER_STRATEGY = "PARSER_STRATEGY"
+# Every record decoded and held, then joined in memory
+MEMORY = "memory"
+# Quotes decoded one at a time against lookups of the fields they use
+STREAMING = "streaming"
+# Quotes decoded one at a time against lookups in a SQLite file in /tmp
+DISK = "disk"
+STRATEGIES = [MEMORY, STREAMING, DISK]
+
+# Traced bytes held per byte of DBF in the central directory, from the test
+# ZIP (46 MB of DBFs): decoding every record peaks at 193 MiB, streaming the
+# quotes past cut-down lookups at 7 MiB and the on-disk index at 2.5 MiB,
+# mostly the parsed quotes. All three take about 3s.
+MEMORY_EXPANSION = 4.5
+STREAMING_EXPANSION = {
+    COTIZAC_FILENAME: 1.0,
+    COTIZAD_FILENAME: 0.5,
+    CLIENTES_FILENAME: 0.1,
+    PROSPECTS_FILENAME: 0.1,
+}
+DISK_EXPANSION = {COTIZAC_FILENAME: 1.0}
+# Share of the available memory a strategy may plan to take, leaving room for
+# the rest of the run (filtering, enrichment, rendering the emails)
+BUDGET_FRACTION = 0.6
 
 STATUS_MAPPING = {
     "CANCELADA": QuoteStatus.CANCELLED,
@@ -24,68 +76,173 @@ STATUS_MAPPING = {
 }
 
 
+def estimate_bytes(strategy: str, sizes: Dict[str, int]) -> int:
+    """Memory a strategy is expected to hold for DBF files of these sizes."""
+    if strategy == MEMORY:
+        return int(sum(sizes.values()) * MEMORY_EXPANSION)
+    expansion = STREAMING_EXPANSION if strategy == STREAMING else DISK_EXPANSION
+    return int(sum(size * expansion.get(name, 0) for name, size in sizes.items()))
+
+
+def choose_strategy(sizes: Dict[str, int], available: Optional[int]) -> str:
+    """The first of memory, streaming and disk whose estimate fits in the budget."""
+    if available is None:
+        return MEMORY
+    for strategy in (MEMORY, STREAMING):
+        if estimate_bytes(strategy, sizes) <= available * BUDGET_FRACTION:
+            return strategy
+    return DISK
+
+
+def _configured_strategy() -> Optional[str]:
+    strategy = os.getenv(PARSER_STRATEGY, "auto").lower()
+    if strategy in STRATEGIES:
+        return strategy
+    if strategy != "auto":
+        logger.warning(f"Unknown {PARSER_STRATEGY} {strategy}; choosing automatically")
+    return None
+
+
+def _open_dbf(path: str) -> Any:
+    """A DBF table; iterating it decodes one record at a time from disk."""
+    from dbfread import DBF
+
+    return DBF(path, encoding="latin1", ignore_missing_memofile=True)
+
+
+def _project(records: Iterable[Dict], fields: List[str]) -> Iterator[Tuple[Any, Dict]]:
+    """(key, record) pairs with only the given fields, the first being the key."""
+    for rec in records:
+        yield rec.get(fields[0]), {name: rec[name] for name in fields if name in rec}
+
+
+def _item_pairs(cotizad_records: Iterable[Dict]) -> Iterator[Tuple[str, str]]:
+    """(quote key, item id) of every quote item, in file order."""
+    for rec in cotizad_records:
+        no_cot = rec.get("NO_COT")
+        cve_prod = rec.get("CVE_PROD")
+        if no_cot is not None and cve_prod:
+            yield str(int(no_cot)).strip(), str(cve_prod).strip()
+
+
 class QuoteParser:
-    def __init__(self, zip_file_path: str, sales_reps_path: str) -> None:
-        self.zip_file_path = zip_file_path
-        self.sales_reps: Dict[str, SalesRep] = self._load_sales_reps(sales_reps_path)
+    def __init__(
+        self,
+        zip_file: Union[str, BinaryIO],
+        sales_reps_path: str,
+        sales_reps: Optional[Dict[str, SalesRep]] = None,
+        strategy: Optional[str] = None,
+    ) -> None:
+        self.zip_file = zip_file
+        # One of STRATEGIES, or None to pick one from the sizes in the ZIP
+        self.strategy = strategy or _configured_strategy()
+        self.sales_reps: Dict[str, SalesRep] = (
+            sales_reps
+            if sales_reps is not None
+            else self._load_sales_reps(sales_reps_path)
+        )
 
     def _load_sales_reps(self, sales_reps_path: str) -> Dict[str, SalesRep]:
-        sales_reps: Dict[str, SalesRep] = {}
         assets_path = os.path.join(
             os.path.dirname(os.path.abspath(__file__)), sales_reps_path
         )
-        if not os.path.exists(assets_path):
-            logger.warning("Sales rep CSV not found at %s", assets_path)
-            return sales_reps
-        with open(assets_path, newline="", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                rep_id = str(row.get("AGENTE", "")).strip()
-                if not rep_id:
-                    continue
-                sales_reps[rep_id] = SalesRep(
-                    id=rep_id,
-                    name=str(row.get("NOMBRE", "")).strip(),
-                    email=str(row.get("EMAIL", "")).strip(),
-                    phone_number=str(row.get("TEL", "")).strip(),
-                )
-        return sales_reps
+        return load_sales_reps_from_csv(assets_path)
 
     def read_quotes_from_zip(self) -> list[Quote]:
-        """Read quotes from a ZIP file containing DBF files."""
+        """Read quotes from a ZIP file (path or seekable file object) containing DBF files."""
         quotes: List[Quote] = []
         with tempfile.TemporaryDirectory() as temp_dir:
-            with zipfile.ZipFile(self.zip_file_path, "r") as zip_ref:
-                zip_ref.extractall(temp_dir)
-            cotizac_path = find_file(temp_dir, COTIZAC_FILENAME)
-            cotizad_path = find_file(temp_dir, COTIZAD_FILENAME)
-            clientes_path = find_file(temp_dir, CLIENTES_FILENAME)
-            prospects_path = find_file(temp_dir, PROSPECTS_FILENAME)
-
-            if not all([cotizac_path, cotizad_path, clientes_path, prospects_path]):
-                logger.error("Required DBF files are missing in the ZIP archive.")
-                return []
-            cotizac_records = list(
-                DBF(cotizac_path, encoding="latin1", ignore_missing_memofile=True)
+            with metrics.stage("extract") as stage, zipfile.ZipFile(
+                self.zip_file, "r"
+            ) as zip_ref:
+                members = self._dbf_members(zip_ref)
+                if len(members) < len(DBF_FILENAMES):
+                    logger.error("Required DBF files are missing in the ZIP archive.")
+                    return []
+                # Decided from the central directory, before anything is extracted
+                sizes = {name: member.file_size for name, member in members.items()}
+                available = memory_budget.available_bytes()
+                strategy = self.strategy or choose_strategy(sizes, available)
+                paths = {
+                    name: zip_ref.extract(member, temp_dir)
+                    for name, member in members.items()
+                }
+                stage.records = len(members)
+                stage.bytes = sum(sizes.values())
+            logger.info(
+                f"Parsing {stage.bytes} bytes of DBF files with the {strategy} strategy"
+            )
+            with memory_budget.account(
+                f"{strategy} parse", estimate_bytes(strategy, sizes), available
+            ):
+                quotes = self._read_quotes(strategy, paths, temp_dir)
+        logger.info(f"Parsed {len(quotes)} quotes from ZIP file")
+        return quotes
+
+    @staticmethod
+    def _dbf_members(zip_ref: zipfile.ZipFile) -> Dict[str, zipfile.ZipInfo]:
+        """The DBF files at the top of the archive, by their expected name."""
+        wanted = {filename.lower(): filename for filename in DBF_FILENAMES}
+        members: Dict[str, zipfile.ZipInfo] = {}
+        for member in zip_ref.infolist():
+            filename = wanted.get(member.filename.lower())
+            if filename:
+                members[filename] = member
+        return members
+
+    def _read_quotes(
+        self, strategy: str, paths: Dict[str, str], temp_dir: str
+    ) -> List[Quote]:
+        decode_started = time.perf_counter()
+        index: Optional["DiskIndex"] = None
+        if strategy == MEMORY:
+            cotizac_list = list(_open_dbf(paths[COTIZAC_FILENAME]))
+            cotizad_list = list(_open_dbf(paths[COTIZAD_FILENAME]))
+            cotizac_records: Iterable[Dict] = cotizac_list
+            clientes_dict: Any = {
+                rec["CVE_CTE"]: rec for rec in _open_dbf(paths[CLIENTES_FILENAME])
+            }
+            prospects_dict: Any = {
+                rec["CVE_PROS"]: rec for rec in _open_dbf(paths[PROSPECTS_FILENAME])
+            }
+            items_by_quote: Any = self._group_items_by_quote(cotizad_list)
+            decoded = len(cotizac_list) + len(cotizad_list)
+        elif strategy == STREAMING:
+            # Only the lookups are held, cut down to the fields the quotes use
+            cotizac_records = _open_dbf(paths[COTIZAC_FILENAME])
+            items_by_quote = self._group_items_by_quote(
+                _open_dbf(paths[COTIZAD_FILENAME])
+            )
+            clientes_dict = dict(
+                _project(_open_dbf(paths[CLIENTES_FILENAME]), CLIENTE_FIELDS)
+            )
+            prospects_dict = dict(
+                _project(_open_dbf(paths[PROSPECTS_FILENAME]), PROSPECT_FIELDS)
+            )
+            decoded = sum(len(items) for items in items_by_quote.values())
+        else:
+            from disk_index import DiskIndex
+
+            index = DiskIndex(temp_dir)
+            cotizac_records = _open_dbf(paths[COTIZAC_FILENAME])
+            decoded = index.add_items(_item_pairs(_open_dbf(paths[COTIZAD_FILENAME])))
+            index.add_records(
+                CLIENTES_FILENAME,
+                _project(_open_dbf(paths[CLIENTES_FILENAME]), CLIENTE_FIELDS),
             )
-            cotizad_records = list(
-                DBF(cotizad_path, encoding="latin1", ignore_missing_memofile=True)
+            index.add_records(
+                PROSPECTS_FILENAME,
+                _project(_open_dbf(paths[PROSPECTS_FILENAME]), PROSPECT_FIELDS),
             )
+            index.finish()
+            items_by_quote = index.items()
+            clientes_dict = index.records(CLIENTES_FILENAME)
+            prospects_dict = index.records(PROSPECTS_FILENAME)
+        decode_finished = time.perf_counter()
+        metrics.record("decode", decode_finished - decode_started, records=decoded)
 
-            clientes_dict: Dict[str, Dict] = {}
-            if clientes_path:
-                clientes_records = list(
-                    DBF(clientes_path, encoding="latin1", ignore_missing_memofile=True)
-                )
-                clientes_dict = {rec["CVE_CTE"]: rec for rec in clientes_records}
-
-            prospects_dict: Dict[str, Dict] = {}
-            if prospects_path:
-                prospects_records = list(
-                    DBF(prospects_path, encoding="latin1", ignore_missing_memofile=True)
-                )
-                prospects_dict = {rec["CVE_PROS"]: rec for rec in prospects_records}
-            items_by_quote = self._group_items_by_quote(cotizad_records)
+        quotes: List[Quote] = []
+        try:
             for cotizac_rec in cotizac_records:
                 try:
                     quote = self._parse_quote(
@@ -102,19 +259,18 @@ class QuoteParser:
                         exc_info=True,
                     )
                     continue
-        logger.info(f"Parsed {len(quotes)} quotes from ZIP file")
+        finally:
+            if index is not None:
+                index.close()
+        metrics.record(
+            "parse", time.perf_counter() - decode_finished, records=len(quotes)
+        )
         return quotes
 
-    def _group_items_by_quote(self, cotizad_records: list) -> Dict[str, List[str]]:
+    def _group_items_by_quote(self, cotizad_records: Iterable) -> Dict[str, List[str]]:
         items_by_quote: Dict[str, List[str]] = {}
-        for rec in cotizad_records:
-            no_cot = rec.get("NO_COT")
-            cve_prod = rec.get("CVE_PROD")
-            if no_cot is not None and cve_prod:
-                quote_keys = str(int(no_cot)).strip()
-                if no_cot not in items_by_quote:
-                    items_by_quote[quote_keys] = []
-                items_by_quote[quote_keys].append(str(cve_prod).strip())
+        for quote_key, item_id in _item_pairs(cotizad_records):
+            items_by_quote.setdefault(quote_key, []).append(item_id)
         return items_by_quote
 
     def _parse_prospect_from_prospect_dbf(
@@ -179,7 +335,7 @@ class QuoteParser:
         created_at = f_alta_cot
         sales_rep = self.sales_reps.get(cve_age)
         if not sales_rep:
-            logger.debug("Sales rep %s not found in CSV; using empty details", cve_age)
+            logger.debug("Sales rep %s not found; using empty details", cve_age)
             sales_rep = SalesRep(id=cve_age, name="", email="", phone_number="")
         return Quote(
             id=no_cot,
@@ -0,0 +1,125 @@
+import csv
+import logging
+import os
+import time
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Dict, Optional
+from model import SalesRep
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import Table
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+DEFAULT_TTL_SECONDS = 300
+
+
+@dataclass
+class CachedSalesReps:
+    sales_reps: Dict[str, SalesRep]
+    version: str
+    loaded_at: float
+
+
+# Keyed by sales reps table name; survives across warm invocations
+_cache: Dict[str, CachedSalesReps] = {}
+
+
+def load_sales_reps_from_csv(sales_reps_path: str) -> Dict[str, SalesRep]:
+    """Load sales reps from the CSV bundled with the Lambda package."""
+    sales_reps: Dict[str, SalesRep] = {}
+    if not os.path.exists(sales_reps_path):
+        logger.warning("Sales rep CSV not found at %s", sales_reps_path)
+        return sales_reps
+    with open(sales_reps_path, newline="", encoding="utf-8") as csvfile:
+        reader = csv.DictReader(csvfile)
+        for row in reader:
+            rep_id = str(row.get("AGENTE", "")).strip()
+            if not rep_id:
+                continue
+            sales_reps[rep_id] = SalesRep(
+                id=rep_id,
+                name=str(row.get("NOMBRE", "")).strip(),
+                email=str(row.get("EMAIL", "")).strip(),
+                phone_number=str(row.get("TEL", "")).strip(),
+            )
+    return sales_reps
+
+
+class SalesRepProvider:
+    def __init__(
+        self,
+        csv_path: str,
+        table: Optional["Table"] = None,
+        state_table: Optional["Table"] = None,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+    ) -> None:
+        self.csv_path = csv_path
+        self.table = table
+        self.state_table = state_table
+        self.ttl_seconds = ttl_seconds
+
+    def _current_version(self) -> str:
+        """Return the ETag of the last CSV synced into the sales reps table, if known."""
+        if self.table is None or self.state_table is None:
+            return ""
+        item = self.state_table.get_item(Key={"id": self.table.name}).get("Item")
+        return str(item.get("etag", "")) if item else ""
+
+    def _scan_table(self) -> Dict[str, SalesRep]:
+        """Read every sales rep from the table with a paginated scan."""
+        assert self.table is not None
+        sales_reps: Dict[str, SalesRep] = {}
+        scan_kwargs = {}
+        while True:
+            response = self.table.scan(**scan_kwargs)
+            for item in response.get("Items", []):
+                rep_id = str(item.get("id", "")).strip()
+                if not rep_id:
+                    continue
+                sales_reps[rep_id] = SalesRep(
+                    id=rep_id,
+                    name=str(item.get("name", "")),
+                    email=str(item.get("email", "")),
+                    phone_number=str(item.get("phone", "")),
+                )
+            if "LastEvaluatedKey" not in response:
+                return sales_reps
+            scan_kwargs["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+
+    def get_sales_reps(self) -> Dict[str, SalesRep]:
+        """
+        Return sales reps keyed by id. The table is scanned at most once per TTL
+        per container; after the TTL the cache is kept if the sync state shows
+        the table has not changed. Falls back to the bundled CSV.
+        """
+        if self.table is None:
+            return load_sales_reps_from_csv(self.csv_path)
+
+        cached = _cache.get(self.table.name)
+        now = time.monotonic()
+        if cached and now - cached.loaded_at < self.ttl_seconds:
+            return cached.sales_reps
+
+        try:
+            version = self._current_version()
+            if cached and version and version == cached.version:
+                logger.info(
+                    "Sales reps unchanged since last load (version %s)", version
+                )
+                cached.loaded_at = now
+                return cached.sales_reps
+            sales_reps = self._scan_table()
+        except Exception as e:
+            logger.warning(f"Could not load sales reps from {self.table.name}: {e}")
+            if cached:
+                return cached.sales_reps
+            return load_sales_reps_from_csv(self.csv_path)
+
+        if not sales_reps:
+            logger.warning(f"Sales reps table {self.table.name} is empty; using CSV")
+            return load_sales_reps_from_csv(self.csv_path)
+        logger.info(f"Loaded {len(sales_reps)} sales reps from {self.table.name}")
+        _cache[self.table.name] = CachedSalesReps(sales_reps, version, now)
+        return sales_reps
@@ -1,12 +1,18 @@
-import boto3
-from mypy_boto3_dynamodb.service_resource import Table
-from typing import List, Set, Dict
+import clients
+from typing import TYPE_CHECKING, List, Set, Dict, Optional
 from datetime import datetime
 from model import Quote, EmailTransaction, EmailStatus
-from jinja2 import Template
 import logging
+import metrics
+import time
 import uuid
 
+if TYPE_CHECKING:
+    from jinja2 import Template
+    from mypy_boto3_dynamodb.service_resource import Table
+    from mypy_boto3_ses import SESClient
+    from issued_ids import IssuedIdsPublisher
+
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
@@ -17,18 +23,23 @@ class QuoteEmailSender:
         quotes: List[Quote],
         template_path: str,
         sender_email: str,
-        transactions_table: Table,
+        transactions_table: "Table",
         domain: str,
+        ses_client: Optional["SESClient"] = None,
+        issued_ids: Optional["IssuedIdsPublisher"] = None,
     ) -> None:
         self.quotes = quotes
-        self.ses_client = boto3.client("ses")
+        self.ses_client = ses_client or clients.get_client("ses")
         self.sender_email = sender_email
         self.transactions_table = transactions_table
         self.domain = domain
+        self.issued_ids = issued_ids
         try:
+            from jinja2 import Template
+
             with open(template_path, "r", encoding="utf-8") as f:
                 template_content = f.read()
-            self.template: Template = Template(template_content)
+            self.template: "Template" = Template(template_content)
         except Exception as e:
             raise ValueError(f"Error reading email template: {str(e)}") from e
 
@@ -40,23 +51,52 @@ class QuoteEmailSender:
             amount=quote.amount,
             status=str(quote.status),
             created_at=quote.created_at,
+            items=quote.items,
             transaction_id=transaction_id,
             domain=self.domain,
         )
 
+    @staticmethod
+    def _cadence_step(quote: Quote, sent_at: datetime) -> int:
+        """Days from the creation of the quote to the email, 0 if unknown."""
+        try:
+            created = datetime.fromisoformat(quote.created_at)
+        except (TypeError, ValueError):
+            return 0
+        return (sent_at.date() - created.date()).days
+
     def _batch_write_transactions(self, transactions: List[EmailTransaction]) -> None:
         """Batch write email transactions to DynamoDB."""
         with self.transactions_table.batch_writer() as batch:
             for transaction in transactions:
                 batch.put_item(Item=transaction.to_dynamodb_item())
 
-    def send_emails(self) -> None:
-        """Send emails for the filtered quotes."""
+    def send_emails(self) -> List[EmailTransaction]:
+        """Send emails for the filtered quotes and return the transactions of those sent."""
         email_transactions: List[EmailTransaction] = []
-        for quote in self.quotes:
-            transaction_id = str(uuid.uuid4())
+        transaction_ids = [str(uuid.uuid4()) for _ in self.quotes]
+        if self.issued_ids is not None and transaction_ids:
+            # Published before sending so a prospect can never click a link
+            # crm-web-response would reject
+            try:
+                with metrics.stage("issued_ids") as stage:
+                    self.issued_ids.publish(transaction_ids)
+                    stage.records = len(transaction_ids)
+            except Exception as e:
+                logger.error(
+                    f"Error publishing issued transaction ids, no emails sent: {str(e)}",
+                    exc_info=True,
+                )
+                return []
+        render_seconds = send_seconds = 0.0
+        rendered_bytes = 0
+        for quote, transaction_id in zip(self.quotes, transaction_ids):
+            started = time.perf_counter()
             rendered_email = self._render_template(quote, transaction_id)
+            render_seconds += time.perf_counter() - started
+            rendered_bytes += len(rendered_email)
             body_text = "Los detalles de tu cotización están adjuntos."
+            started = time.perf_counter()
             try:
                 response = self.ses_client.send_email(
                     Source=self.sender_email,
@@ -75,12 +115,15 @@ class QuoteEmailSender:
                 logger.info(
                     f"Email sent to {quote.prospect.email} for quote {quote.id}, MessageId: {response['MessageId']}"
                 )
+                sent_at = datetime.now()
                 email_transaction = EmailTransaction(
                     id=transaction_id,
                     quote_id=quote.id,
                     email_address=quote.prospect.email,
-                    sent_at=datetime.now().isoformat(),
+                    sent_at=sent_at.isoformat(),
                     status=EmailStatus.SENT,
+                    sales_rep_id=quote.sales_rep.id,
+                    cadence_step=self._cadence_step(quote, sent_at),
                 )
                 email_transactions.append(email_transaction)
             except Exception as e:
@@ -88,8 +131,17 @@ class QuoteEmailSender:
                     f"Error sending email to {quote.prospect.email} for quote {quote.id}: {str(e)}",
                     exc_info=True,
                 )
+            finally:
+                send_seconds += time.perf_counter() - started
+        metrics.record(
+            "render", render_seconds, records=len(self.quotes), bytes=rendered_bytes
+        )
+        metrics.record("ses", send_seconds, records=len(email_transactions))
         if email_transactions:
-            self._batch_write_transactions(email_transactions)
+            with metrics.stage("dynamodb") as stage:
+                self._batch_write_transactions(email_transactions)
+                stage.records = len(email_transactions)
             logger.info(
                 f"Wrote {len(email_transactions)} email transactions to DynamoDB"
             )
+        return email_transactions
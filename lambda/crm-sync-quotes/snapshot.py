@@ -0,0 +1,172 @@
+import gzip
+import hashlib
+import io
+import json
+import logging
+import tempfile
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Iterable, Iterator, List, Optional, Tuple
+from model import Quote
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import Table
+    from mypy_boto3_s3 import S3Client
+
+logger = logging.getLogger(__name__)
+logger.setLevel(logging.INFO)
+
+INSERTED = "inserted"
+CHANGED = "changed"
+REMOVED = "removed"
+SPOOL_MAX_BYTES = 8 * 1024 * 1024
+
+# (quote_id, status, fingerprint), one tab separated line per quote sorted by id
+SnapshotEntry = Tuple[str, str, str]
+
+
+@dataclass
+class QuoteChange:
+    kind: str
+    quote_id: str
+    previous_status: Optional[str] = None
+    status: Optional[str] = None
+    quote: Optional[Quote] = None
+
+    @property
+    def status_changed(self) -> bool:
+        return self.kind == CHANGED and self.previous_status != self.status
+
+
+def fingerprint(quote: Quote) -> str:
+    """Short hash of the fields read from the ERP, so enrichment does not count as a change."""
+    fields = [
+        quote.prospect.id,
+        quote.prospect.name,
+        quote.prospect.email,
+        quote.sales_rep.id,
+        quote.item_ids,
+        quote.amount,
+        quote.status.value,
+        quote.created_at,
+    ]
+    encoded = json.dumps(fields, ensure_ascii=False, separators=(",", ":"))
+    return hashlib.blake2b(encoded.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def build_snapshot(quotes: Iterable[Quote]) -> List[Tuple[SnapshotEntry, Quote]]:
+    """Key-sorted snapshot entries of the parsed quotes. A repeated id keeps its last row."""
+    by_id = {quote.id: quote for quote in quotes}
+    return [
+        (
+            (quote_id, by_id[quote_id].status.value, fingerprint(by_id[quote_id])),
+            by_id[quote_id],
+        )
+        for quote_id in sorted(by_id)
+    ]
+
+
+def read_snapshot(lines: Iterable[str]) -> Iterator[SnapshotEntry]:
+    for line in lines:
+        quote_id, status, digest = line.rstrip("\n").split("\t")
+        yield quote_id, status, digest
+
+
+def write_snapshot(entries: Iterable[SnapshotEntry], fileobj) -> None:
+    with gzip.GzipFile(fileobj=fileobj, mode="wb", mtime=0) as gz, io.TextIOWrapper(
+        gz, encoding="utf-8", newline="\n"
+    ) as text:
+        for entry in entries:
+            text.write("\t".join(entry) + "\n")
+
+
+def diff_snapshots(
+    previous: Iterable[SnapshotEntry],
+    current: Iterable[Tuple[SnapshotEntry, Quote]],
+) -> Iterator[QuoteChange]:
+    """Merge two key-sorted snapshots, holding a single entry of each at a time."""
+    previous_entries = iter(previous)
+    current_entries = iter(current)
+    old = next(previous_entries, None)
+    new = next(current_entries, None)
+    while old is not None or new is not None:
+        if new is None or (old is not None and old[0] < new[0][0]):
+            yield QuoteChange(REMOVED, old[0], previous_status=old[1])
+            old = next(previous_entries, None)
+        elif old is None or new[0][0] < old[0]:
+            (quote_id, status, _), quote = new
+            yield QuoteChange(INSERTED, quote_id, status=status, quote=quote)
+            new = next(current_entries, None)
+        else:
+            (quote_id, status, digest), quote = new
+            if digest != old[2]:
+                yield QuoteChange(
+                    CHANGED,
+                    quote_id,
+                    previous_status=old[1],
+                    status=status,
+                    quote=quote,
+                )
+            old = next(previous_entries, None)
+            new = next(current_entries, None)
+
+
+def write_changes(
+    table: "Table", changes: Iterable[QuoteChange], synced_at: str
+) -> int:
+    """Put the inserted and changed quotes. Removed quotes are left in the table."""
+    written = 0
+    with table.batch_writer(overwrite_by_pkeys=["quote_id"]) as batch:
+        for change in changes:
+            if change.quote is None:
+                continue
+            item = change.quote.to_dynamodb_item()
+            item["synced_at"] = synced_at
+            if change.status_changed:
+                item["previous_status"] = change.previous_status
+                item["status_changed_at"] = synced_at
+            batch.put_item(Item=item)
+            written += 1
+    return written
+
+
+class SnapshotStore:
+    """The latest quote snapshot, kept as a gzipped object in S3."""
+
+    def __init__(
+        self, s3_client: "S3Client", bucket_name: str, object_key: str
+    ) -> None:
+        self.s3_client = s3_client
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+
+    @contextmanager
+    def open_previous(self) -> Iterator[Iterator[SnapshotEntry]]:
+        """Stream the stored snapshot off the GET response body; empty when there is none."""
+        from botocore.exceptions import ClientError
+
+        try:
+            body = self.s3_client.get_object(
+                Bucket=self.bucket_name, Key=self.object_key
+            )["Body"]
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") != "NoSuchKey":
+                raise
+            logger.info(
+                f"No previous snapshot at s3://{self.bucket_name}/{self.object_key}"
+            )
+            yield iter(())
+            return
+        try:
+            with gzip.GzipFile(fileobj=body, mode="rb") as gz:
+                yield read_snapshot(
+                    io.TextIOWrapper(gz, encoding="utf-8", newline="\n")
+                )
+        finally:
+            body.close()
+
+    def save(self, entries: Iterable[SnapshotEntry]) -> None:
+        with tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES) as buffer:
+            write_snapshot(entries, buffer)
+            buffer.seek(0)
+            self.s3_client.upload_fileobj(buffer, self.bucket_name, self.object_key)
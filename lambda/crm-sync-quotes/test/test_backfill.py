@@ -0,0 +1,183 @@
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from datetime import datetime
+from unittest.mock import patch
+import backfill
+from backfill import Backfill, FileResult, plan_jobs
+from model import Quote, Prospect, SalesRep, QuoteStatus
+
+TEST_ZIP = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "test.zip")
+
+
+def make_quote(quote_id):
+    return Quote(
+        id=quote_id,
+        prospect=Prospect(id="1", name="ACME", email="acme@example.com"),
+        sales_rep=SalesRep(id="1", name="", email="", phone_number=""),
+        item_ids=[],
+        amount=10.0,
+        status=QuoteStatus.SENT,
+        created_at="2024-01-01",
+    )
+
+
+class TestPlanJobs(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.temp_dir)
+        for name in ["erp-20240305.zip", "erp-2024-03-01.zip", "erp.zip", "notes.txt"]:
+            open(os.path.join(self.temp_dir, name), "w").close()
+
+    def test_orders_files_by_as_of_date(self):
+        undated = os.path.join(self.temp_dir, "erp.zip")
+        jobs = plan_jobs(
+            [self.temp_dir],
+            {os.path.abspath(undated): datetime(2024, 3, 3)},
+            None,
+        )
+
+        self.assertEqual(
+            [(os.path.basename(job.path), job.as_of.day) for job in jobs],
+            [("erp-2024-03-01.zip", 1), ("erp.zip", 3), ("erp-20240305.zip", 5)],
+        )
+
+    def test_requires_an_as_of_date(self):
+        with self.assertRaises(ValueError):
+            plan_jobs([self.temp_dir], {}, None)
+
+        jobs = plan_jobs([self.temp_dir], {}, datetime(2024, 3, 10))
+        self.assertEqual(jobs[-1].as_of, datetime(2024, 3, 10))
+
+
+def due(*quote_ids, step=3):
+    return [(make_quote(quote_id), step) for quote_id in quote_ids]
+
+
+class TestBackfill(unittest.TestCase):
+    def test_dry_run_skips_quotes_already_reported(self):
+        out = io.StringIO()
+        run = Backfill(seen={"1"}, out=out)
+
+        first = run.handle(FileResult("a.zip", datetime(2024, 1, 4), 3, due("1", "2")))
+        second = run.handle(FileResult("b.zip", datetime(2024, 1, 6), 3, due("2", "3")))
+
+        self.assertEqual((first["duplicates"], first["sent"]), (1, 1))
+        self.assertEqual((second["duplicates"], second["sent"]), (1, 1))
+        self.assertEqual(run.seen, {"1", "2:3", "3:3"})
+        self.assertIn("would send quote 3", out.getvalue())
+
+    def test_later_cadence_step_is_not_a_duplicate(self):
+        run = Backfill(seen={"1:3"}, out=io.StringIO())
+
+        summary = run.handle(
+            FileResult(
+                "a.zip", datetime(2024, 1, 6), 1, due("1", step=3) + due("1", step=5)
+            )
+        )
+
+        self.assertEqual((summary["duplicates"], summary["sent"]), (1, 1))
+        self.assertIn("1:5", run.seen)
+
+    def test_dry_run_does_not_fill_the_dedup_file(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dedup_path = os.path.join(temp_dir, "sent.txt")
+            result = FileResult("a.zip", datetime(2024, 1, 4), 2, due("1", "2"))
+
+            dry_run = Backfill(dedup_path=dedup_path, out=io.StringIO())
+            self.assertEqual(dry_run.handle(result)["sent"], 2)
+            self.assertEqual(backfill.load_dedup(dedup_path), set())
+
+            send_run = Backfill(
+                send=True,
+                seen=backfill.load_dedup(dedup_path),
+                dedup_path=dedup_path,
+                out=io.StringIO(),
+            )
+            with patch.object(Backfill, "_deliver", return_value=["1", "2"]) as deliver:
+                summary = send_run.handle(result)
+
+            self.assertEqual([q.id for q in deliver.call_args.args[0]], ["1", "2"])
+            self.assertEqual((summary["duplicates"], summary["sent"]), (0, 2))
+            self.assertEqual(backfill.load_dedup(dedup_path), {"1:3", "2:3"})
+
+    def test_send_only_remembers_delivered_quotes(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            dedup_path = os.path.join(temp_dir, "sent.txt")
+            run = Backfill(send=True, dedup_path=dedup_path, out=io.StringIO())
+            with patch.object(Backfill, "_deliver", return_value=["1"]) as deliver:
+                summary = run.handle(
+                    FileResult("a.zip", datetime(2024, 1, 4), 2, due("1", "2"))
+                )
+
+            self.assertEqual([q.id for q in deliver.call_args.args[0]], ["1", "2"])
+            self.assertEqual(summary["sent"], 1)
+            self.assertEqual(backfill.load_dedup(dedup_path), {"1:3"})
+
+    def test_failed_file_is_reported(self):
+        summary = Backfill(out=io.StringIO()).handle(
+            FileResult("a.zip", datetime(2024, 1, 4), error="Bad zip")
+        )
+        self.assertEqual(summary["error"], "Bad zip")
+
+
+class TestScanFile(unittest.TestCase):
+    def test_catch_up_lists_quotes_by_send_date(self):
+        quotes = [make_quote("1"), make_quote("2")]
+        quotes[1].created_at = "2024-01-03"
+        with tempfile.TemporaryDirectory() as temp_dir:
+            allowlist = os.path.join(temp_dir, "allowlist.yaml")
+            with open(allowlist, "w", encoding="utf-8") as f:
+                f.write("ids:\n- 1\n- 2\n")
+            job = backfill.FileJob("a.zip", datetime(2024, 1, 4), datetime(2024, 1, 8))
+            with patch("backfill.QuoteParser") as parser:
+                parser.return_value.read_quotes_from_zip.return_value = quotes
+                result = backfill.scan_file(job, {3, 5}, allowlist)
+
+        # 01-04: 1 (3 days), 01-06: 2 (3 days) and 1 (5 days), 01-08: 2 (5 days)
+        self.assertEqual(
+            [(quote.id, step) for quote, step in result.due],
+            [("1", 3), ("2", 3), ("1", 5), ("2", 5)],
+        )
+        self.assertEqual(result.quotes, 2)
+
+
+class TestBackfillMain(unittest.TestCase):
+    def test_quote_is_reported_once_across_files(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            for as_of in ["2024-07-24", "2024-07-25"]:
+                shutil.copy(TEST_ZIP, os.path.join(temp_dir, f"erp-{as_of}.zip"))
+            allowlist = os.path.join(temp_dir, "allowlist.yaml")
+            with open(allowlist, "w", encoding="utf-8") as f:
+                f.write("ids:\n- 427\n- 429\n- 430\n- 447\n")
+            out = io.StringIO()
+
+            summaries = backfill.main(
+                [
+                    temp_dir,
+                    "--cadence",
+                    "3,4",
+                    "--allowlist",
+                    allowlist,
+                    "--workers",
+                    "2",
+                    "--through",
+                    "2024-07-25",
+                ],
+                out=out,
+            )
+
+        # 429 and 430 were created on 07-21 and 447 on 07-22; 427 is not open.
+        # The first file catches up on 07-25 too, which the second one repeats
+        self.assertEqual(
+            [(s["due"], s["duplicates"], s["sent"]) for s in summaries],
+            [(5, 0, 5), (3, 3, 0)],
+        )
+        self.assertEqual(summaries[0]["quotes"], 2549)
+        self.assertIn("would send quote 447", out.getvalue())
+
+
+if __name__ == "__main__":
+    unittest.main()
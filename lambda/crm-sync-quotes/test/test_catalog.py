@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import catalog
+from catalog import ProductCatalog, get_product_catalog
+from model import Quote, Prospect, SalesRep, QuoteStatus, QuoteItem
+
+
+def make_quote(item_ids):
+    return Quote(
+        id="100",
+        prospect=Prospect(id="1", name="ACME", email="acme@example.com"),
+        sales_rep=SalesRep(id="1", name="", email="", phone_number=""),
+        item_ids=item_ids,
+        amount=10.0,
+        status=QuoteStatus.SENT,
+        created_at="2024-01-01",
+    )
+
+
+def make_dynamo_client(pages_by_segment):
+    dynamo_client = MagicMock()
+    paginator = MagicMock()
+    paginator.paginate.side_effect = lambda **kwargs: pages_by_segment.get(
+        kwargs["Segment"], []
+    )
+    dynamo_client.get_paginator.return_value = paginator
+    return dynamo_client
+
+
+class TestProductCatalog(unittest.TestCase):
+    def setUp(self):
+        catalog._catalog_cache.clear()
+        self.dynamo_client = make_dynamo_client(
+            {
+                0: [
+                    {
+                        "Items": [
+                            {
+                                "id": {"S": "GP7145"},
+                                "description": {"S": "BOMBA"},
+                                "product_type": {"S": "EQUIPOS"},
+                            }
+                        ]
+                    }
+                ],
+                1: [
+                    {
+                        "Items": [
+                            {
+                                "id": {"S": "1070976"},
+                                "description": {"S": "HOSE, COOLANT"},
+                                "product_type": {"S": "REFACCIONES"},
+                            }
+                        ]
+                    }
+                ],
+            }
+        )
+
+    def test_load_merges_all_segments(self):
+        product_catalog = ProductCatalog.load(
+            self.dynamo_client, "products", total_segments=2
+        )
+
+        self.assertEqual(len(product_catalog), 2)
+        self.assertEqual(
+            product_catalog.lookup("1070976"),
+            QuoteItem(id="1070976", description="HOSE, COOLANT", product_type="REFACCIONES"),
+        )
+        self.assertIsNone(product_catalog.lookup("UNKNOWN"))
+
+    def test_enrich_keeps_unknown_items(self):
+        product_catalog = ProductCatalog.load(self.dynamo_client, "products", 2)
+        quote = make_quote(["GP7145", "UNKNOWN"])
+
+        missing = product_catalog.enrich([quote])
+
+        self.assertEqual(missing, 1)
+        self.assertEqual(quote.items[0].description, "BOMBA")
+        self.assertEqual(quote.items[1], QuoteItem(id="UNKNOWN"))
+        self.assertEqual(quote.to_dynamodb_item()["items"][0]["product_type"], "EQUIPOS")
+
+    def test_catalog_cached_until_ttl_expires(self):
+        first = get_product_catalog(self.dynamo_client, "products", ttl_seconds=60)
+        second = get_product_catalog(self.dynamo_client, "products", ttl_seconds=60)
+        self.assertIs(first, second)
+
+        with patch("catalog.time.monotonic", return_value=first.loaded_at + 61):
+            third = get_product_catalog(self.dynamo_client, "products", ttl_seconds=60)
+        self.assertIsNot(first, third)
+
+
+if __name__ == "__main__":
+    unittest.main()
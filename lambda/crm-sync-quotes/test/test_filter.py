@@ -0,0 +1,112 @@
+import os
+import tempfile
+import time
+import unittest
+from datetime import date, datetime, timedelta
+from filter import QuoteFilter
+from model import Quote, Prospect, SalesRep, QuoteStatus
+
+CADENCE = {3, 5, 7}
+
+
+def make_quotes(count, first_created=date(2024, 1, 1)):
+    return [
+        Quote(
+            id=str(index),
+            prospect=Prospect(id="1", name="ACME", email="acme@example.com"),
+            sales_rep=SalesRep(id="1", name="", email="", phone_number=""),
+            item_ids=[],
+            amount=10.0,
+            status=QuoteStatus.SENT,
+            created_at=(first_created + timedelta(days=index % 365)).isoformat(),
+        )
+        for index in range(count)
+    ]
+
+
+class TestQuoteFilter(unittest.TestCase):
+    def make_filter(self, quotes, allowed):
+        with tempfile.NamedTemporaryFile(
+            "w", suffix=".yaml", delete=False, encoding="utf-8"
+        ) as f:
+            f.write("ids:\n" + "".join(f"- {quote_id}\n" for quote_id in allowed))
+        self.addCleanup(os.remove, f.name)
+        return QuoteFilter(quotes, CADENCE, f.name)
+
+    def test_filter_quotes_as_of_date(self):
+        quotes = make_quotes(10)
+        quote_filter = self.make_filter(quotes, ["0", "2", "4", "6"])
+
+        due = quote_filter.filter_quotes(now=datetime(2024, 1, 8))
+
+        # Created 7, 5, 3 and 1 days before
+        self.assertEqual([quote.id for quote in due], ["0", "2", "4"])
+
+    def test_ordered_and_cancelled_quotes_are_not_due(self):
+        quotes = make_quotes(3)
+        quotes[1].created_at = quotes[2].created_at = quotes[0].created_at
+        quotes[1].status = QuoteStatus.ORDERED
+        quotes[2].status = QuoteStatus.CANCELLED
+        quote_filter = self.make_filter(quotes, ["0", "1", "2"])
+
+        due = quote_filter.filter_quotes(now=datetime(2024, 1, 4))
+        due_by_date = quote_filter.filter_quotes_between(
+            date(2024, 1, 1), date(2024, 1, 31)
+        )
+
+        self.assertEqual([quote.id for quote in due], ["0"])
+        self.assertEqual(
+            {
+                q.id
+                for by_step in due_by_date.values()
+                for qs in by_step.values()
+                for q in qs
+            },
+            {"0"},
+        )
+
+    def test_range_matches_one_filter_per_day(self):
+        quotes = make_quotes(60)
+        quote_filter = self.make_filter(quotes, [str(i) for i in range(0, 60, 2)])
+        start, end = date(2024, 1, 10), date(2024, 2, 8)
+
+        due = quote_filter.filter_quotes_between(start, end)
+
+        self.assertEqual(list(due), sorted(due))
+        day = start
+        while day <= end:
+            expected = quote_filter.filter_quotes(
+                now=datetime.combine(day, datetime.min.time())
+            )
+            by_step = due.get(day, {})
+            self.assertEqual(
+                sorted(quote.id for quotes in by_step.values() for quote in quotes),
+                sorted(quote.id for quote in expected),
+                day,
+            )
+            for step, step_quotes in by_step.items():
+                for quote in step_quotes:
+                    created = date.fromisoformat(quote.created_at)
+                    self.assertEqual((day - created).days, step)
+            day += timedelta(days=1)
+
+    def test_range_cost_does_not_grow_with_days(self):
+        quotes = make_quotes(20000)
+        quote_filter = self.make_filter(quotes, [str(i) for i in range(20000)])
+
+        def best_of(start, end):
+            timings = []
+            for _ in range(3):
+                started = time.perf_counter()
+                quote_filter.filter_quotes_between(start, end)
+                timings.append(time.perf_counter() - started)
+            return min(timings)
+
+        one_day = best_of(date(2024, 6, 1), date(2024, 6, 1))
+        thirty_days = best_of(date(2024, 6, 1), date(2024, 6, 30))
+
+        self.assertLess(thirty_days, one_day * 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import io
+import unittest
+from unittest.mock import MagicMock
+from botocore.exceptions import ClientError
+from bloom import BloomFilter, BloomFilterGenerations
+from issued_ids import IssuedIdsPublisher
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": ""}}, "S3")
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_false_positive_rate_stays_near_the_target(self):
+        bloom = BloomFilter.for_capacity(10_000, 0.01)
+        for index in range(10_000):
+            bloom.add(f"issued-{index}")
+
+        self.assertTrue(all(f"issued-{index}" in bloom for index in range(10_000)))
+        false_positives = sum(f"unknown-{index}" in bloom for index in range(10_000))
+        self.assertLess(false_positives, 200)
+
+    def test_generations_round_trip_and_rotate(self):
+        filters = BloomFilterGenerations(100, 0.01, 2)
+        for index in range(250):
+            filters.add(str(index))
+
+        loaded = BloomFilterGenerations.from_bytes(filters.to_bytes(), 100, 0.01, 2)
+
+        self.assertEqual(len(loaded.filters), 2)
+        self.assertEqual(len(loaded), 150)
+        self.assertIn("249", loaded)
+        self.assertIn("100", loaded)
+
+    def test_rejects_foreign_data(self):
+        with self.assertRaises(ValueError):
+            BloomFilterGenerations.from_bytes(b"not a filter", 100, 0.01, 2)
+
+
+class TestIssuedIdsPublisher(unittest.TestCase):
+    def setUp(self):
+        self.s3 = MagicMock()
+        self.publisher = IssuedIdsPublisher(self.s3, "bucket", capacity=100)
+
+    def test_first_publish_creates_the_filter(self):
+        self.s3.get_object.side_effect = client_error("NoSuchKey")
+
+        self.publisher.publish(["tx-1", "tx-2"])
+
+        kwargs = self.s3.put_object.call_args.kwargs
+        self.assertEqual(kwargs["IfNoneMatch"], "*")
+        filters = BloomFilterGenerations.from_bytes(kwargs["Body"], 100, 0.001, 2)
+        self.assertIn("tx-1", filters)
+        self.assertIn("tx-2", filters)
+        self.assertIn("first-published-at", kwargs["Metadata"])
+
+    def test_retries_when_another_run_published_first(self):
+        existing = BloomFilterGenerations(100, 0.001, 2)
+        existing.add("tx-0")
+        self.s3.get_object.side_effect = lambda **kwargs: {
+            "Body": io.BytesIO(existing.to_bytes()),
+            "ETag": '"v1"',
+            "Metadata": {"first-published-at": "2024-07-01T00:00:00+00:00"},
+        }
+        self.s3.put_object.side_effect = [client_error("PreconditionFailed"), {}]
+
+        self.publisher.publish(["tx-1"])
+
+        self.assertEqual(self.s3.put_object.call_count, 2)
+        kwargs = self.s3.put_object.call_args.kwargs
+        self.assertEqual(kwargs["IfMatch"], '"v1"')
+        filters = BloomFilterGenerations.from_bytes(kwargs["Body"], 100, 0.001, 2)
+        self.assertIn("tx-0", filters)
+        self.assertIn("tx-1", filters)
+        # The time of the first publish is kept
+        self.assertEqual(
+            kwargs["Metadata"], {"first-published-at": "2024-07-01T00:00:00+00:00"}
+        )
+
+    def test_other_errors_are_raised(self):
+        self.s3.get_object.side_effect = client_error("AccessDenied")
+
+        with self.assertRaises(ClientError):
+            self.publisher.publish(["tx-1"])
+
+
+if __name__ == "__main__":
+    unittest.main()
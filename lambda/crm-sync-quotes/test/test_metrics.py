@@ -0,0 +1,87 @@
+import io
+import json
+import os
+import unittest
+from unittest.mock import patch
+import metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def emitted(self, stdout: io.StringIO):
+        return [json.loads(line) for line in stdout.getvalue().splitlines()]
+
+    @patch("sys.stdout", new_callable=io.StringIO)
+    def test_stage_writes_embedded_metric_format(self, stdout):
+        collector = metrics.Metrics("crm-sync-quotes", namespace="Test")
+
+        with collector.stage("decode") as stage:
+            stage.records = 10
+            stage.bytes = 2048
+
+        [document] = self.emitted(stdout)
+        directive = document["_aws"]["CloudWatchMetrics"][0]
+        self.assertEqual(directive["Namespace"], "Test")
+        self.assertEqual(directive["Dimensions"], [["Service", "Stage"]])
+        self.assertEqual(
+            {metric["Name"] for metric in directive["Metrics"]},
+            {"Duration", "Records", "Bytes", "Throughput"},
+        )
+        self.assertEqual(document["Service"], "crm-sync-quotes")
+        self.assertEqual(document["Stage"], "decode")
+        self.assertEqual(document["Records"], 10)
+        self.assertEqual(document["Bytes"], 2048)
+
+    @patch("sys.stdout", new_callable=io.StringIO)
+    def test_summary_totals_every_run_of_a_stage(self, stdout):
+        collector = metrics.Metrics("crm-sync-quotes", enabled=False)
+
+        for _ in range(3):
+            with collector.stage("download") as stage:
+                stage.records = 2
+        metrics_summary = collector.summary()
+
+        self.assertEqual(stdout.getvalue(), "")
+        self.assertEqual(metrics_summary["download.Records"], 6)
+        self.assertGreaterEqual(
+            metrics_summary["InvocationDuration"], metrics_summary["download.Duration"]
+        )
+
+    @patch("sys.stdout", new_callable=io.StringIO)
+    @patch.dict(os.environ, {"METRICS_ENABLED": "true"})
+    def test_instrument_writes_one_summary_per_invocation(self, stdout):
+        @metrics.timed("filter")
+        def filter_quotes():
+            return [1, 2, 3]
+
+        @metrics.instrument("crm-sync-quotes")
+        def handler(event, context):
+            filter_quotes()
+            metrics.record("ses", 0.5, records=3)
+            return {"statusCode": 200}
+
+        handler({}, None)
+
+        documents = self.emitted(stdout)
+        self.assertEqual([d.get("Stage") for d in documents], ["filter", "ses", None])
+        summary = documents[-1]
+        self.assertEqual(summary["StatusCode"], 200)
+        self.assertEqual(summary["filter.Records"], 3)
+        self.assertEqual(summary["ses.Duration"], 500.0)
+        self.assertFalse(metrics.current().enabled)
+
+    @patch("sys.stdout", new_callable=io.StringIO)
+    @patch.dict(os.environ, {}, clear=True)
+    def test_disabled_outside_lambda(self, stdout):
+        @metrics.instrument("crm-sync-quotes")
+        def handler(event, context):
+            with metrics.stage("download"):
+                pass
+            return {"statusCode": 200}
+
+        handler({}, None)
+
+        self.assertEqual(stdout.getvalue(), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,166 @@
+import io
+import logging
+import os
+import struct
+import unittest
+import zipfile
+from unittest.mock import patch
+import memory_budget
+from parser import (
+    COTIZAC_FILENAME,
+    COTIZAD_FILENAME,
+    CLIENTES_FILENAME,
+    DISK,
+    MEMORY,
+    PROSPECTS_FILENAME,
+    STREAMING,
+    QuoteParser,
+    choose_strategy,
+    estimate_bytes,
+)
+
+MIB = 1024 * 1024
+
+
+def dbf(fields, rows):
+    """A dBase III table of character (C), numeric (N) and date (D) fields."""
+    record_length = 1 + sum(length for _, _, length in fields)
+    header_length = 32 + 32 * len(fields) + 1
+    data = bytearray(
+        struct.pack(
+            "<BBBBIHH20x", 3, 124, 1, 1, len(rows), header_length, record_length
+        )
+    )
+    for name, kind, length in fields:
+        data += struct.pack("<11sc4xBB14x", name.encode(), kind.encode(), length, 0)
+    data += b"\r"
+    for row in rows:
+        data += b" "
+        for (name, kind, length), value in zip(fields, row):
+            text = str(value)
+            data += (text.rjust(length) if kind == "N" else text.ljust(length)).encode(
+                "latin1"
+            )
+    return bytes(data + b"\x1a")
+
+
+def quotes_zip():
+    """Two quotes of a prospect and a client, the first with two items."""
+    tables = {
+        COTIZAC_FILENAME: dbf(
+            [
+                ("NO_COT", "N", 8),
+                ("CVE_CTE", "C", 6),
+                ("TIPO_CTE", "C", 1),
+                ("CVE_AGE", "C", 4),
+                ("STATUS", "C", 10),
+                ("TOTAL_COT", "N", 10),
+                ("F_ALTA_COT", "D", 8),
+            ],
+            [
+                (101, "P1", "P", "7", "EMITIDA", 250, "20240701"),
+                (102, "C1", "C", "7", "PEDIDA", 80, "20240702"),
+                (103, "C9", "C", "7", "EMITIDA", 10, "20240703"),
+            ],
+        ),
+        COTIZAD_FILENAME: dbf(
+            [("NO_COT", "N", 8), ("CVE_PROD", "C", 10)],
+            [(101, "GP7145"), (101, "GP7146"), (102, "KL100")],
+        ),
+        CLIENTES_FILENAME: dbf(
+            [("CVE_CTE", "C", 6), ("NOM_CTE", "C", 20), ("EMAIL_CTE", "C", 30)],
+            [("C1", "ACME", "buyer@acme.example; boss@acme.example")],
+        ),
+        PROSPECTS_FILENAME: dbf(
+            [("CVE_PROS", "C", 6), ("NOM_PROS", "C", 20), ("EMAIL_PROS", "C", 30)],
+            [("P1", "Globex", "ops@globex.example")],
+        ),
+    }
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as archive:
+        for name, data in tables.items():
+            archive.writestr(name.upper() if name == COTIZAD_FILENAME else name, data)
+    buffer.seek(0)
+    return buffer
+
+
+SIZES = {
+    COTIZAC_FILENAME: 100 * MIB,
+    COTIZAD_FILENAME: 300 * MIB,
+    CLIENTES_FILENAME: 20 * MIB,
+    PROSPECTS_FILENAME: 20 * MIB,
+}
+
+
+class TestStrategies(unittest.TestCase):
+    def test_choice_follows_the_available_memory(self):
+        self.assertEqual(choose_strategy(SIZES, 8 * 1024 * MIB), MEMORY)
+        self.assertEqual(choose_strategy(SIZES, 900 * MIB), STREAMING)
+        self.assertEqual(choose_strategy(SIZES, 200 * MIB), DISK)
+        self.assertEqual(choose_strategy(SIZES, None), MEMORY)
+
+    def test_estimates_shrink_with_each_strategy(self):
+        memory, streaming, disk = (
+            estimate_bytes(strategy, SIZES) for strategy in (MEMORY, STREAMING, DISK)
+        )
+
+        self.assertGreater(memory, streaming)
+        self.assertGreater(streaming, disk)
+
+    def test_every_strategy_reads_the_same_quotes(self):
+        results = {
+            strategy: QuoteParser(
+                quotes_zip(), "", sales_reps={}, strategy=strategy
+            ).read_quotes_from_zip()
+            for strategy in (MEMORY, STREAMING, DISK)
+        }
+
+        quotes = results[MEMORY]
+        self.assertEqual(results[STREAMING], quotes)
+        self.assertEqual(results[DISK], quotes)
+        self.assertEqual([quote.id for quote in quotes], ["101", "102"])
+        self.assertEqual(quotes[0].item_ids, ["GP7145", "GP7146"])
+        self.assertEqual(quotes[0].prospect.email, "ops@globex.example")
+        self.assertEqual(quotes[1].prospect.email, "buyer@acme.example")
+
+    def test_tight_budget_falls_back_to_the_disk_index(self):
+        with patch.dict(os.environ, {"PARSER_STRATEGY": "auto"}), patch(
+            "memory_budget.available_bytes", return_value=0
+        ), self.assertLogs("parser", logging.INFO) as logs:
+            quotes = QuoteParser(quotes_zip(), "", sales_reps={}).read_quotes_from_zip()
+
+        self.assertEqual(len(quotes), 2)
+        self.assertIn("with the disk strategy", "\n".join(logs.output))
+
+    def test_missing_tables_give_no_quotes(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr(COTIZAC_FILENAME, b"")
+        buffer.seek(0)
+
+        self.assertEqual(
+            QuoteParser(buffer, "", sales_reps={}).read_quotes_from_zip(), []
+        )
+
+
+class TestMemoryBudget(unittest.TestCase):
+    @patch.dict(os.environ, {"AWS_LAMBDA_FUNCTION_MEMORY_SIZE": "1024"})
+    def test_available_memory_is_the_limit_less_what_is_held(self):
+        with patch("memory_budget.rss_bytes", return_value=300 * MIB):
+            self.assertEqual(memory_budget.available_bytes(), 724 * MIB)
+
+    @patch.dict(os.environ, {"PARSER_TRACE_MEMORY": "true"})
+    def test_traced_peak_is_logged(self):
+        with self.assertLogs("memory_budget", logging.INFO) as logs:
+            with memory_budget.account(
+                "streaming parse", 4 * MIB, 700 * MIB
+            ) as account:
+                held = bytearray(2 * MIB)
+            del held
+
+        self.assertGreaterEqual(account.traced_peak, 2 * MIB)
+        self.assertIn("traced peak 2 MiB", logs.output[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
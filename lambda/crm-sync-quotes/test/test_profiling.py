@@ -0,0 +1,153 @@
+import os
+import pstats
+import tempfile
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from types import SimpleNamespace
+from unittest.mock import MagicMock, patch
+import clients
+import profiling
+
+S3_EVENT = {
+    "Records": [{"s3": {"bucket": {"name": "bucket"}, "object": {"key": "q.zip"}}}]
+}
+
+
+def busy_handler(event, context):
+    data = [str(i) * 10 for i in range(20000)]
+    time.sleep(0.05)
+    return {"statusCode": 200, "body": len(data)}
+
+
+def pooled_work(n):
+    return sum(str(i).count("1") for i in range(n))
+
+
+def pooled_handler(event, context):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        return {"statusCode": 200, "body": sum(executor.map(pooled_work, [5000] * 4))}
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.s3_client = MagicMock()
+        clients.set_client("s3", self.s3_client)
+        self.temp_dir = tempfile.TemporaryDirectory()
+        patcher = patch(
+            "profiling.tempfile.gettempdir", return_value=self.temp_dir.name
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.addCleanup(self.temp_dir.cleanup)
+        self.addCleanup(clients.reset)
+        self.handler = profiling.profiled("crm-sync-quotes")(busy_handler)
+        self.context = SimpleNamespace(aws_request_id="req-1")
+
+    def written(self):
+        return sorted(os.listdir(self.temp_dir.name))
+
+    @patch.dict(os.environ, {}, clear=True)
+    def test_not_profiled_by_default(self):
+        response = self.handler(S3_EVENT, self.context)
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(self.written(), [])
+        self.s3_client.head_object.assert_not_called()
+
+    @patch.dict(os.environ, {"PROFILE_MODE": "cprofile"}, clear=True)
+    def test_cprofile_mode_writes_stats_and_allocations(self):
+        response = self.handler(S3_EVENT, self.context)
+
+        self.assertEqual(response["body"], 20000)
+        files = self.written()
+        self.assertEqual(len(files), 2)
+        [stats_file] = [f for f in files if f.endswith(".pstats")]
+        self.assertIn("req-1", stats_file)
+        stats = pstats.Stats(os.path.join(self.temp_dir.name, stats_file))
+        self.assertTrue(
+            any(func[2] == "busy_handler" for func in stats.stats)  # type: ignore[attr-defined]
+        )
+        [report_file] = [f for f in files if f.endswith(".txt")]
+        with open(os.path.join(self.temp_dir.name, report_file)) as f:
+            report = f.read()
+        self.assertIn("allocation sites", report)
+        self.assertIn("test_profiling.py", report)
+
+    @patch.dict(os.environ, {"PROFILE_MODE": "cprofile"}, clear=True)
+    def test_cprofile_mode_includes_thread_pool_tasks(self):
+        handler = profiling.profiled("crm-sync-quotes")(pooled_handler)
+
+        response = handler(S3_EVENT, self.context)
+
+        self.assertEqual(response["body"], 4 * pooled_work(5000))
+        [stats_file] = [f for f in self.written() if f.endswith(".pstats")]
+        stats = pstats.Stats(os.path.join(self.temp_dir.name, stats_file))
+        [calls] = [
+            stat[1]
+            for func, stat in stats.stats.items()  # type: ignore[attr-defined]
+            if func[2] == "pooled_work"
+        ]
+        self.assertEqual(calls, 4)
+        [report_file] = [f for f in self.written() if f.endswith(".txt")]
+        with open(os.path.join(self.temp_dir.name, report_file)) as f:
+            self.assertIn("pooled_work", f.read())
+        self.assertEqual(ThreadPoolExecutor.submit.__name__, "submit")
+
+    @patch.dict(
+        os.environ,
+        {"PROFILE_MODE": "sample", "PROFILE_SAMPLE_INTERVAL_MS": "5"},
+        clear=True,
+    )
+    def test_sample_mode_writes_collapsed_stacks(self):
+        with patch("tracemalloc.start") as start:
+            self.handler(S3_EVENT, self.context)
+
+        start.assert_not_called()
+        [folded_file] = [f for f in self.written() if f.endswith(".folded")]
+        with open(os.path.join(self.temp_dir.name, folded_file)) as f:
+            stacks = f.read()
+        self.assertIn("busy_handler", stacks)
+        [report_file] = [f for f in self.written() if f.endswith(".txt")]
+        with open(os.path.join(self.temp_dir.name, report_file)) as f:
+            self.assertNotIn("allocation sites", f.read())
+
+    @patch.dict(
+        os.environ,
+        {"PROFILE_MODE": "sample", "PROFILE_TRACE_MEMORY": "true"},
+        clear=True,
+    )
+    def test_sample_mode_traces_memory_when_enabled(self):
+        self.handler(S3_EVENT, self.context)
+
+        [report_file] = [f for f in self.written() if f.endswith(".txt")]
+        with open(os.path.join(self.temp_dir.name, report_file)) as f:
+            self.assertIn("allocation sites", f.read())
+
+    @patch.dict(
+        os.environ,
+        {"PROFILE_FROM_METADATA": "true", "PROFILE_BUCKET": "profiles-bucket"},
+        clear=True,
+    )
+    def test_metadata_marker_enables_profiling_and_uploads(self):
+        self.s3_client.head_object.return_value = {"Metadata": {"profile": "sample"}}
+
+        self.handler(S3_EVENT, self.context)
+
+        self.s3_client.head_object.assert_called_once_with(Bucket="bucket", Key="q.zip")
+        keys = [c.kwargs["Key"] for c in self.s3_client.put_object.call_args_list]
+        self.assertEqual(len(keys), 2)
+        self.assertTrue(all(k.startswith("profiles/crm-sync-quotes/") for k in keys))
+        self.assertEqual(self.written(), [])
+
+    @patch.dict(os.environ, {"PROFILE_FROM_METADATA": "true"}, clear=True)
+    def test_object_without_marker_is_not_profiled(self):
+        self.s3_client.head_object.return_value = {"Metadata": {}}
+
+        self.handler(S3_EVENT, self.context)
+
+        self.assertEqual(self.written(), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
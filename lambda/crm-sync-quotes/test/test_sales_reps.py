@@ -0,0 +1,73 @@
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+import sales_reps
+from sales_reps import SalesRepProvider, load_sales_reps_from_csv
+from model import SalesRep
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+CSV_PATH = os.path.join(BASE_DIR, "assets", "sales_rep.csv")
+
+
+class TestSalesRepProvider(unittest.TestCase):
+    def setUp(self):
+        sales_reps._cache.clear()
+        self.table = MagicMock()
+        self.table.name = "crm-sales-reps"
+        self.table.scan.side_effect = [
+            {
+                "Items": [{"id": "1", "name": "MIGUEL", "email": "m@x.mx", "phone": "81"}],
+                "LastEvaluatedKey": {"id": "1"},
+            },
+            {"Items": [{"id": "8", "name": "JORGE", "email": "j@x.mx"}]},
+        ]
+        self.state_table = MagicMock()
+        self.state_table.get_item.return_value = {"Item": {"etag": "v1"}}
+
+    def test_without_table_reads_csv(self):
+        reps = SalesRepProvider(CSV_PATH).get_sales_reps()
+
+        self.assertEqual(reps, load_sales_reps_from_csv(CSV_PATH))
+        self.assertEqual(reps["1"].phone_number, "8116787046")
+
+    def test_scans_all_pages(self):
+        reps = SalesRepProvider(CSV_PATH, self.table).get_sales_reps()
+
+        self.assertEqual(self.table.scan.call_count, 2)
+        self.assertEqual(
+            self.table.scan.call_args.kwargs, {"ExclusiveStartKey": {"id": "1"}}
+        )
+        self.assertEqual(reps["1"], SalesRep("1", "MIGUEL", "m@x.mx", "81"))
+        self.assertEqual(reps["8"].phone_number, "")
+
+    def test_cached_within_ttl(self):
+        provider = SalesRepProvider(CSV_PATH, self.table, self.state_table, 60)
+        first = provider.get_sales_reps()
+        second = provider.get_sales_reps()
+
+        self.assertIs(first, second)
+        self.assertEqual(self.table.scan.call_count, 2)
+        self.state_table.get_item.assert_called_once()
+
+    def test_revalidates_with_version_after_ttl(self):
+        provider = SalesRepProvider(CSV_PATH, self.table, self.state_table, 60)
+        first = provider.get_sales_reps()
+        loaded_at = sales_reps._cache["crm-sales-reps"].loaded_at
+
+        with patch("sales_reps.time.monotonic", return_value=loaded_at + 61):
+            second = provider.get_sales_reps()
+
+        self.assertIs(first, second)
+        self.assertEqual(self.table.scan.call_count, 2)
+        self.assertEqual(self.state_table.get_item.call_count, 2)
+
+    def test_falls_back_to_csv_on_error(self):
+        self.table.scan.side_effect = Exception("AccessDenied")
+
+        reps = SalesRepProvider(CSV_PATH, self.table).get_sales_reps()
+
+        self.assertEqual(len(reps), 4)
+
+
+if __name__ == "__main__":
+    unittest.main()
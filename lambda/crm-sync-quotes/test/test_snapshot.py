@@ -0,0 +1,171 @@
+import io
+import os
+import unittest
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+import main
+from model import Quote, Prospect, SalesRep, QuoteStatus
+from snapshot import (
+    CHANGED,
+    INSERTED,
+    REMOVED,
+    SnapshotStore,
+    build_snapshot,
+    diff_snapshots,
+    read_snapshot,
+    write_changes,
+    write_snapshot,
+)
+
+
+def make_quote(quote_id, status=QuoteStatus.SENT, amount=10.0):
+    return Quote(
+        id=quote_id,
+        prospect=Prospect(id="1", name="ACME", email="acme@example.com"),
+        sales_rep=SalesRep(
+            id="7", name="Ana", email="ana@example.com", phone_number=""
+        ),
+        item_ids=["GP7145"],
+        amount=amount,
+        status=status,
+        created_at="2024-01-01",
+    )
+
+
+def snapshot_of(quotes):
+    return [entry for entry, _ in build_snapshot(quotes)]
+
+
+class TestDiffSnapshots(unittest.TestCase):
+    def test_reports_inserted_changed_and_removed_quotes(self):
+        previous = snapshot_of(
+            [make_quote("1"), make_quote("2"), make_quote("3"), make_quote("5")]
+        )
+        current = build_snapshot(
+            [
+                make_quote("5", amount=12.5),
+                make_quote("4"),
+                make_quote("2", QuoteStatus.ORDERED),
+                make_quote("1"),
+            ]
+        )
+
+        changes = list(diff_snapshots(previous, current))
+
+        self.assertEqual(
+            [(change.kind, change.quote_id) for change in changes],
+            [(CHANGED, "2"), (REMOVED, "3"), (INSERTED, "4"), (CHANGED, "5")],
+        )
+        self.assertTrue(changes[0].status_changed)
+        self.assertEqual(
+            (changes[0].previous_status, changes[0].status), ("Emitida", "Pedida")
+        )
+        self.assertFalse(changes[3].status_changed)
+        self.assertIsNone(changes[1].quote)
+        self.assertEqual(changes[2].quote.id, "4")
+
+    def test_enrichment_is_not_a_change(self):
+        quote = make_quote("1")
+        previous = snapshot_of([quote])
+        quote.items = [MagicMock()]
+
+        self.assertEqual(list(diff_snapshots(previous, build_snapshot([quote]))), [])
+
+    def test_snapshot_round_trip_is_sorted_by_id(self):
+        buffer = io.BytesIO()
+        entries = snapshot_of([make_quote("20"), make_quote("3"), make_quote("100")])
+
+        write_snapshot(entries, buffer)
+        buffer.seek(0)
+        store = SnapshotStore(MagicMock(), "bucket", "snapshots/quotes.tsv.gz")
+        store.s3_client.get_object.return_value = {"Body": buffer}
+        with store.open_previous() as previous:
+            self.assertEqual(list(previous), entries)
+
+        self.assertEqual([entry[0] for entry in entries], ["100", "20", "3"])
+
+    def test_missing_snapshot_is_empty(self):
+        s3_client = MagicMock()
+        s3_client.get_object.side_effect = ClientError(
+            {"Error": {"Code": "NoSuchKey", "Message": ""}}, "GetObject"
+        )
+
+        with SnapshotStore(s3_client, "bucket", "key").open_previous() as previous:
+            self.assertEqual(list(previous), [])
+
+    def test_read_snapshot_lines(self):
+        self.assertEqual(
+            list(read_snapshot(["1\tEmitida\tab\n", "2\tPedida\tcd\n"])),
+            [("1", "Emitida", "ab"), ("2", "Pedida", "cd")],
+        )
+
+
+class TestWriteChanges(unittest.TestCase):
+    def test_puts_inserted_and_changed_quotes(self):
+        table = MagicMock()
+        batch = table.batch_writer.return_value.__enter__.return_value
+        changes = list(
+            diff_snapshots(
+                snapshot_of([make_quote("1"), make_quote("2")]),
+                build_snapshot(
+                    [make_quote("2", QuoteStatus.CANCELLED), make_quote("3")]
+                ),
+            )
+        )
+
+        written = write_changes(table, changes, "2024-01-02T00:00:00")
+
+        self.assertEqual(written, 2)
+        items = [call.kwargs["Item"] for call in batch.put_item.call_args_list]
+        self.assertEqual([item["quote_id"] for item in items], ["2", "3"])
+        self.assertEqual(items[0]["previous_status"], "Emitida")
+        self.assertEqual(items[0]["status"], "Cancelada")
+        self.assertEqual(items[0]["status_changed_at"], "2024-01-02T00:00:00")
+        self.assertNotIn("previous_status", items[1])
+        self.assertEqual(items[1]["amount"], Decimal("10.0"))
+        self.assertEqual(items[1]["sales_rep"]["id"], "7")
+
+
+def objects_in(s3_objects):
+    """An S3 client mock keeping uploaded objects in a dict."""
+
+    def get_object(Bucket, Key):
+        if Key not in s3_objects:
+            raise ClientError(
+                {"Error": {"Code": "NoSuchKey", "Message": ""}}, "GetObject"
+            )
+        return {"Body": io.BytesIO(s3_objects[Key])}
+
+    s3_client = MagicMock()
+    s3_client.get_object.side_effect = get_object
+    s3_client.upload_fileobj.side_effect = lambda fileobj, bucket, key: (
+        s3_objects.__setitem__(key, fileobj.read())
+    )
+    return s3_client
+
+
+@patch.dict(os.environ, {"SNAPSHOT_BUCKET": "snapshots", "QUOTES_TABLE_NAME": "q"})
+class TestSyncSnapshot(unittest.TestCase):
+    def test_each_upload_is_diffed_against_its_own_snapshot(self):
+        s3_objects = {}
+        s3_client = objects_in(s3_objects)
+        dynamodb = MagicMock()
+        branch_a = [make_quote("1"), make_quote("2")]
+        branch_b = [make_quote("10")]
+
+        main.sync_snapshot(s3_client, dynamodb, "uploads/MTY.zip", branch_a)
+        changes = main.sync_snapshot(s3_client, dynamodb, "uploads/MAT.zip", branch_b)
+
+        self.assertEqual([(c.kind, c.quote_id) for c in changes], [(INSERTED, "10")])
+        self.assertEqual(
+            sorted(s3_objects),
+            ["snapshots/uploads/MAT.tsv.gz", "snapshots/uploads/MTY.tsv.gz"],
+        )
+        branch_a[0].status = QuoteStatus.CANCELLED
+        changes = main.sync_snapshot(s3_client, dynamodb, "uploads/MTY.zip", branch_a)
+        self.assertEqual([(c.kind, c.quote_id) for c in changes], [(CHANGED, "1")])
+
+
+if __name__ == "__main__":
+    unittest.main()
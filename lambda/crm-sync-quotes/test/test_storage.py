@@ -0,0 +1,117 @@
+import io
+import os
+import unittest
+import zipfile
+from unittest.mock import patch
+from botocore.exceptions import ClientError
+import storage
+from storage import ObjectChangedError, open_s3_object
+
+
+class FakeS3Client:
+    """Serves a single object from memory, honouring Range and IfMatch requests."""
+
+    def __init__(self, data: bytes, etag: str = '"v1"'):
+        self.data = data
+        self.etag = etag
+        self.heads = 0
+        self.ranges = []
+        self.conditions = []
+
+    def head_object(self, Bucket, Key):
+        self.heads += 1
+        return {"ContentLength": len(self.data), "ETag": self.etag}
+
+    def get_object(self, Bucket, Key, Range=None, IfMatch=None):
+        self.conditions.append(IfMatch)
+        if IfMatch is not None and IfMatch != self.etag:
+            raise ClientError(
+                {"Error": {"Code": "PreconditionFailed", "Message": "ETag mismatch"}},
+                "GetObject",
+            )
+        data = self.data
+        if Range:
+            start, end = (int(part) for part in Range[len("bytes=") :].split("-"))
+            self.ranges.append((start, end))
+            data = data[start : end + 1]
+        return {"Body": io.BytesIO(data)}
+
+
+def make_zip() -> bytes:
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", zipfile.ZIP_STORED) as archive:
+        archive.writestr("cotizac.DBF", os.urandom(20000))
+        archive.writestr("cotizad.DBF", b"detail" * 1000)
+    return buffer.getvalue()
+
+
+class TestOpenS3Object(unittest.TestCase):
+    def setUp(self):
+        self.data = make_zip()
+
+    def test_spooled_zip_is_readable(self):
+        s3_client = FakeS3Client(self.data)
+
+        with open_s3_object(s3_client, "bucket", "quotes.zip") as zip_file:
+            with zipfile.ZipFile(zip_file) as archive:
+                self.assertEqual(archive.read("cotizad.DBF"), b"detail" * 1000)
+
+        self.assertEqual(s3_client.ranges, [])
+        self.assertEqual(s3_client.conditions, ['"v1"'])
+
+    @patch.dict(
+        os.environ, {"SPOOL_MAX_BYTES": "1024", "IN_MEMORY_MAX_BYTES": "1048576"}
+    )
+    @patch.object(storage, "RANGE_PART_BYTES", 4096)
+    def test_ranged_zip_is_readable(self):
+        s3_client = FakeS3Client(self.data)
+
+        with open_s3_object(s3_client, "bucket", "quotes.zip") as zip_file:
+            with zipfile.ZipFile(zip_file) as archive:
+                self.assertEqual(archive.read("cotizad.DBF"), b"detail" * 1000)
+                self.assertEqual(len(archive.read("cotizac.DBF")), 20000)
+
+        self.assertGreater(len(s3_client.ranges), 1)
+
+    @patch.dict(
+        os.environ, {"SPOOL_MAX_BYTES": "1024", "IN_MEMORY_MAX_BYTES": "1048576"}
+    )
+    @patch.object(storage, "RANGE_PART_BYTES", 4096)
+    def test_ranged_gets_use_the_event_etag(self):
+        s3_client = FakeS3Client(self.data)
+
+        with open_s3_object(
+            s3_client, "bucket", "quotes.zip", size=len(self.data), etag="v1"
+        ) as zip_file:
+            with zipfile.ZipFile(zip_file) as archive:
+                self.assertEqual(archive.read("cotizad.DBF"), b"detail" * 1000)
+
+        self.assertEqual(s3_client.heads, 0)
+        self.assertGreater(len(s3_client.conditions), 1)
+        self.assertEqual(set(s3_client.conditions), {'"v1"'})
+
+    @patch.dict(
+        os.environ, {"SPOOL_MAX_BYTES": "1024", "IN_MEMORY_MAX_BYTES": "1048576"}
+    )
+    @patch.object(storage, "RANGE_PART_BYTES", 4096)
+    def test_overwritten_object_is_not_mixed_with_the_new_version(self):
+        s3_client = FakeS3Client(self.data, etag='"v2"')
+
+        with self.assertRaises(ObjectChangedError):
+            with open_s3_object(
+                s3_client, "bucket", "quotes.zip", size=len(self.data), etag="v1"
+            ):
+                pass
+
+    @patch.dict(os.environ, {"SPOOL_MAX_BYTES": "1024", "IN_MEMORY_MAX_BYTES": "1024"})
+    @patch.object(storage, "RANGE_PART_BYTES", 4096)
+    def test_file_backed_zip_is_readable(self):
+        s3_client = FakeS3Client(self.data)
+
+        with open_s3_object(s3_client, "bucket", "quotes.zip") as zip_file:
+            with zipfile.ZipFile(zip_file) as archive:
+                self.assertEqual(archive.namelist(), ["cotizac.DBF", "cotizad.DBF"])
+
+
+if __name__ == "__main__":
+    unittest.main()
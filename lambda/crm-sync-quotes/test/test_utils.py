@@ -0,0 +1,43 @@
+import unittest
+from model import ObjectVersion
+from utils import parse_s3_event, extract_email
+
+
+class TestParseS3Event(unittest.TestCase):
+    def test_parses_every_record(self):
+        event = {
+            "Records": [
+                {
+                    "s3": {
+                        "bucket": {"name": "b"},
+                        "object": {"key": "MTY.zip", "size": 2048, "eTag": "abc"},
+                    }
+                },
+                {"s3": {"bucket": {"name": "b"}, "object": {"key": "MAT.zip"}}},
+            ]
+        }
+
+        self.assertEqual(
+            parse_s3_event(event),
+            [ObjectVersion("b", "MTY.zip", "abc", 2048), ObjectVersion("b", "MAT.zip")],
+        )
+
+    def test_empty_records(self):
+        with self.assertRaises(ValueError):
+            parse_s3_event({"Records": []})
+
+    def test_missing_object_key(self):
+        with self.assertRaises(ValueError):
+            parse_s3_event({"Records": [{"s3": {"bucket": {"name": "b"}}}]})
+
+
+class TestExtractEmail(unittest.TestCase):
+    def test_first_valid_email(self):
+        self.assertEqual(extract_email("; a@x.mx; b@x.mx"), "a@x.mx")
+
+    def test_no_email(self):
+        self.assertEqual(extract_email("N/A"), "")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,10 @@
 import os
 import logging
-from typing import Dict, Any, Tuple
-import tempfile
-from mypy_boto3_s3 import S3Client
+from typing import TYPE_CHECKING, Dict, Any, List
+from model import ObjectVersion
+
+if TYPE_CHECKING:
+    from mypy_boto3_s3 import S3Client
 
 
 logger = logging.getLogger(__name__)
@@ -10,37 +12,32 @@ logger = logging.getLogger(__name__)
 BATCH_SIZE = 25
 
 
-def parse_s3_event(event: Dict[str, Any]) -> Tuple[str, str]:
+def parse_s3_event(event: Dict[str, Any]) -> List[ObjectVersion]:
     """
-    Parses the S3 event to extract the bucket name and object key.
+    Parses every record of the S3 event into the uploaded object's bucket, key,
+    ETag and size.
     """
     try:
-        record = event["Records"][0]
-        bucket_name = record["s3"]["bucket"]["name"]
-        object_key = record["s3"]["object"]["key"]
-        logger.info(f"Parsed S3 event: bucket={bucket_name}, key={object_key}")
-        return bucket_name, object_key
-    except (KeyError, IndexError) as e:
+        records = event["Records"]
+        if not records:
+            raise IndexError("event has no records")
+        objects = []
+        for record in records:
+            s3_object = record["s3"]["object"]
+            version = ObjectVersion(
+                bucket=record["s3"]["bucket"]["name"],
+                key=s3_object["key"],
+                etag=str(s3_object.get("eTag", "")).strip('"'),
+                size=int(s3_object.get("size", 0)),
+            )
+            logger.info(f"Parsed S3 event: bucket={version.bucket}, key={version.key}")
+            objects.append(version)
+        return objects
+    except (KeyError, IndexError, TypeError) as e:
         logger.error(f"Error parsing S3 event: {e}", exc_info=True)
         raise ValueError(f"Error parsing event: {e}")
 
 
-def download_file_from_s3(
-    s3_client: S3Client, bucket_name: str, object_key: str
-) -> str:
-    """
-    Downloads a file from S3 to a temporary file and returns the path.
-    """
-    with tempfile.NamedTemporaryFile(
-        mode="wb", delete=False, suffix=".csv"
-    ) as temp_file:
-        temp_file_path = temp_file.name
-        logger.info(f"Downloading s3://{bucket_name}/{object_key} to {temp_file_path}")
-        s3_client.download_fileobj(bucket_name, object_key, temp_file)
-        logger.info("Download complete")
-        return temp_file_path
-
-
 def safe_get_env(var_name: str) -> str:
     value = os.getenv(var_name)
     if not value:
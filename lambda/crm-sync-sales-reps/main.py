@@ -1,106 +1,185 @@
-import boto3
-import tempfile
 import os
 import logging
-from mypy_boto3_dynamodb.service_resource import DynamoDBServiceResource, Table
-from mypy_boto3_s3 import S3Client
-from typing import Dict, Any, Tuple, List
-from utils import read_sales_reps_from_csv, safe_get_env, write_sales_reps_to_dynamo
-from model import SalesRep
+import clients
+import metrics
+import profiling
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
+from storage import open_s3_text
+from utils import (
+    CSV_ENCODING,
+    read_sales_reps,
+    safe_get_env,
+    write_sales_reps_to_dynamo,
+    normalize_sequencer,
+    check_sync_state,
+    record_sync_state,
+)
+from model import SalesRep, ObjectVersion
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import DynamoDBServiceResource, Table
+    from mypy_boto3_s3 import S3Client
 
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
 TABLE_NAME = "TABLE_NAME"
+SYNC_STATE_TABLE_NAME = "SYNC_STATE_TABLE_NAME"
+MAX_CONCURRENT_FILES = "MAX_CONCURRENT_FILES"
+DEFAULT_MAX_CONCURRENT_FILES = 4
 
 
-def parse_s3_event(event: Dict[str, Any]) -> Tuple[str, str]:
+def parse_s3_event(event: Dict[str, Any]) -> List[ObjectVersion]:
     """
-    Parses the S3 event to extract the bucket name and object key.
+    Parses every record of the S3 event into the uploaded object's bucket, key,
+    ETag, size and sequencer.
     """
     logger.debug(f"Parsing event: {event}")
     try:
-        record = event["Records"][0]
-        bucket_name = record["s3"]["bucket"]["name"]
-        object_key = record["s3"]["object"]["key"]
-        logger.info(f"Parsed S3 event: bucket='{bucket_name}', key='{object_key}'")
-        return bucket_name, object_key
-    except (KeyError, IndexError) as e:
+        records = event["Records"]
+        if not records:
+            raise IndexError("event has no records")
+        objects = []
+        for record in records:
+            s3_object = record["s3"]["object"]
+            objects.append(
+                ObjectVersion(
+                    bucket=record["s3"]["bucket"]["name"],
+                    key=s3_object["key"],
+                    etag=str(s3_object.get("eTag", "")).strip('"'),
+                    size=int(s3_object.get("size", 0)),
+                    sequencer=normalize_sequencer(s3_object.get("sequencer", "")),
+                )
+            )
+            logger.info(
+                f"Parsed S3 event: bucket='{objects[-1].bucket}', key='{objects[-1].key}'"
+            )
+        return objects
+    except (KeyError, IndexError, TypeError) as e:
         logger.error(f"Error parsing event: {e}", exc_info=True)
         raise ValueError(f"Error parsing event: {e}")
 
 
-def download_file_from_s3(
-    s3_client: S3Client, bucket_name: str, object_key: str
-) -> str:
+def get_sync_state_table(
+    dynamo_db: "DynamoDBServiceResource",
+) -> Optional["Table"]:
     """
-    Downloads a file from S3 to a temporary file and returns the path.
+    Returns the sync state table, or None when upload deduplication is disabled.
     """
-    logger.info(f"Attempting to download s3://{bucket_name}/{object_key}")
-    with tempfile.NamedTemporaryFile(
-        mode="wb", delete=False, suffix=".csv"
-    ) as temp_file:
-        temp_file_path = temp_file.name
-        s3_client.download_fileobj(bucket_name, object_key, temp_file)
-        logger.info(
-            f"Downloaded S3 object s3://{bucket_name}/{object_key} to {temp_file_path}"
-        )
-        return temp_file_path
+    state_table_name = os.getenv(SYNC_STATE_TABLE_NAME)
+    if not state_table_name:
+        return None
+    return dynamo_db.Table(state_table_name)
 
 
-def handler(event, context) -> Dict[str, Any]:
+def process_file(
+    s3_client: "S3Client",
+    dynamo_db: "DynamoDBServiceResource",
+    table_name: str,
+    s3_object: ObjectVersion,
+) -> Dict[str, Any]:
     """
-    Lambda function handler to read sales reps from a CSV file and write them to a DynamoDB table.
+    Syncs a single uploaded sales reps file and returns its status.
     """
-    logger.info("Lambda execution started")
-    s3_client: S3Client = boto3.client("s3")
-    dynamo_db: DynamoDBServiceResource = boto3.resource("dynamodb")
-    
-    try:
-        table_name = safe_get_env(TABLE_NAME)
-    except Exception as e:
-        logger.critical(f"Configuration error: {e}")
-        return {"statusCode": 500, "body": {"error": str(e)}}
-
-    table: Table = dynamo_db.Table(table_name)
-
-    try:
-        bucket_name, object_key = parse_s3_event(event)
-    except ValueError as e:
-        logger.error(f"Event parsing failed: {e}")
-        return {"statusCode": 400, "body": {"error": "Invalid event structure"}}
+    bucket_name, object_key = s3_object.bucket, s3_object.key
+    state_table = get_sync_state_table(dynamo_db)
+    if state_table is not None:
+        try:
+            with metrics.stage("sync_state"):
+                skip_reason = check_sync_state(
+                    s3_client, state_table, table_name, s3_object
+                )
+        except Exception as e:
+            logger.warning(f"Could not check sync state, syncing anyway: {e}")
+            skip_reason = None
+        if skip_reason:
+            logger.info(f"Skipping s3://{bucket_name}/{object_key}: {skip_reason}")
+            return {"statusCode": 200, "body": {"skipped": True, "reason": skip_reason}}
 
-    temp_file_path = None
     try:
-        temp_file_path = download_file_from_s3(s3_client, bucket_name, object_key)
-        sales_reps: List[SalesRep] = read_sales_reps_from_csv(temp_file_path)
+        with metrics.stage("read") as stage, open_s3_text(
+            s3_client, bucket_name, object_key, CSV_ENCODING
+        ) as csvfile:
+            sales_reps: List[SalesRep] = read_sales_reps(csvfile)
+            stage.records = len(sales_reps)
+            stage.bytes = s3_object.size
         logger.info(f"Read {len(sales_reps)} sales reps from CSV")
     except Exception as e:
         logger.error(f"Error processing CSV file: {e}", exc_info=True)
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
-            logger.info(f"Cleaned up temporary file {temp_file_path}")
         return {"statusCode": 500, "body": {"error": str(e)}}
 
     try:
-        write_result = write_sales_reps_to_dynamo(table, sales_reps)
+        table: "Table" = dynamo_db.Table(table_name)
+        with metrics.stage("write") as stage:
+            write_result = write_sales_reps_to_dynamo(table, sales_reps)
+            stage.records = write_result.successful_inserts
     except Exception as e:
         logger.error(f"Error during DynamoDB batch write: {e}", exc_info=True)
         return {"statusCode": 500, "body": {"error": str(e)}}
-    finally:
-        if temp_file_path and os.path.exists(temp_file_path):
-            os.unlink(temp_file_path)
-            logger.info(f"Cleaned up temporary file {temp_file_path}")
 
     logger.info(
-        f"Summary: {write_result.successful_inserts} successful, {write_result.failed_inserts} errors"
+        f"Summary: {write_result.successful_inserts} successful, {write_result.failed_inserts} errors, {write_result.unchanged} unchanged"
     )
+    if state_table is not None and write_result.failed_inserts == 0:
+        try:
+            record_sync_state(state_table, table_name, s3_object)
+        except Exception as e:
+            logger.warning(f"Could not record sync state: {e}")
     return {
         "statusCode": 200,
         "body": {
             "total": len(sales_reps),
             "successful_inserts": write_result.successful_inserts,
             "failed_inserts": write_result.failed_inserts,
+            "unchanged": write_result.unchanged,
         },
-    }
\ No newline at end of file
+    }
+
+
+def summarize_status(results: List[Dict[str, Any]]) -> int:
+    """
+    Returns 200 when every file succeeded, 500 when none did and 207 otherwise.
+    """
+    failed = sum(1 for result in results if result["statusCode"] >= 400)
+    if failed == 0:
+        return 200
+    return 500 if failed == len(results) else 207
+
+
+@profiling.profiled("crm-sync-sales-reps")
+@metrics.instrument("crm-sync-sales-reps")
+def handler(event, context) -> Dict[str, Any]:
+    """
+    Lambda function handler to read sales reps from the uploaded CSV files and write them to a DynamoDB table.
+    Every file in the event is processed concurrently and gets its own status in the response.
+    """
+    logger.info("Lambda execution started")
+    s3_client: "S3Client" = clients.get_client("s3")
+    dynamo_db: "DynamoDBServiceResource" = clients.get_resource("dynamodb")
+
+    try:
+        table_name = safe_get_env(TABLE_NAME)
+    except Exception as e:
+        logger.critical(f"Configuration error: {e}")
+        return {"statusCode": 500, "body": {"error": str(e)}}
+
+    try:
+        s3_objects = parse_s3_event(event)
+    except ValueError as e:
+        logger.error(f"Event parsing failed: {e}")
+        return {"statusCode": 400, "body": {"error": "Invalid event structure"}}
+
+    def process(s3_object: ObjectVersion) -> Dict[str, Any]:
+        result = process_file(s3_client, dynamo_db, table_name, s3_object)
+        return {"bucket": s3_object.bucket, "key": s3_object.key, **result}
+
+    max_workers = min(
+        int(os.getenv(MAX_CONCURRENT_FILES, DEFAULT_MAX_CONCURRENT_FILES)),
+        len(s3_objects),
+    )
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(process, s3_objects))
+
+    return {"statusCode": summarize_status(results), "body": {"files": results}}
@@ -6,12 +6,14 @@ class SalesRep:
     id: str = ""
     name: str = ""
     email: str = ""
+    phone: str = ""
 
     def to_dynamo_item(self) -> dict:
         return {
             "id": self.id,
             "name": self.name,
             "email": self.email,
+            "phone": self.phone,
         }
 
 
@@ -19,3 +21,13 @@ class SalesRep:
 class DBWriteResult:
     successful_inserts: int = 0
     failed_inserts: int = 0
+    unchanged: int = 0
+
+
+@dataclass
+class ObjectVersion:
+    bucket: str
+    key: str
+    etag: str = ""
+    size: int = 0
+    sequencer: str = ""
@@ -0,0 +1,321 @@
+import io
+import logging
+import marshal
+import os
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+from functools import wraps
+from typing import Any, Callable, Dict, List, Optional, Tuple, TypeVar
+import clients
+
+logger = logging.getLogger(__name__)
+
+PROFILE_MODE = "PROFILE_MODE"
+PROFILE_FROM_METADATA = "PROFILE_FROM_METADATA"
+PROFILE_BUCKET = "PROFILE_BUCKET"
+PROFILE_PREFIX = "PROFILE_PREFIX"
+PROFILE_SAMPLE_INTERVAL_MS = "PROFILE_SAMPLE_INTERVAL_MS"
+PROFILE_TRACE_MEMORY = "PROFILE_TRACE_MEMORY"
+
+# Object metadata key (x-amz-meta-profile) that opts a single upload in
+METADATA_KEY = "profile"
+FULL = "cprofile"
+SAMPLE = "sample"
+MODES = (FULL, SAMPLE)
+DEFAULT_PREFIX = "profiles"
+DEFAULT_SAMPLE_INTERVAL_MS = 10
+TOP_FUNCTIONS = 40
+TOP_ALLOCATIONS = 25
+# Frames kept per allocation; the sampling mode keeps one to stay cheap
+TRACE_FRAMES = {FULL: 10, SAMPLE: 1}
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+
+def _normalize_mode(value: Optional[str]) -> Optional[str]:
+    mode = (value or "").strip().lower()
+    return mode if mode in MODES else None
+
+
+def _mode_from_metadata(event: Any) -> Optional[str]:
+    """
+    Returns the profiling mode requested by the metadata of the uploaded
+    objects, if any. Costs one HEAD request per record.
+    """
+    records = event.get("Records") if isinstance(event, dict) else None
+    if not records:
+        return None
+    s3_client = clients.get_client("s3")
+    for record in records:
+        try:
+            head = s3_client.head_object(
+                Bucket=record["s3"]["bucket"]["name"],
+                Key=record["s3"]["object"]["key"],
+            )
+        except Exception as e:
+            logger.warning(f"Could not read profiling marker: {e}")
+            continue
+        mode = _normalize_mode(head.get("Metadata", {}).get(METADATA_KEY))
+        if mode:
+            return mode
+    return None
+
+
+def requested_mode(event: Any) -> Optional[str]:
+    """Returns "cprofile", "sample" or None when the invocation is not profiled."""
+    mode = _normalize_mode(os.getenv(PROFILE_MODE))
+    if mode:
+        return mode
+    if os.getenv(PROFILE_FROM_METADATA, "false").lower() == "true":
+        return _mode_from_metadata(event)
+    return None
+
+
+class StackSampler:
+    """
+    Records the stacks of every other thread at a fixed interval. The cost is
+    bounded by the interval rather than by the number of calls, unlike cProfile.
+    """
+
+    def __init__(self, interval_seconds: float) -> None:
+        self.interval_seconds = interval_seconds
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def start(self) -> None:
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        while not self._stop.wait(self.interval_seconds):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                stack: List[str] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})"
+                    )
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            self.samples += 1
+
+    def collapsed(self) -> str:
+        """Stacks in the collapsed format read by flame graph tools."""
+        return "".join(
+            f"{stack} {count}\n" for stack, count in self.stacks.most_common()
+        )
+
+
+class PoolProfiler:
+    """
+    cProfile of the calling thread plus every task submitted to a
+    ThreadPoolExecutor while enabled. cProfile only sees the thread that
+    enabled it, so each task runs under its own profiler in its worker thread
+    and the profiles are merged by stats().
+    """
+
+    def __init__(self) -> None:
+        import cProfile
+
+        self.profilers: List[Any] = [cProfile.Profile()]
+        self._lock = threading.Lock()
+        self._submit: Optional[Callable[..., Any]] = None
+
+    def enable(self) -> None:
+        from concurrent.futures import ThreadPoolExecutor
+
+        submit = ThreadPoolExecutor.submit
+        wrap = self._wrap
+
+        def profiled_submit(
+            executor: Any, fn: Any, /, *args: Any, **kwargs: Any
+        ) -> Any:
+            return submit(executor, wrap(fn), *args, **kwargs)
+
+        self._submit = submit
+        ThreadPoolExecutor.submit = profiled_submit  # type: ignore[method-assign]
+        self.profilers[0].enable()
+
+    def disable(self) -> None:
+        from concurrent.futures import ThreadPoolExecutor
+
+        self.profilers[0].disable()
+        if self._submit is not None:
+            ThreadPoolExecutor.submit = self._submit  # type: ignore[method-assign]
+            self._submit = None
+
+    def _wrap(self, fn: Callable[..., Any]) -> Callable[..., Any]:
+        import cProfile
+
+        @wraps(fn)
+        def run(*args: Any, **kwargs: Any) -> Any:
+            # A nested task running inline is already seen by its caller
+            if sys.getprofile() is not None:
+                return fn(*args, **kwargs)
+            profiler = cProfile.Profile()
+            with self._lock:
+                self.profilers.append(profiler)
+            profiler.enable()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                profiler.disable()
+
+        return run
+
+    def stats(self, stream: Any) -> Any:
+        """pstats.Stats of the calling thread and of all the pool tasks."""
+        import pstats
+
+        with self._lock:
+            first, *others = self.profilers
+        stats = pstats.Stats(first, stream=stream)
+        for profiler in others:
+            stats.add(profiler)
+        return stats
+
+
+def _trace_memory(mode: str) -> bool:
+    """
+    tracemalloc slows allocation heavy code down several times, so the
+    sampling mode only records allocations with PROFILE_TRACE_MEMORY=true.
+    """
+    default = "true" if mode == FULL else "false"
+    return os.getenv(PROFILE_TRACE_MEMORY, default).lower() == "true"
+
+
+def _top_allocations(snapshot: Any, group_by: str) -> str:
+    lines = [f"Top {TOP_ALLOCATIONS} allocation sites by {group_by}:"]
+    for stat in snapshot.statistics(group_by)[:TOP_ALLOCATIONS]:
+        lines.append(
+            f"{stat.size / 1024:10.1f} KiB {stat.count:8d} blocks  {stat.traceback}"
+        )
+    return "\n".join(lines) + "\n"
+
+
+def _store(service: str, name: str, artifacts: Dict[str, bytes]) -> List[str]:
+    """
+    Uploads the artifacts to PROFILE_BUCKET, or writes them under /tmp when no
+    bucket is configured. Returns where they were written.
+    """
+    bucket = os.getenv(PROFILE_BUCKET)
+    prefix = os.getenv(PROFILE_PREFIX, DEFAULT_PREFIX).strip("/")
+    locations = []
+    for suffix, content in artifacts.items():
+        if bucket:
+            key = f"{prefix}/{service}/{name}{suffix}"
+            clients.get_client("s3").put_object(Bucket=bucket, Key=key, Body=content)
+            locations.append(f"s3://{bucket}/{key}")
+        else:
+            path = os.path.join(tempfile.gettempdir(), f"{service}-{name}{suffix}")
+            with open(path, "wb") as f:
+                f.write(content)
+            locations.append(path)
+    return locations
+
+
+def _run_profiled(
+    mode: str, handler: Callable[..., Any], event: Any, context: Any
+) -> Tuple[Any, Dict[str, bytes], str]:
+    import tracemalloc
+
+    trace_memory = _trace_memory(mode)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start(TRACE_FRAMES[mode])
+    profiler: Optional[PoolProfiler] = None
+    sampler: Optional[StackSampler] = None
+    if mode == FULL:
+        profiler = PoolProfiler()
+        profiler.enable()
+    else:
+        interval_ms = int(
+            os.getenv(PROFILE_SAMPLE_INTERVAL_MS, DEFAULT_SAMPLE_INTERVAL_MS)
+        )
+        sampler = StackSampler(interval_ms / 1000)
+        sampler.start()
+    snapshot: Any = None
+    peak = 0
+    started = time.perf_counter()
+    try:
+        response = handler(event, context)
+    finally:
+        elapsed = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+        if sampler is not None:
+            sampler.stop()
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+        if started_tracing:
+            tracemalloc.stop()
+
+    if snapshot is not None:
+        report = [
+            f"mode={mode} duration={elapsed:.3f}s traced_peak={peak / 1024 / 1024:.1f}MiB\n",
+            _top_allocations(snapshot, "lineno"),
+        ]
+    else:
+        report = [f"mode={mode} duration={elapsed:.3f}s\n"]
+    artifacts: Dict[str, bytes] = {}
+    if profiler is not None:
+        stream = io.StringIO()
+        stats = profiler.stats(stream)
+        stats.sort_stats("cumulative").print_stats(TOP_FUNCTIONS)
+        report.append(stream.getvalue())
+        # Same format as Stats.dump_stats, loadable with pstats.Stats(path)
+        artifacts[".pstats"] = marshal.dumps(stats.stats)  # type: ignore[attr-defined]
+    if sampler is not None:
+        report.append(f"{sampler.samples} samples\n")
+        artifacts[".folded"] = sampler.collapsed().encode("utf-8")
+    summary = "\n".join(report)
+    artifacts[".txt"] = summary.encode("utf-8")
+    return response, artifacts, summary
+
+
+def profiled(service: str) -> Callable[[F], F]:
+    """
+    Decorator for a Lambda handler that profiles the invocations opted in by
+    PROFILE_MODE or, with PROFILE_FROM_METADATA, by the "profile" metadata of
+    the uploaded object. Other invocations run untouched.
+    """
+
+    def decorator(handler: F) -> F:
+        @wraps(handler)
+        def wrapper(event: Any, context: Any) -> Any:
+            try:
+                mode = requested_mode(event)
+            except Exception as e:
+                logger.warning(f"Could not determine profiling mode: {e}")
+                mode = None
+            if mode is None:
+                return handler(event, context)
+
+            logger.info(f"Profiling invocation in {mode} mode")
+            response, artifacts, summary = _run_profiled(mode, handler, event, context)
+            request_id = getattr(context, "aws_request_id", None) or "local"
+            timestamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%SZ")
+            try:
+                locations = _store(service, f"{timestamp}-{request_id}", artifacts)
+                logger.info(f"Profile written to {', '.join(locations)}")
+            except Exception as e:
+                logger.warning(f"Could not store profile: {e}")
+            logger.info(f"Profile summary:\n{summary}")
+            return response
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
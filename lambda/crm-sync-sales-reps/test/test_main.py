@@ -6,8 +6,9 @@ import sys
 # Add the lambda directory to the python path
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from main import parse_s3_event, download_file_from_s3, handler
-from model import SalesRep
+from main import parse_s3_event, handler
+from model import SalesRep, DBWriteResult, ObjectVersion
+from utils import check_sync_state, normalize_sequencer
 
 
 class TestMain(unittest.TestCase):
@@ -22,43 +23,37 @@ class TestMain(unittest.TestCase):
                 }
             ]
         }
-        bucket, key = parse_s3_event(event)
-        self.assertEqual(bucket, "test-bucket")
-        self.assertEqual(key, "test-key.csv")
+        [s3_object] = parse_s3_event(event)
+        self.assertEqual(s3_object.bucket, "test-bucket")
+        self.assertEqual(s3_object.key, "test-key.csv")
+
+    def test_parse_s3_event_all_records(self):
+        event = {
+            "Records": [
+                {"s3": {"bucket": {"name": "b"}, "object": {"key": "one.csv"}}},
+                {"s3": {"bucket": {"name": "b"}, "object": {"key": "two.csv"}}},
+            ]
+        }
+        s3_objects = parse_s3_event(event)
+        self.assertEqual([o.key for o in s3_objects], ["one.csv", "two.csv"])
 
     def test_parse_s3_event_failure(self):
         event = {}
         with self.assertRaises(ValueError):
             parse_s3_event(event)
 
-    @patch("main.tempfile.NamedTemporaryFile")
-    def test_download_file_from_s3(self, mock_tempfile):
-        mock_s3 = MagicMock()
-        mock_file = MagicMock()
-        mock_file.name = "/tmp/test.csv"
-        mock_tempfile.return_value.__enter__.return_value = mock_file
-
-        path = download_file_from_s3(mock_s3, "bucket", "key")
-
-        self.assertEqual(path, "/tmp/test.csv")
-        mock_s3.download_fileobj.assert_called_once()
-
-    @patch("main.boto3.client")
-    @patch("main.boto3.resource")
+    @patch("main.clients.get_client")
+    @patch("main.clients.get_resource")
     @patch("main.safe_get_env")
     @patch("main.parse_s3_event")
-    @patch("main.download_file_from_s3")
-    @patch("main.read_sales_reps_from_csv")
+    @patch("main.open_s3_text")
+    @patch("main.read_sales_reps")
     @patch("main.write_sales_reps_to_dynamo")
-    @patch("main.os.path.exists")
-    @patch("main.os.unlink")
     def test_handler_success(
         self,
-        mock_unlink,
-        mock_exists,
         mock_write_dynamo,
         mock_read_csv,
-        mock_download,
+        mock_open,
         mock_parse,
         mock_get_env,
         mock_resource,
@@ -66,16 +61,15 @@ class TestMain(unittest.TestCase):
     ):
         # Setup mocks
         mock_get_env.return_value = "TestTable"
-        mock_parse.return_value = ("bucket", "key")
-        mock_download.return_value = "/tmp/file.csv"
+        mock_parse.return_value = [ObjectVersion(bucket="bucket", key="key")]
+        csvfile = MagicMock()
+        mock_open.return_value.__enter__.return_value = csvfile
         mock_read_csv.return_value = [
             SalesRep("1", "John", "john@example.com")
         ]
-        mock_write_dynamo.return_value = {
-            "successful_inserts": 1,
-            "failed_inserts": 0,
-        }
-        mock_exists.return_value = True
+        mock_write_dynamo.return_value = DBWriteResult(
+            successful_inserts=1, failed_inserts=0
+        )
 
         event = {}
         context = {}
@@ -83,14 +77,17 @@ class TestMain(unittest.TestCase):
         response = handler(event, context)
 
         self.assertEqual(response["statusCode"], 200)
-        self.assertEqual(response["body"]["total"], 1)
-        self.assertEqual(response["body"]["successful_inserts"], 1)
-        
-        # Verify clean up happened
-        mock_unlink.assert_called_with("/tmp/file.csv")
+        self.assertEqual(response["body"]["files"][0]["body"]["total"], 1)
+        self.assertEqual(
+            response["body"]["files"][0]["body"]["successful_inserts"], 1
+        )
 
-    @patch("main.boto3.client")
-    @patch("main.boto3.resource")
+        # Verify the object was streamed and the stream released
+        mock_read_csv.assert_called_once_with(csvfile)
+        mock_open.return_value.__exit__.assert_called_once()
+
+    @patch("main.clients.get_client")
+    @patch("main.clients.get_resource")
     @patch("main.safe_get_env")
     @patch("main.parse_s3_event")
     def test_handler_event_error(
@@ -103,43 +100,74 @@ class TestMain(unittest.TestCase):
         self.assertEqual(response["statusCode"], 400)
         self.assertIn("Invalid event structure", response["body"]["error"])
 
-    @patch("main.boto3.client")
-    @patch("main.boto3.resource")
+    @patch("main.clients.get_client")
+    @patch("main.clients.get_resource")
     @patch("main.safe_get_env")
     @patch("main.parse_s3_event")
-    @patch("main.download_file_from_s3")
-    @patch("main.os.path.exists")
-    @patch("main.os.unlink")
+    @patch("main.open_s3_text")
     def test_handler_download_error(
         self,
-        mock_unlink,
-        mock_exists,
-        mock_download,
+        mock_open,
         mock_parse,
         mock_get_env,
         mock_resource,
         mock_client,
     ):
-        mock_parse.return_value = ("bucket", "key")
-        mock_download.side_effect = Exception("S3 Error")
-        # Simulate that file was created before error, so we test cleanup
-        mock_exists.return_value = True 
-        
-        # We need to ensure download_file_from_s3 returns something or side_effect triggers.
-        # Here side_effect triggers, so temp_file_path is None in handler init, 
-        # but wait, handler initializes temp_file_path = None.
-        # If download fails, temp_file_path is not assigned the result. 
-        # The exception handler checks `if temp_file_path and ...`
-        # So we can't test unlink here unless we mock the local variable which is hard.
-        # Actually, if download fails inside `download_file_from_s3`, that function handles the temp file creation.
-        # But `handler` catches the exception.
-        # If `download_file_from_s3` fails, it raises exception. `temp_file_path` in handler remains `None`.
-        # So unlink won't be called in the exception block.
-        
+        mock_parse.return_value = [ObjectVersion(bucket="bucket", key="key")]
+        mock_open.side_effect = Exception("S3 Error")
+
         response = handler({}, {})
         
         self.assertEqual(response["statusCode"], 500)
-        self.assertIn("S3 Error", response["body"]["error"])
+        self.assertIn("S3 Error", response["body"]["files"][0]["body"]["error"])
+
+    @patch("main.clients.get_client")
+    @patch("main.clients.get_resource")
+    @patch("main.safe_get_env")
+    @patch("main.check_sync_state")
+    @patch("main.open_s3_text")
+    @patch.dict(os.environ, {"SYNC_STATE_TABLE_NAME": "state"})
+    def test_handler_skips_duplicate_upload(
+        self, mock_open, mock_check, mock_get_env, mock_resource, mock_client
+    ):
+        mock_get_env.return_value = "TestTable"
+        mock_check.return_value = "unchanged"
+        event = {
+            "Records": [
+                {
+                    "s3": {
+                        "bucket": {"name": "bucket"},
+                        "object": {"key": "sales_rep.csv", "eTag": "abc"},
+                    }
+                }
+            ]
+        }
+
+        response = handler(event, {})
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertTrue(response["body"]["files"][0]["body"]["skipped"])
+        mock_open.assert_not_called()
+
+    def test_check_sync_state_unchanged(self):
+        s3_client = MagicMock()
+        s3_client.head_object.return_value = {"ETag": '"abc"', "ContentLength": 10}
+        state_table = MagicMock()
+        state_table.get_item.return_value = {
+            "Item": {"object_key": "sales_rep.csv", "etag": "abc", "size": 10}
+        }
+        version = ObjectVersion(
+            bucket="bucket",
+            key="sales_rep.csv",
+            etag="abc",
+            size=10,
+            sequencer=normalize_sequencer("01"),
+        )
+
+        self.assertEqual(
+            check_sync_state(s3_client, state_table, "TestTable", version),
+            "unchanged",
+        )
 
 
 if __name__ == "__main__":
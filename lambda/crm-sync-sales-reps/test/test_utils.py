@@ -1,6 +1,8 @@
+import io
 import unittest
 import os
-from utils import read_sales_reps_from_csv
+from unittest.mock import MagicMock, patch
+from utils import read_sales_reps, read_sales_reps_from_csv, write_sales_reps_to_dynamo
 from model import SalesRep
 
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -14,19 +16,47 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(len(sales_reps), 4)
         self.assertEqual(
             sales_reps[0],
-            SalesRep(id="1", name="MIGUEL M. IBARRA", email="miguel@hidrorey.mx"),
+            SalesRep(
+                id="1",
+                name="MIGUEL M. IBARRA",
+                email="miguel@hidrorey.mx",
+                phone="8116787046",
+            ),
         )
         self.assertEqual(
             sales_reps[1],
-            SalesRep(id="8", name="JORGE RODRIGUEZ", email="ventasweb@hidrorey.mx"),
+            SalesRep(
+                id="8",
+                name="JORGE RODRIGUEZ",
+                email="ventasweb@hidrorey.mx",
+                phone="8115145029",
+            ),
         )
         self.assertEqual(
             sales_reps[2],
-            SalesRep(id="42", name="GABRIEL TORRES", email="ventasenlinea@hidrorey.mx"),
+            SalesRep(
+                id="42",
+                name="GABRIEL TORRES",
+                email="ventasenlinea@hidrorey.mx",
+                phone="5550066411",
+            ),
         )
         self.assertEqual(
             sales_reps[3],
-            SalesRep(id="51", name="DAVID VARGAS", email="david@hidrorey.mx"),
+            SalesRep(
+                id="51",
+                name="DAVID VARGAS",
+                email="david@hidrorey.mx",
+                phone="8127648080",
+            ),
+        )
+
+    def test_read_sales_reps_from_stream(self):
+        csvfile = io.StringIO("AGENTE,NOMBRE,EMAIL,TEL\n7, ANA , ana@example.com ,\n")
+        sales_reps = read_sales_reps(csvfile)
+
+        self.assertEqual(
+            sales_reps, [SalesRep(id="7", name="ANA", email="ana@example.com")]
         )
 
     def test_read_sales_rep_from_csv_handles_unexisting_file(self):
@@ -35,5 +65,106 @@ class TestUtils(unittest.TestCase):
         self.assertEqual(len(sales_reps), 0)
 
 
+class TestWriteSalesReps(unittest.TestCase):
+    def setUp(self):
+        self.table = MagicMock()
+        self.table.name = "crm-sales-reps"
+        self.client = self.table.meta.client
+        self.client.batch_get_item.return_value = {
+            "Responses": {
+                "crm-sales-reps": [
+                    {
+                        "id": {"S": "1"},
+                        "name": {"S": "MIGUEL"},
+                        "email": {"S": "m@x.mx"},
+                        "phone": {"S": "81"},
+                    },
+                    {
+                        "id": {"S": "8"},
+                        "name": {"S": "JORGE"},
+                        "email": {"S": "j@x.mx"},
+                        "region": {"S": "NORTE"},
+                    },
+                ]
+            },
+            "UnprocessedKeys": {},
+        }
+        self.client.batch_write_item.return_value = {"UnprocessedItems": {}}
+
+    def written_items(self):
+        return [
+            {name: value["S"] for name, value in request["PutRequest"]["Item"].items()}
+            for c in self.client.batch_write_item.call_args_list
+            for request in c.kwargs["RequestItems"]["crm-sales-reps"]
+        ]
+
+    def test_writes_only_new_or_changed_reps(self):
+        sales_reps = [
+            SalesRep(id="1", name="MIGUEL", email="m@x.mx", phone="81"),
+            SalesRep(id="8", name="JORGE", email="j@x.mx", phone="55"),
+            SalesRep(id="42", name="GABRIEL", email="g@x.mx", phone="33"),
+        ]
+
+        result = write_sales_reps_to_dynamo(self.table, sales_reps)
+
+        self.assertEqual(result.successful_inserts, 2)
+        self.assertEqual(result.unchanged, 1)
+        self.assertEqual(result.failed_inserts, 0)
+        self.assertEqual([item["id"] for item in self.written_items()], ["8", "42"])
+        # Attributes set by others are kept
+        self.assertEqual(self.written_items()[0]["region"], "NORTE")
+
+    def test_extra_stored_attributes_are_not_a_change(self):
+        result = write_sales_reps_to_dynamo(
+            self.table, [SalesRep(id="8", name="JORGE", email="j@x.mx")]
+        )
+
+        self.assertEqual(result.unchanged, 1)
+        self.client.batch_write_item.assert_not_called()
+
+    @patch("utils.time.sleep")
+    def test_counts_come_from_batch_write_responses(self, _sleep):
+        sales_reps = [SalesRep(id=str(i), name="REP") for i in range(100, 130)]
+
+        def write(RequestItems):
+            requests = RequestItems["crm-sales-reps"]
+            # The last item of every call stays unprocessed
+            return {"UnprocessedItems": {"crm-sales-reps": requests[-1:]}}
+
+        self.client.batch_write_item.side_effect = write
+
+        result = write_sales_reps_to_dynamo(self.table, sales_reps)
+
+        self.assertEqual(result.successful_inserts, 28)
+        self.assertEqual(result.failed_inserts, 2)
+        sizes = [
+            len(c.kwargs["RequestItems"]["crm-sales-reps"])
+            for c in self.client.batch_write_item.call_args_list
+        ]
+        self.assertEqual(sizes[0], 25)
+
+    def test_fetches_keys_in_chunks_of_100(self):
+        sales_reps = [SalesRep(id=str(i), name="REP") for i in range(250)]
+
+        write_sales_reps_to_dynamo(self.table, sales_reps)
+
+        chunk_sizes = sorted(
+            len(c.kwargs["RequestItems"]["crm-sales-reps"]["Keys"])
+            for c in self.client.batch_get_item.call_args_list
+        )
+        self.assertEqual(chunk_sizes, [50, 100, 100])
+
+    def test_unreadable_reps_are_written(self):
+        self.client.batch_get_item.side_effect = Exception("Throttled")
+
+        result = write_sales_reps_to_dynamo(
+            self.table, [SalesRep(id="1", name="MIGUEL"), SalesRep(id="", name="X")]
+        )
+
+        self.assertEqual(result.successful_inserts, 1)
+        self.assertEqual(result.failed_inserts, 1)
+        self.assertEqual(result.unchanged, 0)
+
+
 if __name__ == "__main__":
     unittest.main()
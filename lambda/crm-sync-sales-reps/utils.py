@@ -1,13 +1,32 @@
 import os
 import csv
 import logging
-from typing import List
-from model import SalesRep, DBWriteResult
-from mypy_boto3_dynamodb.service_resource import Table
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+from boto3.dynamodb.conditions import Attr
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+from model import SalesRep, DBWriteResult, ObjectVersion
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import Table
+    from mypy_boto3_s3 import S3Client
 
 logger = logging.getLogger(__name__)
 logger.setLevel(logging.INFO)
 
+SEQUENCER_WIDTH = 32
+CSV_ENCODING = "utf-8"
+BATCH_GET_SIZE = 100
+BATCH_WRITE_SIZE = 25
+MAX_BATCH_RETRIES = 5
+MAX_FETCH_WORKERS = 4
+
+_deserializer = TypeDeserializer()
+_serializer = TypeSerializer()
+
 
 def safe_get_env(var_name: str) -> str:
     value = os.getenv(var_name)
@@ -17,27 +36,36 @@ def safe_get_env(var_name: str) -> str:
     return value
 
 
+def read_sales_reps(csvfile: Iterable[str]) -> List[SalesRep]:
+    """
+    Reads sales reps from the lines of a CSV with AGENTE, NOMBRE, EMAIL, TEL
+    columns, e.g. an open file or a decoded S3 stream.
+    """
+    sales_reps: List[SalesRep] = []
+    reader = csv.DictReader(csvfile)
+    for row in reader:
+        if not row:
+            continue
+        sales_reps.append(
+            SalesRep(
+                id=(row.get("AGENTE") or "").strip(),
+                name=(row.get("NOMBRE") or "").strip(),
+                email=(row.get("EMAIL") or "").strip(),
+                phone=(row.get("TEL") or "").strip(),
+            )
+        )
+    return sales_reps
+
+
 def read_sales_reps_from_csv(file_path: str) -> List[SalesRep]:
     """
     Retrieves all sales reps from a CSV file that contains AGENTE, NOMBRE, EMAIL, TEL columns.
     Returns a list of SalesRep objects.
     """
     logger.info(f"Reading sales reps from CSV file: {file_path}")
-    sales_reps: List[SalesRep] = []
-
     try:
-        with open(file_path, mode="r", encoding="utf-8") as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if not row:
-                    continue
-                sales_reps.append(
-                    SalesRep(
-                        id=(row.get("AGENTE") or "").strip(),
-                        name=(row.get("NOMBRE") or "").strip(),
-                        email=(row.get("EMAIL") or "").strip(),
-                    )
-                )
+        with open(file_path, mode="r", encoding=CSV_ENCODING) as csvfile:
+            sales_reps = read_sales_reps(csvfile)
         logger.info(f"Successfully read {len(sales_reps)} sales reps from {file_path}")
     except FileNotFoundError:
         logger.warning(f"CSV file not found: {file_path}")
@@ -46,23 +74,212 @@ def read_sales_reps_from_csv(file_path: str) -> List[SalesRep]:
     return sales_reps
 
 
+def _fetch_batch(table: "Table", rep_ids: List[str]) -> Dict[str, dict]:
+    """
+    Fetches up to 100 sales reps with BatchGetItem, retrying unprocessed keys.
+    """
+    client = table.meta.client
+    request = {table.name: {"Keys": [{"id": {"S": rep_id}} for rep_id in rep_ids]}}
+    items: Dict[str, dict] = {}
+    for attempt in range(MAX_BATCH_RETRIES):
+        response = client.batch_get_item(RequestItems=request)
+        for raw_item in response.get("Responses", {}).get(table.name, []):
+            item = {k: _deserializer.deserialize(v) for k, v in raw_item.items()}
+            items[item["id"]] = item
+        request = response.get("UnprocessedKeys") or {}
+        if not request:
+            return items
+        time.sleep(min(0.05 * 2**attempt, 1.0))
+    raise RuntimeError(f"Keys still unprocessed after {MAX_BATCH_RETRIES} attempts")
+
+
+def fetch_current_sales_reps(
+    table: "Table", rep_ids: List[str]
+) -> Dict[str, Optional[dict]]:
+    """
+    Fetches the stored items for the given ids with parallel, chunked BatchGetItem
+    calls. Ids whose chunk could not be read map to None so callers can tell a
+    failed read apart from a missing rep.
+    """
+    chunks = [
+        rep_ids[i : i + BATCH_GET_SIZE] for i in range(0, len(rep_ids), BATCH_GET_SIZE)
+    ]
+
+    def fetch(chunk: List[str]) -> Dict[str, Optional[dict]]:
+        try:
+            return dict(_fetch_batch(table, chunk))
+        except Exception as e:
+            logger.warning(f"Could not read {len(chunk)} sales reps: {e}")
+            return {rep_id: None for rep_id in chunk}
+
+    current: Dict[str, Optional[dict]] = {}
+    with ThreadPoolExecutor(max_workers=MAX_FETCH_WORKERS) as executor:
+        for items in executor.map(fetch, chunks):
+            current.update(items)
+    return current
+
+
+def is_unchanged(stored: Optional[dict], sales_rep: SalesRep) -> bool:
+    """
+    Whether the stored item already holds the rep's fields. Attributes added
+    to the item by other writers are not compared.
+    """
+    if stored is None:
+        return False
+    return all(
+        stored.get(name, "") == value
+        for name, value in sales_rep.to_dynamo_item().items()
+    )
+
+
+def _put_batch(table: "Table", items: List[dict]) -> int:
+    """
+    Puts up to 25 items in one BatchWriteItem call, retrying unprocessed
+    items with exponential backoff. Returns the number of items left unwritten.
+    """
+    requests = [
+        {"PutRequest": {"Item": {k: _serializer.serialize(v) for k, v in item.items()}}}
+        for item in items
+    ]
+    try:
+        for attempt in range(MAX_BATCH_RETRIES):
+            response = table.meta.client.batch_write_item(
+                RequestItems={table.name: requests}
+            )
+            requests = response.get("UnprocessedItems", {}).get(table.name, [])
+            if not requests:
+                return 0
+            time.sleep(min(0.05 * 2**attempt, 1.0))
+        logger.error(f"{len(requests)} sales reps still unprocessed after retries")
+    except Exception as e:
+        logger.error(f"Error writing sales reps to DynamoDB: {e}")
+    return len(requests)
+
+
 def write_sales_reps_to_dynamo(
-    table: Table, sales_reps: List[SalesRep]
+    table: "Table", sales_reps: List[SalesRep]
 ) -> DBWriteResult:
-    logger.info(f"Starting batch write of {len(sales_reps)} items to DynamoDB table '{table.name}'")
-    success_count = 0
+    """
+    Writes only the sales reps that are new or differ from the stored item,
+    keeping any other attributes of the stored item. Reps are counted as
+    written once BatchWriteItem has processed them.
+    """
     error_count = 0
-    with table.batch_writer() as batch:
-        for sales_rep in sales_reps:
-            try:
-                batch.put_item(Item=sales_rep.to_dynamo_item())
-                success_count += 1
-            except Exception as e:
-                logger.error(f"Error inserting sales rep {sales_rep.id}: {e}")
-                error_count += 1
-
-    logger.info(f"Batch write completed. Success: {success_count}, Failed: {error_count}")
+    reps_by_id: Dict[str, SalesRep] = {}
+    for sales_rep in sales_reps:
+        if not sales_rep.id:
+            logger.error(f"Skipping sales rep without id: {sales_rep}")
+            error_count += 1
+            continue
+        reps_by_id[sales_rep.id] = sales_rep
+
+    current = fetch_current_sales_reps(table, list(reps_by_id))
+    changed = [
+        {**(current.get(rep_id) or {}), **rep.to_dynamo_item()}
+        for rep_id, rep in reps_by_id.items()
+        if not is_unchanged(current.get(rep_id), rep)
+    ]
+    unchanged_count = len(reps_by_id) - len(changed)
+
+    logger.info(
+        f"Starting batch write of {len(changed)} changed items to DynamoDB table "
+        f"'{table.name}' ({unchanged_count} unchanged)"
+    )
+    batches = [
+        changed[i : i + BATCH_WRITE_SIZE]
+        for i in range(0, len(changed), BATCH_WRITE_SIZE)
+    ]
+    unwritten = sum(_put_batch(table, batch) for batch in batches)
+    success_count = len(changed) - unwritten
+    error_count += unwritten
+
+    logger.info(
+        f"Batch write completed. Success: {success_count}, Failed: {error_count}, "
+        f"Unchanged: {unchanged_count}"
+    )
     return DBWriteResult(
         successful_inserts=success_count,
         failed_inserts=error_count,
-    )
\ No newline at end of file
+        unchanged=unchanged_count,
+    )
+
+
+def normalize_sequencer(sequencer: str) -> str:
+    """
+    Right-pads an S3 event sequencer with zeros, as S3 specifies for comparing
+    sequencers of different lengths, so that plain string comparison orders the
+    events of a key.
+    """
+    if not sequencer:
+        return ""
+    return sequencer.upper().ljust(SEQUENCER_WIDTH, "0")
+
+
+def check_sync_state(
+    s3_client: "S3Client", state_table: "Table", table_name: str, version: ObjectVersion
+) -> Optional[str]:
+    """
+    Compares an uploaded object against the last processed version recorded for
+    the target table. Returns the reason the sync should be skipped, or None when
+    the object must be processed.
+    """
+    head = s3_client.head_object(Bucket=version.bucket, Key=version.key)
+    current_etag = head["ETag"].strip('"')
+    if version.etag and version.etag != current_etag:
+        logger.info(
+            f"s3://{version.bucket}/{version.key} was overwritten since this event "
+            f"(event ETag {version.etag}, current {current_etag})"
+        )
+        return "superseded"
+    version.etag = current_etag
+    version.size = int(head.get("ContentLength", version.size))
+
+    state = state_table.get_item(Key={"id": table_name}, ConsistentRead=True).get(
+        "Item"
+    )
+    if not state:
+        return None
+    if (
+        version.sequencer
+        and state.get("object_key") == version.key
+        and str(state.get("sequencer", "")) >= version.sequencer
+    ):
+        return "stale"
+    if state.get("etag") == version.etag and int(state.get("size", -1)) == version.size:
+        return "unchanged"
+    return None
+
+
+def record_sync_state(
+    state_table: "Table", table_name: str, version: ObjectVersion
+) -> bool:
+    """
+    Records the object version that was just synced into the target table.
+    A newer version of the same key that was recorded concurrently is never
+    overwritten.
+    """
+    item = {
+        "id": table_name,
+        "bucket": version.bucket,
+        "object_key": version.key,
+        "etag": version.etag,
+        "size": version.size,
+        "sequencer": version.sequencer,
+        "processed_at": datetime.now(timezone.utc).isoformat(),
+    }
+    try:
+        if version.sequencer:
+            state_table.put_item(
+                Item=item,
+                ConditionExpression=Attr("id").not_exists()
+                | Attr("object_key").ne(version.key)
+                | Attr("sequencer").lt(version.sequencer),
+            )
+        else:
+            state_table.put_item(Item=item)
+        return True
+    except ClientError as e:
+        if e.response["Error"]["Code"] != "ConditionalCheckFailedException":  # type: ignore
+            raise
+        logger.info(f"A newer version of {version.key} was already recorded")
+        return False
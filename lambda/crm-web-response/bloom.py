@@ -0,0 +1,125 @@
+import hashlib
+import math
+import struct
+from typing import Iterator, List, Optional
+
+# Serialized layout, shared by crm-sync-quotes (writer) and crm-web-response
+# (reader): MAGIC, generation count (u8), then per generation, newest first,
+# capacity, size in bits (u64), hash count (u8), items added (u64) and the bits
+MAGIC = b"CRMBLOOM1"
+_HEADER = struct.Struct(">QQBQ")
+
+
+class BloomFilter:
+    def __init__(
+        self,
+        capacity: int,
+        size_bits: int,
+        hash_count: int,
+        bits: Optional[bytearray] = None,
+        count: int = 0,
+    ) -> None:
+        self.capacity = capacity
+        self.size_bits = size_bits
+        self.hash_count = hash_count
+        self.bits = bits if bits is not None else bytearray((size_bits + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity: int, error_rate: float) -> "BloomFilter":
+        """Smallest filter holding capacity items at the given false positive rate"""
+        size_bits = max(
+            8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2)
+        )
+        hash_count = max(1, round(size_bits / capacity * math.log(2)))
+        return cls(capacity, size_bits, hash_count)
+
+    @property
+    def is_full(self) -> bool:
+        return self.count >= self.capacity
+
+    def _positions(self, key: str) -> Iterator[int]:
+        # Double hashing over the two halves of one 128-bit digest
+        digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], "little")
+        second = int.from_bytes(digest[8:], "little") | 1
+        for index in range(self.hash_count):
+            yield (first + index * second) % self.size_bits
+
+    def add(self, key: str) -> None:
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        bits = self.bits
+        return all(
+            bits[position >> 3] & (1 << (position & 7))
+            for position in self._positions(key)
+        )
+
+
+class BloomFilterGenerations:
+    """Filters of the most recent items; a new one starts when the newest is full"""
+
+    def __init__(
+        self,
+        capacity: int,
+        error_rate: float,
+        max_generations: int,
+        filters: Optional[List[BloomFilter]] = None,
+    ) -> None:
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.max_generations = max_generations
+        self.filters = filters or [BloomFilter.for_capacity(capacity, error_rate)]
+
+    def add(self, key: str) -> None:
+        if self.filters[0].is_full:
+            self.filters.insert(
+                0, BloomFilter.for_capacity(self.capacity, self.error_rate)
+            )
+            del self.filters[self.max_generations :]
+        self.filters[0].add(key)
+
+    def __contains__(self, key: str) -> bool:
+        return any(key in bloom for bloom in self.filters)
+
+    def __len__(self) -> int:
+        return sum(bloom.count for bloom in self.filters)
+
+    def to_bytes(self) -> bytes:
+        parts = [MAGIC, bytes([len(self.filters)])]
+        for bloom in self.filters:
+            parts.append(
+                _HEADER.pack(
+                    bloom.capacity, bloom.size_bits, bloom.hash_count, bloom.count
+                )
+            )
+            parts.append(bytes(bloom.bits))
+        return b"".join(parts)
+
+    @classmethod
+    def from_bytes(
+        cls, data: bytes, capacity: int, error_rate: float, max_generations: int
+    ) -> "BloomFilterGenerations":
+        if not data.startswith(MAGIC):
+            raise ValueError("Not a serialized Bloom filter")
+        offset = len(MAGIC)
+        generations = data[offset]
+        offset += 1
+        filters = []
+        for _ in range(generations):
+            filter_capacity, size_bits, hash_count, count = _HEADER.unpack_from(
+                data, offset
+            )
+            offset += _HEADER.size
+            length = (size_bits + 7) // 8
+            bits = bytearray(data[offset : offset + length])
+            if len(bits) != length:
+                raise ValueError("Truncated Bloom filter")
+            offset += length
+            filters.append(
+                BloomFilter(filter_capacity, size_bits, hash_count, bits, count)
+            )
+        return cls(capacity, error_rate, max_generations, filters)
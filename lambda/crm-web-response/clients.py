@@ -0,0 +1,70 @@
+import os
+import threading
+from typing import Any, Dict
+import boto3
+from botocore.config import Config
+
+MAX_POOL_CONNECTIONS = "CLIENT_MAX_POOL_CONNECTIONS"
+RETRY_MODE = "CLIENT_RETRY_MODE"
+MAX_ATTEMPTS = "CLIENT_MAX_ATTEMPTS"
+
+# One request at a time per container; a few sockets cover the table lookups
+DEFAULT_MAX_POOL_CONNECTIONS = 4
+DEFAULT_RETRY_MODE = "standard"
+DEFAULT_MAX_ATTEMPTS = 5
+
+# Created on first use and reused for the lifetime of the container
+_clients: Dict[str, Any] = {}
+_resources: Dict[str, Any] = {}
+_lock = threading.Lock()
+
+
+def client_config() -> Config:
+    """Build the botocore config shared by every client in this container."""
+    return Config(
+        max_pool_connections=int(
+            os.getenv(MAX_POOL_CONNECTIONS, DEFAULT_MAX_POOL_CONNECTIONS)
+        ),
+        tcp_keepalive=True,
+        retries={
+            "mode": os.getenv(RETRY_MODE, DEFAULT_RETRY_MODE),
+            "max_attempts": int(os.getenv(MAX_ATTEMPTS, DEFAULT_MAX_ATTEMPTS)),
+        },
+    )
+
+
+def get_client(service_name: str) -> Any:
+    """Return the container-wide boto3 client for a service, creating it once."""
+    with _lock:
+        if service_name not in _clients:
+            _clients[service_name] = boto3.client(service_name, config=client_config())
+        return _clients[service_name]
+
+
+def get_resource(service_name: str) -> Any:
+    """Return the container-wide boto3 resource for a service, creating it once."""
+    with _lock:
+        if service_name not in _resources:
+            _resources[service_name] = boto3.resource(
+                service_name, config=client_config()
+            )
+        return _resources[service_name]
+
+
+def set_client(service_name: str, client: Any) -> None:
+    """Use the given object as the client for a service, e.g. a local fake in tests."""
+    with _lock:
+        _clients[service_name] = client
+
+
+def set_resource(service_name: str, resource: Any) -> None:
+    """Use the given object as the resource for a service, e.g. a local fake in tests."""
+    with _lock:
+        _resources[service_name] = resource
+
+
+def reset() -> None:
+    """Drop the cached and injected clients so the next call creates new ones."""
+    with _lock:
+        _clients.clear()
+        _resources.clear()
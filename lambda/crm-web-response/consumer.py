@@ -0,0 +1,207 @@
+import json
+import os
+import random
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set, Tuple
+import clients
+import counters
+import issued_ids
+import metrics
+import profiling
+import transactions
+from main import TABLE_NAME, transaction_fields, void_responses
+from model import ResponseRecord
+
+MAX_ATTEMPTS = 6
+BASE_BACKOFF_SECONDS = 0.05
+MAX_WORKERS = 4
+
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    return _executor
+
+
+def _backoff(attempt: int) -> None:
+    time.sleep(random.uniform(0, BASE_BACKOFF_SECONDS * 2**attempt))
+
+
+def parse_messages(messages: List[Dict[str, Any]]) -> Dict[str, ResponseRecord]:
+    """Responses by id; of several clicks on the same button the first is kept"""
+    records: Dict[str, ResponseRecord] = {}
+    for message in messages:
+        try:
+            body = json.loads(message["body"])
+            if "void" in body:
+                continue
+            record = ResponseRecord.from_dict(body)
+        except (KeyError, TypeError, ValueError) as e:
+            # Retrying cannot fix a malformed message, so it is dropped
+            print(f"Skipping malformed message {message.get('messageId')}: {e}")
+            continue
+        current = records.get(record.response_id)
+        if current is None or record.received_at < current.received_at:
+            records[record.response_id] = record
+    return records
+
+
+def parse_voids(messages: List[Dict[str, Any]]) -> List[Tuple[List[str], str]]:
+    """Response ids of the prefetch bursts queued by lambda_handler, and their start"""
+    voids = []
+    for message in messages:
+        try:
+            body = json.loads(message["body"])
+            voids.append((list(body["void"]), str(body["since"])))
+        except (KeyError, TypeError, ValueError):
+            continue
+    return voids
+
+
+def _put_new(table_name: str, item: Dict[str, Any]) -> Optional[bool]:
+    """
+    Put one response unless it is stored already, retrying other errors; True
+    if written, False if a response with its id exists, None if it failed
+    """
+    from botocore.exceptions import ClientError
+
+    client = clients.get_client("dynamodb")
+    for attempt in range(MAX_ATTEMPTS):
+        try:
+            client.put_item(
+                TableName=table_name,
+                Item=item,
+                ConditionExpression="attribute_not_exists(response_id)",
+            )
+            return True
+        except ClientError as e:
+            if e.response["Error"]["Code"] == "ConditionalCheckFailedException":
+                return False
+            print(f"Error writing response (attempt {attempt + 1}): {str(e)}")
+        except Exception as e:
+            print(f"Error writing response (attempt {attempt + 1}): {str(e)}")
+        _backoff(attempt)
+    return None
+
+
+def write_records(
+    table_name: str, records: List[ResponseRecord]
+) -> Tuple[List[ResponseRecord], Set[str]]:
+    """
+    Write the records with conditional puts, so a response stored meanwhile
+    keeps its first click and is not counted again; return the records
+    written and the ids that could not be
+    """
+    from boto3.dynamodb.types import TypeSerializer
+
+    serializer = TypeSerializer()
+    items = [
+        {name: serializer.serialize(value) for name, value in record.to_dict().items()}
+        for record in records
+    ]
+    written: List[ResponseRecord] = []
+    failed: Set[str] = set()
+    results = _get_executor().map(lambda item: _put_new(table_name, item), items)
+    for record, result in zip(records, results):
+        if result:
+            written.append(record)
+        elif result is None:
+            failed.add(record.response_id)
+    return written, failed
+
+
+def is_issued(email_transaction_id: str) -> bool:
+    return issued_ids.get_issued_ids().might_contain(email_transaction_id)
+
+
+def add_transactions(records: List[ResponseRecord]) -> List[ResponseRecord]:
+    """
+    Copy their email transaction onto the responses, with one BatchGetItem per
+    100 uncached transactions; when the Bloom filter of issued ids is in use,
+    drop those neither found nor in the filter, as lambda_handler does.
+    """
+    if not transactions.is_enabled() or not records:
+        return records
+    try:
+        with metrics.stage("transaction") as stage:
+            ids = [record.email_transaction_id for record in records]
+            found = transactions.get_transactions(ids)
+            missing = [id_ for id_ in ids if id_ not in found]
+            if missing:
+                # The sender writes the transactions after sending the emails
+                found.update(
+                    transactions.get_transactions(missing, consistent_read=True)
+                )
+            stage.records = len(found)
+    except Exception as e:
+        print(f"Error reading email transactions: {str(e)}")
+        return records
+    kept = []
+    for record in records:
+        transaction = found.get(record.email_transaction_id)
+        if transaction is None:
+            # Only ids let through by the grace period of the issued ids
+            # filter need the lookup to confirm them; the others are issued
+            # and recorded without their transaction
+            if issued_ids.is_enabled() and not is_issued(record.email_transaction_id):
+                print(f"Skipping response to unknown transaction: {record.response_id}")
+                continue
+        else:
+            for name, value in transaction_fields(transaction).items():
+                setattr(record, name, value)
+        kept.append(record)
+    return kept
+
+
+def count_responses(records: List[ResponseRecord]) -> None:
+    try:
+        with metrics.stage("counters") as stage:
+            stage.records = counters.increment_many(records)
+    except Exception as e:
+        print(f"Error updating response counters: {str(e)}")
+
+
+@profiling.profiled("crm-web-response-consumer")
+@metrics.instrument("crm-web-response-consumer")
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Drains the responses queued by lambda_handler when RESPONSE_QUEUE_URL is
+    set. Meant for an SQS event source mapping with ReportBatchItemFailures:
+    the messages of the responses that could not be written are returned so
+    that only those are received again.
+    """
+    messages = event.get("Records") or []
+    table_name = os.environ[TABLE_NAME]
+    with metrics.stage("parse") as stage:
+        records = parse_messages(messages)
+        stage.records = len(messages)
+
+    enriched = add_transactions(list(records.values()))
+
+    with metrics.stage("dynamodb") as stage:
+        written, failed = write_records(table_name, enriched)
+        stage.records = len(written)
+    if failed:
+        print(f"Could not write {len(failed)} responses, they will be retried")
+
+    if counters.is_enabled():
+        count_responses(written)
+
+    # After the writes, so a burst queued with its clicks is still undone
+    for response_ids, since in parse_voids(messages):
+        with metrics.stage("void") as stage:
+            stage.records = void_responses(response_ids, since)
+
+    failures = []
+    for message in messages:
+        try:
+            response_id = json.loads(message["body"]).get("response_id")
+        except (KeyError, TypeError, ValueError, AttributeError):
+            continue
+        if response_id in failed:
+            failures.append({"itemIdentifier": message["messageId"]})
+    return {"batchItemFailures": failures}
@@ -0,0 +1,170 @@
+import os
+import random
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import TYPE_CHECKING, Dict, Iterable, List, Optional
+import clients
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import Table
+    from model import ResponseRecord
+
+COUNTERS_TABLE_NAME = "COUNTERS_TABLE_NAME"
+COUNTER_SHARDS = "COUNTER_SHARDS"
+DEFAULT_COUNTER_SHARDS = 8
+MAX_WORKERS = 4
+
+# Every response of a day, and of a busy rep, hits these counters, so their
+# increments are spread over COUNTER_SHARDS items
+SHARDED_KINDS = {"day", "rep"}
+
+_table: Optional["Table"] = None
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def is_enabled() -> bool:
+    return bool(os.getenv(COUNTERS_TABLE_NAME))
+
+
+def get_table() -> "Table":
+    """Return the counters table, created on first use and reused while warm"""
+    global _table
+    if _table is None:
+        _table = clients.get_resource("dynamodb").Table(os.environ[COUNTERS_TABLE_NAME])
+    return _table
+
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=MAX_WORKERS)
+    return _executor
+
+
+def shard_count() -> int:
+    return int(os.getenv(COUNTER_SHARDS, DEFAULT_COUNTER_SHARDS))
+
+
+def counter_attribute(response_type: str) -> str:
+    """Attribute counting one response type, e.g. more_info for More Info"""
+    return response_type.lower().replace(" ", "_")
+
+
+def counter_keys(kind: str, value: str) -> List[str]:
+    """Every item holding part of a counter"""
+    if kind not in SHARDED_KINDS:
+        return [f"{kind}#{value}"]
+    return [f"{kind}#{value}#{shard}" for shard in range(shard_count())]
+
+
+def write_key(kind: str, value: str) -> str:
+    """The item an increment goes to, a random shard for sharded counters"""
+    if kind not in SHARDED_KINDS:
+        return f"{kind}#{value}"
+    return f"{kind}#{value}#{random.randrange(shard_count())}"
+
+
+def _add(counter_id: str, attribute: str, updated_at: str) -> None:
+    get_table().update_item(
+        Key={"counter_id": counter_id},
+        UpdateExpression="ADD responses :one, #type :one SET updated_at = :now",
+        ExpressionAttributeNames={"#type": attribute},
+        ExpressionAttributeValues={":one": 1, ":now": updated_at},
+    )
+
+
+def _add_counts(counter_id: str, counts: Dict[str, int], updated_at: str) -> None:
+    names = {f"#type{index}": attribute for index, attribute in enumerate(counts)}
+    values = {f":type{index}": count for index, count in enumerate(counts.values())}
+    additions = ", ".join(f"{name} {value}" for name, value in zip(names, values))
+    get_table().update_item(
+        Key={"counter_id": counter_id},
+        UpdateExpression=f"ADD responses :total, {additions} SET updated_at = :now",
+        ExpressionAttributeNames=names,
+        ExpressionAttributeValues={
+            ":total": sum(counts.values()),
+            ":now": updated_at,
+            **values,
+        },
+    )
+
+
+def _counted(
+    received_at: str,
+    prospect_id: str,
+    quote_id: Optional[str],
+    sales_rep_id: Optional[str],
+) -> Dict[str, str]:
+    counted = {"day": received_at[:10], "prospect": prospect_id}
+    if quote_id:
+        counted["quote"] = quote_id
+    if sales_rep_id:
+        counted["rep"] = sales_rep_id
+    return counted
+
+
+def increment(
+    response_type: str,
+    received_at: str,
+    prospect_id: str,
+    quote_id: Optional[str] = None,
+    sales_rep_id: Optional[str] = None,
+) -> int:
+    """Count a new response on its day, prospect, quote and rep counters"""
+    counted = _counted(received_at, prospect_id, quote_id, sales_rep_id)
+    attribute = counter_attribute(response_type)
+    now = datetime.now(timezone.utc).isoformat()
+    futures = [
+        _get_executor().submit(_add, write_key(kind, value), attribute, now)
+        for kind, value in counted.items()
+    ]
+    for future in futures:
+        future.result()
+    return len(futures)
+
+
+def increment_many(records: Iterable["ResponseRecord"], by: int = 1) -> int:
+    """
+    Count new responses with one update per counter they share, not per
+    response; by=-1 takes voided responses back off their counters.
+    """
+    totals: Dict[tuple, Counter] = {}
+    for record in records:
+        attribute = counter_attribute(record.response_type)
+        counted = _counted(
+            record.received_at,
+            record.prospect_id,
+            record.quote_id,
+            record.sales_rep_id,
+        )
+        for kind, value in counted.items():
+            totals.setdefault((kind, value), Counter())[attribute] += by
+    now = datetime.now(timezone.utc).isoformat()
+    futures = [
+        _get_executor().submit(_add_counts, write_key(kind, value), dict(counts), now)
+        for (kind, value), counts in totals.items()
+    ]
+    for future in futures:
+        future.result()
+    return len(futures)
+
+
+def read_totals(kind: str, value: str) -> Dict[str, int]:
+    """Sum the shards of a counter, e.g. read_totals("rep", "12")"""
+    keys = counter_keys(kind, value)
+    items = _get_executor().map(
+        lambda key: get_table().get_item(Key={"counter_id": key}).get("Item") or {},
+        keys,
+    )
+    totals: Dict[str, int] = {}
+    for item in items:
+        for name, count in item.items():
+            if name not in ("counter_id", "updated_at"):
+                totals[name] = totals.get(name, 0) + int(count)
+    return totals
+
+
+def reset() -> None:
+    global _table
+    _table = None
@@ -0,0 +1,416 @@
+"""
+Exports a DynamoDB table to S3 as gzipped NDJSON or CSV, from the command line.
+
+Scan pages, optionally from parallel segments, are encoded and compressed as
+they arrive and written straight into an S3 multipart upload, so only the
+part being filled is held in memory whatever the size of the table. Every
+part is a complete gzip member (their concatenation is a valid gzip file),
+and after each part the upload id, the uploaded parts and where each segment
+got to are saved next to the export as <key>.progress.json. An interrupted
+export continues from there with --resume.
+
+    python export.py crm-api-responses --bucket crm-exports --key audits/responses.ndjson.gz
+    python export.py crm-products --bucket crm-exports --key audits/products.csv.gz --format csv --segments 4
+    python export.py crm-api-responses --bucket crm-exports --key audits/responses.ndjson.gz --resume
+"""
+
+import argparse
+import base64
+import csv
+import io
+import json
+import logging
+import sys
+import zlib
+from dataclasses import asdict, dataclass, field
+from decimal import Decimal
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence
+from scans import scan_pages
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb import DynamoDBClient
+    from mypy_boto3_s3 import S3Client
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ["ndjson", "csv"]
+# S3 rejects smaller parts except the last one
+MIN_PART_BYTES = 5 * 1024 * 1024
+DEFAULT_PART_BYTES = 8 * 1024 * 1024
+COMPRESSION_LEVEL = 6
+# Position of a segment whose last page was exported
+DONE = "done"
+
+
+@dataclass
+class ExportProgress:
+    """What has been uploaded so far, saved after every part"""
+
+    table_name: str
+    format: str
+    total_segments: int
+    upload_id: str
+    parts: List[Dict[str, Any]] = field(default_factory=list)
+    # Last key exported per segment, or DONE; segments not started are absent
+    positions: Dict[str, Any] = field(default_factory=dict)
+    columns: Optional[List[str]] = None
+    items: int = 0
+    bytes: int = 0
+
+    def remaining_segments(self) -> List[int]:
+        return [
+            segment
+            for segment in range(self.total_segments)
+            if self.positions.get(str(segment)) != DONE
+        ]
+
+    def start_keys(self) -> Dict[int, Dict[str, Any]]:
+        return {
+            int(segment): position
+            for segment, position in self.positions.items()
+            if position != DONE
+        }
+
+
+def progress_key(key: str) -> str:
+    return f"{key}.progress.json"
+
+
+def load_progress(
+    s3_client: "S3Client", bucket: str, key: str
+) -> Optional[ExportProgress]:
+    from botocore.exceptions import ClientError
+
+    try:
+        response = s3_client.get_object(Bucket=bucket, Key=progress_key(key))
+    except ClientError as e:
+        if e.response.get("Error", {}).get("Code") in ("NoSuchKey", "404"):
+            return None
+        raise
+    return ExportProgress(**json.loads(response["Body"].read()))
+
+
+def save_progress(
+    s3_client: "S3Client", bucket: str, key: str, progress: ExportProgress
+) -> None:
+    s3_client.put_object(
+        Bucket=bucket,
+        Key=progress_key(key),
+        Body=json.dumps(asdict(progress)).encode("utf-8"),
+        ContentType="application/json",
+    )
+
+
+def _json_default(value: Any) -> Any:
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    if isinstance(value, (set, frozenset)):
+        return sorted(value, key=str)
+    if isinstance(value, (bytes, bytearray)):
+        return base64.b64encode(bytes(value)).decode("ascii")
+    if hasattr(value, "value"):
+        # boto3 Binary
+        return base64.b64encode(bytes(value.value)).decode("ascii")
+    raise TypeError(f"Cannot export {type(value).__name__}")
+
+
+def _cell(value: Any) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    # Numbers as written in JSON, maps and lists as JSON
+    return json.dumps(value, default=_json_default, separators=(",", ":"))
+
+
+class ItemEncoder:
+    """Turns pages of typed DynamoDB items into NDJSON lines or CSV rows"""
+
+    def __init__(self, report_format: str, columns: Optional[List[str]]) -> None:
+        from boto3.dynamodb.types import TypeDeserializer
+
+        self.format = report_format
+        self.columns = columns
+        self._deserializer = TypeDeserializer()
+
+    def _items(self, page: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        deserialize = self._deserializer.deserialize
+        return [
+            {name: deserialize(value) for name, value in item.items()} for item in page
+        ]
+
+    def header(self) -> bytes:
+        if self.format != "csv" or not self.columns:
+            return b""
+        output = io.StringIO()
+        csv.writer(output).writerow(self.columns)
+        return output.getvalue().encode("utf-8")
+
+    def encode(self, page: List[Dict[str, Any]]) -> bytes:
+        items = self._items(page)
+        if self.format == "ndjson":
+            return "".join(
+                json.dumps(item, default=_json_default, separators=(",", ":")) + "\n"
+                for item in items
+            ).encode("utf-8")
+        output = io.StringIO()
+        writer = csv.writer(output)
+        for item in items:
+            writer.writerow([_cell(item.get(name)) for name in self.columns or []])
+        return output.getvalue().encode("utf-8")
+
+
+class PartWriter:
+    """
+    Compresses into a buffer of one part and uploads it as the next part of a
+    multipart upload once it reaches part_bytes, ending the gzip member there
+    """
+
+    def __init__(
+        self,
+        s3_client: "S3Client",
+        bucket: str,
+        key: str,
+        progress: ExportProgress,
+        part_bytes: int,
+    ) -> None:
+        self.s3_client = s3_client
+        self.bucket = bucket
+        self.key = key
+        self.progress = progress
+        self.part_bytes = part_bytes
+        self._buffer = bytearray()
+        self._compressor = self._new_compressor()
+        self._pending = False
+
+    @staticmethod
+    def _new_compressor():
+        # wbits 31: gzip header and trailer around the deflate stream
+        return zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, 31)
+
+    @classmethod
+    def empty_member(cls) -> bytes:
+        """A gzip member of no data"""
+        return cls._new_compressor().flush(zlib.Z_FINISH)
+
+    @property
+    def full(self) -> bool:
+        return len(self._buffer) >= self.part_bytes
+
+    @property
+    def empty(self) -> bool:
+        """Nothing written to the export yet"""
+        return not self.progress.parts and not self._pending
+
+    def write(self, data: bytes) -> None:
+        if data:
+            self._buffer += self._compressor.compress(data)
+            self._pending = True
+
+    def upload_part(self) -> None:
+        """Upload what was written since the last part, if anything"""
+        if not self._pending:
+            return
+        self._buffer += self._compressor.flush(zlib.Z_FINISH)
+        number = len(self.progress.parts) + 1
+        response = self.s3_client.upload_part(
+            Bucket=self.bucket,
+            Key=self.key,
+            PartNumber=number,
+            UploadId=self.progress.upload_id,
+            Body=bytes(self._buffer),
+        )
+        self.progress.parts.append({"PartNumber": number, "ETag": response["ETag"]})
+        self.progress.bytes += len(self._buffer)
+        self._buffer = bytearray()
+        self._compressor = self._new_compressor()
+        self._pending = False
+
+
+def content_type(report_format: str) -> str:
+    return "text/csv" if report_format == "csv" else "application/x-ndjson"
+
+
+def _start(
+    s3_client: "S3Client",
+    table_name: str,
+    bucket: str,
+    key: str,
+    report_format: str,
+    total_segments: int,
+    columns: Optional[List[str]],
+    resume: bool,
+) -> ExportProgress:
+    previous = load_progress(s3_client, bucket, key)
+    if previous is not None and resume:
+        if (previous.table_name, previous.format, previous.total_segments) != (
+            table_name,
+            report_format,
+            total_segments,
+        ):
+            raise ValueError(
+                f"{progress_key(key)} is an export of {previous.table_name} as "
+                f"{previous.format} with {previous.total_segments} segments"
+            )
+        logger.info(
+            f"Resuming upload {previous.upload_id} after {len(previous.parts)} parts"
+        )
+        return previous
+    if previous is not None:
+        # Started over: drop the parts of the interrupted export
+        try:
+            s3_client.abort_multipart_upload(
+                Bucket=bucket, Key=key, UploadId=previous.upload_id
+            )
+        except Exception as e:
+            logger.warning(f"Could not abort upload {previous.upload_id}: {e}")
+    upload = s3_client.create_multipart_upload(
+        Bucket=bucket,
+        Key=key,
+        ContentType=content_type(report_format),
+        ContentEncoding="gzip",
+    )
+    progress = ExportProgress(
+        table_name, report_format, total_segments, upload["UploadId"], columns=columns
+    )
+    save_progress(s3_client, bucket, key, progress)
+    return progress
+
+
+def export_table(
+    dynamodb_client: "DynamoDBClient",
+    s3_client: "S3Client",
+    table_name: str,
+    bucket: str,
+    key: str,
+    report_format: str = "ndjson",
+    total_segments: int = 1,
+    columns: Optional[List[str]] = None,
+    part_bytes: int = DEFAULT_PART_BYTES,
+    resume: bool = False,
+) -> ExportProgress:
+    """Stream the whole table into s3://bucket/key; return what was exported"""
+    progress = _start(
+        s3_client,
+        table_name,
+        bucket,
+        key,
+        report_format,
+        total_segments,
+        columns,
+        resume,
+    )
+    encoder = ItemEncoder(report_format, progress.columns)
+    writer = PartWriter(s3_client, bucket, key, progress, part_bytes)
+    # Positions of the pages in the part being filled, saved once it is uploaded
+    positions: Dict[str, Any] = {}
+    items = 0
+
+    def commit() -> None:
+        nonlocal items
+        writer.upload_part()
+        progress.positions.update(positions)
+        progress.items += items
+        positions.clear()
+        items = 0
+        save_progress(s3_client, bucket, key, progress)
+
+    for segment, page in scan_pages(
+        dynamodb_client,
+        table_name,
+        total_segments,
+        segments=progress.remaining_segments(),
+        start_keys=progress.start_keys(),
+    ):
+        page_items = page.get("Items", [])
+        if report_format == "csv" and encoder.columns is None and page_items:
+            # Without --columns, the attributes of the first page found
+            encoder.columns = progress.columns = sorted(
+                {name for item in page_items for name in item}
+            )
+        if writer.empty:
+            writer.write(encoder.header())
+        writer.write(encoder.encode(page_items))
+        items += len(page_items)
+        positions[str(segment)] = page.get("LastEvaluatedKey") or DONE
+        if writer.full:
+            commit()
+    commit()
+
+    if progress.parts:
+        s3_client.complete_multipart_upload(
+            Bucket=bucket,
+            Key=key,
+            UploadId=progress.upload_id,
+            MultipartUpload={"Parts": progress.parts},
+        )
+    else:
+        # Nothing was read (an empty table) and S3 cannot complete an upload
+        # without parts, so the export is a single empty gzip member instead
+        s3_client.abort_multipart_upload(
+            Bucket=bucket, Key=key, UploadId=progress.upload_id
+        )
+        s3_client.put_object(
+            Bucket=bucket,
+            Key=key,
+            Body=PartWriter.empty_member(),
+            ContentType=content_type(report_format),
+            ContentEncoding="gzip",
+        )
+    s3_client.delete_object(Bucket=bucket, Key=progress_key(key))
+    return progress
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("table", help="DynamoDB table to export")
+    parser.add_argument("--bucket", required=True)
+    parser.add_argument("--key", required=True, help="object key, e.g. x.ndjson.gz")
+    parser.add_argument("--format", choices=FORMATS, default="ndjson")
+    parser.add_argument("--segments", type=int, default=1)
+    parser.add_argument(
+        "--columns",
+        type=lambda value: [name.strip() for name in value.split(",") if name],
+        help="CSV columns, by default the attributes of the first items read",
+    )
+    parser.add_argument(
+        "--part-mib", type=int, default=DEFAULT_PART_BYTES // 1024 // 1024
+    )
+    parser.add_argument(
+        "--resume", action="store_true", help="continue an interrupted export"
+    )
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+    if args.part_mib * 1024 * 1024 < MIN_PART_BYTES:
+        parser.error("--part-mib must be at least 5")
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None, out=sys.stdout) -> ExportProgress:
+    import clients
+
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+    progress = export_table(
+        clients.get_client("dynamodb"),
+        clients.get_client("s3"),
+        args.table,
+        args.bucket,
+        args.key,
+        args.format,
+        args.segments,
+        args.columns,
+        args.part_mib * 1024 * 1024,
+        args.resume,
+    )
+    print(
+        f"Exported {progress.items} items of {args.table} to "
+        f"s3://{args.bucket}/{args.key} in {len(progress.parts)} parts, "
+        f"{progress.bytes} bytes",
+        file=out,
+    )
+    return progress
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,317 @@
+"""
+Sent, responded and bought counts of the quote emails, from the command line.
+
+The email transactions and responses tables are read with parallel segmented
+scans and hash-joined on the transaction id: the smaller table, by the item
+count DynamoDB reports, is loaded into a dict and the other one is streamed
+past it, so memory grows with one side only. Every email is counted once on
+its sales rep, send day and cadence step, as responded if any of its buttons
+was clicked and as bought if Buy was. The report is written as CSV or JSON.
+
+    python funnel.py
+    python funnel.py --since 2024-07-01 --until 2024-07-31 --format json --out funnel.json
+"""
+
+import argparse
+import csv
+import json
+import logging
+import os
+import sys
+import time
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+)
+from scans import scan_pages
+
+logger = logging.getLogger(__name__)
+
+TABLE_NAME = "TABLE_NAME"
+TRANSACTIONS_TABLE_NAME = "TRANSACTIONS_TABLE_NAME"
+DEFAULT_SEGMENTS = 8
+
+TRANSACTION_ATTRIBUTES = ["transaction_id", "sales_rep_id", "sent_at", "cadence_step"]
+RESPONSE_ATTRIBUTES = ["email_transaction_id", "response_type"]
+DIMENSIONS = ["rep", "day", "step"]
+
+# Flags of an email, kept in the two low bits of the joined values
+RESPONDED = 1
+BOUGHT = 2
+BUY = "Buy"
+
+# (sales_rep_id, day, cadence_step)
+Cell = Tuple[str, str, str]
+Row = Tuple[str, ...]
+
+
+def _attribute(value: Optional[Dict[str, Any]]) -> str:
+    if not value:
+        return ""
+    return value.get("S") or value.get("N") or ""
+
+
+def scan_rows(
+    client: Any,
+    table_name: str,
+    attributes: List[str],
+    total_segments: int = DEFAULT_SEGMENTS,
+) -> Iterator[Row]:
+    """Stream the attributes of every item, from total_segments parallel scans"""
+    for _, page in scan_pages(
+        client,
+        table_name,
+        total_segments,
+        ProjectionExpression=", ".join(f"#a{i}" for i in range(len(attributes))),
+        ExpressionAttributeNames={f"#a{i}": name for i, name in enumerate(attributes)},
+    ):
+        for item in page.get("Items", []):
+            yield tuple(_attribute(item.get(name)) for name in attributes)
+
+
+def response_flags(response_type: str) -> int:
+    return RESPONDED | BOUGHT if response_type == BUY else RESPONDED
+
+
+class Funnel:
+    """Sent, responded and bought emails per sales rep, day and cadence step"""
+
+    def __init__(self) -> None:
+        self.cells: Dict[Cell, List[int]] = {}
+
+    def add(self, cell: Cell, flags: int, emails: int = 1) -> None:
+        counts = self.cells.get(cell)
+        if counts is None:
+            counts = self.cells[cell] = [0, 0, 0]
+        counts[0] += emails
+        if flags & RESPONDED:
+            counts[1] += emails
+        if flags & BOUGHT:
+            counts[2] += emails
+
+    def rollup(self, dimension: str) -> Dict[str, List[int]]:
+        position = DIMENSIONS.index(dimension)
+        totals: Dict[str, List[int]] = {}
+        for cell, counts in self.cells.items():
+            total = totals.setdefault(cell[position], [0, 0, 0])
+            for index, count in enumerate(counts):
+                total[index] += count
+        return dict(sorted(totals.items(), key=lambda entry: _sort_key(entry[0])))
+
+    def totals(self) -> List[int]:
+        return [
+            sum(counts[index] for counts in self.cells.values()) for index in range(3)
+        ]
+
+    def rows(self) -> List[Dict[str, Any]]:
+        """One row for all emails, then one per rep, per day and per step"""
+        groups = [("total", {"all": self.totals()})]
+        groups += [(dimension, self.rollup(dimension)) for dimension in DIMENSIONS]
+        return [
+            _row(dimension, value, counts)
+            for dimension, totals in groups
+            for value, counts in totals.items()
+        ]
+
+
+def _sort_key(value: str) -> Tuple[int, Any]:
+    # Numeric rep ids and steps in numeric order, unknown ones last
+    if value.isdigit():
+        return (0, int(value))
+    return (1 if value else 2, value)
+
+
+def _row(dimension: str, value: str, counts: List[int]) -> Dict[str, Any]:
+    sent, responded, bought = counts
+    return {
+        "dimension": dimension,
+        "value": value,
+        "sent": sent,
+        "responded": responded,
+        "bought": bought,
+        "response_rate": round(responded / sent, 4) if sent else 0.0,
+        "buy_rate": round(bought / sent, 4) if sent else 0.0,
+    }
+
+
+def _cell(transaction: Row) -> Cell:
+    _, sales_rep_id, sent_at, cadence_step = transaction
+    return (sales_rep_id, sent_at[:10], cadence_step)
+
+
+def join_on_responses(
+    transactions: Iterable[Row],
+    responses: Iterable[Row],
+    keep: Optional[Callable[[Row], bool]] = None,
+) -> Funnel:
+    """Hash the responses by transaction, then stream the transactions past them"""
+    flags: Dict[str, int] = {}
+    for email_transaction_id, response_type in responses:
+        previous = flags.get(email_transaction_id, 0)
+        flags[email_transaction_id] = previous | response_flags(response_type)
+    # Emails of the same cell with the same flags are added together
+    counted: Dict[Tuple[Cell, int], int] = {}
+    for transaction in transactions:
+        if keep is None or keep(transaction):
+            key = (_cell(transaction), flags.get(transaction[0], 0))
+            counted[key] = counted.get(key, 0) + 1
+    funnel = Funnel()
+    for (cell, cell_flags), emails in counted.items():
+        funnel.add(cell, cell_flags, emails)
+    return funnel
+
+
+def join_on_transactions(
+    transactions: Iterable[Row],
+    responses: Iterable[Row],
+    keep: Optional[Callable[[Row], bool]] = None,
+) -> Funnel:
+    """Hash the transactions, then stream the responses past them"""
+    cells: List[Cell] = []
+    cell_index: Dict[Cell, int] = {}
+    # Cell index shifted past the flags, per transaction id
+    joined: Dict[str, int] = {}
+    for transaction in transactions:
+        if keep is not None and not keep(transaction):
+            continue
+        cell = _cell(transaction)
+        index = cell_index.get(cell)
+        if index is None:
+            index = cell_index[cell] = len(cells)
+            cells.append(cell)
+        joined[transaction[0]] = index << 2
+    for email_transaction_id, response_type in responses:
+        value = joined.get(email_transaction_id)
+        if value is not None:
+            joined[email_transaction_id] = value | response_flags(response_type)
+    # Emails of the same cell with the same flags are added together
+    counted: Dict[int, int] = {}
+    for value in joined.values():
+        counted[value] = counted.get(value, 0) + 1
+    funnel = Funnel()
+    for value, emails in counted.items():
+        funnel.add(cells[value >> 2], value & 3, emails)
+    return funnel
+
+
+def item_count(client: Any, table_name: str) -> Optional[int]:
+    """Item count DynamoDB reports for the table, updated about every 6 hours"""
+    try:
+        return int(client.describe_table(TableName=table_name)["Table"]["ItemCount"])
+    except Exception as e:
+        logger.warning(f"Could not read the size of {table_name}: {e}")
+        return None
+
+
+def sent_between(
+    since: Optional[str], until: Optional[str]
+) -> Optional[Callable[[Row], bool]]:
+    """Filter on the send day of the transactions, None to keep them all"""
+    if since is None and until is None:
+        return None
+
+    def keep(transaction: Row) -> bool:
+        day = transaction[2][:10]
+        return (since is None or day >= since) and (until is None or day <= until)
+
+    return keep
+
+
+def build_funnel(
+    client: Any,
+    transactions_table: str,
+    responses_table: str,
+    segments: int = DEFAULT_SEGMENTS,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> Funnel:
+    started = time.perf_counter()
+    transactions = item_count(client, transactions_table)
+    responses = item_count(client, responses_table)
+    # Usually only a fraction of the emails get a response
+    build_on_transactions = (
+        transactions is not None and responses is not None and transactions < responses
+    )
+    join = join_on_transactions if build_on_transactions else join_on_responses
+    funnel = join(
+        scan_rows(client, transactions_table, TRANSACTION_ATTRIBUTES, segments),
+        scan_rows(client, responses_table, RESPONSE_ATTRIBUTES, segments),
+        sent_between(since, until),
+    )
+    logger.info(
+        f"Joined {transactions_table} and {responses_table} on "
+        f"{'transactions' if build_on_transactions else 'responses'} into "
+        f"{len(funnel.cells)} cells in {time.perf_counter() - started:.2f}s"
+    )
+    return funnel
+
+
+def write_report(funnel: Funnel, report_format: str, out: Any) -> None:
+    rows = funnel.rows()
+    if report_format == "json":
+        report: Dict[str, Any] = {"total": rows[0]}
+        for dimension in DIMENSIONS:
+            report[dimension] = [
+                {name: value for name, value in row.items() if name != "dimension"}
+                for row in rows
+                if row["dimension"] == dimension
+            ]
+        json.dump(report, out, separators=(",", ":"))
+        out.write("\n")
+        return
+    writer = csv.DictWriter(out, fieldnames=list(rows[0]))
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument(
+        "--transactions-table", default=os.getenv(TRANSACTIONS_TABLE_NAME)
+    )
+    parser.add_argument("--responses-table", default=os.getenv(TABLE_NAME))
+    parser.add_argument("--segments", type=int, default=DEFAULT_SEGMENTS)
+    parser.add_argument("--since", help="first send day included, YYYY-MM-DD")
+    parser.add_argument("--until", help="last send day included, YYYY-MM-DD")
+    parser.add_argument("--format", choices=["csv", "json"], default="csv")
+    parser.add_argument("--out", help="write the report to this file")
+    parser.add_argument("--log-level", default="WARNING")
+    args = parser.parse_args(argv)
+    if not args.transactions_table or not args.responses_table:
+        parser.error(
+            f"both tables are required, from the options or "
+            f"{TRANSACTIONS_TABLE_NAME} and {TABLE_NAME}"
+        )
+    return args
+
+
+def main(argv: Optional[Sequence[str]] = None, out=sys.stdout) -> Funnel:
+    import clients
+
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+    funnel = build_funnel(
+        clients.get_client("dynamodb"),
+        args.transactions_table,
+        args.responses_table,
+        args.segments,
+        args.since,
+        args.until,
+    )
+    if args.out:
+        with open(args.out, "w", encoding="utf-8", newline="") as f:
+            write_report(funnel, args.format, f)
+    else:
+        write_report(funnel, args.format, out)
+    return funnel
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+import json
+import os
+from typing import List, Optional
+import clients
+from model import ResponseRecord
+
+RESPONSE_QUEUE_URL = "RESPONSE_QUEUE_URL"
+# Voids wait this long in the queue, so the clicks they void are written first
+VOID_DELAY_SECONDS = 60
+
+
+def is_enabled() -> bool:
+    return bool(os.getenv(RESPONSE_QUEUE_URL))
+
+
+def enqueue(record: ResponseRecord) -> Optional[str]:
+    """Hand the response to the consumer through the queue; return an error, if any"""
+    try:
+        clients.get_client("sqs").send_message(
+            QueueUrl=os.environ[RESPONSE_QUEUE_URL],
+            MessageBody=json.dumps(record.to_dict()),
+        )
+        return None
+    except Exception as e:
+        return f"Queue error: {str(e)}"
+
+
+def enqueue_void(response_ids: List[str], since: str) -> Optional[str]:
+    """Have the consumer delete responses of a prefetch burst received since then"""
+    try:
+        clients.get_client("sqs").send_message(
+            QueueUrl=os.environ[RESPONSE_QUEUE_URL],
+            MessageBody=json.dumps({"void": response_ids, "since": since}),
+            DelaySeconds=VOID_DELAY_SECONDS,
+        )
+        return None
+    except Exception as e:
+        return f"Queue error: {str(e)}"
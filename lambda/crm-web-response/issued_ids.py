@@ -0,0 +1,138 @@
+import os
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+import clients
+from bloom import BloomFilterGenerations
+
+ISSUED_IDS_BUCKET = "ISSUED_IDS_BUCKET"
+ISSUED_IDS_KEY = "ISSUED_IDS_KEY"
+ISSUED_IDS_REFRESH_SECONDS = "ISSUED_IDS_REFRESH_SECONDS"
+ISSUED_IDS_RECHECK_SECONDS = "ISSUED_IDS_RECHECK_SECONDS"
+DEFAULT_KEY = "issued/transactions.bloom"
+DEFAULT_REFRESH_SECONDS = 60
+# A negative can be an id emailed after the last refresh, so it forces one,
+# at most this often so that floods of made-up ids cannot hammer S3
+DEFAULT_RECHECK_SECONDS = 5
+ISSUED_IDS_GRACE_DAYS = "ISSUED_IDS_GRACE_DAYS"
+# Ids emailed before the first publish are not in the filter, so for this long
+# after it a negative is confirmed with the transaction lookup instead
+DEFAULT_GRACE_DAYS = 30
+# Object metadata set by crm-sync-quotes
+FIRST_PUBLISHED_AT = "first-published-at"
+
+NOT_MODIFIED_CODES = {"304", "NotModified"}
+
+
+class IssuedIds:
+    """The filter of issued transaction ids published by crm-sync-quotes, kept while warm"""
+
+    def __init__(
+        self,
+        bucket_name: str,
+        object_key: str,
+        refresh_seconds: float,
+        recheck_seconds: float,
+        grace_seconds: float = DEFAULT_GRACE_DAYS * 86400,
+    ) -> None:
+        self.bucket_name = bucket_name
+        self.object_key = object_key
+        self.refresh_seconds = refresh_seconds
+        self.recheck_seconds = recheck_seconds
+        self.grace_seconds = grace_seconds
+        self.filters: Optional[BloomFilterGenerations] = None
+        # Epoch seconds of the first publish, None when the filter does not say
+        self.first_published_at: Optional[float] = None
+        self.etag: Optional[str] = None
+        self.checked_at = float("-inf")
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "IssuedIds":
+        return cls(
+            os.environ[ISSUED_IDS_BUCKET],
+            os.getenv(ISSUED_IDS_KEY, DEFAULT_KEY),
+            float(os.getenv(ISSUED_IDS_REFRESH_SECONDS, DEFAULT_REFRESH_SECONDS)),
+            float(os.getenv(ISSUED_IDS_RECHECK_SECONDS, DEFAULT_RECHECK_SECONDS)),
+            float(os.getenv(ISSUED_IDS_GRACE_DAYS, DEFAULT_GRACE_DAYS)) * 86400,
+        )
+
+    def refresh(self, now: float) -> None:
+        """Download the filter unless its ETag is unchanged"""
+        from botocore.exceptions import ClientError
+
+        self.checked_at = now
+        request = {"Bucket": self.bucket_name, "Key": self.object_key}
+        if self.etag is not None:
+            request["IfNoneMatch"] = self.etag
+        try:
+            response = clients.get_client("s3").get_object(**request)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in NOT_MODIFIED_CODES:
+                return
+            raise
+        body = response["Body"]
+        try:
+            data = body.read()
+        finally:
+            body.close()
+        # Sizes come from the serialized filters; these only apply to new ones
+        self.filters = BloomFilterGenerations.from_bytes(data, 1, 0.5, 1)
+        self.etag = response["ETag"]
+        first_published_at = (response.get("Metadata") or {}).get(FIRST_PUBLISHED_AT)
+        try:
+            self.first_published_at = datetime.fromisoformat(
+                first_published_at
+            ).timestamp()
+        except (TypeError, ValueError):
+            self.first_published_at = None
+
+    def _refresh_after(self, interval: float) -> None:
+        now = time.monotonic()
+        if now - self.checked_at < interval:
+            return
+        with self._lock:
+            if now - self.checked_at < interval:
+                return
+            try:
+                self.refresh(now)
+            except Exception as e:
+                print(f"Error refreshing issued transaction ids: {str(e)}")
+
+    def might_contain(self, email_transaction_id: str) -> bool:
+        """False only when the id was certainly never issued"""
+        self._refresh_after(self.refresh_seconds)
+        if self.filters is not None and email_transaction_id in self.filters:
+            return True
+        self._refresh_after(self.recheck_seconds)
+        if self.filters is None:
+            # Nothing published or readable yet: rely on the transaction lookup
+            return True
+        return email_transaction_id in self.filters
+
+    def in_grace_period(self) -> bool:
+        """Whether ids not in the filter may still have been emailed before its first publish"""
+        if self.first_published_at is None:
+            return True
+        return time.time() - self.first_published_at < self.grace_seconds
+
+
+_issued_ids: Optional[IssuedIds] = None
+
+
+def is_enabled() -> bool:
+    return bool(os.getenv(ISSUED_IDS_BUCKET))
+
+
+def get_issued_ids() -> IssuedIds:
+    """Return the container-wide filter, loaded on first use"""
+    global _issued_ids
+    if _issued_ids is None:
+        _issued_ids = IssuedIds.from_env()
+    return _issued_ids
+
+
+def reset() -> None:
+    global _issued_ids
+    _issued_ids = None
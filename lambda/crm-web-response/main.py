@@ -1,17 +1,47 @@
 import json
+import os
 import uuid
-from datetime import datetime, timezone
-from typing import Dict, Any, Optional
-import boto3
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Dict, Any, List, Optional
 from botocore.exceptions import ClientError
+import clients
+import counters
+import ingest
+import issued_ids
+import metrics
+import prefetch
+import profiling
+import transactions
 from utils import safe_get_env
 from model import ResponseType, ResponseRecord
 
-TABLE_NAME = safe_get_env("TABLE_NAME")
-ENABLE_CORS = safe_get_env("ENABLE_CORS").lower() == "true"
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import Table
 
-dynamodb = boto3.resource("dynamodb")
-table = dynamodb.Table(TABLE_NAME)
+TABLE_NAME = "TABLE_NAME"
+ENABLE_CORS = "ENABLE_CORS"
+RESPONSE_CACHE_SIZE = "RESPONSE_CACHE_SIZE"
+DEFAULT_RESPONSE_CACHE_SIZE = 1024
+
+# Namespace of the response ids derived from (email_transaction_id, response_type)
+RESPONSE_ID_NAMESPACE = uuid.UUID("6f1c2a8e-4b1d-5a57-9f0e-3c8a4e2d7b10")
+
+_table: Optional["Table"] = None
+# Records written or found by this container, most recently used last
+_recorded: "OrderedDict[str, ResponseRecord]" = OrderedDict()
+
+
+def get_table() -> "Table":
+    """Return the responses table, created on first use and reused while warm"""
+    global _table
+    if _table is None:
+        _table = clients.get_resource("dynamodb").Table(safe_get_env(TABLE_NAME))
+    return _table
+
+
+def is_cors_enabled() -> bool:
+    return safe_get_env(ENABLE_CORS).lower() == "true"
 
 
 def create_response(
@@ -20,7 +50,7 @@ def create_response(
     """Create a standardized API Gateway response"""
     default_headers = {"Content-Type": "application/json"}
 
-    if ENABLE_CORS:
+    if is_cors_enabled():
         default_headers.update(
             {
                 "Access-Control-Allow-Origin": "*",
@@ -62,19 +92,188 @@ def validate_query_params(params: Dict[str, Any]) -> tuple[bool, Optional[str]]:
     return True, None
 
 
-def save_to_dynamodb(record: ResponseRecord) -> tuple[bool, Optional[str]]:
-    """Save response record to DynamoDB"""
+def response_id_for(email_transaction_id: str, response_type: str) -> str:
+    """Same id for every click on the same button of the same email"""
+    return str(
+        uuid.uuid5(RESPONSE_ID_NAMESPACE, f"{email_transaction_id}#{response_type}")
+    )
+
+
+def get_recorded(response_id: str) -> Optional[ResponseRecord]:
+    """Return a record this container already wrote or found, if still cached"""
+    record = _recorded.get(response_id)
+    if record is not None:
+        _recorded.move_to_end(response_id)
+    return record
+
+
+def remember(record: ResponseRecord) -> None:
+    _recorded[record.response_id] = record
+    _recorded.move_to_end(record.response_id)
+    max_size = int(os.getenv(RESPONSE_CACHE_SIZE, DEFAULT_RESPONSE_CACHE_SIZE))
+    while len(_recorded) > max_size:
+        _recorded.popitem(last=False)
+
+
+def _existing_record(error: ClientError, response_id: str) -> ResponseRecord:
+    """The record that made the conditional put fail"""
+    item = error.response.get("Item")
+    if item:
+        from boto3.dynamodb.types import TypeDeserializer
+
+        deserializer = TypeDeserializer()
+        item = {name: deserializer.deserialize(value) for name, value in item.items()}
+    else:
+        item = (
+            get_table()
+            .get_item(Key={"response_id": response_id}, ConsistentRead=True)
+            .get("Item")
+        )
+    return ResponseRecord.from_dict(item or {"response_id": response_id})
+
+
+def save_to_dynamodb(
+    record: ResponseRecord,
+) -> tuple[Optional[ResponseRecord], Optional[str]]:
+    """Save response record to DynamoDB unless one exists; return the stored record"""
     try:
-        table.put_item(Item=record.to_dict())
-        return True, None
+        get_table().put_item(
+            Item=record.to_dict(),
+            ConditionExpression="attribute_not_exists(response_id)",
+            ReturnValuesOnConditionCheckFailure="ALL_OLD",
+        )
+        return record, None
     except ClientError as e:
         error_code = e.response["Error"]["Code"]  # type: ignore
+        if error_code == "ConditionalCheckFailedException":
+            try:
+                return _existing_record(e, record.response_id), None
+            except Exception as lookup_error:
+                return None, f"Unexpected error: {str(lookup_error)}"
         error_message = e.response["Error"]["Message"]  # type: ignore
-        return False, f"DynamoDB error ({error_code}): {error_message}"
+        return None, f"DynamoDB error ({error_code}): {error_message}"
     except Exception as e:
-        return False, f"Unexpected error: {str(e)}"
+        return None, f"Unexpected error: {str(e)}"
+
+
+def get_transaction_context(email_transaction_id: str) -> Optional[Dict[str, Any]]:
+    """Fields of the email transaction to store on the response, None if not found"""
+    if not transactions.is_enabled():
+        return {}
+    try:
+        with metrics.stage("transaction") as stage:
+            transaction = transactions.get_transaction(email_transaction_id)
+            if transaction is None:
+                # Written just now, or not at all yet: the sender publishes
+                # the ids before sending and writes the transactions after
+                transaction = transactions.get_transaction(
+                    email_transaction_id, consistent_read=True
+                )
+            stage.records = int(transaction is not None)
+    except Exception as e:
+        print(f"Error reading email transaction: {str(e)}")
+        return {}
+    if transaction is None:
+        return None
+    return transaction_fields(transaction)
+
+
+def transaction_fields(transaction: Dict[str, Any]) -> Dict[str, Any]:
+    """The fields of an email transaction copied onto its responses"""
+    return {
+        name: str(transaction[name])
+        for name in transactions.TRANSACTION_FIELDS
+        if transaction.get(name)
+    }
 
 
+def response_data(record: ResponseRecord) -> Dict[str, Any]:
+    return {
+        "response_id": record.response_id,
+        "received_at": record.received_at,
+        "prospect_id": record.prospect_id,
+        "response_type": record.response_type,
+    }
+
+
+def unknown_transaction_response() -> Dict[str, Any]:
+    return create_response(
+        400, {"error": "Invalid request", "message": "Unknown email transaction"}
+    )
+
+
+def count_response(record: ResponseRecord) -> None:
+    """Add a new response to the counters of its day, prospect, quote and rep"""
+    try:
+        with metrics.stage("counters") as stage:
+            stage.records = counters.increment(
+                record.response_type,
+                record.received_at,
+                record.prospect_id,
+                quote_id=record.quote_id,
+                sales_rep_id=record.sales_rep_id,
+            )
+    except Exception as e:
+        print(f"Error updating response counters: {str(e)}")
+
+
+def void_responses(response_ids: List[str], since: str) -> int:
+    """
+    Delete the responses of a prefetch burst and take them back off the
+    counters; a response recorded before the burst began was a real click and
+    stays. Return how many were deleted.
+    """
+    voided = []
+    for response_id in response_ids:
+        _recorded.pop(response_id, None)
+        try:
+            attributes = (
+                get_table()
+                .delete_item(
+                    Key={"response_id": response_id},
+                    ConditionExpression="received_at >= :since",
+                    ExpressionAttributeValues={":since": since},
+                    ReturnValues="ALL_OLD",
+                )
+                .get("Attributes")
+            )
+        except ClientError as e:
+            error_code = e.response["Error"]["Code"]  # type: ignore
+            if error_code != "ConditionalCheckFailedException":
+                print(f"Error voiding response {response_id}: {str(e)}")
+            continue
+        except Exception as e:
+            print(f"Error voiding response {response_id}: {str(e)}")
+            continue
+        if attributes:
+            voided.append(ResponseRecord.from_dict(attributes))
+    if voided and counters.is_enabled():
+        try:
+            with metrics.stage("counters") as stage:
+                stage.records = counters.increment_many(voided, by=-1)
+        except Exception as e:
+            print(f"Error updating response counters: {str(e)}")
+    return len(voided)
+
+
+def void_burst(email_transaction_id: str, buttons: List[str], window_ms: int) -> None:
+    """Void the responses to the buttons clicked earlier in a prefetch burst"""
+    response_ids = [response_id_for(email_transaction_id, button) for button in buttons]
+    since = (datetime.now(timezone.utc) - timedelta(milliseconds=window_ms)).isoformat()
+    if ingest.is_enabled():
+        # The clicks may still be queued, so the consumer voids them later
+        for response_id in response_ids:
+            _recorded.pop(response_id, None)
+        error = ingest.enqueue_void(response_ids, since)
+        if error:
+            print(f"Error queuing voided responses: {error}")
+        return
+    with metrics.stage("void") as stage:
+        stage.records = void_responses(response_ids, since)
+
+
+@profiling.profiled("crm-web-response")
+@metrics.instrument("crm-web-response")
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     Lambda handler for prospect response tracking.
@@ -96,41 +295,127 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
 
     query_params = event.get("queryStringParameters") or {}
 
-    is_valid, error_message = validate_query_params(query_params)
+    with metrics.stage("validate") as stage:
+        is_valid, error_message = validate_query_params(query_params)
+        stage.records = 1
     if not is_valid:
         return create_response(
             400, {"error": "Invalid request", "message": error_message}
         )
 
-    response_type = ResponseType.from_string(query_params["response"])
-    record = ResponseRecord(
-        response_id=str(uuid.uuid4()),
-        received_at=datetime.now(timezone.utc).isoformat(),
-        email_transaction_id=query_params["email_transaction_id"].strip(),
-        prospect_id=query_params["id"].strip(),
-        response_type=str(response_type),
-    )
+    response_type = str(ResponseType.from_string(query_params["response"]))
+    email_transaction_id = query_params["email_transaction_id"].strip()
 
-    success, error = save_to_dynamodb(record)
-    if not success:
-        print(f"Error saving to DynamoDB: {error}")
+    # Made-up ids are turned away before any DynamoDB call. During the grace
+    # period after the first publish a negative is confirmed with the
+    # transaction lookup instead, as the id may have been emailed before the
+    # filter existed
+    issued = True
+    if issued_ids.is_enabled():
+        with metrics.stage("issued_ids") as stage:
+            known_ids = issued_ids.get_issued_ids()
+            issued = known_ids.might_contain(email_transaction_id)
+            stage.records = 1
+        if not issued and not known_ids.in_grace_period():
+            metrics.record("unknown_transaction", 0.0, records=1)
+            return unknown_transaction_response()
+
+    if prefetch.is_enabled():
+        classifier = prefetch.get_classifier(len(ResponseType))
+        with metrics.stage("classify") as stage:
+            reason, voided = classifier.classify(
+                event, email_transaction_id, response_type
+            )
+            stage.records = 1
+        if voided:
+            void_burst(email_transaction_id, voided, classifier.tracker.window_ms)
+        if reason:
+            print(
+                f"Ignoring suspected prefetch ({reason}): "
+                f"{email_transaction_id} {response_type}"
+            )
+            metrics.record("prefetch", 0.0, records=1)
+            return create_response(
+                202,
+                {
+                    "message": "Response not recorded",
+                    "data": {"response_type": response_type},
+                },
+            )
+
+    response_id = response_id_for(email_transaction_id, response_type)
+
+    stored = get_recorded(response_id)
+    if stored is None and ingest.is_enabled():
+        # Write-behind: consumer.handler looks up the transaction, writes the
+        # response in batches and counts it
+        record = ResponseRecord(
+            response_id=response_id,
+            received_at=datetime.now(timezone.utc).isoformat(),
+            email_transaction_id=email_transaction_id,
+            prospect_id=query_params["id"].strip(),
+            response_type=response_type,
+        )
+        with metrics.stage("enqueue") as stage:
+            error = ingest.enqueue(record)
+            stage.records = int(error is None)
+        if error:
+            print(f"Error queuing response: {error}")
+            return create_response(
+                500,
+                {
+                    "error": "Internal server error",
+                    "message": "Failed to save response record",
+                },
+            )
+        remember(record)
         return create_response(
-            500,
-            {
-                "error": "Internal server error",
-                "message": "Failed to save response record",
-            },
+            202, {"message": "Response accepted", "data": response_data(record)}
+        )
+    if stored is None:
+        transaction = get_transaction_context(email_transaction_id)
+        if transaction is None:
+            if not issued:
+                metrics.record("unknown_transaction", 0.0, records=1)
+                return unknown_transaction_response()
+            # An issued id whose transaction is not written yet, or whose
+            # write failed: recorded without its context
+            transaction = {}
+        record = ResponseRecord(
+            response_id=response_id,
+            received_at=datetime.now(timezone.utc).isoformat(),
+            email_transaction_id=email_transaction_id,
+            prospect_id=query_params["id"].strip(),
+            response_type=response_type,
+            **transaction,
         )
+        with metrics.stage("dynamodb") as stage:
+            stored, error = save_to_dynamodb(record)
+            stage.records = int(stored is record)
+        if stored is None:
+            print(f"Error saving to DynamoDB: {error}")
+            return create_response(
+                500,
+                {
+                    "error": "Internal server error",
+                    "message": "Failed to save response record",
+                },
+            )
+        remember(stored)
+        created = stored is record
+        if created and counters.is_enabled():
+            count_response(stored)
+    else:
+        created = False
 
     return create_response(
-        201,
+        201 if created else 200,
         {
-            "message": "Response recorded successfully",
-            "data": {
-                "response_id": record.response_id,
-                "received_at": record.received_at,
-                "prospect_id": record.prospect_id,
-                "response_type": record.response_type,
-            },
+            "message": (
+                "Response recorded successfully"
+                if created
+                else "Response already recorded"
+            ),
+            "data": response_data(stored),
         },
     )
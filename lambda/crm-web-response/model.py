@@ -1,4 +1,4 @@
-from dataclasses import dataclass, asdict
+from dataclasses import MISSING, dataclass, asdict
 from enum import Enum
 from typing import Optional, Dict, Any
 
@@ -28,6 +28,22 @@ class ResponseRecord:
     email_transaction_id: str
     prospect_id: str
     response_type: str
+    # Copied from the email transaction, when it is known
+    quote_id: Optional[str] = None
+    email_address: Optional[str] = None
+    sent_at: Optional[str] = None
+    sales_rep_id: Optional[str] = None
 
     def to_dict(self) -> dict:
-        return asdict(self)
+        return {name: value for name, value in asdict(self).items() if value}
+
+    @classmethod
+    def from_dict(cls, item: Dict[str, Any]) -> "ResponseRecord":
+        values = {}
+        for name, field in cls.__dataclass_fields__.items():
+            value = item.get(name)
+            if value is not None:
+                values[name] = str(value)
+            elif field.default is MISSING:
+                values[name] = ""
+        return cls(**values)
@@ -0,0 +1,190 @@
+import ipaddress
+import os
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, List, Optional, Tuple, Union
+
+PREFETCH_FILTER = "PREFETCH_FILTER"
+PREFETCH_WINDOW_MS = "PREFETCH_WINDOW_MS"
+PREFETCH_BURST_BUTTONS = "PREFETCH_BURST_BUTTONS"
+PREFETCH_SCANNER_CIDRS = "PREFETCH_SCANNER_CIDRS"
+PREFETCH_TRACKED_TRANSACTIONS = "PREFETCH_TRACKED_TRANSACTIONS"
+
+DEFAULT_WINDOW_MS = 2000
+DEFAULT_TRACKED_TRANSACTIONS = 4096
+# Exchange Online Protection, whose Safe Links follow every link of a message
+DEFAULT_SCANNER_CIDRS = "40.92.0.0/15,40.107.0.0/16,52.100.0.0/14,104.47.0.0/17"
+
+# Mail security gateways, link preview services and HTTP libraries; a person
+# answering from a browser or mail app matches none of these
+# Named gateways, link previewers and HTTP libraries only: generic words such
+# as "bot" or "ms-office" also match real clients (CUBOT phones, Office apps)
+SCANNER_USER_AGENT = re.compile(
+    r"barracuda|mimecast|proofpoint|messagelabs|symantec|forcepoint|trendmicro"
+    r"|sophos|fortinet|cisco|ironport|safelinks"
+    r"|bingpreview|googleimageproxy|googlebot|bingbot|slackbot|twitterbot"
+    r"|linkedinbot|facebookexternalhit|headless|phantomjs|python|curl|wget"
+    r"|okhttp|go-http-client|java/|libwww|httpclient|scanner|crawler|spider",
+    re.IGNORECASE,
+)
+
+Network = Union[ipaddress.IPv4Network, ipaddress.IPv6Network]
+
+
+def _setting(name: str, default: int) -> int:
+    return int(os.getenv(name, default))
+
+
+def _parse_networks(value: str) -> List[Network]:
+    return [
+        ipaddress.ip_network(cidr.strip(), strict=False)
+        for cidr in value.split(",")
+        if cidr.strip()
+    ]
+
+
+def get_user_agent(event: Dict[str, Any]) -> str:
+    headers = event.get("headers") or {}
+    user_agent = headers.get("User-Agent") or headers.get("user-agent")
+    if user_agent is None:
+        user_agent = next(
+            (v for k, v in headers.items() if k.lower() == "user-agent"), ""
+        )
+    return user_agent or ""
+
+
+def get_source_ip(event: Dict[str, Any]) -> str:
+    request_context = event.get("requestContext") or {}
+    identity = request_context.get("identity") or request_context.get("http") or {}
+    return identity.get("sourceIp") or ""
+
+
+class BurstTracker:
+    """
+    Buttons clicked recently per email transaction. Clicks are only seen by
+    the container that served them, so a burst spread over concurrent
+    containers goes unnoticed.
+    """
+
+    def __init__(self, window_ms: int, burst_buttons: int, max_transactions: int):
+        self.window_ms = window_ms
+        self.burst_buttons = burst_buttons
+        self.max_transactions = max_transactions
+        # [time, button, voided] of each click in the window, oldest first
+        self._clicks: "OrderedDict[str, Deque[List[Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def track(
+        self, email_transaction_id: str, response_type: str, now_ms: float
+    ) -> Optional[List[str]]:
+        """
+        Record a click. When it makes a burst of distinct buttons, return the
+        buttons clicked earlier in the window and not voided yet, whose
+        responses are then voided along with this click; None otherwise.
+        """
+        with self._lock:
+            clicks = self._clicks.get(email_transaction_id)
+            if clicks is None:
+                clicks = self._clicks[email_transaction_id] = deque()
+                if len(self._clicks) > self.max_transactions:
+                    self._clicks.popitem(last=False)
+            else:
+                self._clicks.move_to_end(email_transaction_id)
+            while clicks and now_ms - clicks[0][0] > self.window_ms:
+                clicks.popleft()
+            clicks.append([now_ms, response_type, False])
+            if len({click[1] for click in clicks}) < self.burst_buttons:
+                return None
+            earlier = []
+            for click in list(clicks)[:-1]:
+                if not click[2] and click[1] not in earlier:
+                    earlier.append(click[1])
+                click[2] = True
+            clicks[-1][2] = True
+            return earlier
+
+
+class PrefetchClassifier:
+    def __init__(
+        self,
+        scanner_networks: List[Network],
+        tracker: BurstTracker,
+    ) -> None:
+        self.scanner_networks = scanner_networks
+        self.tracker = tracker
+        self._ip_cache: "OrderedDict[str, bool]" = OrderedDict()
+
+    @classmethod
+    def from_env(cls, button_count: int) -> "PrefetchClassifier":
+        return cls(
+            _parse_networks(os.getenv(PREFETCH_SCANNER_CIDRS, DEFAULT_SCANNER_CIDRS)),
+            BurstTracker(
+                _setting(PREFETCH_WINDOW_MS, DEFAULT_WINDOW_MS),
+                _setting(PREFETCH_BURST_BUTTONS, button_count),
+                _setting(PREFETCH_TRACKED_TRANSACTIONS, DEFAULT_TRACKED_TRANSACTIONS),
+            ),
+        )
+
+    def _is_scanner_ip(self, source_ip: str) -> bool:
+        cached = self._ip_cache.get(source_ip)
+        if cached is not None:
+            return cached
+        try:
+            address = ipaddress.ip_address(source_ip)
+            matched = any(address in network for network in self.scanner_networks)
+        except ValueError:
+            matched = False
+        self._ip_cache[source_ip] = matched
+        if len(self._ip_cache) > self.tracker.max_transactions:
+            self._ip_cache.popitem(last=False)
+        return matched
+
+    def classify(
+        self,
+        event: Dict[str, Any],
+        email_transaction_id: str,
+        response_type: str,
+        now_ms: Optional[float] = None,
+    ) -> Tuple[Optional[str], List[str]]:
+        """
+        Return why the request looks like a prefetch, or None for a real click,
+        and the buttons of the email clicked earlier in the burst it makes, if
+        any, whose responses must be voided
+        """
+        if now_ms is None:
+            now_ms = time.monotonic() * 1000
+        # Every click is tracked, so a burst is seen whatever gave it away first
+        earlier = self.tracker.track(email_transaction_id, response_type, now_ms)
+        voided = earlier or []
+        user_agent = get_user_agent(event)
+        if not user_agent:
+            return "missing user agent", voided
+        if SCANNER_USER_AGENT.search(user_agent):
+            return "scanner user agent", voided
+        if self._is_scanner_ip(get_source_ip(event)):
+            return "scanner source ip", voided
+        if earlier is not None:
+            return "button burst", voided
+        return None, voided
+
+
+_classifier: Optional[PrefetchClassifier] = None
+
+
+def is_enabled() -> bool:
+    return os.getenv(PREFETCH_FILTER, "true").lower() == "true"
+
+
+def get_classifier(button_count: int) -> PrefetchClassifier:
+    """Return the container-wide classifier, created on first use"""
+    global _classifier
+    if _classifier is None:
+        _classifier = PrefetchClassifier.from_env(button_count)
+    return _classifier
+
+
+def reset() -> None:
+    global _classifier
+    _classifier = None
@@ -0,0 +1,90 @@
+import queue
+import threading
+from typing import Any, Dict, Iterable, Iterator, Optional, Tuple
+
+# Scanned pages buffered per segment before the scanning threads wait
+PAGES_PER_SEGMENT = 2
+
+
+def _put(pages: "queue.Queue", value: Any, stop: threading.Event) -> bool:
+    """Wait for room in the queue unless the reader stopped; False if it did"""
+    while not stop.is_set():
+        try:
+            pages.put(value, timeout=0.1)
+            return True
+        except queue.Full:
+            continue
+    return False
+
+
+def _scan_segment(
+    client: Any,
+    request: Dict[str, Any],
+    segment: int,
+    pages: "queue.Queue",
+    stop: threading.Event,
+) -> None:
+    try:
+        while True:
+            page = client.scan(**request)
+            if not _put(pages, (segment, page), stop):
+                return
+            last_key = page.get("LastEvaluatedKey")
+            if not last_key:
+                break
+            request["ExclusiveStartKey"] = last_key
+        _put(pages, (segment, None), stop)
+    except Exception as e:
+        _put(pages, (segment, e), stop)
+
+
+def scan_pages(
+    client: Any,
+    table_name: str,
+    total_segments: int = 1,
+    segments: Optional[Iterable[int]] = None,
+    start_keys: Optional[Dict[int, Dict[str, Any]]] = None,
+    **scan_kwargs: Any,
+) -> Iterator[Tuple[int, Dict[str, Any]]]:
+    """
+    Yield (segment, page) for every page of a parallel segmented scan, as the
+    pages arrive, with one thread per segment and a bounded number of pages
+    read ahead. A segment listed in start_keys resumes after that key, and only
+    the given segments are scanned; a page without LastEvaluatedKey is the
+    last of its segment.
+    """
+    segments = list(range(total_segments) if segments is None else segments)
+    start_keys = start_keys or {}
+    pages: "queue.Queue" = queue.Queue(maxsize=len(segments) * PAGES_PER_SEGMENT)
+    stop = threading.Event()
+    threads = []
+    for segment in segments:
+        request = {
+            "TableName": table_name,
+            "Segment": segment,
+            "TotalSegments": total_segments,
+            **scan_kwargs,
+        }
+        if start_keys.get(segment):
+            request["ExclusiveStartKey"] = start_keys[segment]
+        threads.append(
+            threading.Thread(
+                target=_scan_segment,
+                args=(client, request, segment, pages, stop),
+                daemon=True,
+            )
+        )
+    for thread in threads:
+        thread.start()
+    try:
+        running = len(threads)
+        while running:
+            segment, page = pages.get()
+            if page is None:
+                running -= 1
+            elif isinstance(page, Exception):
+                raise page
+            else:
+                yield segment, page
+    finally:
+        stop.set()
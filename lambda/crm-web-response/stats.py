@@ -0,0 +1,177 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+import counters
+import metrics
+import profiling
+from main import create_response, is_cors_enabled
+from model import ResponseType
+
+STATS_CACHE_SIZE = "STATS_CACHE_SIZE"
+STATS_CACHE_TTL_SECONDS = "STATS_CACHE_TTL_SECONDS"
+DEFAULT_CACHE_SIZE = 1024
+DEFAULT_CACHE_TTL_SECONDS = 30
+
+# Query parameter of each counter kind stats can be read for
+KINDS = {"quote_id": "quote", "sales_rep_id": "rep"}
+
+# Stats body and its ETag by (kind, id), with the time they were read, most
+# recently used last
+_cache: "OrderedDict[Tuple[str, str], Tuple[float, Dict[str, Any], str]]" = (
+    OrderedDict()
+)
+_lock = threading.Lock()
+
+
+def cache_ttl_seconds() -> float:
+    return float(os.getenv(STATS_CACHE_TTL_SECONDS, DEFAULT_CACHE_TTL_SECONDS))
+
+
+def parse_query(params: Dict[str, Any]) -> Tuple[Optional[Tuple[str, str]], str]:
+    """The parameter and id asked for, or None and why the request is invalid"""
+    given = [(name, str(params[name]).strip()) for name in KINDS if params.get(name)]
+    if len(given) != 1 or not given[0][1]:
+        return None, f"Exactly one of {', '.join(KINDS)} is required"
+    return given[0], ""
+
+
+def build_stats(name: str, value: str, totals: Dict[str, int]) -> Dict[str, Any]:
+    responses = totals.get("responses", 0)
+    attributes = [counters.counter_attribute(str(type_)) for type_ in ResponseType]
+    by_type = {attribute: totals.get(attribute, 0) for attribute in attributes}
+    return {
+        name: value,
+        "responses": responses,
+        **by_type,
+        "buy_rate": round(by_type["buy"] / responses, 4) if responses else 0.0,
+    }
+
+
+def etag_for(body: Dict[str, Any]) -> str:
+    """Strong ETag of the stats, so unchanged counts match across containers"""
+    encoded = json.dumps(body, sort_keys=True, separators=(",", ":")).encode("utf-8")
+    return f'"{hashlib.blake2b(encoded, digest_size=12).hexdigest()}"'
+
+
+def _cached(key: Tuple[str, str], now: float) -> Optional[Tuple[Dict[str, Any], str]]:
+    with _lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        if now - entry[0] >= cache_ttl_seconds():
+            del _cache[key]
+            return None
+        _cache.move_to_end(key)
+        return entry[1], entry[2]
+
+
+def _store(key: Tuple[str, str], body: Dict[str, Any], etag: str, now: float) -> None:
+    max_size = int(os.getenv(STATS_CACHE_SIZE, DEFAULT_CACHE_SIZE))
+    with _lock:
+        _cache[key] = (now, body, etag)
+        _cache.move_to_end(key)
+        while len(_cache) > max_size:
+            _cache.popitem(last=False)
+
+
+def get_stats(name: str, value: str) -> Tuple[Dict[str, Any], str]:
+    """Stats of a quote or rep and their ETag, from the cache while fresh"""
+    kind = KINDS[name]
+    now = time.monotonic()
+    cached = _cached((kind, value), now)
+    if cached is not None:
+        metrics.record("cache", 0.0, records=1)
+        return cached
+    with metrics.stage("counters") as stage:
+        totals = counters.read_totals(kind, value)
+        stage.records = 1
+    body = build_stats(name, value, totals)
+    etag = etag_for(body)
+    _store((kind, value), body, etag, now)
+    return body, etag
+
+
+def _header(event: Dict[str, Any], name: str) -> Optional[str]:
+    headers = event.get("headers") or {}
+    return next(
+        (value for key, value in headers.items() if key.lower() == name.lower()), None
+    )
+
+
+def matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Whether an If-None-Match header names the current ETag (weak comparison)"""
+    if not if_none_match:
+        return False
+    tags = [tag.strip() for tag in if_none_match.split(",")]
+    return "*" in tags or etag in [
+        tag[2:] if tag.startswith("W/") else tag for tag in tags
+    ]
+
+
+def cache_headers(etag: str) -> Dict[str, str]:
+    headers = {
+        "ETag": etag,
+        "Cache-Control": f"private, max-age={int(cache_ttl_seconds())}",
+    }
+    if is_cors_enabled():
+        headers["Access-Control-Allow-Headers"] = "Content-Type,If-None-Match"
+        headers["Access-Control-Expose-Headers"] = "ETag"
+    return headers
+
+
+@profiling.profiled("crm-web-response-stats")
+@metrics.instrument("crm-web-response-stats")
+def handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+    """
+    Returns the response counts of a quote or sales rep, read from the counters
+    kept by lambda_handler and consumer.handler.
+
+    Expected query parameters, one of:
+    - quote_id: Quote ID
+    - sales_rep_id: Sales rep ID
+    """
+    if event.get("httpMethod") == "OPTIONS":
+        return create_response(200, {"message": "OK"})
+
+    if event.get("httpMethod") != "GET":
+        return create_response(
+            405,
+            {"error": "Method not allowed", "message": "Only GET method is supported"},
+        )
+
+    params = event.get("queryStringParameters") or {}
+    query, error_message = parse_query(params)
+    if query is None:
+        return create_response(
+            400, {"error": "Invalid request", "message": error_message}
+        )
+    if not counters.is_enabled():
+        return create_response(
+            503,
+            {"error": "Unavailable", "message": "Response counters are not enabled"},
+        )
+
+    try:
+        body, etag = get_stats(*query)
+    except Exception as e:
+        print(f"Error reading response counters: {str(e)}")
+        return create_response(
+            500,
+            {"error": "Internal server error", "message": "Failed to read stats"},
+        )
+
+    headers = cache_headers(etag)
+    if matches(_header(event, "If-None-Match"), etag):
+        response = create_response(304, {}, headers)
+        response["body"] = ""
+        return response
+    return create_response(200, {"data": body}, headers)
+
+
+def reset() -> None:
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,246 @@
+import json
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+import consumer
+import main
+import prefetch
+import transactions
+from test.test_main import make_event
+
+
+def sqs_event(records):
+    return {
+        "Records": [
+            {"messageId": f"m{index}", "body": json.dumps(record)}
+            for index, record in enumerate(records)
+        ]
+    }
+
+
+def queued(index, received_at="2024-07-21T10:00:00+00:00"):
+    return {
+        "response_id": f"r{index}",
+        "received_at": received_at,
+        "email_transaction_id": f"tx-{index}",
+        "prospect_id": f"p{index}",
+        "response_type": "Buy",
+    }
+
+
+@patch.dict(
+    os.environ,
+    {
+        "TABLE_NAME": "responses",
+        "ENABLE_CORS": "false",
+        "RESPONSE_QUEUE_URL": "https://sqs.local/responses",
+    },
+)
+class TestQueuedResponses(unittest.TestCase):
+    def setUp(self):
+        main._recorded.clear()
+        prefetch.reset()
+        self.sqs = MagicMock()
+        self.table = MagicMock()
+        for target, value in [
+            ("ingest.clients.get_client", self.sqs),
+            ("main.get_table", self.table),
+        ]:
+            patcher = patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_click_is_queued_instead_of_written(self):
+        response = main.lambda_handler(make_event(), None)
+
+        self.assertEqual(response["statusCode"], 202)
+        self.table.put_item.assert_not_called()
+        kwargs = self.sqs.send_message.call_args.kwargs
+        self.assertEqual(kwargs["QueueUrl"], "https://sqs.local/responses")
+        body = json.loads(kwargs["MessageBody"])
+        self.assertEqual(body["response_id"], main.response_id_for("tx-1", "Buy"))
+
+    def test_repeat_click_is_not_queued_again(self):
+        main.lambda_handler(make_event(), None)
+
+        response = main.lambda_handler(make_event(), None)
+
+        self.assertEqual(response["statusCode"], 200)
+        self.sqs.send_message.assert_called_once()
+
+    def test_queue_errors_fail_the_request(self):
+        self.sqs.send_message.side_effect = RuntimeError("unavailable")
+
+        response = main.lambda_handler(make_event(), None)
+
+        self.assertEqual(response["statusCode"], 500)
+        self.assertEqual(main._recorded, {})
+
+
+def client_error(code):
+    return ClientError({"Error": {"Code": code, "Message": code}}, "PutItem")
+
+
+@patch.dict(os.environ, {"TABLE_NAME": "responses"})
+class TestConsumer(unittest.TestCase):
+    def setUp(self):
+        self.dynamodb = MagicMock()
+        self.dynamodb.put_item.return_value = {}
+        for patcher in [
+            patch("consumer.clients.get_client", return_value=self.dynamodb),
+            patch("consumer.BASE_BACKOFF_SECONDS", 0),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def written_ids(self):
+        return [
+            call.kwargs["Item"]["response_id"]["S"]
+            for call in self.dynamodb.put_item.call_args_list
+        ]
+
+    def test_writes_each_response_unless_stored(self):
+        response = consumer.handler(sqs_event([queued(i) for i in range(60)]), None)
+
+        self.assertEqual(response, {"batchItemFailures": []})
+        self.assertEqual(len(set(self.written_ids())), 60)
+        for call in self.dynamodb.put_item.call_args_list:
+            self.assertEqual(call.kwargs["TableName"], "responses")
+            self.assertEqual(
+                call.kwargs["ConditionExpression"], "attribute_not_exists(response_id)"
+            )
+
+    @patch.dict(os.environ, {"COUNTERS_TABLE_NAME": "counters"})
+    def test_first_click_wins_and_stored_responses_are_not_counted(self):
+        def put_item(**kwargs):
+            if kwargs["Item"]["response_id"]["S"] == "r1":
+                raise client_error("ConditionalCheckFailedException")
+            return {}
+
+        self.dynamodb.put_item.side_effect = put_item
+        increment_many = MagicMock(return_value=2)
+        messages = [
+            queued(0, "2024-07-21T10:00:05+00:00"),
+            queued(0, "2024-07-21T10:00:00+00:00"),
+            queued(1),
+        ]
+
+        with patch("counters.increment_many", increment_many):
+            response = consumer.handler(sqs_event(messages), None)
+
+        self.assertEqual(response, {"batchItemFailures": []})
+        self.assertEqual(sorted(self.written_ids()), ["r0", "r1"])
+        [item] = [
+            call.kwargs["Item"]
+            for call in self.dynamodb.put_item.call_args_list
+            if call.kwargs["Item"]["response_id"]["S"] == "r0"
+        ]
+        self.assertEqual(item["received_at"]["S"], "2024-07-21T10:00:00+00:00")
+        counted = increment_many.call_args.args[0]
+        self.assertEqual([record.response_id for record in counted], ["r0"])
+
+    def test_write_errors_are_retried(self):
+        self.dynamodb.put_item.side_effect = [
+            client_error("ProvisionedThroughputExceededException"),
+            {},
+        ]
+
+        response = consumer.handler(sqs_event([queued(0)]), None)
+
+        self.assertEqual(response, {"batchItemFailures": []})
+        self.assertEqual(self.dynamodb.put_item.call_count, 2)
+
+    def test_messages_left_unwritten_are_reported(self):
+        def put_item(**kwargs):
+            if kwargs["Item"]["response_id"]["S"] == "r2":
+                raise client_error("InternalServerError")
+            return {}
+
+        self.dynamodb.put_item.side_effect = put_item
+
+        response = consumer.handler(sqs_event([queued(i) for i in range(3)]), None)
+
+        self.assertEqual(response, {"batchItemFailures": [{"itemIdentifier": "m2"}]})
+        self.assertEqual(self.written_ids().count("r2"), consumer.MAX_ATTEMPTS)
+
+    def test_malformed_messages_are_dropped(self):
+        event = sqs_event([queued(0)])
+        event["Records"].append({"messageId": "bad", "body": "not json"})
+
+        response = consumer.handler(event, None)
+
+        self.assertEqual(response, {"batchItemFailures": []})
+        self.assertEqual(self.written_ids(), ["r0"])
+
+    def test_queued_bursts_are_voided_after_the_writes(self):
+        table = MagicMock()
+        written_before_delete = []
+        table.delete_item.side_effect = lambda **kwargs: (
+            written_before_delete.extend(self.written_ids()) or {}
+        )
+        since = "2024-07-21T09:59:58+00:00"
+        event = sqs_event([queued(0), {"void": ["r0"], "since": since}])
+
+        with patch("main.get_table", return_value=table):
+            response = consumer.handler(event, None)
+
+        self.assertEqual(response, {"batchItemFailures": []})
+        delete = table.delete_item.call_args.kwargs
+        self.assertEqual(delete["Key"], {"response_id": "r0"})
+        self.assertEqual(delete["ExpressionAttributeValues"], {":since": since})
+        self.assertEqual(written_before_delete, ["r0"])
+
+    @patch.dict(
+        os.environ,
+        {"TRANSACTIONS_TABLE_NAME": "transactions", "COUNTERS_TABLE_NAME": "counters"},
+    )
+    def test_new_responses_are_enriched_and_counted_together(self):
+        transactions.reset()
+        self.addCleanup(transactions.reset)
+        found = {"tx-0": {"quote_id": "q1", "sales_rep_id": "7"}}
+        increment_many = MagicMock(return_value=4)
+        for patcher in [
+            patch("transactions.get_transactions", return_value=found),
+            patch("counters.increment_many", increment_many),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        consumer.handler(sqs_event([queued(0), queued(1)]), None)
+
+        [item] = [
+            call.kwargs["Item"]
+            for call in self.dynamodb.put_item.call_args_list
+            if call.kwargs["Item"]["response_id"]["S"] == "r0"
+        ]
+        self.assertEqual(item["quote_id"], {"S": "q1"})
+        counted = increment_many.call_args.args[0]
+        self.assertEqual(sorted(record.response_id for record in counted), ["r0", "r1"])
+
+    @patch.dict(
+        os.environ,
+        {"TRANSACTIONS_TABLE_NAME": "transactions", "ISSUED_IDS_BUCKET": "issued"},
+    )
+    def test_issued_ids_without_a_transaction_are_kept(self):
+        transactions.reset()
+        self.addCleanup(transactions.reset)
+        issued = MagicMock()
+        issued.might_contain.side_effect = lambda id_: id_ != "tx-1"
+        get_transactions = MagicMock(return_value={})
+        for patcher in [
+            patch("transactions.get_transactions", get_transactions),
+            patch("issued_ids.get_issued_ids", return_value=issued),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+        consumer.handler(sqs_event([queued(0), queued(1)]), None)
+
+        # tx-0 is in the filter, tx-1 was let through by the grace period
+        self.assertEqual(self.written_ids(), ["r0"])
+        self.assertEqual(get_transactions.call_args.kwargs, {"consistent_read": True})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,137 @@
+import os
+import unittest
+from decimal import Decimal
+from unittest.mock import MagicMock, patch
+import counters
+import main
+import prefetch
+from model import ResponseRecord
+from test.test_main import make_event
+
+
+@patch.dict(os.environ, {"COUNTERS_TABLE_NAME": "counters", "COUNTER_SHARDS": "4"})
+class TestCounters(unittest.TestCase):
+    def setUp(self):
+        self.table = MagicMock()
+        patcher = patch("counters.get_table", return_value=self.table)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def updated_keys(self):
+        return sorted(
+            call.kwargs["Key"]["counter_id"]
+            for call in self.table.update_item.call_args_list
+        )
+
+    def test_increment_adds_to_each_counter(self):
+        written = counters.increment(
+            "More Info",
+            "2024-07-21T10:00:00+00:00",
+            "p1",
+            quote_id="q1",
+            sales_rep_id="7",
+        )
+
+        self.assertEqual(written, 4)
+        keys = self.updated_keys()
+        self.assertRegex(keys[0], r"^day#2024-07-21#[0-3]$")
+        self.assertEqual(keys[1:3], ["prospect#p1", "quote#q1"])
+        self.assertRegex(keys[3], r"^rep#7#[0-3]$")
+        kwargs = self.table.update_item.call_args.kwargs
+        self.assertTrue(kwargs["UpdateExpression"].startswith("ADD responses :one"))
+        self.assertEqual(kwargs["ExpressionAttributeNames"], {"#type": "more_info"})
+
+    def test_increment_without_transaction(self):
+        counters.increment("Buy", "2024-07-21T10:00:00+00:00", "p1")
+
+        self.assertEqual(len(self.updated_keys()), 2)
+
+    def test_increment_many_adds_once_per_counter(self):
+        records = [
+            ResponseRecord("r1", "2024-07-21T10:00:00", "tx-1", "p1", "Buy"),
+            ResponseRecord("r2", "2024-07-21T11:00:00", "tx-2", "p1", "More Info"),
+            ResponseRecord("r3", "2024-07-21T12:00:00", "tx-3", "p2", "Buy"),
+        ]
+
+        written = counters.increment_many(records)
+
+        self.assertEqual(written, 3)
+        updates = {
+            call.kwargs["Key"]["counter_id"]: call.kwargs
+            for call in self.table.update_item.call_args_list
+        }
+        prospect = updates["prospect#p1"]
+        self.assertEqual(prospect["ExpressionAttributeValues"][":total"], 2)
+        self.assertEqual(
+            sorted(prospect["ExpressionAttributeNames"].values()), ["buy", "more_info"]
+        )
+        day = next(kwargs for key, kwargs in updates.items() if key.startswith("day#"))
+        self.assertEqual(day["ExpressionAttributeValues"][":total"], 3)
+
+    def test_read_totals_sums_every_shard(self):
+        items = {
+            "rep#7#0": {
+                "counter_id": "rep#7#0",
+                "responses": Decimal(2),
+                "buy": Decimal(2),
+            },
+            "rep#7#3": {
+                "counter_id": "rep#7#3",
+                "responses": Decimal(1),
+                "more_info": Decimal(1),
+            },
+        }
+        self.table.get_item.side_effect = lambda Key: (
+            {"Item": items[Key["counter_id"]]} if Key["counter_id"] in items else {}
+        )
+
+        totals = counters.read_totals("rep", "7")
+
+        self.assertEqual(totals, {"responses": 3, "buy": 2, "more_info": 1})
+        self.assertEqual(self.table.get_item.call_count, 4)
+
+
+@patch.dict(
+    os.environ,
+    {
+        "TABLE_NAME": "responses",
+        "ENABLE_CORS": "false",
+        "COUNTERS_TABLE_NAME": "counters",
+        "TRANSACTIONS_TABLE_NAME": "transactions",
+    },
+)
+class TestHandlerCounters(unittest.TestCase):
+    def setUp(self):
+        main._recorded.clear()
+        prefetch.reset()
+        self.increment = self.start(patch("counters.increment", return_value=4))
+        self.start(patch("main.get_table"))
+        self.start(
+            patch(
+                "transactions.get_transaction",
+                return_value={"quote_id": "q1", "sales_rep_id": "7"},
+            )
+        )
+
+    def start(self, patcher):
+        self.addCleanup(patcher.stop)
+        return patcher.start()
+
+    def test_only_new_responses_are_counted(self):
+        main.lambda_handler(make_event(), None)
+        main.lambda_handler(make_event(), None)
+
+        self.increment.assert_called_once()
+        kwargs = self.increment.call_args.kwargs
+        self.assertEqual((kwargs["quote_id"], kwargs["sales_rep_id"]), ("q1", "7"))
+
+    def test_counter_errors_do_not_fail_the_request(self):
+        self.increment.side_effect = RuntimeError("throttled")
+
+        response = main.lambda_handler(make_event(), None)
+
+        self.assertEqual(response["statusCode"], 201)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,165 @@
+import gzip
+import json
+import unittest
+from decimal import Decimal
+from unittest.mock import MagicMock
+import export
+
+
+def fake_s3():
+    """Client keeping the parts uploaded and the progress marker in memory"""
+    s3 = MagicMock()
+    s3.parts = {}
+    s3.objects = {}
+    s3.create_multipart_upload.return_value = {"UploadId": "upload-1"}
+
+    def upload_part(Bucket, Key, PartNumber, UploadId, Body):
+        s3.parts[PartNumber] = Body
+        return {"ETag": f'"{PartNumber}"'}
+
+    def put_object(Bucket, Key, Body, **kwargs):
+        s3.objects[Key] = Body
+
+    def get_object(Bucket, Key):
+        from botocore.exceptions import ClientError
+
+        if Key not in s3.objects:
+            raise ClientError({"Error": {"Code": "NoSuchKey"}}, "GetObject")
+        body = MagicMock()
+        body.read.return_value = s3.objects[Key]
+        return {"Body": body}
+
+    s3.upload_part.side_effect = upload_part
+    s3.put_object.side_effect = put_object
+    s3.get_object.side_effect = get_object
+    s3.delete_object.side_effect = lambda Bucket, Key: s3.objects.pop(Key)
+    return s3
+
+
+def fake_dynamodb(items):
+    """Low-level client returning the items of each segment one per page"""
+
+    def scan(TableName, Segment, TotalSegments, ExclusiveStartKey=None, **kwargs):
+        mine = items[Segment::TotalSegments]
+        position = 0 if ExclusiveStartKey is None else int(ExclusiveStartKey["n"]["N"])
+        page = {"Items": mine[position : position + 1]}
+        if position + 1 < len(mine):
+            page["LastEvaluatedKey"] = {"n": {"N": str(position + 1)}}
+        return page
+
+    client = MagicMock()
+    client.scan.side_effect = scan
+    return client
+
+
+ITEMS = [
+    {"id": {"S": "a"}, "count": {"N": "3"}, "tags": {"SS": ["y", "x"]}},
+    {"id": {"S": "b"}, "count": {"N": "1.5"}, "note": {"S": "hi, there"}},
+    {"id": {"S": "c"}, "details": {"M": {"n": {"N": "2"}}}},
+]
+
+
+class TestExport(unittest.TestCase):
+    def test_ndjson_of_every_item(self):
+        s3 = fake_s3()
+
+        progress = export.export_table(
+            fake_dynamodb(ITEMS), s3, "table", "bucket", "out.ndjson.gz"
+        )
+
+        data = gzip.decompress(b"".join(s3.parts[n] for n in sorted(s3.parts)))
+        self.assertEqual(
+            [json.loads(line) for line in data.decode().splitlines()],
+            [
+                {"id": "a", "count": 3, "tags": ["x", "y"]},
+                {"id": "b", "count": 1.5, "note": "hi, there"},
+                {"id": "c", "details": {"n": 2}},
+            ],
+        )
+        self.assertEqual(progress.items, 3)
+        s3.complete_multipart_upload.assert_called_once_with(
+            Bucket="bucket",
+            Key="out.ndjson.gz",
+            UploadId="upload-1",
+            MultipartUpload={"Parts": [{"PartNumber": 1, "ETag": '"1"'}]},
+        )
+        # The progress marker goes once the export is complete
+        self.assertEqual(s3.objects, {})
+
+    def test_empty_table_gives_an_empty_gzip_file(self):
+        s3 = fake_s3()
+
+        progress = export.export_table(
+            fake_dynamodb([]), s3, "table", "bucket", "out.ndjson.gz"
+        )
+
+        self.assertEqual(progress.items, 0)
+        s3.complete_multipart_upload.assert_not_called()
+        s3.abort_multipart_upload.assert_called_once_with(
+            Bucket="bucket", Key="out.ndjson.gz", UploadId="upload-1"
+        )
+        self.assertEqual(list(s3.objects), ["out.ndjson.gz"])
+        self.assertEqual(gzip.decompress(s3.objects["out.ndjson.gz"]), b"")
+
+    def test_csv_with_a_header_in_the_first_part_only(self):
+        s3 = fake_s3()
+
+        export.export_table(
+            fake_dynamodb(ITEMS),
+            s3,
+            "table",
+            "bucket",
+            "out.csv.gz",
+            "csv",
+            columns=["id", "count", "note"],
+            part_bytes=1,
+        )
+
+        self.assertEqual(len(s3.parts), 3)
+        data = gzip.decompress(b"".join(s3.parts[n] for n in sorted(s3.parts)))
+        self.assertEqual(
+            data.decode().splitlines(),
+            ["id,count,note", "a,3,", 'b,1.5,"hi, there"', "c,,"],
+        )
+
+    def test_resume_skips_the_pages_already_uploaded(self):
+        s3 = fake_s3()
+        calls = []
+
+        def fail_second_part(Bucket, Key, PartNumber, UploadId, Body):
+            calls.append(PartNumber)
+            if len(calls) == 2:
+                raise ConnectionError("lost")
+            s3.parts[PartNumber] = Body
+            return {"ETag": f'"{PartNumber}"'}
+
+        s3.upload_part.side_effect = fail_second_part
+        with self.assertRaises(ConnectionError):
+            export.export_table(
+                fake_dynamodb(ITEMS), s3, "table", "bucket", "k", part_bytes=1
+            )
+        marker = json.loads(s3.objects["k.progress.json"])
+        self.assertEqual(marker["positions"], {"0": {"n": {"N": "1"}}})
+
+        progress = export.export_table(
+            fake_dynamodb(ITEMS), s3, "table", "bucket", "k", part_bytes=1, resume=True
+        )
+
+        s3.create_multipart_upload.assert_called_once()
+        self.assertEqual(progress.items, 3)
+        data = gzip.decompress(b"".join(s3.parts[n] for n in sorted(s3.parts)))
+        self.assertEqual(
+            [json.loads(line)["id"] for line in data.splitlines()], list("abc")
+        )
+
+    def test_decimal_values(self):
+        self.assertEqual(export._json_default(Decimal("2")), 2)
+        self.assertEqual(export._json_default(Decimal("0.25")), 0.25)
+
+    def test_part_size_below_the_s3_minimum(self):
+        with self.assertRaises(SystemExit):
+            export.parse_args(["t", "--bucket", "b", "--key", "k", "--part-mib", "4"])
+
+
+if __name__ == "__main__":
+    unittest.main()
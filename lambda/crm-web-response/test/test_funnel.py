@@ -0,0 +1,148 @@
+import csv
+import io
+import json
+import unittest
+from unittest.mock import MagicMock, patch
+import funnel
+
+TRANSACTIONS = [
+    ("tx-1", "7", "2024-07-01T09:00:00", "3"),
+    ("tx-2", "7", "2024-07-01T09:05:00", "3"),
+    ("tx-3", "12", "2024-07-02T09:00:00", "5"),
+    ("tx-4", "12", "2024-07-02T09:00:00", ""),
+]
+RESPONSES = [
+    ("tx-1", "More Info"),
+    ("tx-1", "Buy"),
+    ("tx-3", "Not Interested"),
+    ("tx-unknown", "Buy"),
+]
+
+
+def typed(names, row):
+    return {
+        name: {"N": value} if name == "cadence_step" else {"S": value}
+        for name, value in zip(names, row)
+        if value
+    }
+
+
+def fake_client(transactions, responses):
+    """Low-level client whose scans split the items over the segments"""
+    tables = {
+        "transactions": (funnel.TRANSACTION_ATTRIBUTES, transactions),
+        "responses": (funnel.RESPONSE_ATTRIBUTES, responses),
+    }
+
+    def scan(TableName, Segment, TotalSegments, ExclusiveStartKey=None, **kwargs):
+        names, rows = tables[TableName]
+        items = [typed(names, row) for row in rows[Segment::TotalSegments]]
+        # Two pages per segment
+        if ExclusiveStartKey is None:
+            return {"Items": items[: len(items) // 2], "LastEvaluatedKey": {"p": 1}}
+        return {"Items": items[len(items) // 2 :]}
+
+    client = MagicMock()
+    client.scan.side_effect = scan
+    client.describe_table.side_effect = lambda TableName: {
+        "Table": {"ItemCount": len(tables[TableName][1])}
+    }
+    return client
+
+
+class TestJoins(unittest.TestCase):
+    def test_both_build_sides_give_the_same_funnel(self):
+        by_responses = funnel.join_on_responses(TRANSACTIONS, RESPONSES)
+        by_transactions = funnel.join_on_transactions(TRANSACTIONS, RESPONSES)
+
+        self.assertEqual(by_responses.cells, by_transactions.cells)
+        self.assertEqual(by_responses.totals(), [4, 2, 1])
+
+    def test_rollups_per_rep_day_and_step(self):
+        result = funnel.join_on_responses(TRANSACTIONS, RESPONSES)
+
+        self.assertEqual(result.rollup("rep"), {"7": [2, 1, 1], "12": [2, 1, 0]})
+        self.assertEqual(
+            result.rollup("day"), {"2024-07-01": [2, 1, 1], "2024-07-02": [2, 1, 0]}
+        )
+        self.assertEqual(
+            result.rollup("step"), {"3": [2, 1, 1], "5": [1, 1, 0], "": [1, 0, 0]}
+        )
+
+    def test_send_day_filter(self):
+        keep = funnel.sent_between("2024-07-02", None)
+
+        result = funnel.join_on_transactions(TRANSACTIONS, RESPONSES, keep)
+
+        self.assertEqual(result.totals(), [2, 1, 0])
+        self.assertIsNone(funnel.sent_between(None, None))
+
+
+class TestScans(unittest.TestCase):
+    def test_scan_rows_reads_every_segment(self):
+        client = fake_client(TRANSACTIONS, RESPONSES)
+
+        rows = list(
+            funnel.scan_rows(client, "transactions", funnel.TRANSACTION_ATTRIBUTES, 3)
+        )
+
+        self.assertEqual(sorted(rows), sorted(TRANSACTIONS))
+        segments = sorted(call.kwargs["Segment"] for call in client.scan.call_args_list)
+        self.assertEqual(segments, [0, 0, 1, 1, 2, 2])
+
+    def test_scan_errors_are_raised(self):
+        client = MagicMock()
+        client.scan.side_effect = RuntimeError("boom")
+
+        with self.assertRaises(RuntimeError):
+            list(funnel.scan_rows(client, "t", ["a"], 2))
+
+    def test_build_funnel_hashes_the_smaller_table(self):
+        many_responses = RESPONSES * 3
+        client = fake_client(TRANSACTIONS, many_responses)
+
+        result = funnel.build_funnel(client, "transactions", "responses", 2)
+
+        self.assertEqual(result.totals(), [4, 2, 1])
+
+
+class TestReport(unittest.TestCase):
+    def run_main(self, *options):
+        client = fake_client(TRANSACTIONS, RESPONSES)
+        out = io.StringIO()
+        with patch("clients.get_client", return_value=client):
+            funnel.main(
+                [
+                    "--transactions-table",
+                    "transactions",
+                    "--responses-table",
+                    "responses",
+                    *options,
+                ],
+                out=out,
+            )
+        return out.getvalue()
+
+    def test_csv_report(self):
+        rows = list(csv.DictReader(io.StringIO(self.run_main())))
+
+        self.assertEqual(rows[0]["dimension"], "total")
+        self.assertEqual(
+            (rows[0]["sent"], rows[0]["responded"], rows[0]["bought"]), ("4", "2", "1")
+        )
+        self.assertEqual(rows[0]["response_rate"], "0.5")
+        self.assertEqual(
+            [(row["dimension"], row["value"]) for row in rows[1:3]],
+            [("rep", "7"), ("rep", "12")],
+        )
+
+    def test_json_report(self):
+        report = json.loads(self.run_main("--format", "json"))
+
+        self.assertEqual(report["total"]["buy_rate"], 0.25)
+        self.assertEqual([row["value"] for row in report["step"]], ["3", "5", ""])
+        self.assertNotIn("dimension", report["day"][0])
+
+
+if __name__ == "__main__":
+    unittest.main()
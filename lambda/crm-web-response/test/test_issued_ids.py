@@ -0,0 +1,204 @@
+import io
+import json
+import os
+import time
+import unittest
+from datetime import datetime, timedelta, timezone
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+import issued_ids
+import main
+import prefetch
+import transactions
+from bloom import BloomFilterGenerations
+from test.test_main import make_event
+
+
+def published(*transaction_ids):
+    filters = BloomFilterGenerations(1000, 0.001, 2)
+    for transaction_id in transaction_ids:
+        filters.add(transaction_id)
+    return filters.to_bytes()
+
+
+def not_modified():
+    return ClientError({"Error": {"Code": "304", "Message": ""}}, "GetObject")
+
+
+@patch.dict(os.environ, {"ISSUED_IDS_BUCKET": "issued"})
+class TestIssuedIds(unittest.TestCase):
+    def setUp(self):
+        issued_ids.reset()
+        self.s3 = MagicMock()
+        self.s3.get_object.return_value = {
+            "Body": io.BytesIO(published("tx-1")),
+            "ETag": '"v1"',
+        }
+        patcher = patch("issued_ids.clients.get_client", return_value=self.s3)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_loads_once_per_container(self):
+        ids = issued_ids.get_issued_ids()
+
+        self.assertTrue(ids.might_contain("tx-1"))
+        self.assertTrue(ids.might_contain("tx-1"))
+        self.s3.get_object.assert_called_once()
+
+    def test_refreshes_only_when_the_etag_changed(self):
+        ids = issued_ids.get_issued_ids()
+        self.assertFalse(ids.might_contain("tx-2"))
+
+        ids.checked_at = float("-inf")
+        self.s3.get_object.side_effect = not_modified()
+        self.assertFalse(ids.might_contain("tx-2"))
+        self.assertEqual(self.s3.get_object.call_args.kwargs["IfNoneMatch"], '"v1"')
+
+        ids.checked_at = float("-inf")
+        self.s3.get_object.side_effect = None
+        self.s3.get_object.return_value = {
+            "Body": io.BytesIO(published("tx-1", "tx-2")),
+            "ETag": '"v2"',
+        }
+        self.assertTrue(ids.might_contain("tx-2"))
+        self.assertEqual(ids.etag, '"v2"')
+
+    def test_negatives_recheck_at_most_every_few_seconds(self):
+        ids = issued_ids.get_issued_ids()
+        for index in range(100):
+            ids.might_contain(f"made-up-{index}")
+
+        self.s3.get_object.assert_called_once()
+
+    def test_fails_open_without_a_published_filter(self):
+        self.s3.get_object.side_effect = ClientError(
+            {"Error": {"Code": "NoSuchKey", "Message": ""}}, "GetObject"
+        )
+
+        self.assertTrue(issued_ids.get_issued_ids().might_contain("tx-9"))
+
+    def test_grace_period_counts_from_the_first_publish(self):
+        ids = issued_ids.get_issued_ids()
+        ids.might_contain("tx-1")
+        # Filters published without the metadata keep confirming negatives
+        self.assertTrue(ids.in_grace_period())
+
+        first = datetime.now(timezone.utc) - timedelta(days=29)
+        self.s3.get_object.side_effect = lambda **kwargs: {
+            "Body": io.BytesIO(published("tx-1")),
+            "ETag": '"v2"',
+            "Metadata": {"first-published-at": first.isoformat()},
+        }
+        ids.refresh(time.monotonic())
+        self.assertTrue(ids.in_grace_period())
+
+        with patch.dict(os.environ, {"ISSUED_IDS_GRACE_DAYS": "7"}):
+            issued_ids.reset()
+            ids = issued_ids.get_issued_ids()
+            ids.might_contain("tx-1")
+        self.assertFalse(ids.in_grace_period())
+
+    def test_lookup_is_fast_when_warm(self):
+        ids = issued_ids.get_issued_ids()
+        ids.might_contain("tx-1")
+
+        started = time.perf_counter()
+        for index in range(1000):
+            ids.might_contain(f"made-up-{index}")
+        elapsed = (time.perf_counter() - started) / 1000
+
+        self.assertLess(elapsed, 0.001)
+
+
+@patch.dict(
+    os.environ,
+    {
+        "TABLE_NAME": "responses",
+        "ENABLE_CORS": "false",
+        "ISSUED_IDS_BUCKET": "issued",
+        "TRANSACTIONS_TABLE_NAME": "transactions",
+    },
+)
+class TestUnknownTransactions(unittest.TestCase):
+    def setUp(self):
+        main._recorded.clear()
+        prefetch.reset()
+        issued_ids.reset()
+        transactions.reset()
+        self.s3 = MagicMock()
+        self.s3.get_object.return_value = {
+            "Body": io.BytesIO(published("tx-1", "tx-false-positive")),
+            "ETag": '"v1"',
+            "Metadata": {"first-published-at": "2024-01-01T00:00:00+00:00"},
+        }
+        self.table = MagicMock()
+        self.transactions_table = MagicMock()
+        # tx-0 was emailed before the filter was first published
+        self.transactions_table.get_item.side_effect = lambda Key, **kwargs: (
+            {"Item": {"quote_id": "q1"}}
+            if Key["transaction_id"] in ("tx-0", "tx-1")
+            else {}
+        )
+        for target, value in [
+            ("issued_ids.clients.get_client", self.s3),
+            ("main.get_table", self.table),
+            ("transactions.get_table", self.transactions_table),
+        ]:
+            patcher = patch(target, return_value=value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_unknown_id_is_rejected_before_dynamodb(self):
+        response = main.lambda_handler(make_event(email_transaction_id="forged"), None)
+
+        self.assertEqual(response["statusCode"], 400)
+        self.assertEqual(
+            json.loads(response["body"])["message"], "Unknown email transaction"
+        )
+        self.transactions_table.get_item.assert_not_called()
+        self.table.put_item.assert_not_called()
+
+    def test_issued_id_without_a_transaction_yet_is_recorded(self):
+        # The sender publishes the ids before it writes the transactions
+        event = make_event(email_transaction_id="tx-false-positive")
+
+        response = main.lambda_handler(event, None)
+
+        self.assertEqual(response["statusCode"], 201)
+        reads = self.transactions_table.get_item.call_args_list
+        self.assertEqual(
+            [call.kwargs["ConsistentRead"] for call in reads], [False, True]
+        )
+        self.assertNotIn("quote_id", self.table.put_item.call_args.kwargs["Item"])
+
+    def test_unlisted_ids_are_looked_up_during_the_grace_period(self):
+        self.s3.get_object.return_value["Metadata"] = {
+            "first-published-at": datetime.now(timezone.utc).isoformat()
+        }
+
+        emailed_earlier = main.lambda_handler(
+            make_event(email_transaction_id="tx-0"), None
+        )
+        forged = main.lambda_handler(make_event(email_transaction_id="forged"), None)
+
+        self.assertEqual(emailed_earlier["statusCode"], 201)
+        self.assertEqual(forged["statusCode"], 400)
+        # tx-0 is found at once, forged is read again consistently
+        self.assertEqual(self.transactions_table.get_item.call_count, 3)
+        self.assertEqual(self.table.put_item.call_count, 1)
+
+    def test_unlisted_id_is_rejected_after_the_grace_period(self):
+        response = main.lambda_handler(make_event(email_transaction_id="tx-0"), None)
+
+        self.assertEqual(response["statusCode"], 400)
+        self.transactions_table.get_item.assert_not_called()
+
+    def test_issued_id_is_recorded(self):
+        response = main.lambda_handler(make_event(), None)
+
+        self.assertEqual(response["statusCode"], 201)
+        self.assertEqual(self.table.put_item.call_args.kwargs["Item"]["quote_id"], "q1")
+
+
+if __name__ == "__main__":
+    unittest.main()
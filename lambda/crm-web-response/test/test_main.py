@@ -0,0 +1,219 @@
+import json
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+from botocore.exceptions import ClientError
+import main
+import prefetch
+
+
+def make_event(response="Buy", email_transaction_id="tx-1"):
+    return {
+        "httpMethod": "GET",
+        "headers": {"User-Agent": "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0)"},
+        "requestContext": {"identity": {"sourceIp": "203.0.113.10"}},
+        "queryStringParameters": {
+            "id": "prospect-1",
+            "response": response,
+            "email_transaction_id": email_transaction_id,
+        },
+    }
+
+
+def conditional_check_failed(item=None):
+    response = {"Error": {"Code": "ConditionalCheckFailedException", "Message": ""}}
+    if item is not None:
+        response["Item"] = {name: {"S": value} for name, value in item.items()}
+    return ClientError(response, "PutItem")
+
+
+@patch.dict(os.environ, {"TABLE_NAME": "responses", "ENABLE_CORS": "false"})
+class TestIdempotentResponses(unittest.TestCase):
+    def setUp(self):
+        main._recorded.clear()
+        prefetch.reset()
+        self.table = MagicMock()
+        patcher = patch("main.get_table", return_value=self.table)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_response_id_is_deterministic(self):
+        self.assertEqual(
+            main.response_id_for("tx-1", "Buy"), main.response_id_for("tx-1", "Buy")
+        )
+        self.assertNotEqual(
+            main.response_id_for("tx-1", "Buy"),
+            main.response_id_for("tx-1", "More Info"),
+        )
+
+    def test_first_click_is_written_conditionally(self):
+        response = main.lambda_handler(make_event(), None)
+
+        self.assertEqual(response["statusCode"], 201)
+        kwargs = self.table.put_item.call_args.kwargs
+        self.assertEqual(
+            kwargs["Item"]["response_id"], main.response_id_for("tx-1", "Buy")
+        )
+        self.assertEqual(
+            kwargs["ConditionExpression"], "attribute_not_exists(response_id)"
+        )
+
+    def test_repeat_click_in_warm_container_skips_dynamodb(self):
+        first = json.loads(main.lambda_handler(make_event(), None)["body"])
+
+        response = main.lambda_handler(make_event("buy"), None)
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(json.loads(response["body"])["data"], first["data"])
+        self.assertEqual(self.table.put_item.call_count, 1)
+
+    def test_repeat_click_returns_the_original_record(self):
+        original = {
+            "response_id": main.response_id_for("tx-1", "Buy"),
+            "received_at": "2024-01-01T00:00:00+00:00",
+            "email_transaction_id": "tx-1",
+            "prospect_id": "prospect-1",
+            "response_type": "Buy",
+        }
+        self.table.put_item.side_effect = conditional_check_failed(original)
+
+        response = main.lambda_handler(make_event(), None)
+
+        self.assertEqual(response["statusCode"], 200)
+        data = json.loads(response["body"])["data"]
+        self.assertEqual(data["received_at"], "2024-01-01T00:00:00+00:00")
+        self.table.get_item.assert_not_called()
+
+        main.lambda_handler(make_event(), None)
+        self.assertEqual(self.table.put_item.call_count, 1)
+
+    def test_falls_back_to_a_consistent_read(self):
+        self.table.put_item.side_effect = conditional_check_failed()
+        self.table.get_item.return_value = {
+            "Item": {"response_id": "r", "received_at": "2024-01-02"}
+        }
+
+        response = main.lambda_handler(make_event(), None)
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertTrue(self.table.get_item.call_args.kwargs["ConsistentRead"])
+
+    def test_other_errors_fail_the_request(self):
+        self.table.put_item.side_effect = ClientError(
+            {
+                "Error": {
+                    "Code": "ProvisionedThroughputExceededException",
+                    "Message": "",
+                }
+            },
+            "PutItem",
+        )
+
+        response = main.lambda_handler(make_event(), None)
+
+        self.assertEqual(response["statusCode"], 500)
+        self.assertEqual(main._recorded, {})
+
+    def test_cache_is_bounded(self):
+        with patch.dict(os.environ, {"RESPONSE_CACHE_SIZE": "2"}):
+            for index in range(3):
+                main.lambda_handler(
+                    make_event(email_transaction_id=f"tx-{index}"), None
+                )
+
+        self.assertEqual(len(main._recorded), 2)
+        self.assertIsNone(main.get_recorded(main.response_id_for("tx-0", "Buy")))
+
+
+@patch.dict(os.environ, {"TABLE_NAME": "responses", "ENABLE_CORS": "false"})
+class TestPrefetchFilter(unittest.TestCase):
+    def setUp(self):
+        main._recorded.clear()
+        prefetch.reset()
+        self.table = MagicMock()
+        patcher = patch("main.get_table", return_value=self.table)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_scanner_is_not_recorded(self):
+        event = make_event()
+        event["headers"] = {"user-agent": "Mimecast-LinkScanner/1.0"}
+
+        response = main.lambda_handler(event, None)
+
+        self.assertEqual(response["statusCode"], 202)
+        self.table.put_item.assert_not_called()
+
+    def test_burst_of_every_button_voids_its_earlier_clicks(self):
+        stored = []
+        self.table.put_item.side_effect = lambda **kwargs: stored.append(kwargs["Item"])
+        self.table.delete_item.side_effect = lambda **kwargs: {
+            "Attributes": next(
+                item
+                for item in stored
+                if item["response_id"] == kwargs["Key"]["response_id"]
+            )
+        }
+
+        with patch.dict(os.environ, {"COUNTERS_TABLE_NAME": "counters"}), patch(
+            "counters.increment"
+        ) as increment, patch("counters.increment_many") as increment_many:
+            statuses = [
+                main.lambda_handler(make_event(response), None)["statusCode"]
+                for response in ["Buy", "More Info", "Not Interested"]
+            ]
+
+        self.assertEqual(statuses, [201, 201, 202])
+        self.assertEqual(increment.call_count, 2)
+        deletes = self.table.delete_item.call_args_list
+        self.assertEqual(
+            [call.kwargs["Key"]["response_id"] for call in deletes],
+            [main.response_id_for("tx-1", button) for button in ["Buy", "More Info"]],
+        )
+        # Responses recorded before the burst began are real clicks and stay
+        since = deletes[0].kwargs["ExpressionAttributeValues"][":since"]
+        self.assertLessEqual(since, stored[0]["received_at"])
+        (voided,) = increment_many.call_args.args
+        self.assertEqual(
+            [record.response_type for record in voided], ["Buy", "More Info"]
+        )
+        self.assertEqual(increment_many.call_args.kwargs, {"by": -1})
+        self.assertIsNone(main.get_recorded(stored[0]["response_id"]))
+
+    def test_response_recorded_before_the_burst_is_kept(self):
+        self.table.delete_item.side_effect = conditional_check_failed()
+
+        with patch("counters.increment_many") as increment_many:
+            for response in ["Buy", "More Info", "Not Interested"]:
+                main.lambda_handler(make_event(response), None)
+
+        self.assertEqual(self.table.delete_item.call_count, 2)
+        increment_many.assert_not_called()
+
+    def test_burst_is_voided_by_the_consumer_in_write_behind_mode(self):
+        sqs = MagicMock()
+        with patch.dict(os.environ, {"RESPONSE_QUEUE_URL": "queue"}), patch(
+            "clients.get_client", return_value=sqs
+        ):
+            for response in ["Buy", "More Info", "Not Interested"]:
+                main.lambda_handler(make_event(response), None)
+
+        self.table.delete_item.assert_not_called()
+        void = sqs.send_message.call_args_list[-1].kwargs
+        self.assertEqual(
+            json.loads(void["MessageBody"])["void"],
+            [main.response_id_for("tx-1", button) for button in ["Buy", "More Info"]],
+        )
+        self.assertGreater(void["DelaySeconds"], 0)
+
+    def test_filter_can_be_disabled(self):
+        event = make_event()
+        event["headers"] = {}
+        with patch.dict(os.environ, {"PREFETCH_FILTER": "false"}):
+            response = main.lambda_handler(event, None)
+
+        self.assertEqual(response["statusCode"], 201)
+
+
+if __name__ == "__main__":
+    unittest.main()
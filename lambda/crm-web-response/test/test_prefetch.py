@@ -0,0 +1,137 @@
+import os
+import time
+import unittest
+from unittest.mock import patch
+import prefetch
+from prefetch import BurstTracker, PrefetchClassifier
+
+BROWSER = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 Chrome/126.0"
+
+# Budget of the classification stage per request
+MAX_CLASSIFY_MS = 1.0
+
+
+def make_event(user_agent=BROWSER, source_ip="203.0.113.10"):
+    return {
+        "headers": {"User-Agent": user_agent},
+        "requestContext": {"identity": {"sourceIp": source_ip}},
+    }
+
+
+class TestPrefetchClassifier(unittest.TestCase):
+    def setUp(self):
+        prefetch.reset()
+        self.classifier = PrefetchClassifier.from_env(button_count=3)
+
+    def classify(self, event, transaction="tx-1", button="Buy", now_ms=0.0):
+        return self.classifier.classify(event, transaction, button, now_ms)[0]
+
+    def test_browser_click_is_not_a_prefetch(self):
+        self.assertIsNone(self.classify(make_event()))
+
+    def test_user_agent_heuristics(self):
+        self.assertEqual(self.classify(make_event("")), "missing user agent")
+        for user_agent in [
+            "Barracuda Sentinel (EE)",
+            "python-requests/2.31",
+            "Mozilla/5.0 (compatible; BingPreview/1.0b)",
+            "Mozilla/5.0 HeadlessChrome/120.0",
+            "Mozilla/5.0 (compatible; Googlebot/2.1; +http://www.google.com/bot.html)",
+            "Slackbot-LinkExpanding 1.0 (+https://api.slack.com/robots)",
+        ]:
+            self.assertEqual(
+                self.classify(make_event(user_agent)), "scanner user agent", user_agent
+            )
+
+    def test_real_clients_are_not_scanners(self):
+        for index, user_agent in enumerate(
+            [
+                "Microsoft Office/16.0 (Windows NT 10.0; Microsoft Outlook 16.0.17328; Pro)",
+                "Mozilla/4.0 (compatible; ms-office; MSOffice 16)",
+                "Mozilla/5.0 (Linux; Android 12; CUBOT KINGKONG 7) AppleWebKit/537.36 "
+                "(KHTML, like Gecko) Chrome/120.0.0.0 Mobile Safari/537.36",
+                "Mozilla/5.0 (iPhone; CPU iPhone OS 17_5 like Mac OS X) "
+                "AppleWebKit/605.1.15 (KHTML, like Gecko) Mobile/15E148",
+            ]
+        ):
+            self.assertIsNone(
+                self.classify(make_event(user_agent), transaction=f"tx-{index}"),
+                user_agent,
+            )
+
+    def test_source_ip_heuristics(self):
+        self.assertEqual(
+            self.classify(make_event(source_ip="40.107.22.5")), "scanner source ip"
+        )
+        self.assertIsNone(self.classify(make_event(source_ip="not an ip")))
+        with patch.dict(os.environ, {"PREFETCH_SCANNER_CIDRS": "198.51.100.0/24"}):
+            classifier = PrefetchClassifier.from_env(button_count=3)
+        self.assertEqual(
+            classifier.classify(make_event(source_ip="198.51.100.7"), "tx", "Buy", 0)[
+                0
+            ],
+            "scanner source ip",
+        )
+
+    def test_burst_of_every_button_within_the_window(self):
+        event = make_event()
+        self.assertIsNone(self.classify(event, button="Buy", now_ms=0))
+        self.assertIsNone(self.classify(event, button="More Info", now_ms=40))
+        self.assertIsNone(self.classify(event, "tx-2", "Not Interested", now_ms=60))
+
+        self.assertEqual(
+            self.classifier.classify(event, "tx-1", "Not Interested", 80),
+            ("button burst", ["Buy", "More Info"]),
+        )
+        # The earlier clicks are voided once; later ones are still a burst
+        self.assertEqual(
+            self.classifier.classify(event, "tx-1", "Buy", 100), ("button burst", [])
+        )
+
+    def test_burst_voids_clicks_rejected_for_another_reason(self):
+        self.classify(make_event("curl/8.4"), button="Buy", now_ms=0)
+        self.classify(make_event(), button="More Info", now_ms=10)
+
+        self.assertEqual(
+            self.classifier.classify(make_event(), "tx-1", "Not Interested", 20),
+            ("button burst", ["Buy", "More Info"]),
+        )
+
+    def test_clicks_outside_the_window_are_not_a_burst(self):
+        event = make_event()
+        self.classify(event, button="Buy", now_ms=0)
+        self.classify(event, button="More Info", now_ms=1000)
+        self.assertIsNone(self.classify(event, button="Not Interested", now_ms=2500))
+
+    def test_tracker_is_bounded(self):
+        tracker = BurstTracker(window_ms=2000, burst_buttons=2, max_transactions=2)
+        tracker.track("tx-1", "Buy", 0)
+        tracker.track("tx-2", "Buy", 0)
+        tracker.track("tx-3", "Buy", 0)
+
+        self.assertIsNone(tracker.track("tx-1", "More Info", 10))
+        self.assertEqual(tracker.track("tx-3", "More Info", 10), ["Buy"])
+
+    def test_classification_stays_under_budget(self):
+        events = [
+            make_event(source_ip=f"203.0.{index % 256}.{index % 7}")
+            for index in range(1000)
+        ]
+        buttons = ["Buy", "More Info", "Not Interested"]
+        runs = 10000
+
+        started = time.perf_counter()
+        for index in range(runs):
+            self.classifier.classify(
+                events[index % len(events)],
+                f"tx-{index % 5000}",
+                buttons[index % 3],
+                index * 0.5,
+            )
+        per_request_ms = (time.perf_counter() - started) * 1000 / runs
+
+        self.assertLess(per_request_ms, MAX_CLASSIFY_MS)
+
+
+if __name__ == "__main__":
+    unittest.main()
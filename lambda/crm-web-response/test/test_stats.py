@@ -0,0 +1,110 @@
+import json
+import os
+import time
+import unittest
+from unittest.mock import patch
+import stats
+
+# Warm requests answered from the container cache
+MAX_WARM_MS = 10
+
+
+def stats_event(if_none_match=None, **params):
+    headers = {"User-Agent": "Mozilla/5.0"}
+    if if_none_match:
+        headers["If-None-Match"] = if_none_match
+    return {"httpMethod": "GET", "headers": headers, "queryStringParameters": params}
+
+
+@patch.dict(
+    os.environ,
+    {"TABLE_NAME": "responses", "ENABLE_CORS": "true", "COUNTERS_TABLE_NAME": "c"},
+)
+class TestStats(unittest.TestCase):
+    def setUp(self):
+        stats.reset()
+        patcher = patch(
+            "counters.read_totals",
+            return_value={"responses": 4, "buy": 1, "more_info": 3},
+        )
+        self.read_totals = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_stats_of_a_rep(self):
+        response = stats.handler(stats_event(sales_rep_id="7"), None)
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertEqual(
+            json.loads(response["body"])["data"],
+            {
+                "sales_rep_id": "7",
+                "responses": 4,
+                "buy": 1,
+                "more_info": 3,
+                "not_interested": 0,
+                "buy_rate": 0.25,
+            },
+        )
+        self.read_totals.assert_called_once_with("rep", "7")
+        self.assertEqual(response["headers"]["Access-Control-Expose-Headers"], "ETag")
+
+    def test_repeat_polls_are_served_from_the_cache(self):
+        first = stats.handler(stats_event(quote_id="q1"), None)
+        second = stats.handler(stats_event(quote_id="q1"), None)
+
+        self.read_totals.assert_called_once_with("quote", "q1")
+        self.assertEqual(first["body"], second["body"])
+        self.assertEqual(first["headers"]["ETag"], second["headers"]["ETag"])
+
+    def test_matching_etag_gets_not_modified(self):
+        etag = stats.handler(stats_event(quote_id="q1"), None)["headers"]["ETag"]
+
+        response = stats.handler(stats_event(f'W/{etag}, "other"', quote_id="q1"), None)
+
+        self.assertEqual(response["statusCode"], 304)
+        self.assertEqual(response["body"], "")
+        self.assertEqual(response["headers"]["ETag"], etag)
+
+    def test_changed_counts_change_the_etag(self):
+        etag = stats.handler(stats_event(quote_id="q1"), None)["headers"]["ETag"]
+        stats.reset()
+        self.read_totals.return_value = {"responses": 5, "buy": 2, "more_info": 3}
+
+        response = stats.handler(stats_event(etag, quote_id="q1"), None)
+
+        self.assertEqual(response["statusCode"], 200)
+        self.assertNotEqual(response["headers"]["ETag"], etag)
+
+    @patch.dict(os.environ, {"STATS_CACHE_TTL_SECONDS": "0"})
+    def test_expired_entries_are_read_again(self):
+        stats.handler(stats_event(quote_id="q1"), None)
+        stats.handler(stats_event(quote_id="q1"), None)
+
+        self.assertEqual(self.read_totals.call_count, 2)
+
+    def test_exactly_one_id_is_required(self):
+        for params in [{}, {"quote_id": "q1", "sales_rep_id": "7"}, {"quote_id": " "}]:
+            response = stats.handler(stats_event(**params), None)
+            self.assertEqual(response["statusCode"], 400)
+
+    def test_counter_errors_fail_the_request(self):
+        self.read_totals.side_effect = RuntimeError("throttled")
+
+        response = stats.handler(stats_event(quote_id="q1"), None)
+
+        self.assertEqual(response["statusCode"], 500)
+
+    def test_warm_requests_are_fast(self):
+        etag = stats.handler(stats_event(quote_id="q1"), None)["headers"]["ETag"]
+        runs = 1000
+
+        started = time.perf_counter()
+        for index in range(runs):
+            stats.handler(stats_event(etag if index % 2 else None, quote_id="q1"), None)
+        per_request_ms = (time.perf_counter() - started) * 1000 / runs
+
+        self.assertLess(per_request_ms, MAX_WARM_MS)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,124 @@
+import os
+import unittest
+from unittest.mock import MagicMock, patch
+import main
+import prefetch
+import transactions
+from test.test_main import make_event
+
+TRANSACTION = {
+    "quote_id": "q1",
+    "email_address": "acme@example.com",
+    "sent_at": "2024-07-21T09:00:00",
+    "sales_rep_id": "7",
+}
+
+
+@patch.dict(os.environ, {"TRANSACTIONS_TABLE_NAME": "transactions"})
+class TestTransactionCache(unittest.TestCase):
+    def setUp(self):
+        transactions.reset()
+        self.table = MagicMock()
+        self.table.get_item.return_value = {"Item": TRANSACTION}
+        patcher = patch("transactions.get_table", return_value=self.table)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_repeated_lookups_are_served_from_the_cache(self):
+        self.assertEqual(transactions.get_transaction("tx-1"), TRANSACTION)
+        self.assertEqual(transactions.get_transaction("tx-1"), TRANSACTION)
+
+        self.table.get_item.assert_called_once()
+        kwargs = self.table.get_item.call_args.kwargs
+        self.assertEqual(kwargs["Key"], {"transaction_id": "tx-1"})
+        self.assertEqual(
+            sorted(kwargs["ExpressionAttributeNames"].values()),
+            sorted(transactions.TRANSACTION_FIELDS),
+        )
+
+    def test_entries_expire(self):
+        with patch("transactions.time.monotonic", side_effect=[0.0, 10.0, 1000.0]):
+            transactions.get_transaction("tx-1")
+            transactions.get_transaction("tx-1")
+            transactions.get_transaction("tx-1")
+
+        self.assertEqual(self.table.get_item.call_count, 2)
+
+    def test_unknown_transactions_are_not_cached(self):
+        self.table.get_item.return_value = {}
+
+        self.assertIsNone(transactions.get_transaction("tx-1"))
+        self.assertIsNone(transactions.get_transaction("tx-1"))
+
+        self.assertEqual(self.table.get_item.call_count, 2)
+
+    def test_get_transactions_reads_uncached_ids_in_batches(self):
+        transactions.get_transaction("tx-1")
+        client = MagicMock()
+        client.batch_get_item.return_value = {
+            "Responses": {
+                "transactions": [
+                    {"transaction_id": {"S": "tx-2"}, "quote_id": {"S": "q2"}}
+                ]
+            }
+        }
+        with patch("transactions.clients.get_client", return_value=client):
+            found = transactions.get_transactions(["tx-1", "tx-2", "tx-3", "tx-2"])
+
+        self.assertEqual(found, {"tx-1": TRANSACTION, "tx-2": {"quote_id": "q2"}})
+        keys = client.batch_get_item.call_args.kwargs["RequestItems"]["transactions"]
+        self.assertEqual(
+            keys["Keys"],
+            [{"transaction_id": {"S": "tx-2"}}, {"transaction_id": {"S": "tx-3"}}],
+        )
+
+    def test_cache_is_bounded(self):
+        with patch.dict(os.environ, {"TRANSACTION_CACHE_SIZE": "2"}):
+            for transaction_id in ["tx-1", "tx-2", "tx-3", "tx-1"]:
+                transactions.get_transaction(transaction_id)
+
+        self.assertEqual(self.table.get_item.call_count, 4)
+        self.assertEqual(list(transactions._cache), ["tx-3", "tx-1"])
+
+
+@patch.dict(
+    os.environ,
+    {
+        "TABLE_NAME": "responses",
+        "ENABLE_CORS": "false",
+        "TRANSACTIONS_TABLE_NAME": "transactions",
+    },
+)
+class TestDenormalizedResponses(unittest.TestCase):
+    def setUp(self):
+        main._recorded.clear()
+        prefetch.reset()
+        self.responses = MagicMock()
+        self.get_transaction = MagicMock(return_value=TRANSACTION)
+        for patcher in [
+            patch("main.get_table", return_value=self.responses),
+            patch("transactions.get_transaction", self.get_transaction),
+        ]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_transaction_fields_are_stored_on_the_response(self):
+        main.lambda_handler(make_event(), None)
+
+        item = self.responses.put_item.call_args.kwargs["Item"]
+        for name, value in TRANSACTION.items():
+            self.assertEqual(item[name], value)
+        self.assertEqual(item["email_transaction_id"], "tx-1")
+
+    def test_response_is_recorded_without_the_transaction(self):
+        self.get_transaction.side_effect = RuntimeError("throttled")
+
+        response = main.lambda_handler(make_event(), None)
+
+        self.assertEqual(response["statusCode"], 201)
+        item = self.responses.put_item.call_args.kwargs["Item"]
+        self.assertNotIn("quote_id", item)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,143 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Tuple
+import clients
+
+if TYPE_CHECKING:
+    from mypy_boto3_dynamodb.service_resource import Table
+
+TRANSACTIONS_TABLE_NAME = "TRANSACTIONS_TABLE_NAME"
+TRANSACTION_CACHE_SIZE = "TRANSACTION_CACHE_SIZE"
+TRANSACTION_CACHE_TTL_SECONDS = "TRANSACTION_CACHE_TTL_SECONDS"
+DEFAULT_CACHE_SIZE = 2048
+DEFAULT_CACHE_TTL_SECONDS = 900
+BATCH_GET_LIMIT = 100
+MAX_ATTEMPTS = 5
+
+# Fields of the email transaction written by crm-sync-quotes copied onto responses
+TRANSACTION_FIELDS = ["quote_id", "email_address", "sent_at", "sales_rep_id"]
+
+_table: Optional["Table"] = None
+# Transactions by id with the time they were read, most recently used last.
+# Only found transactions are cached: the sender writes them after sending.
+_cache: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def is_enabled() -> bool:
+    return bool(os.getenv(TRANSACTIONS_TABLE_NAME))
+
+
+def get_table() -> "Table":
+    """Return the email transactions table, created on first use and reused while warm"""
+    global _table
+    if _table is None:
+        _table = clients.get_resource("dynamodb").Table(
+            os.environ[TRANSACTIONS_TABLE_NAME]
+        )
+    return _table
+
+
+def _cached(email_transaction_id: str, now: float) -> Optional[Dict[str, Any]]:
+    ttl_seconds = float(
+        os.getenv(TRANSACTION_CACHE_TTL_SECONDS, DEFAULT_CACHE_TTL_SECONDS)
+    )
+    with _lock:
+        entry = _cache.get(email_transaction_id)
+        if entry is None:
+            return None
+        if now - entry[0] >= ttl_seconds:
+            del _cache[email_transaction_id]
+            return None
+        _cache.move_to_end(email_transaction_id)
+        return entry[1]
+
+
+def _store(email_transaction_id: str, transaction: Dict[str, Any], now: float) -> None:
+    max_size = int(os.getenv(TRANSACTION_CACHE_SIZE, DEFAULT_CACHE_SIZE))
+    with _lock:
+        _cache[email_transaction_id] = (now, transaction)
+        _cache.move_to_end(email_transaction_id)
+        while len(_cache) > max_size:
+            _cache.popitem(last=False)
+
+
+def get_transaction(
+    email_transaction_id: str, consistent_read: bool = False
+) -> Optional[Dict[str, Any]]:
+    """Return the email transaction the response came from, if it exists"""
+    now = time.monotonic()
+    transaction = _cached(email_transaction_id, now)
+    if transaction is not None:
+        return transaction
+    response = get_table().get_item(
+        Key={"transaction_id": email_transaction_id},
+        ProjectionExpression=", ".join(f"#{name}" for name in TRANSACTION_FIELDS),
+        ExpressionAttributeNames={f"#{name}": name for name in TRANSACTION_FIELDS},
+        ConsistentRead=consistent_read,
+    )
+    transaction = response.get("Item")
+    if transaction is not None:
+        _store(email_transaction_id, transaction, now)
+    return transaction
+
+
+def _batch_get(ids: List[str], consistent_read: bool) -> Dict[str, Dict[str, Any]]:
+    from boto3.dynamodb.types import TypeDeserializer
+
+    deserializer = TypeDeserializer()
+    table_name = os.environ[TRANSACTIONS_TABLE_NAME]
+    names = ["transaction_id"] + TRANSACTION_FIELDS
+    request = {
+        table_name: {
+            "Keys": [{"transaction_id": {"S": key}} for key in ids],
+            "ProjectionExpression": ", ".join(f"#{name}" for name in names),
+            "ExpressionAttributeNames": {f"#{name}": name for name in names},
+            "ConsistentRead": consistent_read,
+        }
+    }
+    found: Dict[str, Dict[str, Any]] = {}
+    client = clients.get_client("dynamodb")
+    for attempt in range(MAX_ATTEMPTS):
+        response = client.batch_get_item(RequestItems=request)
+        for item in response.get("Responses", {}).get(table_name, []):
+            transaction = {
+                name: deserializer.deserialize(value) for name, value in item.items()
+            }
+            found[transaction.pop("transaction_id")] = transaction
+        request = response.get("UnprocessedKeys") or {}
+        if not request:
+            return found
+        time.sleep(0.05 * 2**attempt)
+    raise RuntimeError(f"{len(request[table_name]['Keys'])} transactions left unread")
+
+
+def get_transactions(
+    email_transaction_ids: List[str], consistent_read: bool = False
+) -> Dict[str, Dict[str, Any]]:
+    """Return the email transactions found, by id, reading the uncached ones in batches"""
+    now = time.monotonic()
+    found: Dict[str, Dict[str, Any]] = {}
+    missing = []
+    for email_transaction_id in dict.fromkeys(email_transaction_ids):
+        transaction = _cached(email_transaction_id, now)
+        if transaction is None:
+            missing.append(email_transaction_id)
+        else:
+            found[email_transaction_id] = transaction
+    for start in range(0, len(missing), BATCH_GET_LIMIT):
+        for email_transaction_id, transaction in _batch_get(
+            missing[start : start + BATCH_GET_LIMIT], consistent_read
+        ).items():
+            _store(email_transaction_id, transaction, now)
+            found[email_transaction_id] = transaction
+    return found
+
+
+def reset() -> None:
+    global _table
+    _table = None
+    with _lock:
+        _cache.clear()
@@ -0,0 +1,1277 @@
+"""
+In-process stand-ins for the S3, DynamoDB, SES and SQS APIs used by the lambdas.
+
+They implement just enough of the boto3 client and resource interfaces for the
+handlers to run unchanged, keep everything in memory, and can add per-call
+latency, throttling and unprocessed batch items to make load runs realistic.
+"""
+
+import hashlib
+import io
+import random
+import threading
+import time
+import uuid
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timezone
+from decimal import Decimal
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+from boto3.dynamodb.conditions import ConditionBase
+from boto3.dynamodb.types import TypeDeserializer, TypeSerializer
+from botocore.exceptions import ClientError
+
+# S3 rejects multipart uploads with smaller parts, except the last one
+MIN_PART_BYTES = 5 * 1024 * 1024
+BATCH_WRITE_LIMIT = 25
+BATCH_GET_LIMIT = 100
+DEFAULT_PAGE_SIZE = 1000
+
+_serializer = TypeSerializer()
+_deserializer = TypeDeserializer()
+
+
+def client_error(code: str, message: str, operation: str) -> ClientError:
+    return ClientError({"Error": {"Code": code, "Message": message}}, operation)
+
+
+class _Latency:
+    """Sleeps a fixed time per API call to stand in for the network round trip."""
+
+    def __init__(self, latency_ms: float) -> None:
+        self.seconds = latency_ms / 1000
+
+    def wait(self) -> None:
+        if self.seconds > 0:
+            time.sleep(self.seconds)
+
+
+# --------------------------------------------------------------------------- S3
+
+
+class FakeStreamingBody(io.BytesIO):
+    """BytesIO with the extra methods of botocore's StreamingBody."""
+
+    def iter_chunks(self, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        while True:
+            chunk = self.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def iter_lines(self, chunk_size: int = 1024 * 1024) -> Iterator[bytes]:
+        for line in self:
+            yield line.rstrip(b"\r\n")
+
+
+class _StoredObject:
+    __slots__ = ("data", "etag", "metadata", "last_modified")
+
+    def __init__(self, data: bytes, metadata: Dict[str, str]) -> None:
+        self.data = data
+        self.etag = f'"{hashlib.md5(data).hexdigest()}"'
+        self.metadata = metadata
+        self.last_modified = datetime.now(timezone.utc)
+
+
+class FakeS3:
+    """Object store with the subset of the S3 client API used by the lambdas."""
+
+    def __init__(
+        self, latency_ms: float = 0.0, min_part_bytes: int = MIN_PART_BYTES
+    ) -> None:
+        self._latency = _Latency(latency_ms)
+        self._buckets: Dict[str, Dict[str, _StoredObject]] = {}
+        # Parts of the multipart uploads in progress, by upload id
+        self._uploads: Dict[str, Tuple[str, str, Dict[int, bytes]]] = {}
+        self._lock = threading.Lock()
+        self._sequence = 0
+        self.min_part_bytes = min_part_bytes
+        self.requests: Dict[str, int] = {}
+
+    def _call(self, operation: str) -> None:
+        with self._lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+        self._latency.wait()
+
+    def _get(self, bucket: str, key: str, operation: str) -> _StoredObject:
+        stored = self._buckets.get(bucket, {}).get(key)
+        if stored is None:
+            code = "404" if operation == "HeadObject" else "NoSuchKey"
+            raise client_error(code, f"{bucket}/{key} does not exist", operation)
+        return stored
+
+    def put_object(
+        self,
+        Bucket: str,
+        Key: str,
+        Body: Any = b"",
+        Metadata: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        self._call("PutObject")
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        if isinstance(Body, str):
+            Body = Body.encode("utf-8")
+        stored = _StoredObject(bytes(Body), dict(Metadata or {}))
+        with self._lock:
+            bucket = self._buckets.setdefault(Bucket, {})
+            current = bucket.get(Key)
+            # Conditional writes: IfNoneMatch="*" creates, IfMatch=<etag> replaces
+            if (kwargs.get("IfNoneMatch") == "*" and current is not None) or (
+                "IfMatch" in kwargs
+                and (current is None or current.etag != kwargs["IfMatch"])
+            ):
+                raise client_error(
+                    "PreconditionFailed",
+                    "At least one of the pre-conditions you specified did not hold",
+                    "PutObject",
+                )
+            bucket[Key] = stored
+        return {"ETag": stored.etag}
+
+    def upload_fileobj(self, Fileobj: Any, Bucket: str, Key: str, **kwargs) -> None:
+        extra = kwargs.get("ExtraArgs") or {}
+        self.put_object(Bucket, Key, Fileobj.read(), Metadata=extra.get("Metadata"))
+
+    def head_object(self, Bucket: str, Key: str, **kwargs: Any) -> Dict[str, Any]:
+        self._call("HeadObject")
+        stored = self._get(Bucket, Key, "HeadObject")
+        return {
+            "ContentLength": len(stored.data),
+            "ETag": stored.etag,
+            "Metadata": dict(stored.metadata),
+            "LastModified": stored.last_modified,
+        }
+
+    def get_object(
+        self, Bucket: str, Key: str, Range: Optional[str] = None, **kwargs: Any
+    ) -> Dict[str, Any]:
+        self._call("GetObject")
+        stored = self._get(Bucket, Key, "GetObject")
+        if kwargs.get("IfNoneMatch") == stored.etag:
+            raise client_error("304", "Not Modified", "GetObject")
+        if "IfMatch" in kwargs and kwargs["IfMatch"] != stored.etag:
+            raise client_error(
+                "PreconditionFailed",
+                "At least one of the pre-conditions you specified did not hold",
+                "GetObject",
+            )
+        data = stored.data
+        if Range:
+            start_text, end_text = Range[len("bytes=") :].split("-")
+            start = int(start_text)
+            end = int(end_text) if end_text else len(data) - 1
+            data = data[start : end + 1]
+        return {
+            "Body": FakeStreamingBody(data),
+            "ContentLength": len(data),
+            "ETag": stored.etag,
+            "Metadata": dict(stored.metadata),
+            "LastModified": stored.last_modified,
+        }
+
+    def download_fileobj(self, Bucket: str, Key: str, Fileobj: Any, **kwargs) -> None:
+        response = self.get_object(Bucket=Bucket, Key=Key)
+        Fileobj.write(response["Body"].read())
+
+    def delete_object(self, Bucket: str, Key: str, **kwargs: Any) -> Dict[str, Any]:
+        self._call("DeleteObject")
+        with self._lock:
+            self._buckets.get(Bucket, {}).pop(Key, None)
+        return {}
+
+    def list_objects_v2(
+        self,
+        Bucket: str,
+        Prefix: str = "",
+        MaxKeys: int = 1000,
+        ContinuationToken: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        self._call("ListObjectsV2")
+        keys = sorted(
+            key for key in self._buckets.get(Bucket, {}) if key.startswith(Prefix)
+        )
+        if ContinuationToken:
+            keys = [key for key in keys if key > ContinuationToken]
+        page, rest = keys[:MaxKeys], keys[MaxKeys:]
+        response: Dict[str, Any] = {
+            "KeyCount": len(page),
+            "IsTruncated": bool(rest),
+            "Contents": [
+                {
+                    "Key": key,
+                    "Size": len(self._buckets[Bucket][key].data),
+                    "ETag": self._buckets[Bucket][key].etag,
+                }
+                for key in page
+            ],
+        }
+        if rest:
+            response["NextContinuationToken"] = page[-1]
+        return response
+
+    def create_multipart_upload(
+        self, Bucket: str, Key: str, **kwargs: Any
+    ) -> Dict[str, Any]:
+        self._call("CreateMultipartUpload")
+        upload_id = uuid.uuid4().hex
+        with self._lock:
+            self._uploads[upload_id] = (Bucket, Key, {})
+        return {"Bucket": Bucket, "Key": Key, "UploadId": upload_id}
+
+    def _upload(self, upload_id: str, operation: str) -> Dict[int, bytes]:
+        upload = self._uploads.get(upload_id)
+        if upload is None:
+            raise client_error(
+                "NoSuchUpload", "The specified upload does not exist.", operation
+            )
+        return upload[2]
+
+    def upload_part(
+        self,
+        Bucket: str,
+        Key: str,
+        PartNumber: int,
+        UploadId: str,
+        Body: Any = b"",
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        self._call("UploadPart")
+        if hasattr(Body, "read"):
+            Body = Body.read()
+        data = bytes(Body)
+        with self._lock:
+            self._upload(UploadId, "UploadPart")[PartNumber] = data
+        return {"ETag": f'"{hashlib.md5(data).hexdigest()}"'}
+
+    def list_parts(
+        self, Bucket: str, Key: str, UploadId: str, **kwargs: Any
+    ) -> Dict[str, Any]:
+        self._call("ListParts")
+        with self._lock:
+            parts = dict(self._upload(UploadId, "ListParts"))
+        return {
+            "Parts": [
+                {
+                    "PartNumber": number,
+                    "ETag": f'"{hashlib.md5(data).hexdigest()}"',
+                    "Size": len(data),
+                }
+                for number, data in sorted(parts.items())
+            ]
+        }
+
+    def complete_multipart_upload(
+        self,
+        Bucket: str,
+        Key: str,
+        UploadId: str,
+        MultipartUpload: Dict[str, List[Dict[str, Any]]],
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        self._call("CompleteMultipartUpload")
+        with self._lock:
+            parts = self._upload(UploadId, "CompleteMultipartUpload")
+            chosen = MultipartUpload["Parts"]
+            if not chosen:
+                raise client_error(
+                    "MalformedXML",
+                    "The XML you provided was not well-formed or did not validate "
+                    "against our published schema",
+                    "CompleteMultipartUpload",
+                )
+            for index, part in enumerate(chosen):
+                data = parts.get(part["PartNumber"])
+                if data is None or part["ETag"] != (
+                    f'"{hashlib.md5(data).hexdigest()}"'
+                ):
+                    raise client_error(
+                        "InvalidPart",
+                        "One or more of the specified parts could not be found.",
+                        "CompleteMultipartUpload",
+                    )
+                if index < len(chosen) - 1 and len(data) < self.min_part_bytes:
+                    raise client_error(
+                        "EntityTooSmall",
+                        "Your proposed upload is smaller than the minimum allowed size",
+                        "CompleteMultipartUpload",
+                    )
+            data = b"".join(parts[part["PartNumber"]] for part in chosen)
+            del self._uploads[UploadId]
+            stored = _StoredObject(data, {})
+            self._buckets.setdefault(Bucket, {})[Key] = stored
+        return {"Bucket": Bucket, "Key": Key, "ETag": stored.etag}
+
+    def abort_multipart_upload(
+        self, Bucket: str, Key: str, UploadId: str, **kwargs: Any
+    ) -> Dict[str, Any]:
+        self._call("AbortMultipartUpload")
+        with self._lock:
+            self._upload(UploadId, "AbortMultipartUpload")
+            del self._uploads[UploadId]
+        return {}
+
+    def object_event(self, bucket: str, key: str) -> Dict[str, Any]:
+        """Builds the S3 notification record a real upload of the object emits."""
+        stored = self._get(bucket, key, "HeadObject")
+        with self._lock:
+            self._sequence += 1
+            sequencer = f"{self._sequence:016X}"
+        return {
+            "eventSource": "aws:s3",
+            "eventName": "ObjectCreated:Put",
+            "s3": {
+                "bucket": {"name": bucket},
+                "object": {
+                    "key": key,
+                    "size": len(stored.data),
+                    "eTag": stored.etag.strip('"'),
+                    "sequencer": sequencer,
+                },
+            },
+        }
+
+
+# --------------------------------------------------------------------- DynamoDB
+
+_COMPARATORS: Dict[str, Callable[[Any, Any], bool]] = {
+    "=": lambda a, b: a == b,
+    "<>": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+
+
+def _attribute_value(item: Dict[str, Any], path: str) -> Any:
+    value: Any = item
+    for part in path.split("."):
+        if not isinstance(value, dict) or part not in value:
+            return _MISSING
+        value = value[part]
+    return value
+
+
+_MISSING = object()
+
+
+def evaluate(condition: Optional[ConditionBase], item: Dict[str, Any]) -> bool:
+    """Evaluates a boto3 Key/Attr condition against a deserialized item."""
+    if condition is None:
+        return True
+    expression = condition.get_expression()
+    operator = expression["operator"]
+    values = expression["values"]
+    if operator == "AND":
+        return evaluate(values[0], item) and evaluate(values[1], item)
+    if operator == "OR":
+        return evaluate(values[0], item) or evaluate(values[1], item)
+    if operator == "NOT":
+        return not evaluate(values[0], item)
+    actual = _attribute_value(item, values[0].name)
+    if operator == "attribute_exists":
+        return actual is not _MISSING
+    if operator == "attribute_not_exists":
+        return actual is _MISSING
+    if actual is _MISSING:
+        return False
+    try:
+        if operator in _COMPARATORS:
+            return _COMPARATORS[operator](actual, values[1])
+        if operator == "BETWEEN":
+            return values[1] <= actual <= values[2]
+        if operator == "IN":
+            return actual in values[1]
+        if operator == "begins_with":
+            return str(actual).startswith(values[1])
+        if operator == "contains":
+            return values[1] in actual
+    except TypeError:
+        return False
+    raise NotImplementedError(f"Condition operator {operator} is not supported")
+
+
+def _string_condition(
+    expression: str, names: Dict[str, str]
+) -> Callable[[Dict[str, Any]], bool]:
+    """Supports the attribute_(not_)exists(name) string conditions."""
+    expression = expression.strip()
+    for function, expected in (
+        ("attribute_not_exists", False),
+        ("attribute_exists", True),
+    ):
+        if expression.startswith(f"{function}(") and expression.endswith(")"):
+            name = expression[len(function) + 1 : -1].strip()
+            name = names.get(name, name)
+            return (
+                lambda item: (_attribute_value(item, name) is not _MISSING) == expected
+            )
+    raise NotImplementedError(f"Condition expression {expression!r} is not supported")
+
+
+def _check_condition(
+    condition: Any,
+    item: Optional[Dict[str, Any]],
+    names: Optional[Dict[str, str]],
+    operation: str,
+    return_values: Optional[str] = None,
+) -> None:
+    native = item or {}
+    if isinstance(condition, str):
+        passed = _string_condition(condition, names or {})(native)
+    else:
+        passed = evaluate(condition, native)
+    if not passed:
+        error = client_error(
+            "ConditionalCheckFailedException",
+            "The conditional request failed",
+            operation,
+        )
+        # ReturnValuesOnConditionCheckFailure=ALL_OLD
+        if return_values == "ALL_OLD" and item is not None:
+            error.response["Item"] = _serialize(item)
+        raise error
+
+
+def _projection(
+    expression: Optional[str], names: Optional[Dict[str, str]]
+) -> Optional[List[str]]:
+    if not expression:
+        return None
+    return [
+        (names or {}).get(part.strip(), part.strip()) for part in expression.split(",")
+    ]
+
+
+def _project(item: Dict[str, Any], attributes: Optional[List[str]]) -> Dict[str, Any]:
+    if attributes is None:
+        return dict(item)
+    return {name: item[name] for name in attributes if name in item}
+
+
+class _TableData:
+    """Items of one table, stored in the typed wire format, plus its indexes."""
+
+    def __init__(
+        self,
+        name: str,
+        hash_key: str,
+        range_key: Optional[str],
+        indexes: Dict[str, Tuple[str, Optional[str]]],
+    ) -> None:
+        self.name = name
+        self.hash_key = hash_key
+        self.range_key = range_key
+        self.indexes = indexes
+        self.items: Dict[Tuple, Dict[str, Any]] = {}
+        # index name (None for the table) -> hash value -> primary keys
+        self.by_hash: Dict[Optional[str], Dict[Any, set]] = {
+            index: {} for index in [None, *indexes]
+        }
+        self.lock = threading.RLock()
+
+    def key_schema(self, index: Optional[str]) -> Tuple[str, Optional[str]]:
+        if index is None:
+            return self.hash_key, self.range_key
+        if index not in self.indexes:
+            raise client_error(
+                "ValidationException",
+                f"The table does not have the specified index: {index}",
+                "Query",
+            )
+        return self.indexes[index]
+
+    def primary_key(self, typed: Dict[str, Any], operation: str) -> Tuple:
+        parts = []
+        for name in (self.hash_key, self.range_key):
+            if name is None:
+                continue
+            value = typed.get(name)
+            if not isinstance(value, dict) or not (value.keys() & {"S", "N", "B"}):
+                raise client_error(
+                    "ValidationException",
+                    f"Missing or invalid key attribute {name} in {self.name}",
+                    operation,
+                )
+            parts.append(_deserializer.deserialize(value))
+        return tuple(parts)
+
+    def _index_entries(self, item: Dict[str, Any]):
+        for index in self.by_hash:
+            hash_name, _ = self.key_schema(index)
+            value = item.get(hash_name)
+            if value is not None:
+                yield index, _deserializer.deserialize(value)
+
+    def put(self, typed: Dict[str, Any], operation: str) -> Optional[Dict[str, Any]]:
+        key = self.primary_key(typed, operation)
+        with self.lock:
+            previous = self.items.get(key)
+            if previous is not None:
+                self._unindex(key, previous)
+            self.items[key] = typed
+            for index, value in self._index_entries(typed):
+                self.by_hash[index].setdefault(value, set()).add(key)
+        return previous
+
+    def delete(self, key: Tuple) -> Optional[Dict[str, Any]]:
+        with self.lock:
+            previous = self.items.pop(key, None)
+            if previous is not None:
+                self._unindex(key, previous)
+        return previous
+
+    def _unindex(self, key: Tuple, item: Dict[str, Any]) -> None:
+        for index, value in self._index_entries(item):
+            keys = self.by_hash[index].get(value)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.by_hash[index][value]
+
+    def ordered_keys(self, keys) -> List[Tuple]:
+        return sorted(keys, key=lambda key: tuple(str(part) for part in key))
+
+
+class FakeDynamoDB:
+    """
+    In-memory DynamoDB shared by a low-level client and a resource, so code that
+    mixes both sees the same data.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        unprocessed_rate: float = 0.0,
+        page_size: int = DEFAULT_PAGE_SIZE,
+        seed: Optional[int] = None,
+    ) -> None:
+        self._latency = _Latency(latency_ms)
+        self.unprocessed_rate = unprocessed_rate
+        self.page_size = page_size
+        self._random = random.Random(seed)
+        self._tables: Dict[str, _TableData] = {}
+        self._lock = threading.Lock()
+        self.requests: Dict[str, int] = {}
+        self.client = FakeDynamoDBClient(self)
+        self.resource = FakeDynamoDBResource(self)
+
+    def create_table(
+        self,
+        name: str,
+        hash_key: str,
+        range_key: Optional[str] = None,
+        indexes: Optional[Dict[str, Tuple[str, Optional[str]]]] = None,
+    ) -> "FakeTable":
+        self._tables[name] = _TableData(name, hash_key, range_key, indexes or {})
+        return self.resource.Table(name)
+
+    def table(self, name: str, operation: str) -> _TableData:
+        table = self._tables.get(name)
+        if table is None:
+            raise client_error(
+                "ResourceNotFoundException",
+                f"Requested resource not found: Table: {name} not found",
+                operation,
+            )
+        return table
+
+    def call(self, operation: str) -> None:
+        with self._lock:
+            self.requests[operation] = self.requests.get(operation, 0) + 1
+        self._latency.wait()
+
+    def item_count(self, name: str) -> int:
+        return len(self._tables[name].items)
+
+    def unprocessed(self) -> bool:
+        with self._lock:
+            return self._random.random() < self.unprocessed_rate
+
+
+class FakeDynamoDBClient:
+    """Low-level client; items are passed in the typed wire format."""
+
+    def __init__(self, db: FakeDynamoDB) -> None:
+        self._db = db
+
+    def put_item(
+        self,
+        TableName: str,
+        Item: Dict[str, Any],
+        ConditionExpression: Any = None,
+        ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        self._db.call("PutItem")
+        table = self._db.table(TableName, "PutItem")
+        with table.lock:
+            if ConditionExpression is not None:
+                key = table.primary_key(Item, "PutItem")
+                current = table.items.get(key)
+                _check_condition(
+                    ConditionExpression,
+                    _deserialize(current),
+                    ExpressionAttributeNames,
+                    "PutItem",
+                    kwargs.get("ReturnValuesOnConditionCheckFailure"),
+                )
+            table.put(dict(Item), "PutItem")
+        return {}
+
+    def get_item(
+        self,
+        TableName: str,
+        Key: Dict[str, Any],
+        ProjectionExpression: Optional[str] = None,
+        ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        self._db.call("GetItem")
+        table = self._db.table(TableName, "GetItem")
+        item = table.items.get(table.primary_key(Key, "GetItem"))
+        if item is None:
+            return {}
+        attributes = _projection(ProjectionExpression, ExpressionAttributeNames)
+        return {"Item": _project(item, attributes)}
+
+    def delete_item(
+        self,
+        TableName: str,
+        Key: Dict[str, Any],
+        ConditionExpression: Any = None,
+        ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        self._db.call("DeleteItem")
+        table = self._db.table(TableName, "DeleteItem")
+        key = table.primary_key(Key, "DeleteItem")
+        with table.lock:
+            if ConditionExpression is not None:
+                _check_condition(
+                    ConditionExpression,
+                    _deserialize(table.items.get(key)),
+                    ExpressionAttributeNames,
+                    "DeleteItem",
+                    kwargs.get("ReturnValuesOnConditionCheckFailure"),
+                )
+            table.delete(key)
+        return {}
+
+    def update_item(
+        self,
+        TableName: str,
+        Key: Dict[str, Any],
+        UpdateExpression: str,
+        ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+        ExpressionAttributeValues: Optional[Dict[str, Any]] = None,
+        ConditionExpression: Any = None,
+        ReturnValues: str = "NONE",
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        self._db.call("UpdateItem")
+        table = self._db.table(TableName, "UpdateItem")
+        key = table.primary_key(Key, "UpdateItem")
+        names = ExpressionAttributeNames or {}
+        values = {
+            name: _deserializer.deserialize(value)
+            for name, value in (ExpressionAttributeValues or {}).items()
+        }
+        with table.lock:
+            current = _deserialize(table.items.get(key))
+            if ConditionExpression is not None:
+                _check_condition(
+                    ConditionExpression,
+                    current,
+                    names,
+                    "UpdateItem",
+                    kwargs.get("ReturnValuesOnConditionCheckFailure"),
+                )
+            item = dict(current or _deserialize(Key) or {})
+            _apply_update(item, UpdateExpression, names, values)
+            table.put(_serialize(item), "UpdateItem")
+        if ReturnValues == "ALL_NEW":
+            return {"Attributes": _serialize(item)}
+        if ReturnValues == "ALL_OLD" and current is not None:
+            return {"Attributes": _serialize(current)}
+        return {}
+
+    def batch_write_item(self, RequestItems: Dict[str, List[Dict]], **kwargs) -> Dict:
+        self._db.call("BatchWriteItem")
+        if sum(len(requests) for requests in RequestItems.values()) > BATCH_WRITE_LIMIT:
+            raise client_error(
+                "ValidationException",
+                "Too many items requested for the BatchWriteItem call",
+                "BatchWriteItem",
+            )
+        unprocessed: Dict[str, List[Dict]] = {}
+        for table_name, requests in RequestItems.items():
+            table = self._db.table(table_name, "BatchWriteItem")
+            for request in requests:
+                if self._db.unprocessed():
+                    unprocessed.setdefault(table_name, []).append(request)
+                elif "PutRequest" in request:
+                    table.put(dict(request["PutRequest"]["Item"]), "BatchWriteItem")
+                else:
+                    key = request["DeleteRequest"]["Key"]
+                    table.delete(table.primary_key(key, "BatchWriteItem"))
+        return {"UnprocessedItems": unprocessed}
+
+    def batch_get_item(self, RequestItems: Dict[str, Dict], **kwargs) -> Dict:
+        self._db.call("BatchGetItem")
+        if sum(len(r["Keys"]) for r in RequestItems.values()) > BATCH_GET_LIMIT:
+            raise client_error(
+                "ValidationException",
+                "Too many items requested for the BatchGetItem call",
+                "BatchGetItem",
+            )
+        responses: Dict[str, List[Dict]] = {}
+        unprocessed: Dict[str, Dict] = {}
+        for table_name, request in RequestItems.items():
+            table = self._db.table(table_name, "BatchGetItem")
+            attributes = _projection(
+                request.get("ProjectionExpression"),
+                request.get("ExpressionAttributeNames"),
+            )
+            found = responses.setdefault(table_name, [])
+            for key in request["Keys"]:
+                if self._db.unprocessed():
+                    unprocessed.setdefault(table_name, {"Keys": []})["Keys"].append(key)
+                    continue
+                item = table.items.get(table.primary_key(key, "BatchGetItem"))
+                if item is not None:
+                    found.append(_project(item, attributes))
+        return {"Responses": responses, "UnprocessedKeys": unprocessed}
+
+    def describe_table(self, TableName: str, **kwargs: Any) -> Dict[str, Any]:
+        self._db.call("DescribeTable")
+        table = self._db.table(TableName, "DescribeTable")
+        return {
+            "Table": {
+                "TableName": TableName,
+                "TableStatus": "ACTIVE",
+                "ItemCount": len(table.items),
+            }
+        }
+
+    def scan(
+        self,
+        TableName: str,
+        Segment: Optional[int] = None,
+        TotalSegments: Optional[int] = None,
+        ExclusiveStartKey: Optional[Dict[str, Any]] = None,
+        Limit: Optional[int] = None,
+        ProjectionExpression: Optional[str] = None,
+        ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+        FilterExpression: Optional[ConditionBase] = None,
+        Select: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        self._db.call("Scan")
+        table = self._db.table(TableName, "Scan")
+        with table.lock:
+            keys = list(table.items)
+        if TotalSegments:
+            keys = [
+                key
+                for key in keys
+                if zlib.crc32(str(key[0]).encode("utf-8")) % TotalSegments == Segment
+            ]
+        return self._page(
+            table,
+            table.ordered_keys(keys),
+            ExclusiveStartKey,
+            Limit,
+            _projection(ProjectionExpression, ExpressionAttributeNames),
+            FilterExpression,
+            Select,
+            "Scan",
+        )
+
+    def query(
+        self,
+        TableName: str,
+        KeyConditionExpression: ConditionBase,
+        IndexName: Optional[str] = None,
+        ExclusiveStartKey: Optional[Dict[str, Any]] = None,
+        Limit: Optional[int] = None,
+        ScanIndexForward: bool = True,
+        ProjectionExpression: Optional[str] = None,
+        ExpressionAttributeNames: Optional[Dict[str, str]] = None,
+        FilterExpression: Optional[ConditionBase] = None,
+        Select: Optional[str] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        self._db.call("Query")
+        table = self._db.table(TableName, "Query")
+        hash_name, range_name = table.key_schema(IndexName)
+        hash_value = _hash_key_value(KeyConditionExpression, hash_name)
+        with table.lock:
+            keys = list(table.by_hash[IndexName].get(hash_value, ()))
+            matching = []
+            for key in keys:
+                item = _deserialize(table.items[key]) or {}
+                if evaluate(KeyConditionExpression, item):
+                    sort_value = item.get(range_name) if range_name else None
+                    matching.append((sort_value, tuple(str(p) for p in key), key))
+
+        matching.sort(
+            key=lambda entry: (
+                entry[0] is not None,
+                entry[0] if entry[0] is not None else 0,
+                entry[1],
+            ),
+            reverse=not ScanIndexForward,
+        )
+        ordered = [key for _, _, key in matching]
+        return self._page(
+            table,
+            ordered,
+            ExclusiveStartKey,
+            Limit,
+            _projection(ProjectionExpression, ExpressionAttributeNames),
+            FilterExpression,
+            Select,
+            "Query",
+        )
+
+    def _page(
+        self,
+        table: _TableData,
+        keys: List[Tuple],
+        start_key: Optional[Dict[str, Any]],
+        limit: Optional[int],
+        attributes: Optional[List[str]],
+        filter_expression: Optional[ConditionBase],
+        select: Optional[str],
+        operation: str,
+    ) -> Dict[str, Any]:
+        if start_key:
+            start = table.primary_key(start_key, operation)
+            position = keys.index(start) + 1 if start in keys else 0
+            keys = keys[position:]
+        page_size = min(limit or self._db.page_size, self._db.page_size)
+        page, rest = keys[:page_size], keys[page_size:]
+        items = []
+        for key in page:
+            item = table.items.get(key)
+            if item is None:
+                continue
+            if filter_expression is not None and not evaluate(
+                filter_expression, _deserialize(item)
+            ):
+                continue
+            items.append(_project(item, attributes))
+        response: Dict[str, Any] = {"Count": len(items), "ScannedCount": len(page)}
+        if select != "COUNT":
+            response["Items"] = items
+        if rest:
+            last = table.items.get(page[-1]) or {}
+            response["LastEvaluatedKey"] = {
+                name: last[name]
+                for name in (table.hash_key, table.range_key)
+                if name and name in last
+            }
+        return response
+
+    def get_paginator(self, operation_name: str) -> "FakePaginator":
+        return FakePaginator(getattr(self, operation_name))
+
+
+class FakePaginator:
+    def __init__(self, method: Callable[..., Dict[str, Any]]) -> None:
+        self._method = method
+
+    def paginate(self, **kwargs: Any) -> Iterator[Dict[str, Any]]:
+        kwargs.pop("PaginationConfig", None)
+        while True:
+            page = self._method(**kwargs)
+            yield page
+            if "LastEvaluatedKey" not in page:
+                return
+            kwargs["ExclusiveStartKey"] = page["LastEvaluatedKey"]
+
+
+def _serialize(item: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    return {name: _serializer.serialize(value) for name, value in (item or {}).items()}
+
+
+def _deserialize(item: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    if item is None:
+        return None
+    return {name: _deserializer.deserialize(value) for name, value in item.items()}
+
+
+def _hash_key_value(condition: ConditionBase, hash_name: str) -> Any:
+    """Finds the equality on the partition key inside a key condition."""
+    expression = condition.get_expression()
+    if expression["operator"] == "AND":
+        for part in expression["values"]:
+            try:
+                return _hash_key_value(part, hash_name)
+            except NotImplementedError:
+                continue
+    elif expression["operator"] == "=" and expression["values"][0].name == hash_name:
+        return expression["values"][1]
+    raise NotImplementedError(f"Key condition must test {hash_name} for equality")
+
+
+def _apply_update(
+    item: Dict[str, Any],
+    expression: str,
+    names: Dict[str, str],
+    values: Dict[str, Any],
+) -> None:
+    """Applies the SET, ADD and REMOVE clauses of an update expression."""
+    clauses: List[Tuple[str, str]] = []
+    tokens = expression.replace("\n", " ").split()
+    action = None
+    buffer: List[str] = []
+    for token in tokens:
+        if token.upper() in ("SET", "ADD", "REMOVE"):
+            if action:
+                clauses.append((action, " ".join(buffer)))
+            action, buffer = token.upper(), []
+        else:
+            buffer.append(token)
+    if action:
+        clauses.append((action, " ".join(buffer)))
+
+    def resolve(operand: str) -> Any:
+        operand = operand.strip()
+        if operand.startswith(":"):
+            return values[operand]
+        if operand.startswith("if_not_exists(") and operand.endswith(")"):
+            name, default = operand[len("if_not_exists(") : -1].split(",")
+            current = item.get(names.get(name.strip(), name.strip()))
+            return current if current is not None else resolve(default)
+        return item.get(names.get(operand, operand), 0)
+
+    for action, body in clauses:
+        for assignment in _split_top_level(body):
+            if action == "SET":
+                target, value = assignment.split("=", 1)
+                target = names.get(target.strip(), target.strip())
+                if "+" in value and not value.strip().startswith("if_not_exists"):
+                    left, right = value.split("+", 1)
+                    item[target] = resolve(left) + resolve(right)
+                elif " - " in value:
+                    left, right = value.split(" - ", 1)
+                    item[target] = resolve(left) - resolve(right)
+                else:
+                    item[target] = resolve(value)
+            elif action == "ADD":
+                target, value = assignment.split()
+                target = names.get(target, target)
+                increment = values[value]
+                current = item.get(target)
+                if isinstance(increment, set):
+                    item[target] = (current or set()) | increment
+                else:
+                    item[target] = (current or Decimal(0)) + increment
+            else:
+                item.pop(names.get(assignment.strip(), assignment.strip()), None)
+
+
+def _split_top_level(body: str) -> List[str]:
+    parts, depth, current = [], 0, []
+    for char in body:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == "," and depth == 0:
+            parts.append("".join(current))
+            current = []
+        else:
+            current.append(char)
+    if "".join(current).strip():
+        parts.append("".join(current))
+    return parts
+
+
+class _Meta:
+    def __init__(self, client: FakeDynamoDBClient) -> None:
+        self.client = client
+
+
+class FakeTable:
+    """Resource Table; items are plain Python values, numbers as Decimal."""
+
+    def __init__(self, db: FakeDynamoDB, name: str) -> None:
+        self._db = db
+        self.name = name
+        self.table_name = name
+        self.meta = _Meta(db.client)
+
+    def put_item(self, Item: Dict[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        return self._db.client.put_item(
+            TableName=self.name, Item=_serialize(Item), **kwargs
+        )
+
+    def get_item(self, Key: Dict[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        response = self._db.client.get_item(
+            TableName=self.name, Key=_serialize(Key), **kwargs
+        )
+        if "Item" in response:
+            response["Item"] = _deserialize(response["Item"])
+        return response
+
+    def delete_item(self, Key: Dict[str, Any], **kwargs: Any) -> Dict[str, Any]:
+        return self._db.client.delete_item(
+            TableName=self.name, Key=_serialize(Key), **kwargs
+        )
+
+    def update_item(
+        self,
+        Key: Dict[str, Any],
+        ExpressionAttributeValues: Optional[Dict[str, Any]] = None,
+        **kwargs: Any,
+    ) -> Dict[str, Any]:
+        response = self._db.client.update_item(
+            TableName=self.name,
+            Key=_serialize(Key),
+            ExpressionAttributeValues=_serialize(ExpressionAttributeValues),
+            **kwargs,
+        )
+        if "Attributes" in response:
+            response["Attributes"] = _deserialize(response["Attributes"])
+        return response
+
+    def scan(self, **kwargs: Any) -> Dict[str, Any]:
+        return self._read(self._db.client.scan, kwargs)
+
+    def query(self, **kwargs: Any) -> Dict[str, Any]:
+        return self._read(self._db.client.query, kwargs)
+
+    def _read(self, method: Callable[..., Dict], kwargs: Dict[str, Any]) -> Dict:
+        if "ExclusiveStartKey" in kwargs:
+            kwargs["ExclusiveStartKey"] = _serialize(kwargs["ExclusiveStartKey"])
+        response = method(TableName=self.name, **kwargs)
+        if "Items" in response:
+            response["Items"] = [_deserialize(item) for item in response["Items"]]
+        if "LastEvaluatedKey" in response:
+            response["LastEvaluatedKey"] = _deserialize(response["LastEvaluatedKey"])
+        return response
+
+    def batch_writer(self, overwrite_by_pkeys: Optional[List[str]] = None):
+        return FakeBatchWriter(self._db.client, self.name)
+
+
+class FakeBatchWriter:
+    """Buffers writes into BatchWriteItem calls and resends unprocessed items."""
+
+    def __init__(self, client: FakeDynamoDBClient, table_name: str) -> None:
+        self._client = client
+        self._table_name = table_name
+        self._buffer: List[Dict[str, Any]] = []
+
+    def put_item(self, Item: Dict[str, Any]) -> None:
+        self._add({"PutRequest": {"Item": _serialize(Item)}})
+
+    def delete_item(self, Key: Dict[str, Any]) -> None:
+        self._add({"DeleteRequest": {"Key": _serialize(Key)}})
+
+    def _add(self, request: Dict[str, Any]) -> None:
+        self._buffer.append(request)
+        if len(self._buffer) >= BATCH_WRITE_LIMIT:
+            self._flush()
+
+    def _flush(self) -> None:
+        batch, self._buffer = (
+            self._buffer[:BATCH_WRITE_LIMIT],
+            self._buffer[BATCH_WRITE_LIMIT:],
+        )
+        response = self._client.batch_write_item(RequestItems={self._table_name: batch})
+        self._buffer.extend(response["UnprocessedItems"].get(self._table_name, []))
+
+    def __enter__(self) -> "FakeBatchWriter":
+        return self
+
+    def __exit__(self, *exc_info: Any) -> None:
+        while self._buffer:
+            self._flush()
+
+
+class FakeDynamoDBResource:
+    def __init__(self, db: FakeDynamoDB) -> None:
+        self._db = db
+        self.meta = _Meta(db.client)
+
+    def Table(self, name: str) -> FakeTable:
+        return FakeTable(self._db, name)
+
+
+# -------------------------------------------------------------------------- SES
+
+
+class FakeSES:
+    """
+    Collects sent emails. Sending can be slowed down, limited to a maximum rate
+    with a token bucket (like the SES account quota) and made to fail randomly.
+    """
+
+    def __init__(
+        self,
+        latency_ms: float = 0.0,
+        max_send_rate: Optional[float] = None,
+        error_rate: float = 0.0,
+        seed: Optional[int] = None,
+    ) -> None:
+        self._latency = _Latency(latency_ms)
+        self.max_send_rate = max_send_rate
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self._tokens = max_send_rate or 0.0
+        self._refilled = time.monotonic()
+        self._lock = threading.Lock()
+        self.sent: List[Dict[str, Any]] = []
+        self.throttled = 0
+        self.failed = 0
+
+    def _take_token(self) -> bool:
+        if self.max_send_rate is None:
+            return True
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_send_rate,
+            self._tokens + (now - self._refilled) * self.max_send_rate,
+        )
+        self._refilled = now
+        if self._tokens < 1:
+            return False
+        self._tokens -= 1
+        return True
+
+    def send_email(
+        self, Source: str, Destination: Dict, Message: Dict, **kwargs: Any
+    ) -> Dict[str, Any]:
+        self._latency.wait()
+        with self._lock:
+            if not self._take_token():
+                self.throttled += 1
+                raise client_error(
+                    "Throttling", "Maximum sending rate exceeded.", "SendEmail"
+                )
+            if self._random.random() < self.error_rate:
+                self.failed += 1
+                raise client_error(
+                    "MessageRejected", "Email address is not verified.", "SendEmail"
+                )
+            message_id = str(uuid.uuid4())
+            self.sent.append(
+                {
+                    "MessageId": message_id,
+                    "Source": Source,
+                    "Destination": Destination,
+                    "Message": Message,
+                }
+            )
+        return {"MessageId": message_id}
+
+
+# -------------------------------------------------------------------------- SQS
+
+
+class FakeSQS:
+    """
+    Standard queues in memory. Received messages stay in flight until deleted,
+    like within their visibility timeout; return_in_flight makes them visible
+    again, as when it expires.
+    """
+
+    def __init__(self, latency_ms: float = 0.0) -> None:
+        self._latency = _Latency(latency_ms)
+        self._queues: Dict[str, "OrderedDict[str, str]"] = {}
+        self._in_flight: Dict[str, Dict[str, Tuple[str, str]]] = {}
+        self._lock = threading.Lock()
+
+    def create_queue(self, QueueName: str, **kwargs: Any) -> Dict[str, Any]:
+        url = f"https://sqs.local/000000000000/{QueueName}"
+        with self._lock:
+            self._queues.setdefault(url, OrderedDict())
+            self._in_flight.setdefault(url, {})
+        return {"QueueUrl": url}
+
+    def _queue(self, url: str, operation: str) -> "OrderedDict[str, str]":
+        queue = self._queues.get(url)
+        if queue is None:
+            raise client_error(
+                "AWS.SimpleQueueService.NonExistentQueue",
+                "The specified queue does not exist.",
+                operation,
+            )
+        return queue
+
+    def send_message(
+        self, QueueUrl: str, MessageBody: str, **kwargs: Any
+    ) -> Dict[str, Any]:
+        self._latency.wait()
+        message_id = str(uuid.uuid4())
+        with self._lock:
+            self._queue(QueueUrl, "SendMessage")[message_id] = MessageBody
+        return {
+            "MessageId": message_id,
+            "MD5OfMessageBody": hashlib.md5(MessageBody.encode()).hexdigest(),
+        }
+
+    def receive_message(
+        self, QueueUrl: str, MaxNumberOfMessages: int = 1, **kwargs: Any
+    ) -> Dict[str, Any]:
+        self._latency.wait()
+        messages = []
+        with self._lock:
+            queue = self._queue(QueueUrl, "ReceiveMessage")
+            while queue and len(messages) < MaxNumberOfMessages:
+                message_id, body = queue.popitem(last=False)
+                receipt_handle = str(uuid.uuid4())
+                self._in_flight[QueueUrl][receipt_handle] = (message_id, body)
+                messages.append(
+                    {
+                        "MessageId": message_id,
+                        "ReceiptHandle": receipt_handle,
+                        "Body": body,
+                    }
+                )
+        return {"Messages": messages} if messages else {}
+
+    def delete_message(
+        self, QueueUrl: str, ReceiptHandle: str, **kwargs: Any
+    ) -> Dict[str, Any]:
+        with self._lock:
+            self._queue(QueueUrl, "DeleteMessage")
+            self._in_flight[QueueUrl].pop(ReceiptHandle, None)
+        return {}
+
+    def return_in_flight(self, QueueUrl: str) -> int:
+        """Makes the received but undeleted messages visible again."""
+        with self._lock:
+            queue = self._queue(QueueUrl, "ReceiveMessage")
+            in_flight = self._in_flight[QueueUrl]
+            for message_id, body in in_flight.values():
+                queue[message_id] = body
+            returned = len(in_flight)
+            in_flight.clear()
+        return returned
+
+    def message_count(self, QueueUrl: str) -> int:
+        with self._lock:
+            return len(self._queue(QueueUrl, "GetQueueAttributes"))
+
+    def lambda_event(self, messages: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Builds the event an SQS event source mapping passes to a lambda."""
+        return {
+            "Records": [
+                {
+                    "messageId": message["MessageId"],
+                    "receiptHandle": message["ReceiptHandle"],
+                    "body": message["Body"],
+                    "eventSource": "aws:sqs",
+                }
+                for message in messages
+            ]
+        }
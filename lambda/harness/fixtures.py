@@ -0,0 +1,91 @@
+"""
+Realistic inputs for the load harness, derived from the sample files kept in
+the lambdas' test data and assets.
+"""
+
+import csv
+import io
+import os
+import random
+from typing import Any, Dict, Iterator, List
+
+LAMBDA_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PRODUCTS_CSV = os.path.join(
+    LAMBDA_DIR, "crm-sync-products", "test", "data", "products.csv"
+)
+QUOTES_ZIP = os.path.join(LAMBDA_DIR, "crm-sync-quotes", "test", "data", "test.zip")
+SALES_REPS_CSV = os.path.join(LAMBDA_DIR, "crm-sync-quotes", "assets", "sales_rep.csv")
+PRODUCTS_ENCODING = "latin-1"
+RESPONSE_TYPES = ["Buy", "More Info", "Not Interested"]
+
+
+def read_bytes(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def products_csv(revision: int, changed_fraction: float = 0.02) -> bytes:
+    """
+    The sample products export with a fraction of the descriptions edited, so
+    every revision is a new upload with a realistic amount of changed rows.
+    """
+    rng = random.Random(revision)
+    with open(PRODUCTS_CSV, "r", encoding=PRODUCTS_ENCODING, newline="") as f:
+        rows = list(csv.reader(f))
+    for row in rows:
+        if len(row) > 14 and row[3] != "Clave" and rng.random() < changed_fraction:
+            row[4] = f"{row[4].strip()} r{revision}"
+    output = io.StringIO()
+    csv.writer(output, lineterminator="\r\n").writerows(rows)
+    return output.getvalue().encode(PRODUCTS_ENCODING, errors="replace")
+
+
+def sales_reps_csv(revision: int, extra_reps: int = 200) -> bytes:
+    """The bundled sales reps plus synthetic ones whose phones change per revision."""
+    with open(SALES_REPS_CSV, "r", encoding="utf-8") as f:
+        rows = list(csv.DictReader(f))
+    fieldnames = ["AGENTE", "NOMBRE", "EMAIL", "TEL"]
+    known = {row.get("AGENTE") for row in rows}
+    for index in range(extra_reps):
+        rep_id = str(1000 + index)
+        if rep_id in known:
+            continue
+        rows.append(
+            {
+                "AGENTE": rep_id,
+                "NOMBRE": f"AGENTE {rep_id}",
+                "EMAIL": f"agente{rep_id}@example.com",
+                "TEL": f"81{(index * 7919 + revision) % 10**8:08d}",
+            }
+        )
+    output = io.StringIO()
+    writer = csv.DictWriter(output, fieldnames=fieldnames, extrasaction="ignore")
+    writer.writeheader()
+    writer.writerows(rows)
+    return output.getvalue().encode("utf-8")
+
+
+def s3_event(records: List[Dict[str, Any]]) -> Dict[str, Any]:
+    return {"Records": records}
+
+
+def response_events(
+    transactions: List[Dict[str, str]], count: int, seed: int = 0
+) -> Iterator[Dict[str, Any]]:
+    """
+    API Gateway GET requests as produced by clicks on the email buttons. Most
+    transactions get one click, some several, as with real recipients.
+    """
+    rng = random.Random(seed)
+    for _ in range(count):
+        transaction = rng.choice(transactions)
+        yield {
+            "httpMethod": "GET",
+            "headers": {"User-Agent": "Mozilla/5.0"},
+            "requestContext": {"identity": {"sourceIp": "203.0.113.10"}},
+            "queryStringParameters": {
+                "id": transaction["prospect_id"],
+                "response": rng.choice(RESPONSE_TYPES),
+                "email_transaction_id": transaction["id"],
+            },
+        }
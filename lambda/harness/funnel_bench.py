@@ -0,0 +1,145 @@
+"""
+Benchmark of the funnel report of crm-web-response.
+
+Joins and aggregates --rows synthetic email transactions, a --response-rate
+fraction of them with responses, with each of the two hash join strategies,
+streaming the rows from generators so only the build side is held in memory.
+Then loads --scan-rows transactions and their responses into the fake
+DynamoDB and runs the whole report, segmented scans included, with 1 and
+--segments scan segments.
+
+    python funnel_bench.py --rows 10000000
+    python funnel_bench.py --rows 1000000 --scan-rows 50000 --dynamodb-latency-ms 5
+"""
+
+import argparse
+import resource
+import sys
+import time
+from typing import Iterator, List, Optional, Tuple
+from fakes import FakeDynamoDB
+from run import load_lambda
+
+TRANSACTIONS_TABLE = "crm-quotes-emails-transactions"
+RESPONSES_TABLE = "crm-api-responses"
+SALES_REPS = 40
+DAYS = 30
+STEPS = ["3", "5", "7"]
+RESPONSE_TYPES = ["Buy", "More Info", "Not Interested"]
+
+
+def transaction_rows(rows: int) -> Iterator[Tuple[str, str, str, str]]:
+    for index in range(rows):
+        yield (
+            f"{index:032x}",
+            str(index % SALES_REPS),
+            f"2024-07-{index % DAYS + 1:02d}T09:00:00",
+            STEPS[index % len(STEPS)],
+        )
+
+
+def response_rows(rows: int, response_rate: float) -> Iterator[Tuple[str, str]]:
+    every = max(1, round(1 / response_rate))
+    for index in range(0, rows, every):
+        yield (f"{index:032x}", RESPONSE_TYPES[index // every % len(RESPONSE_TYPES)])
+        if index // every % 5 == 0:
+            # Some prospects click a second button
+            yield (f"{index:032x}", RESPONSE_TYPES[(index // every + 1) % 3])
+
+
+def max_rss_mib() -> float:
+    # ru_maxrss is in KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def bench_join(funnel, rows: int, response_rate: float) -> List[str]:
+    lines = []
+    for join in (funnel.join_on_responses, funnel.join_on_transactions):
+        before = max_rss_mib()
+        started = time.perf_counter()
+        result = join(
+            transaction_rows(rows),
+            response_rows(rows, response_rate),
+            funnel.sent_between(None, None),
+        )
+        seconds = time.perf_counter() - started
+        sent, responded, bought = result.totals()
+        lines.append(
+            f"{join.__name__:<22} {rows:>11,} emails {seconds:>7.2f}s "
+            f"{rows / seconds:>12,.0f} rows/s  peak RSS +{max_rss_mib() - before:,.0f} MiB  "
+            f"responded {responded:,} bought {bought:,}"
+        )
+    return lines
+
+
+def bench_scans(
+    funnel, rows: int, response_rate: float, segments: int, latency_ms: float
+) -> List[str]:
+    db = FakeDynamoDB(latency_ms=latency_ms)
+    transactions = db.create_table(TRANSACTIONS_TABLE, "transaction_id")
+    responses = db.create_table(RESPONSES_TABLE, "response_id")
+    with transactions.batch_writer() as batch:
+        for transaction_id, sales_rep_id, sent_at, step in transaction_rows(rows):
+            batch.put_item(
+                Item={
+                    "transaction_id": transaction_id,
+                    "sales_rep_id": sales_rep_id,
+                    "sent_at": sent_at,
+                    "cadence_step": int(step),
+                }
+            )
+    with responses.batch_writer() as batch:
+        for index, (transaction_id, response_type) in enumerate(
+            response_rows(rows, response_rate)
+        ):
+            batch.put_item(
+                Item={
+                    "response_id": f"r{index}",
+                    "email_transaction_id": transaction_id,
+                    "response_type": response_type,
+                }
+            )
+    scanned = rows + db.item_count(RESPONSES_TABLE)
+    lines = []
+    for total_segments in sorted({1, segments}):
+        started = time.perf_counter()
+        funnel.build_funnel(
+            db.client, TRANSACTIONS_TABLE, RESPONSES_TABLE, total_segments
+        ).rows()
+        seconds = time.perf_counter() - started
+        lines.append(
+            f"scan + join, {total_segments} segment(s) {scanned:>9,} items "
+            f"{seconds:>7.2f}s {scanned / seconds:>10,.0f} items/s"
+        )
+    return lines
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--rows", type=int, default=10_000_000)
+    parser.add_argument("--response-rate", type=float, default=0.15)
+    parser.add_argument("--scan-rows", type=int, default=20_000)
+    parser.add_argument("--segments", type=int, default=8)
+    parser.add_argument("--dynamodb-latency-ms", type=float, default=5.0)
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None, out=sys.stdout) -> int:
+    args = parse_args(argv)
+    funnel = load_lambda("crm-web-response")["funnel"]
+    for line in bench_join(funnel, args.rows, args.response_rate):
+        print(line, file=out)
+    if args.scan_rows:
+        for line in bench_scans(
+            funnel,
+            args.scan_rows,
+            args.response_rate,
+            args.segments,
+            args.dynamodb_latency_ms,
+        ):
+            print(line, file=out)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,497 @@
+"""
+End-to-end load harness for the CRM lambdas.
+
+Runs the real handlers of crm-sync-sales-reps, crm-sync-products,
+crm-sync-quotes and crm-web-response against the in-process fakes, plus the
+quote email sender and the queued response consumer, and reports throughput, tail latency, peak memory and the
+per-stage breakdown written by each lambda's metrics module.
+
+    python run.py --iterations 3 --emails 300 --requests 2000 --ses-max-send-rate 14
+"""
+
+import argparse
+import importlib
+import io
+import json
+import logging
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+from dataclasses import dataclass, field
+from types import ModuleType
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+import fixtures
+from fakes import FakeDynamoDB, FakeS3, FakeSES, FakeSQS
+
+LAMBDA_DIR = fixtures.LAMBDA_DIR
+LAMBDAS = [
+    "crm-sync-sales-reps",
+    "crm-sync-products",
+    "crm-sync-quotes",
+    "crm-web-response",
+]
+STAGES = ["sales-reps", "products", "quotes", "email", "web-response", "consumer"]
+
+UPLOADS_BUCKET = "crm-uploads"
+SALES_REPS_TABLE = "crm-sales-reps"
+PRODUCTS_TABLE = "crm-products"
+SYNC_STATE_TABLE = "crm-sync-state"
+TRANSACTIONS_TABLE = "crm-quotes-emails-transactions"
+RESPONSES_TABLE = "crm-api-responses"
+QUOTES_TABLE = "crm-quotes"
+COUNTERS_TABLE = "crm-response-counters"
+SNAPSHOTS_BUCKET = "crm-snapshots"
+ISSUED_IDS_BUCKET = "crm-issued-ids"
+RESPONSES_QUEUE = "crm-api-responses"
+
+# Modules imported as entry points, besides main
+ENTRY_POINTS = {"crm-web-response": ["consumer", "export", "funnel"]}
+
+# Metric of each stage whose record count is used for throughput
+PRIMARY_METRIC = {
+    "sales-reps": "read",
+    "products": "read",
+    "quotes": "parse",
+    "email": "ses",
+    "web-response": "dynamodb",
+    "consumer": "dynamodb",
+}
+
+
+def _lambda_module_names() -> set:
+    return {
+        os.path.splitext(name)[0]
+        for directory in LAMBDAS
+        for name in os.listdir(os.path.join(LAMBDA_DIR, directory))
+        if name.endswith(".py")
+    }
+
+
+def load_lambda(name: str) -> Dict[str, ModuleType]:
+    """
+    Imports a lambda's main module with its own flat-named siblings. Every
+    lambda has a main, utils, clients... so each is loaded in isolation and
+    removed from sys.modules afterwards; the returned modules keep working.
+    """
+    directory = os.path.join(LAMBDA_DIR, name)
+    names = _lambda_module_names()
+    saved = {n: sys.modules.pop(n) for n in names if n in sys.modules}
+    loaded: Dict[str, ModuleType] = {}
+    sys.path.insert(0, directory)
+    try:
+        for module in ["main"] + ENTRY_POINTS.get(name, []):
+            importlib.import_module(module)
+        loaded = {n: sys.modules[n] for n in names if n in sys.modules}
+    finally:
+        sys.path.remove(directory)
+        for n in names:
+            sys.modules.pop(n, None)
+        sys.modules.update(saved)
+    return loaded
+
+
+@contextmanager
+def environment(**variables: str) -> Iterator[None]:
+    previous = {name: os.environ.get(name) for name in variables}
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            if value is None:
+                os.environ.pop(name, None)
+            else:
+                os.environ[name] = value
+
+
+def percentile(values: List[float], fraction: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(fraction * (len(ordered) - 1))))
+    return ordered[index]
+
+
+@dataclass
+class StageReport:
+    name: str
+    latencies_ms: List[float] = field(default_factory=list)
+    # Memory allocated at the peak of each invocation on top of what was live
+    peaks: List[int] = field(default_factory=list)
+    records: int = 0
+    errors: int = 0
+    seconds: float = 0.0
+    breakdown: Dict[str, List[float]] = field(default_factory=dict)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "stage": self.name,
+            "invocations": len(self.latencies_ms),
+            "errors": self.errors,
+            "records": self.records,
+            "seconds": round(self.seconds, 3),
+            "invocations_per_second": (
+                round(len(self.latencies_ms) / self.seconds, 2) if self.seconds else 0.0
+            ),
+            "records_per_second": (
+                round(self.records / self.seconds, 1) if self.seconds else 0.0
+            ),
+            "latency_ms": {
+                "p50": round(percentile(self.latencies_ms, 0.50), 2),
+                "p95": round(percentile(self.latencies_ms, 0.95), 2),
+                "p99": round(percentile(self.latencies_ms, 0.99), 2),
+                "max": round(max(self.latencies_ms, default=0.0), 2),
+            },
+            "peak_memory_mib": round(max(self.peaks, default=0) / 1024 / 1024, 2),
+            "stages_ms": {
+                stage: {
+                    "p50": round(percentile(durations, 0.50), 2),
+                    "p99": round(percentile(durations, 0.99), 2),
+                    "total": round(sum(durations), 1),
+                }
+                for stage, durations in self.breakdown.items()
+            },
+        }
+
+
+def run_stage(
+    name: str,
+    handler: Callable[[Any, Any], Any],
+    events: Iterable[Any],
+    trace_memory: bool,
+    primary: Optional[str] = None,
+) -> StageReport:
+    """Invokes the handler once per event, one at a time like a warm container."""
+    report = StageReport(name)
+    primary = primary or PRIMARY_METRIC[name]
+    started = time.perf_counter()
+    for event in events:
+        output = io.StringIO()
+        if trace_memory:
+            baseline = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        invoked = time.perf_counter()
+        with redirect_stdout(output):
+            response = handler(event, None)
+        report.latencies_ms.append((time.perf_counter() - invoked) * 1000)
+        if trace_memory:
+            report.peaks.append(tracemalloc.get_traced_memory()[1] - baseline)
+        if isinstance(response, dict) and response.get("statusCode", 200) >= 400:
+            report.errors += 1
+        for line in output.getvalue().splitlines():
+            if not line.startswith("{"):
+                continue
+            document = json.loads(line)
+            if "InvocationDuration" not in document:
+                continue
+            report.records += int(document.get(f"{primary}.Records", 0))
+            for metric, value in document.items():
+                if metric.endswith(".Duration"):
+                    stage = metric[: -len(".Duration")]
+                    report.breakdown.setdefault(stage, []).append(value)
+    report.seconds = time.perf_counter() - started
+    return report
+
+
+class Harness:
+    def __init__(self, args: argparse.Namespace) -> None:
+        self.args = args
+        self.s3 = FakeS3(latency_ms=args.s3_latency_ms)
+        self.dynamodb = FakeDynamoDB(
+            latency_ms=args.dynamodb_latency_ms,
+            unprocessed_rate=args.unprocessed_rate,
+            seed=args.seed,
+        )
+        self.ses = FakeSES(
+            latency_ms=args.ses_latency_ms,
+            max_send_rate=args.ses_max_send_rate,
+            error_rate=args.ses_error_rate,
+            seed=args.seed,
+        )
+        self.sqs = FakeSQS(latency_ms=args.sqs_latency_ms)
+        self.queue_url = self.sqs.create_queue(QueueName=RESPONSES_QUEUE)["QueueUrl"]
+        for table in (SALES_REPS_TABLE, PRODUCTS_TABLE, SYNC_STATE_TABLE):
+            self.dynamodb.create_table(table, "id")
+        self.dynamodb.create_table(
+            TRANSACTIONS_TABLE,
+            "transaction_id",
+            indexes={"by_quote_id": ("quote_id", None)},
+        )
+        self.dynamodb.create_table(RESPONSES_TABLE, "response_id")
+        self.dynamodb.create_table(QUOTES_TABLE, "quote_id")
+        self.dynamodb.create_table(COUNTERS_TABLE, "counter_id")
+        self.modules = {name: load_lambda(name) for name in LAMBDAS}
+        for modules in self.modules.values():
+            clients = modules["clients"]
+            clients.set_client("s3", self.s3)
+            clients.set_client("ses", self.ses)
+            clients.set_client("sqs", self.sqs)
+            clients.set_client("dynamodb", self.dynamodb.client)
+            clients.set_resource("dynamodb", self.dynamodb.resource)
+        self.transactions: List[Dict[str, str]] = []
+
+    def upload_events(self, key: str, bodies: Iterable[bytes]) -> Iterator[Dict]:
+        for body in bodies:
+            self.s3.put_object(Bucket=UPLOADS_BUCKET, Key=key, Body=body)
+            yield fixtures.s3_event([self.s3.object_event(UPLOADS_BUCKET, key)])
+
+    def sales_reps(self) -> StageReport:
+        bodies = (
+            fixtures.sales_reps_csv(revision)
+            for revision in range(self.args.iterations)
+        )
+        with environment(
+            TABLE_NAME=SALES_REPS_TABLE, SYNC_STATE_TABLE_NAME=SYNC_STATE_TABLE
+        ):
+            return self._run(
+                "sales-reps",
+                self.modules["crm-sync-sales-reps"]["main"].handler,
+                self.upload_events("sales_rep.csv", bodies),
+            )
+
+    def products(self) -> StageReport:
+        bodies = (
+            fixtures.products_csv(revision) for revision in range(self.args.iterations)
+        )
+        with environment(
+            TABLE_NAME=PRODUCTS_TABLE,
+            SYNC_STATE_TABLE_NAME=SYNC_STATE_TABLE,
+            RECONCILE="true",
+        ):
+            return self._run(
+                "products",
+                self.modules["crm-sync-products"]["main"].handler,
+                self.upload_events("products.csv", bodies),
+            )
+
+    def quotes(self) -> StageReport:
+        data = fixtures.read_bytes(fixtures.QUOTES_ZIP)
+        keys = [f"quotes/{index:04d}.zip" for index in range(self.args.iterations)]
+        with environment(
+            TABLE_NAME=TRANSACTIONS_TABLE,
+            PRODUCTS_TABLE_NAME=PRODUCTS_TABLE,
+            SALES_REPS_TABLE_NAME=SALES_REPS_TABLE,
+            SYNC_STATE_TABLE_NAME=SYNC_STATE_TABLE,
+            QUOTES_TABLE_NAME=QUOTES_TABLE,
+            SNAPSHOT_BUCKET=SNAPSHOTS_BUCKET,
+            SENDER_EMAIL="contacto@example.com",
+            DOMAIN="example.com",
+        ):
+            return self._run(
+                "quotes",
+                self.modules["crm-sync-quotes"]["main"].handler,
+                (next(self.upload_events(key, [data])) for key in keys),
+            )
+
+    def email(self) -> StageReport:
+        """
+        Sends the open quotes of the sample ZIP through QuoteEmailSender, in
+        batches the size of one day of reminders.
+        """
+        modules = self.modules["crm-sync-quotes"]
+        quotes = [
+            quote
+            for quote in modules["parser"]
+            .QuoteParser(fixtures.QUOTES_ZIP, "assets/sales_rep.csv")
+            .read_quotes_from_zip()
+            if str(quote.status) == "Emitida"
+        ]
+        quotes = (quotes * (self.args.emails // max(len(quotes), 1) + 1))[
+            : self.args.emails
+        ]
+        prospects = {quote.id: quote.prospect.id for quote in quotes}
+        template = os.path.join(
+            LAMBDA_DIR, "crm-sync-quotes", "assets", "template.html"
+        )
+        table = self.dynamodb.resource.Table(TRANSACTIONS_TABLE)
+        batch_size = self.args.email_batch
+
+        def send(batch: List[Any], context: Any) -> Dict[str, Any]:
+            modules["sender"].QuoteEmailSender(
+                quotes=batch,
+                template_path=template,
+                sender_email="contacto@example.com",
+                transactions_table=table,
+                domain="example.com",
+                ses_client=self.ses,
+                issued_ids=modules["issued_ids"].IssuedIdsPublisher(
+                    self.s3, ISSUED_IDS_BUCKET
+                ),
+            ).send_emails()
+            return {"statusCode": 200}
+
+        report = self._run(
+            "email",
+            modules["metrics"].instrument("email")(send),
+            (quotes[i : i + batch_size] for i in range(0, len(quotes), batch_size)),
+        )
+        items = table.scan().get("Items", [])
+        self.transactions = [
+            {"id": item["transaction_id"], "prospect_id": prospects[item["quote_id"]]}
+            for item in items
+            if item["quote_id"] in prospects
+        ]
+        return report
+
+    def web_response(self) -> StageReport:
+        transactions = self.transactions or [
+            {"id": f"synthetic-{index}", "prospect_id": str(index)}
+            for index in range(1000)
+        ]
+        with environment(
+            TABLE_NAME=RESPONSES_TABLE,
+            ENABLE_CORS="true",
+            TRANSACTIONS_TABLE_NAME=TRANSACTIONS_TABLE,
+            COUNTERS_TABLE_NAME=COUNTERS_TABLE,
+            # Synthetic ids were never issued, so only sent emails are checked
+            **({"ISSUED_IDS_BUCKET": ISSUED_IDS_BUCKET} if self.transactions else {}),
+            **({"RESPONSE_QUEUE_URL": self.queue_url} if self.args.queue else {}),
+        ):
+            return self._run(
+                "web-response",
+                self.modules["crm-web-response"]["main"].lambda_handler,
+                fixtures.response_events(
+                    transactions, self.args.requests, seed=self.args.seed
+                ),
+                primary="enqueue" if self.args.queue else None,
+            )
+
+    def consumer(self) -> StageReport:
+        """
+        Drains the responses queued by the web-response stage (with --queue)
+        in batches of --consumer-batch messages, deleting those the consumer
+        did not report as failed and retrying the rest, like an SQS event
+        source mapping with ReportBatchItemFailures.
+        """
+        consumer = self.modules["crm-web-response"]["consumer"]
+        batch_size = self.args.consumer_batch
+
+        def batches() -> Iterator[Dict[str, Any]]:
+            while True:
+                messages = self.sqs.receive_message(
+                    QueueUrl=self.queue_url, MaxNumberOfMessages=batch_size
+                ).get("Messages", [])
+                if not messages:
+                    return
+                yield self.sqs.lambda_event(messages)
+
+        def drain(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
+            response = consumer.handler(event, context)
+            failed = {
+                failure["itemIdentifier"] for failure in response["batchItemFailures"]
+            }
+            for record in event["Records"]:
+                if record["messageId"] not in failed:
+                    self.sqs.delete_message(
+                        QueueUrl=self.queue_url, ReceiptHandle=record["receiptHandle"]
+                    )
+            self.sqs.return_in_flight(self.queue_url)
+            return {"statusCode": 500 if failed else 200}
+
+        with environment(
+            TABLE_NAME=RESPONSES_TABLE,
+            TRANSACTIONS_TABLE_NAME=TRANSACTIONS_TABLE,
+            COUNTERS_TABLE_NAME=COUNTERS_TABLE,
+        ):
+            return self._run("consumer", drain, batches())
+
+    def _run(
+        self,
+        name: str,
+        handler: Callable,
+        events: Iterable[Any],
+        primary: Optional[str] = None,
+    ) -> StageReport:
+        with environment(METRICS_ENABLED="true"):
+            return run_stage(name, handler, events, not self.args.no_memory, primary)
+
+    def run(self, stages: List[str]) -> List[StageReport]:
+        runners = {
+            "sales-reps": self.sales_reps,
+            "products": self.products,
+            "quotes": self.quotes,
+            "email": self.email,
+            "web-response": self.web_response,
+            "consumer": self.consumer,
+        }
+        if not self.args.no_memory:
+            tracemalloc.start()
+        try:
+            return [runners[stage]() for stage in stages]
+        finally:
+            if not self.args.no_memory:
+                tracemalloc.stop()
+
+
+def format_report(reports: List[StageReport], ses: FakeSES) -> str:
+    lines = [
+        f"{'stage':<13}{'calls':>6}{'errors':>7}{'records/s':>11}"
+        f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'max ms':>9}{'peak MiB':>10}"
+    ]
+    for report in reports:
+        data = report.as_dict()
+        latency = data["latency_ms"]
+        lines.append(
+            f"{report.name:<13}{data['invocations']:>6}{data['errors']:>7}"
+            f"{data['records_per_second']:>11}{latency['p50']:>9}{latency['p95']:>9}"
+            f"{latency['p99']:>9}{latency['max']:>9}{data['peak_memory_mib']:>10}"
+        )
+        for stage, durations in data["stages_ms"].items():
+            lines.append(
+                f"  {stage:<20} p50 {durations['p50']:>9} ms   p99 {durations['p99']:>9} ms"
+            )
+    lines.append(
+        f"SES: {len(ses.sent)} sent, {ses.throttled} throttled, {ses.failed} rejected"
+    )
+    return "\n".join(lines)
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--stages", default=",".join(STAGES))
+    parser.add_argument(
+        "--iterations", type=int, default=3, help="uploads per sync lambda"
+    )
+    parser.add_argument("--emails", type=int, default=200)
+    parser.add_argument("--email-batch", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument(
+        "--queue", action="store_true", help="queue responses for the consumer"
+    )
+    parser.add_argument("--consumer-batch", type=int, default=100)
+    parser.add_argument("--s3-latency-ms", type=float, default=0.0)
+    parser.add_argument("--dynamodb-latency-ms", type=float, default=0.0)
+    parser.add_argument("--unprocessed-rate", type=float, default=0.0)
+    parser.add_argument("--ses-latency-ms", type=float, default=0.0)
+    parser.add_argument("--ses-max-send-rate", type=float, default=None)
+    parser.add_argument("--ses-error-rate", type=float, default=0.0)
+    parser.add_argument("--sqs-latency-ms", type=float, default=0.0)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-memory", action="store_true", help="skip tracemalloc")
+    parser.add_argument("--json", help="also write the report to this file")
+    parser.add_argument("--log-level", default="CRITICAL")
+    return parser.parse_args(argv)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    logging.basicConfig(level=args.log_level)
+    logging.disable(logging.getLevelName(args.log_level) - 1)
+    stages = [stage.strip() for stage in args.stages.split(",") if stage.strip()]
+    unknown = set(stages) - set(STAGES)
+    if unknown:
+        raise SystemExit(f"Unknown stages: {', '.join(sorted(unknown))}")
+
+    harness = Harness(args)
+    reports = harness.run(stages)
+    print(format_report(reports, harness.ses))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump([report.as_dict() for report in reports], f, indent=2)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,108 @@
+import gzip
+import json
+import unittest
+from fakes import FakeDynamoDB, FakeS3
+from run import load_lambda
+
+TABLE = "crm-api-responses"
+BUCKET = "crm-exports"
+
+
+class TestExport(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.export = load_lambda("crm-web-response")["export"]
+
+    def setUp(self):
+        # Small pages, each one uploaded as a part of its own
+        self.db = FakeDynamoDB(page_size=25)
+        table = self.db.create_table(TABLE, "response_id")
+        with table.batch_writer() as batch:
+            for index in range(500):
+                batch.put_item(
+                    Item={
+                        "response_id": f"r{index:04d}",
+                        "response_type": ["Buy", "More Info"][index % 2],
+                        "count": index,
+                    }
+                )
+        self.s3 = FakeS3(min_part_bytes=1)
+
+    def read(self, key):
+        body = self.s3.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+        return gzip.decompress(body).decode()
+
+    def test_segmented_export_in_several_parts(self):
+        progress = self.export.export_table(
+            self.db.client,
+            self.s3,
+            TABLE,
+            BUCKET,
+            "r.ndjson.gz",
+            "ndjson",
+            4,
+            None,
+            1,
+        )
+
+        rows = [json.loads(line) for line in self.read("r.ndjson.gz").splitlines()]
+        self.assertEqual(len(rows), 500)
+        self.assertEqual(
+            sorted(row["response_id"] for row in rows),
+            [f"r{index:04d}" for index in range(500)],
+        )
+        self.assertGreater(len(progress.parts), 1)
+
+    def test_empty_table(self):
+        self.db.create_table("empty", "id")
+
+        progress = self.export.export_table(
+            self.db.client, self.s3, "empty", BUCKET, "e.ndjson.gz", "ndjson", 4
+        )
+
+        self.assertEqual(self.read("e.ndjson.gz"), "")
+        self.assertEqual((progress.items, progress.parts), (0, []))
+        self.assertEqual(self.s3.requests["AbortMultipartUpload"], 1)
+        self.assertNotIn("CompleteMultipartUpload", self.s3.requests)
+
+    def test_csv_resumes_after_a_failed_part(self):
+        upload_part = self.s3.upload_part
+        calls = []
+
+        def flaky_upload_part(**kwargs):
+            calls.append(kwargs["PartNumber"])
+            if len(calls) == 3:
+                raise ConnectionError("connection reset")
+            return upload_part(**kwargs)
+
+        self.s3.upload_part = flaky_upload_part
+        with self.assertRaises(ConnectionError):
+            self.export.export_table(
+                self.db.client, self.s3, TABLE, BUCKET, "r.csv.gz", "csv", 2, None, 1
+            )
+        self.s3.upload_part = upload_part
+
+        progress = self.export.export_table(
+            self.db.client,
+            self.s3,
+            TABLE,
+            BUCKET,
+            "r.csv.gz",
+            "csv",
+            2,
+            None,
+            1,
+            True,
+        )
+
+        lines = self.read("r.csv.gz").splitlines()
+        self.assertEqual(lines[0], "count,response_id,response_type")
+        self.assertEqual(len(lines), 501)
+        self.assertEqual(len(set(lines[1:])), 500)
+        self.assertEqual(progress.items, 500)
+        with self.assertRaises(Exception):
+            self.s3.get_object(Bucket=BUCKET, Key="r.csv.gz.progress.json")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,203 @@
+import io
+import unittest
+from decimal import Decimal
+from boto3.dynamodb.conditions import Attr, Key
+from botocore.exceptions import ClientError
+from fakes import FakeDynamoDB, FakeS3, FakeSES, FakeSQS
+
+
+class TestFakeS3(unittest.TestCase):
+    def setUp(self):
+        self.s3 = FakeS3()
+        self.s3.put_object(
+            Bucket="b", Key="k", Body=b"0123456789", Metadata={"profile": "sample"}
+        )
+
+    def test_get_object_range(self):
+        response = self.s3.get_object(Bucket="b", Key="k", Range="bytes=2-5")
+        self.assertEqual(response["Body"].read(), b"2345")
+
+    def test_head_object_and_missing_key(self):
+        head = self.s3.head_object(Bucket="b", Key="k")
+        self.assertEqual(head["ContentLength"], 10)
+        self.assertEqual(head["Metadata"], {"profile": "sample"})
+        with self.assertRaises(ClientError) as context:
+            self.s3.head_object(Bucket="b", Key="missing")
+        self.assertEqual(context.exception.response["Error"]["Code"], "404")
+
+    def test_conditional_requests(self):
+        etag = self.s3.head_object(Bucket="b", Key="k")["ETag"]
+        with self.assertRaises(ClientError) as context:
+            self.s3.get_object(Bucket="b", Key="k", IfNoneMatch=etag)
+        self.assertEqual(context.exception.response["Error"]["Code"], "304")
+        with self.assertRaises(ClientError) as context:
+            self.s3.get_object(Bucket="b", Key="k", Range="bytes=0-1", IfMatch='"old"')
+        self.assertEqual(
+            context.exception.response["Error"]["Code"], "PreconditionFailed"
+        )
+        body = self.s3.get_object(Bucket="b", Key="k", Range="bytes=0-1", IfMatch=etag)
+        self.assertEqual(body["Body"].read(), b"01")
+
+        with self.assertRaises(ClientError):
+            self.s3.put_object(Bucket="b", Key="k", Body=b"x", IfNoneMatch="*")
+        with self.assertRaises(ClientError):
+            self.s3.put_object(Bucket="b", Key="k", Body=b"x", IfMatch='"stale"')
+        new_etag = self.s3.put_object(Bucket="b", Key="k", Body=b"x", IfMatch=etag)
+        self.assertNotEqual(new_etag["ETag"], etag)
+
+    def test_download_fileobj_and_event(self):
+        buffer = io.BytesIO()
+        self.s3.download_fileobj("b", "k", buffer)
+        self.assertEqual(buffer.getvalue(), b"0123456789")
+
+        first = self.s3.object_event("b", "k")["s3"]["object"]
+        second = self.s3.object_event("b", "k")["s3"]["object"]
+        self.assertEqual(first["size"], 10)
+        self.assertLess(first["sequencer"], second["sequencer"])
+
+
+class TestFakeDynamoDB(unittest.TestCase):
+    def setUp(self):
+        self.db = FakeDynamoDB(page_size=10)
+        self.table = self.db.create_table(
+            "transactions",
+            "transaction_id",
+            indexes={"by_quote_id": ("quote_id", "sent_at")},
+        )
+
+    def test_batch_writer_resends_unprocessed_items(self):
+        self.db.unprocessed_rate = 0.5
+        with self.table.batch_writer() as batch:
+            for index in range(60):
+                batch.put_item(
+                    Item={"transaction_id": str(index), "quote_id": str(index % 3)}
+                )
+
+        self.assertEqual(self.db.item_count("transactions"), 60)
+        self.assertGreater(self.db.requests["BatchWriteItem"], 3)
+
+    def test_query_gsi_in_range_key_order(self):
+        for index in range(5):
+            self.table.put_item(
+                Item={
+                    "transaction_id": f"t{index}",
+                    "quote_id": "Q1" if index % 2 == 0 else "Q2",
+                    "sent_at": f"2024-01-0{5 - index}",
+                    "amount": Decimal(index),
+                }
+            )
+
+        response = self.table.query(
+            IndexName="by_quote_id",
+            KeyConditionExpression=Key("quote_id").eq("Q1")
+            & Key("sent_at").gte("2024-01-02"),
+        )
+
+        self.assertEqual(
+            [item["transaction_id"] for item in response["Items"]], ["t2", "t0"]
+        )
+
+    def test_segmented_scan_pages_through_every_item(self):
+        for index in range(45):
+            self.table.put_item(Item={"transaction_id": str(index)})
+
+        seen = []
+        for segment in range(3):
+            paginator = self.db.client.get_paginator("scan")
+            for page in paginator.paginate(
+                TableName="transactions", Segment=segment, TotalSegments=3
+            ):
+                self.assertLessEqual(len(page["Items"]), 10)
+                seen.extend(item["transaction_id"]["S"] for item in page["Items"])
+
+        self.assertEqual(sorted(seen, key=int), [str(i) for i in range(45)])
+
+    def test_conditional_put(self):
+        self.table.put_item(Item={"transaction_id": "t1", "version": 2})
+        with self.assertRaises(ClientError) as context:
+            self.table.put_item(
+                Item={"transaction_id": "t1", "version": 1},
+                ConditionExpression=Attr("transaction_id").not_exists()
+                | Attr("version").lt(1),
+            )
+        self.assertEqual(
+            context.exception.response["Error"]["Code"],
+            "ConditionalCheckFailedException",
+        )
+        self.table.put_item(
+            Item={"transaction_id": "t2"},
+            ConditionExpression="attribute_not_exists(transaction_id)",
+        )
+        with self.assertRaises(ClientError) as context:
+            self.table.put_item(
+                Item={"transaction_id": "t2", "version": 3},
+                ConditionExpression="attribute_not_exists(transaction_id)",
+                ReturnValuesOnConditionCheckFailure="ALL_OLD",
+            )
+        self.assertEqual(
+            context.exception.response["Item"], {"transaction_id": {"S": "t2"}}
+        )
+
+    def test_update_item_add_and_set(self):
+        for _ in range(3):
+            self.table.update_item(
+                Key={"transaction_id": "counter"},
+                UpdateExpression="ADD #count :one SET updated_at = :now",
+                ExpressionAttributeNames={"#count": "count"},
+                ExpressionAttributeValues={":one": 1, ":now": "2024-01-01"},
+            )
+
+        item = self.table.get_item(Key={"transaction_id": "counter"})["Item"]
+        self.assertEqual(item["count"], 3)
+        self.assertEqual(item["updated_at"], "2024-01-01")
+
+    def test_rejects_invalid_keys(self):
+        with self.assertRaises(ClientError):
+            self.table.put_item(Item={"transaction_id": {"S": "typed"}})
+        with self.assertRaises(ClientError):
+            self.db.resource.Table("missing").get_item(Key={"id": "1"})
+
+
+class TestFakeSES(unittest.TestCase):
+    def send(self, ses):
+        return ses.send_email(
+            Source="a@example.com",
+            Destination={"ToAddresses": ["b@example.com"]},
+            Message={"Subject": {"Data": "s"}, "Body": {"Text": {"Data": "t"}}},
+        )
+
+    def test_throttles_above_max_send_rate(self):
+        ses = FakeSES(max_send_rate=2)
+        results = []
+        for _ in range(5):
+            try:
+                results.append(self.send(ses)["MessageId"])
+            except ClientError as e:
+                results.append(e.response["Error"]["Code"])
+
+        self.assertEqual(results.count("Throttling"), 3)
+        self.assertEqual(len(ses.sent), 2)
+        self.assertEqual(ses.throttled, 3)
+
+
+class TestFakeSQS(unittest.TestCase):
+    def test_received_messages_stay_in_flight_until_deleted(self):
+        sqs = FakeSQS()
+        url = sqs.create_queue(QueueName="q")["QueueUrl"]
+        for body in ["a", "b", "c"]:
+            sqs.send_message(QueueUrl=url, MessageBody=body)
+
+        messages = sqs.receive_message(QueueUrl=url, MaxNumberOfMessages=2)["Messages"]
+        self.assertEqual([message["Body"] for message in messages], ["a", "b"])
+        sqs.delete_message(QueueUrl=url, ReceiptHandle=messages[0]["ReceiptHandle"])
+
+        self.assertEqual(sqs.return_in_flight(url), 1)
+        self.assertEqual(sqs.message_count(url), 2)
+        event = sqs.lambda_event(
+            sqs.receive_message(QueueUrl=url, MaxNumberOfMessages=10)["Messages"]
+        )
+        self.assertEqual(sorted(r["body"] for r in event["Records"]), ["b", "c"])
+
+
+if __name__ == "__main__":
+    unittest.main()
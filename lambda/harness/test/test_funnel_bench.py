@@ -0,0 +1,21 @@
+import io
+import unittest
+import funnel_bench
+
+
+class TestFunnelBench(unittest.TestCase):
+    def test_both_joins_and_the_scans_agree(self):
+        out = io.StringIO()
+
+        funnel_bench.main(
+            ["--rows", "700", "--scan-rows", "700", "--dynamodb-latency-ms", "0"],
+            out=out,
+        )
+
+        lines = out.getvalue().splitlines()
+        self.assertEqual(len(lines), 4)
+        self.assertEqual(lines[0].split("responded")[1], lines[1].split("responded")[1])
+
+
+if __name__ == "__main__":
+    unittest.main()
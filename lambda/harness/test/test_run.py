@@ -0,0 +1,66 @@
+import sys
+import unittest
+import run
+
+
+class TestHarness(unittest.TestCase):
+    def test_lambdas_are_loaded_in_isolation(self):
+        products = run.load_lambda("crm-sync-products")
+        web_response = run.load_lambda("crm-web-response")
+
+        self.assertIsNot(products["clients"], web_response["clients"])
+        self.assertTrue(hasattr(products["main"], "handler"))
+        self.assertTrue(hasattr(web_response["main"], "lambda_handler"))
+        self.assertNotIn("main", sys.modules)
+
+    def test_sales_reps_and_web_response_stages(self):
+        args = run.parse_args(
+            [
+                "--stages",
+                "sales-reps,web-response",
+                "--iterations",
+                "2",
+                "--requests",
+                "50",
+            ]
+        )
+        harness = run.Harness(args)
+
+        sales_reps, web_response = harness.run(["sales-reps", "web-response"])
+
+        self.assertEqual(sales_reps.errors, 0)
+        self.assertEqual(len(sales_reps.latencies_ms), 2)
+        self.assertGreater(sales_reps.records, 0)
+        self.assertIn("write", sales_reps.breakdown)
+        self.assertEqual(web_response.errors, 0)
+        self.assertEqual(web_response.records, 50)
+        self.assertEqual(harness.dynamodb.item_count(run.RESPONSES_TABLE), 50)
+        report = web_response.as_dict()
+        self.assertGreater(report["records_per_second"], 0)
+        self.assertGreaterEqual(
+            report["latency_ms"]["p99"], report["latency_ms"]["p50"]
+        )
+
+    def test_queued_responses_are_drained_by_the_consumer(self):
+        args = run.parse_args(
+            ["--queue", "--requests", "60", "--consumer-batch", "25", "--no-memory"]
+        )
+        harness = run.Harness(args)
+
+        web_response, consumer = harness.run(["web-response", "consumer"])
+
+        self.assertEqual(web_response.errors, 0)
+        # Only the consumer writes responses, one conditional put each
+        self.assertEqual(
+            harness.dynamodb.requests.get("PutItem", 0), web_response.records
+        )
+        self.assertEqual(consumer.errors, 0)
+        self.assertEqual(len(consumer.latencies_ms), 3)
+        self.assertEqual(harness.sqs.message_count(harness.queue_url), 0)
+        self.assertEqual(
+            harness.dynamodb.item_count(run.RESPONSES_TABLE), web_response.records
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()